@@ -0,0 +1,78 @@
+import os
+import sys
+# DON'T CHANGE THIS !!!
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import argparse
+import logging
+import signal
+import threading
+from src.models.user import db
+from src.services.batch_pipeline import BatchPipeline
+from src.services.usage_buffer import flush_usage_logs
+from src.controllers.ai_processor import AIProcessor
+
+logger = logging.getLogger('batch')
+
+
+def watch(app, pipeline: BatchPipeline, interval: float):
+    """Consulta os lotes periodicamente até receber SIGINT/SIGTERM"""
+    stop_event = threading.Event()
+
+    def handle_signal(signum, frame):
+        logger.info('Sinal %s recebido, finalizando...', signum)
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    while not stop_event.is_set():
+        with app.app_context():
+            try:
+                result = pipeline.poll()
+                if result['checked'] or result['applied']:
+                    logger.info('Lotes consultados: %s', result)
+            except Exception:
+                logger.exception('Erro ao consultar lotes')
+                db.session.rollback()
+            db.session.remove()
+        stop_event.wait(interval)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Processamento offline do backlog pela Batch API (executar via cron)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    submit_notes = subparsers.add_parser('submit-notes', help='Envia anotações pendentes antigas em lote')
+    submit_notes.add_argument('--user-id', default=None)
+    submit_notes.add_argument('--limit', type=int, default=None)
+
+    submit_summaries = subparsers.add_parser('submit-summaries', help='Envia os resumos diários em lote')
+    submit_summaries.add_argument('--date', default=None, help='Dia a resumir (YYYY-MM-DD, UTC); padrão: ontem')
+    submit_summaries.add_argument('--user-id', default=None)
+
+    poll = subparsers.add_parser('poll', help='Consulta os lotes em andamento e aplica os concluídos')
+    poll.add_argument('--watch', action='store_true', help='Continua consultando a cada --interval segundos')
+    poll.add_argument('--interval', type=float, default=float(os.getenv('BATCH_POLL_INTERVAL', 300)))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    from src.main import app
+    pipeline = BatchPipeline(AIProcessor())
+
+    if args.command == 'poll' and args.watch:
+        watch(app, pipeline, args.interval)
+    else:
+        with app.app_context():
+            if args.command == 'submit-notes':
+                result = pipeline.submit_note_backlog(user_id=args.user_id, limit=args.limit)
+            elif args.command == 'submit-summaries':
+                result = pipeline.submit_daily_summaries(date=args.date, user_id=args.user_id)
+            else:
+                result = pipeline.poll()
+            logger.info('%s: %s', args.command, result)
+
+    # Grava os registros de uso ainda no buffer
+    with app.app_context():
+        flush_usage_logs()
@@ -1,136 +1,124 @@
+import os
 import json
+import hashlib
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
-from src.models.user import db, User
+from sqlalchemy.exc import IntegrityError
+from src.models.user import db, User, UserDailyUsage, UsageRollup, AI_QUOTA_API_TYPE
 from src.models.note import Note, Insight
 from src.models.category import Category
+from src.models.summary import DailySummary
 from src.services.chatgpt_service import ChatGPTService
 from src.services.perplexity_service import PerplexityService
 from src.services.whatsapp_service import WhatsAppService
+from src.services.concurrency import Stage, StageGraph, StageSkipped, run_bounded
+from src.services.response_cache import get_cache_stats
+from src.services.resilience import get_resilience_stats
+from src.services.stage_router import StageRouter, get_router_stats
+from src.services.prompt_registry import get_prompt_stats
+from src.services.topic_cache import get_topic_cache_stats
+from src.services.batch_pipeline import get_batch_stats, content_fingerprint
+from src.models.batch import BatchItem
+from src.services.embedding_service import get_embedding_service
+from src.models.keyword_index import NoteKeywordSignature
+from src.services.keyword_index import get_keyword_index
+from src.services.dedup_service import get_duplicate_detector
+from src.services.category_classifier import get_classifier_service
+from src.services.job_queue import enqueue_classifier_training
+from src.services.text_processing import top_keywords, term_frequencies
+from src.services.topic_clustering import build_tfidf_matrix, MiniBatchKMeans, suggest_cluster_count, top_terms
 
 class AIProcessor:
     """Orquestrador para processamento de anotações com IA"""
     
-    def __init__(self):
+    def __init__(self, combined_analysis: bool = None):
         self.chatgpt = ChatGPTService()
         self.perplexity = PerplexityService()
         self.whatsapp = WhatsAppService()
+        self.embeddings = get_embedding_service()
+        self.keywords = get_keyword_index()
+        self.duplicates = get_duplicate_detector()
+        self.classifier = get_classifier_service()
+        self.router = StageRouter()
+        self.stage_timeout = float(os.getenv('AI_STAGE_TIMEOUT_SECONDS', 45))
+        
+        # Análise e extração de tarefas em uma única chamada (padrão)
+        if combined_analysis is None:
+            combined_analysis = os.getenv('AI_COMBINED_ANALYSIS', 'true').lower() == 'true'
+        self.combined_analysis = combined_analysis
     
-    def process_note(self, note_id: str, user_preferences: dict = None) -> dict:
-        """Processa uma anotação completa com IA"""
+    def process_note(self, note_id: str, user_preferences: dict = None, on_progress=None) -> dict:
+        """Processa uma anotação completa com IA.
+        
+        on_progress, se informado, recebe um evento por etapa concluída
+        (análise, tarefas, informações externas) à medida que terminam.
+        """
         try:
             # Busca anotação
             note = Note.query.get(note_id)
             if not note:
                 return {'success': False, 'error': 'Anotação não encontrada'}
             
-            # Verifica se usuário pode usar IA
+            # Já enviada à Batch API com o mesmo conteúdo: não paga a análise duas vezes
+            batch_item = BatchItem.pending_for_note(note.id)
+            if batch_item and batch_item.fingerprint == content_fingerprint(note.content):
+                return {'success': False, 'error': 'Anotação aguardando processamento em lote', 'batch_pending': True}
+            
             user = User.query.get(note.user_id)
-            if not user.can_use_ai_features():
+            if not user.within_spend_cap():
+                return {'success': False, 'error': 'Limite mensal de gastos com IA atingido'}
+            
+            # Reserva o uso de IA antes das chamadas (atômico, sem corrida entre requisições)
+            reserved_day = user.reserve_ai_usage()
+            if reserved_day is None:
                 return {'success': False, 'error': 'Limite de uso de IA atingido'}
             
+            # Escolhe as etapas pagas que valem a pena para esta anotação
+            routing = self.router.route(user, note.content, user_preferences, self.combined_analysis, note.id)
+            note.update_metadata('ai_routing', {
+                'stages': routing['stages'],
+                'skipped': routing['skipped'],
+                'external_score': routing['external_score']
+            })
+            
             # Marca como processando
             note.mark_as_processing()
             db.session.commit()
             
-            results = {}
-            
-            # 1. Análise inicial com ChatGPT
-            chatgpt_result = self.chatgpt.analyze_note(
-                user_id=note.user_id,
-                note_content=note.content,
-                user_preferences=user_preferences
-            )
-            
-            if chatgpt_result['success']:
-                results['chatgpt_analysis'] = chatgpt_result['analysis']
-                
-                # Aplica categoria sugerida
-                category_name = chatgpt_result['analysis'].get('category_suggestion')
-                if category_name:
-                    category = Category.find_or_create_by_name(note.user_id, category_name)
-                    note.category = category.name
-                
-                # Aplica tags sugeridas
-                suggested_tags = chatgpt_result['analysis'].get('tags', [])
-                note.set_tags(suggested_tags)
-                
-                # Cria insights
-                self._create_insights_from_analysis(note, chatgpt_result['analysis'])
-            
-            # 2. Busca informações externas com Perplexity (se relevante)
-            if self._should_search_external_info(note.content):
-                perplexity_result = self.perplexity.search_related_information(
-                    user_id=note.user_id,
-                    note_content=note.content
-                )
-                
-                if perplexity_result['success']:
-                    results['external_info'] = perplexity_result['information']
-                    results['citations'] = perplexity_result['citations']
-                    
-                    # Cria insight com informações externas
-                    external_insight = Insight(
-                        user_id=note.user_id,
-                        note_id=note.id,
-                        insight_type='external_info',
-                        content=perplexity_result['information'],
-                        confidence_score=0.8,
-                        insight_metadata={
-                            'citations': perplexity_result['citations'],
-                            'source': 'perplexity'
-                        }
-                    )
-                    db.session.add(external_insight)
+            # Executa etapas independentes em paralelo
+            graph = StageGraph(self._build_note_stages(note.user_id, note.content, user_preferences, routing['stages']))
+            stage_results = graph.run(on_stage=self._stage_progress(on_progress) if on_progress else None)
             
-            # 3. Extração de tarefas e prazos
-            tasks_result = self.chatgpt.extract_tasks_and_deadlines(
-                user_id=note.user_id,
-                note_content=note.content
-            )
-            
-            if tasks_result['success']:
-                extraction = tasks_result['extraction']
-                results['tasks'] = extraction.get('tasks', [])
-                
-                # Define prazo sugerido se encontrado
-                tasks = extraction.get('tasks', [])
-                if tasks:
-                    # Pega a primeira tarefa com prazo
-                    for task in tasks:
-                        if task.get('deadline'):
-                            try:
-                                deadline = datetime.strptime(task['deadline'], '%Y-%m-%d')
-                                note.deadline_suggested = deadline
-                                break
-                            except:
-                                pass
-                
-                # Cria insights para tarefas
-                for task in tasks:
-                    task_insight = Insight(
-                        user_id=note.user_id,
-                        note_id=note.id,
-                        insight_type='task',
-                        content=task['task'],
-                        confidence_score=task.get('confidence', 0.7),
-                        insight_metadata={
-                            'deadline': task.get('deadline'),
-                            'priority': task.get('priority', 'média')
-                        }
-                    )
-                    db.session.add(task_insight)
-            
-            # Marca como processada
+            # Nenhuma etapa concluída (ex.: provedores indisponíveis): não consome a
+            # cota e a nota fica como falha, para o job tentar de novo com backoff
+            if not any(stage['status'] == 'ok' for stage in stage_results.values()):
+                user.release_ai_usage(reserved_day)
+                reserved_day = None
+
+                error = '; '.join(
+                    f"{name}: {stage['error']}" for name, stage in stage_results.items() if stage.get('error')
+                ) or 'Nenhuma etapa concluída'
+                db.session.rollback()
+                note.mark_as_failed(error)
+                db.session.commit()
+                return {
+                    'success': False,
+                    'error': error,
+                    'provider_unavailable': all(stage['status'] == 'skipped' for stage in stage_results.values())
+                }
+
+            # Aplica resultados e persiste tudo em um único commit
+            results = self._apply_stage_results(note, stage_results)
             note.mark_as_processed()
             db.session.commit()
             
             # Envia insights via WhatsApp se habilitado
-            if user.whatsapp_opt_in:
+            analysis_stage = stage_results.get('analysis', {})
+            if user.whatsapp_opt_in and analysis_stage.get('status') == 'ok':
                 self.whatsapp.send_ai_insights(
                     user_id=note.user_id,
                     note_id=note.id,
-                    insights=chatgpt_result
+                    insights=analysis_stage['value']
                 )
             
             return {
@@ -140,8 +128,12 @@ class AIProcessor:
             }
             
         except Exception as e:
-            # Marca como falha
-            if 'note' in locals():
+            # Devolve a reserva de uso e marca como falha
+            if locals().get('reserved_day'):
+                user.release_ai_usage(reserved_day)
+            
+            if 'note' in locals() and note:
+                db.session.rollback()
                 note.mark_as_failed(str(e))
                 db.session.commit()
             
@@ -150,8 +142,200 @@ class AIProcessor:
                 'error': str(e)
             }
     
-    def process_daily_notes(self, user_id: str, date: str = None) -> dict:
+    @staticmethod
+    def _stage_progress(on_progress):
+        """Adapta on_progress ao callback de etapas do StageGraph"""
+        def on_stage(name: str, result: dict):
+            on_progress({
+                'stage': name,
+                'status': result['status'],
+                'error': result['error'],
+                'duration': result['duration']
+            })
+        return on_stage
+    
+    def _build_note_stages(self, user_id: str, content: str, user_preferences: dict = None,
+                           selected: List[str] = None) -> List[Stage]:
+        """Monta o grafo de etapas de IA para uma anotação.
+        
+        selected são as etapas escolhidas pelo StageRouter (padrão: análise
+        e tarefas). As etapas recebem apenas valores simples (nunca objetos
+        do ORM), pois rodam em threads com sessões próprias.
+        """
+        selected = selected or ['analysis', 'tasks']
+        
+        if self.combined_analysis:
+            # Uma chamada só; a etapa de tarefas apenas reaproveita a resposta
+            stages = [
+                Stage('analysis', lambda inputs: self._require_success(self.chatgpt.analyze_note_complete(
+                    user_id=user_id,
+                    note_content=content,
+                    user_preferences=user_preferences
+                )), timeout=self.stage_timeout),
+                Stage('tasks', lambda inputs: {
+                    'success': True,
+                    'extraction': inputs['analysis']['extraction']
+                }, depends_on=['analysis'])
+            ]
+        else:
+            stages = [
+                Stage('analysis', lambda inputs: self._require_success(self.chatgpt.analyze_note(
+                    user_id=user_id,
+                    note_content=content,
+                    user_preferences=user_preferences
+                )), timeout=self.stage_timeout),
+                Stage('tasks', lambda inputs: self._require_success(self.chatgpt.extract_tasks_and_deadlines(
+                    user_id=user_id,
+                    note_content=content
+                )), timeout=self.stage_timeout)
+            ]
+        
+        stages = [stage for stage in stages if stage.name in selected]
+        
+        # Busca informações externas com Perplexity (se escolhida pelo roteador)
+        if 'external_info' in selected:
+            stages.append(Stage('external_info', lambda inputs: self._require_success(
+                self.perplexity.search_related_information(
+                    user_id=user_id,
+                    note_content=content
+                )
+            ), timeout=self.stage_timeout))
+        
+        return stages
+    
+    @staticmethod
+    def _require_success(result: dict) -> dict:
+        """Converte retorno de falha dos serviços em exceção da etapa.
+        
+        Provedor indisponível (circuito aberto) não é falha da anotação:
+        a etapa é apenas descartada.
+        """
+        if not result.get('success'):
+            if result.get('provider_unavailable'):
+                raise StageSkipped(result.get('error', 'Provedor indisponível'))
+            raise Exception(result.get('error', 'Falha na etapa'))
+        return result
+    
+    def _apply_stage_results(self, note: Note, stage_results: Dict[str, dict]) -> dict:
+        """Aplica os resultados das etapas na anotação (sem commit)"""
+        results = {}
+        
+        # 1. Análise com ChatGPT
+        analysis_stage = stage_results.get('analysis')
+        if analysis_stage and analysis_stage['status'] == 'ok':
+            analysis = analysis_stage['value']['analysis']
+            results['chatgpt_analysis'] = analysis
+            
+            # Aplica categoria sugerida, preservando a do usuário ou a do classificador local
+            category_name = analysis.get('category_suggestion')
+            category_source = note.get_metadata().get('category_source')
+            if category_name and category_source not in ('user', 'classifier'):
+                previous_category = note.category if category_source == 'ai' else None
+                category = Category.find_or_create_by_name(note.user_id, category_name, commit=False)
+                note.category = category.name
+                note.update_metadata('category_source', 'ai')
+                self.classifier.learn_note(note, previous_category=previous_category)
+            
+            # Aplica tags sugeridas
+            note.set_tags(analysis.get('tags', []))
+            
+            # Cria insights
+            self._create_insights_from_analysis(note, analysis)
+        
+        # 2. Informações externas com Perplexity
+        external_stage = stage_results.get('external_info')
+        if external_stage and external_stage['status'] == 'ok':
+            perplexity_result = external_stage['value']
+            results['external_info'] = perplexity_result['information']
+            results['citations'] = perplexity_result['citations']
+            
+            # Cria insight com informações externas
+            external_insight = Insight(
+                user_id=note.user_id,
+                note_id=note.id,
+                insight_type='external_info',
+                content=perplexity_result['information'],
+                confidence_score=0.8,
+                insight_metadata={
+                    'citations': perplexity_result['citations'],
+                    'source': 'perplexity'
+                }
+            )
+            db.session.add(external_insight)
+        
+        # 3. Tarefas e prazos
+        tasks_stage = stage_results.get('tasks')
+        if tasks_stage and tasks_stage['status'] == 'ok':
+            tasks = tasks_stage['value']['extraction'].get('tasks', [])
+            results['tasks'] = tasks
+            self._apply_tasks(note, tasks)
+        
+        # Registra status de cada etapa para diagnóstico
+        results['stages'] = {
+            name: {'status': stage['status'], 'duration': stage['duration'], 'error': stage['error']}
+            for name, stage in stage_results.items()
+        }
+        note.update_metadata('ai_stages', results['stages'])
+        
+        return results
+    
+    def _apply_tasks(self, note: Note, tasks: List[dict]):
+        """Define prazo sugerido e cria insights de tarefas"""
+        # Pega a primeira tarefa com prazo
+        for task in tasks:
+            if task.get('deadline'):
+                try:
+                    note.deadline_suggested = datetime.strptime(task['deadline'], '%Y-%m-%d')
+                    break
+                except:
+                    pass
+        
+        # Cria insights para tarefas
+        for task in tasks:
+            task_insight = Insight(
+                user_id=note.user_id,
+                note_id=note.id,
+                insight_type='task',
+                content=task['task'],
+                confidence_score=task.get('confidence', 0.7),
+                insight_metadata={
+                    'deadline': task.get('deadline'),
+                    'priority': task.get('priority', 'média')
+                }
+            )
+            db.session.add(task_insight)
+    
+    def process_daily_notes(self, user_id: str, date: str = None, force: bool = False) -> dict:
         """Processa todas as anotações do dia e gera resumo"""
+        result = self.build_daily_summary(user_id, date, force=force)
+        if not result['success'] or not result.get('summary'):
+            return result
+        
+        try:
+            # Envia resumo via WhatsApp se habilitado (resumo servido do
+            # armazenamento já foi enviado quando gerado)
+            user = User.query.get(user_id)
+            if user and user.whatsapp_opt_in and not result.get('cached'):
+                self.whatsapp.send_daily_summary(user_id, result['summary'], notes_omitted=result.get('notes_omitted', 0),
+                                                 chunks_failed=result.get('chunks_failed', 0))
+            
+            return result
+            
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
+    def build_daily_summary(self, user_id: str, date: str = None, force: bool = False, before_call=None) -> dict:
+        """Gera o resumo das anotações do dia, sem enviá-lo.
+        
+        O resumo gerado fica armazenado por (usuário, dia) junto com uma
+        impressão digital das notas que o compõem; enquanto nenhuma nota do
+        dia for criada, editada ou removida, pedidos repetidos são servidos
+        do armazenamento sem chamar o LLM. before_call é repassado a
+        generate_daily_summary (uma chamada por requisição ao LLM).
+        """
         try:
             if not date:
                 date = datetime.now().strftime('%Y-%m-%d')
@@ -159,46 +343,55 @@ class AIProcessor:
             # Busca anotações do dia
             start_date = datetime.strptime(date, '%Y-%m-%d')
             end_date = start_date + timedelta(days=1)
-            
-            notes = Note.query.filter(
+            day_filter = (
                 Note.user_id == user_id,
                 Note.created_at >= start_date,
                 Note.created_at < end_date
-            ).all()
+            )
             
-            if not notes:
+            # Consulta leve (id, updated_at) para validar o resumo armazenado
+            versions = db.session.query(Note.id, Note.updated_at).filter(*day_filter).order_by(Note.id).all()
+            if not versions:
                 return {'success': True, 'message': 'Nenhuma anotação encontrada para o dia'}
             
-            # Prepara dados das notas
-            notes_data = []
-            for note in notes:
-                notes_data.append({
-                    'id': note.id,
-                    'content': note.content,
-                    'category': note.category,
-                    'tags': note.get_tags(),
-                    'created_at': note.created_at.isoformat()
-                })
+            fingerprint = self._daily_fingerprint(versions)
+            stored = DailySummary.get_for_day(user_id, start_date.date())
+            if stored and stored.fingerprint == fingerprint and not force:
+                return {
+                    'success': True,
+                    'summary': stored.get_summary(),
+                    'notes_processed': stored.notes_count,
+                    'notes_omitted': stored.notes_omitted,
+                    'chunks_failed': 0,
+                    'partial': bool(stored.notes_omitted),
+                    'cached': True
+                }
+            
+            notes = Note.query.filter(*day_filter).all()
             
             # Gera resumo diário
             summary_result = self.chatgpt.generate_daily_summary(
                 user_id=user_id,
-                notes=notes_data,
-                date=date
+                notes=self._summary_notes_data(notes),
+                date=date,
+                before_call=before_call
             )
             
             if not summary_result['success']:
                 return summary_result
             
-            # Envia resumo via WhatsApp se habilitado
-            user = User.query.get(user_id)
-            if user and user.whatsapp_opt_in:
-                self.whatsapp.send_daily_summary(user_id, summary_result['summary'])
+            # Resumo parcial (chunks com falha) não é armazenado: o próximo pedido tenta de novo
+            if not summary_result.get('chunks_failed'):
+                self._store_summary(user_id, 'day', start_date.date(), fingerprint, len(notes), summary_result)
             
             return {
                 'success': True,
                 'summary': summary_result['summary'],
-                'notes_processed': len(notes)
+                'notes_processed': len(notes),
+                'notes_omitted': summary_result.get('notes_omitted', 0),
+                'chunks_failed': summary_result.get('chunks_failed', 0),
+                'partial': bool(summary_result.get('notes_omitted') or summary_result.get('chunks_failed')),
+                'cached': False
             }
             
         except Exception as e:
@@ -207,6 +400,144 @@ class AIProcessor:
                 'error': str(e)
             }
     
+    @staticmethod
+    def _summary_notes_data(notes: List[Note]) -> List[dict]:
+        """Dados das notas enviados ao resumo diário"""
+        return [{
+            'id': note.id,
+            'content': note.content,
+            'category': note.category,
+            'tags': note.get_tags(),
+            'created_at': note.created_at.isoformat()
+        } for note in notes]
+    
+    @staticmethod
+    def _daily_fingerprint(versions) -> str:
+        """Impressão digital das notas do dia: ids e datas de atualização ordenados"""
+        digest = hashlib.sha256()
+        for note_id, updated_at in versions:
+            digest.update(f'{note_id}:{updated_at.isoformat() if updated_at else ""};'.encode('utf-8'))
+        return digest.hexdigest()
+    
+    def build_period_summary(self, user_id: str, period: str, date: str = None, force: bool = False) -> dict:
+        """Resumo semanal ('week') ou mensal ('month') a partir dos resumos diários.
+        
+        Dias do período sem resumo armazenado (ou com resumo desatualizado)
+        são gerados antes; o resumo do período é uma única redução sobre os
+        resumos diários e também fica armazenado, validado pelas impressões
+        digitais dos dias que o compõem.
+        """
+        try:
+            reference = datetime.strptime(date, '%Y-%m-%d').date() if date else datetime.now().date()
+            if period == 'week':
+                start = reference - timedelta(days=reference.weekday())
+                end = start + timedelta(days=7)
+                label = f"semana de {start.isoformat()} a {(end - timedelta(days=1)).isoformat()}"
+            elif period == 'month':
+                start = reference.replace(day=1)
+                end = (start + timedelta(days=32)).replace(day=1)
+                label = f"mês {start.strftime('%m/%Y')}"
+            else:
+                return {'success': False, 'error': 'Período inválido'}
+            
+            # Dias futuros ainda não têm anotações
+            end = min(end, datetime.now().date() + timedelta(days=1))
+            
+            # Completa (ou atualiza) os resumos diários que faltam
+            days = []
+            days_generated = 0
+            days_failed = []
+            day = start
+            while day < end:
+                result = self.build_daily_summary(user_id, day.isoformat())
+                # Resumo diário parcial não foi armazenado: o dia conta como falha
+                if not result['success'] or result.get('chunks_failed'):
+                    days_failed.append(day.isoformat())
+                elif result.get('summary'):
+                    days.append(day)
+                    if not result.get('cached'):
+                        days_generated += 1
+                day += timedelta(days=1)
+            
+            stored_days = DailySummary.query.filter(
+                DailySummary.user_id == user_id,
+                DailySummary.period == 'day',
+                DailySummary.date.in_(days)
+            ).order_by(DailySummary.date).all() if days else []
+            
+            if not stored_days:
+                return {
+                    'success': True,
+                    'message': 'Nenhuma anotação encontrada para o período',
+                    'days_failed': days_failed
+                }
+            
+            digest = hashlib.sha256()
+            for stored_day in stored_days:
+                digest.update(f'{stored_day.date.isoformat()}:{stored_day.fingerprint};'.encode('utf-8'))
+            fingerprint = digest.hexdigest()
+            notes_count = sum(stored_day.notes_count for stored_day in stored_days)
+            
+            base = {
+                'success': True,
+                'period': period,
+                'start_date': start.isoformat(),
+                'end_date': (end - timedelta(days=1)).isoformat(),
+                'days_summarized': len(stored_days),
+                'days_generated': days_generated,
+                'days_failed': days_failed,
+                'notes_processed': notes_count
+            }
+            
+            stored = DailySummary.get_for_period(user_id, period, start)
+            if stored and stored.fingerprint == fingerprint and not force:
+                return {**base, 'summary': stored.get_summary(), 'cached': True}
+            
+            summary_result = self.chatgpt.generate_period_summary(
+                user_id=user_id,
+                daily_summaries=[
+                    {'date': stored_day.date.isoformat(), 'summary': stored_day.get_summary()}
+                    for stored_day in stored_days
+                ],
+                period_label=label
+            )
+            
+            if not summary_result['success']:
+                return summary_result
+            
+            # Período com dias que falharam fica incompleto: não é armazenado
+            if not days_failed:
+                self._store_summary(user_id, period, start, fingerprint, notes_count, summary_result)
+            
+            return {**base, 'summary': summary_result['summary'], 'cached': False}
+            
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
+    def _store_summary(self, user_id: str, period: str, start, fingerprint: str, notes_count: int, summary_result: dict):
+        """Grava (ou substitui) o resumo armazenado do período"""
+        for _ in range(2):
+            stored = DailySummary.get_for_period(user_id, period, start)
+            if stored is None:
+                stored = DailySummary(user_id=user_id, period=period, date=start)
+                db.session.add(stored)
+            stored.fingerprint = fingerprint
+            stored.set_summary(summary_result['summary'])
+            stored.notes_count = notes_count
+            stored.notes_omitted = summary_result.get('notes_omitted', 0)
+            stored.mode = summary_result.get('mode')
+            stored.tokens_used = summary_result.get('tokens_used', 0)
+            stored.cost = summary_result.get('cost', 0.0)
+            try:
+                db.session.commit()
+                return
+            except IntegrityError:
+                # Outra requisição gravou o mesmo dia ao mesmo tempo: atualiza a linha dela
+                db.session.rollback()
+    
     def categorize_uncategorized_notes(self, user_id: str, limit: int = 10) -> dict:
         """Categoriza anotações sem categoria"""
         try:
@@ -289,6 +620,320 @@ class AIProcessor:
                 'error': str(e)
             }
     
+    def categorize_backlog(self, user_id: str, checkpoint: dict = None, on_checkpoint=None,
+                           chunk_token_budget: int = None, max_concurrency: int = None,
+                           max_chars: int = 1000, page_size: int = 500) -> dict:
+        """Categoriza todo o backlog de anotações sem categoria.
+        
+        Percorre as anotações por paginação keyset (Note.id), agrupa-as em
+        chunks limitados por tokens estimados e envia os chunks em paralelo.
+        Cada página é aplicada em lote e confirmada junto com o checkpoint,
+        de modo que uma execução interrompida continua de onde parou.
+        
+        Chunks com falha são reenviados (BACKLOG_CHUNK_RETRIES); se ainda
+        falharem, o checkpoint para antes da primeira nota não categorizada
+        e uma exceção é lançada, para o job tentar de novo a partir dali.
+        """
+        chunk_token_budget = chunk_token_budget or int(os.getenv('BACKLOG_CHUNK_TOKENS', 3000))
+        max_concurrency = max_concurrency or int(os.getenv('BACKLOG_MAX_CONCURRENCY', 4))
+        chunk_retries = int(os.getenv('BACKLOG_CHUNK_RETRIES', 1))
+        
+        state = {
+            'cursor': None,
+            'notes_seen': 0,
+            'notes_categorized': 0,
+            'notes_classified_locally': 0,
+            'new_categories_created': 0,
+            'chunks_failed': 0
+        }
+        state.update(checkpoint or {})
+        
+        existing_categories = {cat.name for cat in Category.get_by_user(user_id)}
+        user = User.query.get(user_id)
+        
+        while True:
+            # Teto mensal conferido a cada página: o backlog pode gerar muitas chamadas pagas
+            if user and not user.within_spend_cap():
+                return {'success': False, 'error': 'Limite mensal de gastos com IA atingido', **state}
+            
+            query = db.session.query(Note.id, Note.content).filter(
+                Note.user_id == user_id,
+                Note.category.is_(None)
+            )
+            if state['cursor']:
+                query = query.filter(Note.id > state['cursor'])
+            page = query.order_by(Note.id).limit(page_size).all()
+            
+            if not page:
+                break
+            
+            # Classificador local resolve as notas em que está confiante; só o resto vai ao LLM
+            model = self.classifier.get_trained_model(user_id)
+            pending = []
+            local_assignments = {}
+            for row in page:
+                category_name, confidence = model.predict(term_frequencies(row.content)) if model else (None, 0.0)
+                if category_name and confidence >= self.classifier.confidence_threshold:
+                    local_assignments[row.id] = (category_name, confidence)
+                else:
+                    pending.append(row)
+            
+            if local_assignments:
+                for note in Note.query.filter(Note.id.in_(list(local_assignments.keys()))).all():
+                    note.category, confidence = local_assignments[note.id]
+                    note.update_metadata('category_source', 'classifier')
+                    note.update_metadata('category_confidence', round(confidence, 4))
+                state['notes_classified_locally'] += len(local_assignments)
+            
+            chunks = self._pack_notes_into_chunks(pending, chunk_token_budget, max_chars)
+            categories_list = sorted(existing_categories)
+            
+            def categorize_chunk(chunk):
+                return self.chatgpt.categorize_notes(
+                    user_id=user_id,
+                    notes=chunk,
+                    existing_categories=categories_list,
+                    max_chars=max_chars,
+                    max_tokens=min(4000, 200 + 60 * len(chunk))
+                )
+            
+            # Agrupa ids por categoria para atualizar em lote
+            assignments = {}
+            new_categories = {}
+            failed_chunks = []
+            attempts = 0
+            while chunks:
+                for chunk, result, error in run_bounded(categorize_chunk, chunks, max_workers=max_concurrency):
+                    if error or not result['success']:
+                        failed_chunks.append((chunk, result or {}))
+                        continue
+                    
+                    categorization = result['categorization']
+                    for cat_data in categorization.get('categorizations', []):
+                        note_index = cat_data.get('note_index', 1) - 1
+                        category_name = cat_data.get('suggested_category')
+                        if category_name and 0 <= note_index < len(chunk):
+                            assignments.setdefault(category_name, []).append(chunk[note_index]['id'])
+                
+                    for new_cat in categorization.get('new_categories', []):
+                        if new_cat.get('name'):
+                            new_categories.setdefault(new_cat['name'], new_cat)
+                
+                # Reenvia os chunks com falha (exceto com o provedor indisponível)
+                attempts += 1
+                retryable = all(not result.get('provider_unavailable') for _, result in failed_chunks)
+                if not failed_chunks or attempts > chunk_retries or not retryable:
+                    break
+                chunks = [chunk for chunk, _ in failed_chunks]
+                failed_chunks = []
+            
+            # Cria categorias que ainda não existem
+            for category_name in set(assignments) | set(new_categories):
+                if category_name in existing_categories:
+                    continue
+                new_cat = new_categories.get(category_name, {})
+                db.session.add(Category(
+                    user_id=user_id,
+                    name=category_name,
+                    description=new_cat.get('description'),
+                    icon=new_cat.get('suggested_icon', '📝'),
+                    is_system_generated=True
+                ))
+                existing_categories.add(category_name)
+                state['new_categories_created'] += 1
+            
+            # Aplica categorias em lote (uma atualização por categoria)
+            now = datetime.utcnow()
+            for category_name, note_ids in assignments.items():
+                state['notes_categorized'] += Note.query.filter(
+                    Note.id.in_(note_ids),
+                    Note.category.is_(None)
+                ).update({'category': category_name, 'updated_at': now}, synchronize_session=False)
+            
+            # Com chunks ainda falhando, o cursor para antes da primeira nota não categorizada
+            failed_ids = {note['id'] for chunk, _ in failed_chunks for note in chunk}
+            processed = next((i for i, row in enumerate(page) if row.id in failed_ids), len(page))
+            state['notes_seen'] += processed
+            if processed:
+                state['cursor'] = page[processed - 1].id
+            state['chunks_failed'] += len(failed_chunks)
+            
+            # Checkpoint é gravado na mesma transação das atualizações
+            db.session.flush()
+            if on_checkpoint:
+                on_checkpoint(dict(state))
+            db.session.commit()
+            
+            if failed_chunks:
+                raise Exception(f'{len(failed_chunks)} chunks falharam ao categorizar o backlog; '
+                                f'retomando do checkpoint na próxima tentativa')
+        
+        return {
+            'success': True,
+            'notes_seen': state['notes_seen'],
+            'notes_categorized': state['notes_categorized'],
+            'notes_classified_locally': state['notes_classified_locally'],
+            'new_categories_created': state['new_categories_created'],
+            'chunks_failed': state['chunks_failed']
+        }
+    
+    def _pack_notes_into_chunks(self, notes: list, token_budget: int, max_chars: int, max_notes: int = 50) -> List[List[dict]]:
+        """Agrupa notas em chunks limitados por tokens estimados"""
+        chunks = []
+        current = []
+        current_tokens = 0
+        
+        for note_id, content in notes:
+            tokens = self.chatgpt.estimate_tokens(content[:max_chars]) + 10  # Numeração e separadores
+            if current and (current_tokens + tokens > token_budget or len(current) >= max_notes):
+                chunks.append(current)
+                current = []
+                current_tokens = 0
+            current.append({'id': note_id, 'content': content})
+            current_tokens += tokens
+        
+        if current:
+            chunks.append(current)
+        
+        return chunks
+    
+    def cluster_topics(self, user_id: str, n_clusters: int = None, use_llm: bool = True,
+                       include_categorized: bool = False, max_llm_concurrency: int = None,
+                       page_size: int = 1000) -> dict:
+        """Agrupa anotações por assunto (TF-IDF + k-means) e propõe categorias.
+        
+        Usa as assinaturas de palavras-chave já calculadas na escrita, então
+        nenhuma nota é enviada ao LLM. Opcionalmente faz uma única chamada
+        por cluster para nomeá-lo. Nada é gravado: o resultado é uma proposta
+        a ser aplicada com apply_topic_clusters.
+        """
+        max_llm_concurrency = max_llm_concurrency or int(os.getenv('BACKLOG_MAX_CONCURRENCY', 4))
+        min_similarity = float(os.getenv('CLUSTER_MIN_SIMILARITY', 0.1))
+        
+        note_ids = []
+        documents = []
+        cursor = None
+        while True:
+            query = db.session.query(Note.id, Note.content, NoteKeywordSignature.terms).outerjoin(
+                NoteKeywordSignature, NoteKeywordSignature.note_id == Note.id
+            ).filter(Note.user_id == user_id)
+            if not include_categorized:
+                query = query.filter(Note.category.is_(None))
+            if cursor:
+                query = query.filter(Note.id > cursor)
+            page = query.order_by(Note.id).limit(page_size).all()
+            if not page:
+                break
+            
+            for note_id, content, terms in page:
+                note_ids.append(note_id)
+                documents.append(json.loads(terms) if terms else term_frequencies(content))
+            cursor = page[-1].id
+        
+        if len(note_ids) < 2:
+            return {'success': True, 'clusters': [], 'unassigned_note_ids': note_ids, 'notes_seen': len(note_ids)}
+        
+        matrix, vocabulary = build_tfidf_matrix(documents)
+        if not vocabulary:
+            return {'success': True, 'clusters': [], 'unassigned_note_ids': note_ids, 'notes_seen': len(note_ids)}
+        
+        max_clusters = int(os.getenv('CLUSTER_MAX_K', 30))
+        k = n_clusters or suggest_cluster_count(len(note_ids), max_clusters)
+        model = MiniBatchKMeans(n_clusters=k).fit(matrix)
+        labels, similarities = model.predict(matrix)
+        
+        members = {}
+        unassigned = []
+        for note_id, label, similarity in zip(note_ids, labels, similarities):
+            if similarity < min_similarity:
+                unassigned.append(note_id)
+            else:
+                members.setdefault(int(label), []).append((float(similarity), note_id))
+        
+        clusters = []
+        for label, items in sorted(members.items()):
+            items.sort(reverse=True)
+            terms = top_terms(model.centers[label], vocabulary)
+            clusters.append({
+                'cluster_id': label,
+                'size': len(items),
+                'top_terms': terms,
+                'proposed_category': ' / '.join(term.capitalize() for term in terms[:3]),
+                'note_ids': [note_id for _, note_id in items],
+                'sample_note_ids': [note_id for _, note_id in items[:5]]
+            })
+        
+        if use_llm and clusters:
+            self._label_clusters(user_id, clusters, max_llm_concurrency)
+        
+        return {
+            'success': True,
+            'clusters': clusters,
+            'unassigned_note_ids': unassigned,
+            'notes_seen': len(note_ids)
+        }
+    
+    def _label_clusters(self, user_id: str, clusters: List[dict], max_concurrency: int):
+        """Nomeia cada cluster com uma chamada ao LLM (mais próximas do centro como exemplo)"""
+        existing_categories = sorted(cat.name for cat in Category.get_by_user(user_id))
+        
+        sample_ids = [note_id for cluster in clusters for note_id in cluster['sample_note_ids']]
+        contents = dict(db.session.query(Note.id, Note.content).filter(Note.id.in_(sample_ids)).all())
+        
+        def label_cluster(cluster):
+            return self.chatgpt.label_topic_cluster(
+                user_id=user_id,
+                top_terms=cluster['top_terms'],
+                sample_notes=[contents[note_id] for note_id in cluster['sample_note_ids'] if note_id in contents],
+                existing_categories=existing_categories
+            )
+        
+        for cluster, result, error in run_bounded(label_cluster, clusters, max_workers=max_concurrency):
+            if error or not result['success']:
+                continue
+            label = result['label']
+            if label.get('category'):
+                cluster['proposed_category'] = label['category']
+                cluster['description'] = label.get('description')
+                cluster['confidence'] = label.get('confidence')
+    
+    def apply_topic_clusters(self, user_id: str, assignments: Dict[str, List[str]],
+                             only_uncategorized: bool = True) -> dict:
+        """Aplica categorias propostas em lote ({categoria: [note_ids]})"""
+        try:
+            notes_categorized = 0
+            now = datetime.utcnow()
+            
+            for category_name, note_ids in assignments.items():
+                if not category_name or not note_ids:
+                    continue
+                category = Category.find_or_create_by_name(user_id, category_name, commit=False)
+                
+                query = Note.query.filter(Note.user_id == user_id, Note.id.in_(note_ids))
+                if only_uncategorized:
+                    query = query.filter(Note.category.is_(None))
+                notes_categorized += query.update(
+                    {'category': category.name, 'updated_at': now}, synchronize_session=False
+                )
+            
+            # Categorias aplicadas em lote entram no classificador local pelo retreino
+            if notes_categorized:
+                enqueue_classifier_training(user_id, commit=False)
+            
+            db.session.commit()
+            
+            return {
+                'success': True,
+                'notes_categorized': notes_categorized
+            }
+            
+        except Exception as e:
+            db.session.rollback()
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
     def find_related_notes(self, note_id: str) -> dict:
         """Encontra anotações relacionadas usando IA"""
         try:
@@ -296,33 +941,15 @@ class AIProcessor:
             if not note:
                 return {'success': False, 'error': 'Anotação não encontrada'}
             
-            # Busca outras anotações do usuário
-            other_notes = Note.query.filter(
-                Note.user_id == note.user_id,
-                Note.id != note.id
-            ).limit(50).all()  # Limita para performance
-            
-            if not other_notes:
-                return {'success': True, 'related_notes': []}
+            # Quase-duplicatas não entram como candidatas (a original já representa o conteúdo)
+            excluded = self.duplicates.related_exclusions(note)
             
-            # TODO: Implementar análise de similaridade com embeddings
-            # Por enquanto, busca por palavras-chave simples
+            # Busca por similaridade de embeddings sobre todo o acervo do usuário
+            related_notes = self._find_related_by_embeddings(note, exclude_ids=excluded)
             
-            keywords = self._extract_keywords(note.content)
-            related_notes = []
-            
-            for other_note in other_notes:
-                similarity_score = self._calculate_simple_similarity(
-                    note.content, other_note.content, keywords
-                )
-                
-                if similarity_score > 0.3:  # Threshold de similaridade
-                    related_notes.append({
-                        'note_id': other_note.id,
-                        'title': other_note.get_title(),
-                        'similarity_score': similarity_score,
-                        'category': other_note.category
-                    })
+            if related_notes is None:
+                # Sem vetores comparáveis (nota ou acervo sem embedding do modelo atual): BM25
+                related_notes = self._find_related_by_keywords(note, exclude_ids=excluded)
             
             # Ordena por similaridade
             related_notes.sort(key=lambda x: x['similarity_score'], reverse=True)
@@ -343,6 +970,46 @@ class AIProcessor:
                 'error': str(e)
             }
     
+    def _find_related_by_embeddings(self, note: Note, k: int = 10, exclude_ids: set = None) -> Optional[List[dict]]:
+        """Top-k por cosseno no índice vetorial; None se não há vetores comparáveis (usa BM25)"""
+        matches = self.embeddings.find_similar(note, k=k, exclude_ids=exclude_ids)
+        if matches is None:
+            return None
+        
+        min_score = float(os.getenv('RELATED_NOTES_MIN_SIMILARITY', 0.3))
+        scores = {note_id: score for note_id, score in matches if score >= min_score}
+        if not scores:
+            return []
+        
+        others = Note.query.filter(Note.id.in_(list(scores.keys()))).all()
+        return [{
+            'note_id': other.id,
+            'title': other.get_title(),
+            'similarity_score': round(scores[other.id], 4),
+            'category': other.category
+        } for other in others]
+    
+    def _find_related_by_keywords(self, note: Note, k: int = 10, exclude_ids: set = None) -> List[dict]:
+        """Top-k por BM25 no índice invertido de palavras-chave"""
+        if not NoteKeywordSignature.query.get(note.id):
+            self.keywords.index_note(note)
+        
+        min_score = float(os.getenv('RELATED_NOTES_MIN_KEYWORD_SCORE', 0.1))
+        scores = {
+            note_id: score for note_id, score in self.keywords.find_similar(note, k=k, exclude_ids=exclude_ids)
+            if score >= min_score
+        }
+        if not scores:
+            return []
+        
+        others = Note.query.filter(Note.id.in_(list(scores.keys()))).all()
+        return [{
+            'note_id': other.id,
+            'title': other.get_title(),
+            'similarity_score': round(scores[other.id], 4),
+            'category': other.category
+        } for other in others]
+    
     def _create_insights_from_analysis(self, note: Note, analysis: dict):
         """Cria insights baseados na análise do ChatGPT"""
         
@@ -382,45 +1049,9 @@ class AIProcessor:
             )
             db.session.add(topics_insight)
     
-    def _should_search_external_info(self, content: str) -> bool:
-        """Determina se deve buscar informações externas"""
-        # Palavras-chave que indicam necessidade de busca externa
-        search_keywords = [
-            'preço', 'custo', 'valor', 'mercado', 'tendência',
-            'notícia', 'evento', 'conferência', 'curso',
-            'empresa', 'startup', 'investimento', 'ação',
-            'tecnologia', 'ferramenta', 'app', 'software'
-        ]
-        
-        content_lower = content.lower()
-        return any(keyword in content_lower for keyword in search_keywords)
-    
     def _extract_keywords(self, text: str) -> List[str]:
-        """Extrai palavras-chave simples do texto"""
-        # Implementação simples - em produção usaria NLP mais avançado
-        words = text.lower().split()
-        
-        # Remove palavras comuns
-        stop_words = {
-            'o', 'a', 'os', 'as', 'um', 'uma', 'de', 'do', 'da', 'dos', 'das',
-            'em', 'no', 'na', 'nos', 'nas', 'para', 'por', 'com', 'sem',
-            'e', 'ou', 'mas', 'que', 'se', 'é', 'são', 'foi', 'foram'
-        }
-        
-        keywords = [word for word in words if len(word) > 3 and word not in stop_words]
-        return list(set(keywords))[:10]  # Top 10 palavras únicas
-    
-    def _calculate_simple_similarity(self, text1: str, text2: str, keywords: List[str]) -> float:
-        """Calcula similaridade simples entre textos"""
-        text2_lower = text2.lower()
-        
-        # Conta quantas palavras-chave aparecem no segundo texto
-        matches = sum(1 for keyword in keywords if keyword in text2_lower)
-        
-        if not keywords:
-            return 0.0
-        
-        return matches / len(keywords)
+        """Extrai as 10 palavras-chave mais frequentes (normalizadas e com stemming)"""
+        return top_keywords(text, limit=10)
     
     def get_processing_stats(self, user_id: str) -> dict:
         """Retorna estatísticas de processamento do usuário"""
@@ -435,21 +1066,14 @@ class AIProcessor:
             # Conta insights gerados
             total_insights = Insight.query.filter_by(user_id=user_id).count()
             
-            # Uso de APIs hoje
-            from src.models.user import UsageLog
-            today = datetime.now().date()
-            
-            chatgpt_usage_today = UsageLog.query.filter(
-                UsageLog.user_id == user_id,
-                UsageLog.api_type == 'chatgpt',
-                db.func.date(UsageLog.created_at) == today
-            ).count()
+            # Uso de APIs hoje (contadores diários)
+            chatgpt_usage_today = UserDailyUsage.get_count(user_id, 'chatgpt')
+            perplexity_usage_today = UserDailyUsage.get_count(user_id, 'perplexity')
+            ai_processing_today = UserDailyUsage.get_count(user_id, AI_QUOTA_API_TYPE)
             
-            perplexity_usage_today = UsageLog.query.filter(
-                UsageLog.user_id == user_id,
-                UsageLog.api_type == 'perplexity',
-                db.func.date(UsageLog.created_at) == today
-            ).count()
+            # Custos lidos das agregações diárias (sem varrer usage_logs)
+            today_start = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+            user = User.query.get(user_id)
             
             return {
                 'success': True,
@@ -462,8 +1086,18 @@ class AIProcessor:
                     'total_insights': total_insights,
                     'api_usage_today': {
                         'chatgpt': chatgpt_usage_today,
-                        'perplexity': perplexity_usage_today
-                    }
+                        'perplexity': perplexity_usage_today,
+                        'ai_processing': ai_processing_today
+                    },
+                    'cost_today': round(UsageRollup.get_cost(user_id, today_start), 6),
+                    'cost_month': round(UsageRollup.get_monthly_cost(user_id), 6),
+                    'monthly_spend_cap': user.monthly_spend_cap() if user else None,
+                    'response_cache': get_cache_stats(),
+                    'providers': get_resilience_stats(),
+                    'stage_routing': get_router_stats(),
+                    'prompts': get_prompt_stats(),
+                    'topic_cache': get_topic_cache_stats(),
+                    'batch': get_batch_stats()
                 }
             }
             
@@ -8,6 +8,14 @@ from flask_cors import CORS
 from src.models.user import db
 from src.models.note import Note, Insight, MediaFile
 from src.models.category import Category
+from src.models.job import ProcessingJob
+from src.models.cache import ResponseCacheEntry
+from src.models.embedding import NoteEmbedding
+from src.models.keyword_index import NoteKeywordSignature, NoteTerm
+from src.models.fingerprint import NoteFingerprint, NoteLSHBucket
+from src.models.classifier import CategoryClassifier, ClassifierDelta
+from src.models.summary import DailySummary
+from src.models.batch import BatchSubmission, BatchItem
 from src.routes.auth import auth_bp
 from src.routes.notes import notes_bp
 from src.routes.categories import categories_bp
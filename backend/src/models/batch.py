@@ -0,0 +1,104 @@
+from datetime import datetime
+import uuid
+from src.models.user import db
+
+class BatchSubmission(db.Model):
+    """Lote enviado à Batch API da OpenAI (processamento offline, mais barato)"""
+    __tablename__ = 'batch_submissions'
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    kind = db.Column(db.String(30), nullable=False)  # 'note_analysis' ou 'daily_summary'
+    # 'pending', 'submitted', 'in_progress', 'completed', 'applying', 'applied', 'failed', 'expired', 'cancelled'
+    status = db.Column(db.String(20), default='pending', nullable=False, index=True)
+    provider_batch_id = db.Column(db.String(100), nullable=True, unique=True)
+    input_file_id = db.Column(db.String(100), nullable=True)
+    output_file_id = db.Column(db.String(100), nullable=True)
+    error_file_id = db.Column(db.String(100), nullable=True)
+    request_count = db.Column(db.Integer, default=0, nullable=False)
+    applied_count = db.Column(db.Integer, default=0, nullable=False)
+    skipped_count = db.Column(db.Integer, default=0, nullable=False)
+    failed_count = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    submitted_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    applied_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    # Status em que o lote ainda depende do provedor
+    OPEN_STATUSES = ('submitted', 'in_progress')
+
+    items = db.relationship('BatchItem', backref='batch', lazy=True, cascade='all, delete-orphan')
+
+    def is_open(self):
+        """Verifica se o lote ainda aguarda o provedor"""
+        return self.status in self.OPEN_STATUSES
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'provider_batch_id': self.provider_batch_id,
+            'request_count': self.request_count,
+            'applied_count': self.applied_count,
+            'skipped_count': self.skipped_count,
+            'failed_count': self.failed_count,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat(),
+            'submitted_at': self.submitted_at.isoformat() if self.submitted_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'applied_at': self.applied_at.isoformat() if self.applied_at else None
+        }
+
+    def __repr__(self):
+        return f'<BatchSubmission {self.kind} {self.status} ({self.request_count} requisições)>'
+
+
+class BatchItem(db.Model):
+    """Requisição individual de um lote, identificada pelo custom_id enviado ao provedor"""
+    __tablename__ = 'batch_items'
+
+    batch_id = db.Column(db.String(36), db.ForeignKey('batch_submissions.id', ondelete='CASCADE'), primary_key=True)
+    custom_id = db.Column(db.String(100), primary_key=True)  # 'note:<id>' ou 'day:<user_id>:<data>'
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False, index=True)
+    note_id = db.Column(db.String(36), nullable=True, index=True)
+    target_date = db.Column(db.Date, nullable=True)
+    fingerprint = db.Column(db.String(64), nullable=False)  # sha256 da entrada no envio
+    estimated_cost = db.Column(db.Float, default=0.0, nullable=False)  # Reservado do teto mensal até a aplicação
+    status = db.Column(db.String(20), default='pending', nullable=False)  # 'pending', 'applied', 'skipped', 'failed'
+    error = db.Column(db.Text, nullable=True)
+    applied_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_batch_items_status_note', 'status', 'note_id'),
+    )
+
+    @staticmethod
+    def pending_for_note(note_id):
+        """Item ainda não aplicado da anotação, se ela estiver em um lote em andamento"""
+        return BatchItem.query.filter_by(note_id=note_id, status='pending').first()
+
+    @staticmethod
+    def pending_cost(user_id):
+        """Custo estimado dos itens do usuário ainda não aplicados (fora das agregações de uso)"""
+        return db.session.query(db.func.coalesce(db.func.sum(BatchItem.estimated_cost), 0.0)).filter(
+            BatchItem.user_id == user_id,
+            BatchItem.status == 'pending'
+        ).scalar()
+
+    def to_dict(self):
+        return {
+            'batch_id': self.batch_id,
+            'custom_id': self.custom_id,
+            'user_id': self.user_id,
+            'note_id': self.note_id,
+            'target_date': self.target_date.isoformat() if self.target_date else None,
+            'status': self.status,
+            'estimated_cost': self.estimated_cost,
+            'error': self.error,
+            'applied_at': self.applied_at.isoformat() if self.applied_at else None
+        }
+
+    def __repr__(self):
+        return f'<BatchItem {self.custom_id} {self.status}>'
@@ -0,0 +1,21 @@
+from datetime import datetime
+from src.models.user import db
+
+class ResponseCacheEntry(db.Model):
+    """Resposta de API de IA armazenada em cache (camada persistente)"""
+    __tablename__ = 'response_cache'
+
+    key = db.Column(db.String(64), primary_key=True)  # SHA-256 da requisição
+    namespace = db.Column(db.String(50), nullable=False, index=True)  # 'openai', 'perplexity'
+    value = db.Column(db.Text, nullable=False)  # JSON da resposta
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    last_accessed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    hits = db.Column(db.Integer, default=0, nullable=False)
+
+    def is_expired(self):
+        """Verifica se a entrada expirou"""
+        return datetime.utcnow() >= self.expires_at
+
+    def __repr__(self):
+        return f'<ResponseCacheEntry {self.namespace}:{self.key[:8]}>'
@@ -159,7 +159,7 @@ class Category(db.Model):
         return build_tree(root_categories)
 
     @staticmethod
-    def find_or_create_by_name(user_id, name, auto_create=True):
+    def find_or_create_by_name(user_id, name, auto_create=True, commit=True):
         """Encontra categoria por nome ou cria se não existir"""
         category = Category.query.filter(
             Category.user_id == user_id,
@@ -174,7 +174,10 @@ class Category(db.Model):
                 is_system_generated=True  # Marcada como gerada pelo sistema (IA)
             )
             db.session.add(category)
-            db.session.commit()
+            if commit:
+                db.session.commit()
+            else:
+                db.session.flush()
         
         return category
 
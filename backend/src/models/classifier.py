@@ -0,0 +1,55 @@
+from datetime import datetime
+import json
+from src.models.user import db
+
+class CategoryClassifier(db.Model):
+    """Classificador local de categorias de um usuário (naive Bayes serializado)"""
+    __tablename__ = 'category_classifiers'
+
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), primary_key=True)
+    model_data = db.Column(db.LargeBinary, nullable=False)  # JSON comprimido com zlib
+    num_features = db.Column(db.Integer, nullable=False)
+    trained_notes = db.Column(db.Integer, default=0, nullable=False)
+    num_categories = db.Column(db.Integer, default=0, nullable=False)
+    version = db.Column(db.Integer, default=0, nullable=False)  # Incrementada a cada atualização
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'num_features': self.num_features,
+            'trained_notes': self.trained_notes,
+            'num_categories': self.num_categories,
+            'version': self.version,
+            'model_size_bytes': len(self.model_data or b''),
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+    def __repr__(self):
+        return f'<CategoryClassifier for User {self.user_id}>'
+
+
+class ClassifierDelta(db.Model):
+    """Alteração pendente do classificador (notas aprendidas/esquecidas), ainda não incorporada ao modelo.
+
+    As requisições só inserem deltas; um job em segundo plano os incorpora
+    ao modelo serializado, na ordem do id.
+    """
+    __tablename__ = 'classifier_deltas'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)  # Ordem de aplicação
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False, index=True)
+    changes = db.Column(db.Text, nullable=False)  # JSON: [[termos, categoria, peso], ...]
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def get_changes(self):
+        """Retorna lista de (termos, categoria, peso)"""
+        return [tuple(change) for change in json.loads(self.changes)]
+
+    def set_changes(self, changes):
+        """Define alterações a partir de lista de (termos, categoria, peso)"""
+        self.changes = json.dumps([list(change) for change in changes], ensure_ascii=False)
+
+    def __repr__(self):
+        return f'<ClassifierDelta {self.id} for User {self.user_id}>'
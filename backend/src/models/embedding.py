@@ -0,0 +1,37 @@
+from datetime import datetime
+import numpy as np
+from src.models.user import db
+
+class NoteEmbedding(db.Model):
+    """Embedding de uma anotação armazenado como blob float32"""
+    __tablename__ = 'note_embeddings'
+
+    note_id = db.Column(db.String(36), db.ForeignKey('notes.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False, index=True)
+    model = db.Column(db.String(100), nullable=False)  # Provedor/modelo que gerou o vetor
+    dim = db.Column(db.Integer, nullable=False)
+    vector = db.Column(db.LargeBinary, nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False)  # Evita recalcular conteúdo inalterado
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def get_vector(self) -> np.ndarray:
+        """Retorna vetor como array float32"""
+        return np.frombuffer(self.vector, dtype=np.float32)
+
+    def set_vector(self, vector):
+        """Define vetor a partir de array/lista"""
+        array = np.asarray(vector, dtype=np.float32)
+        self.dim = int(array.shape[0])
+        self.vector = array.tobytes()
+
+    def to_dict(self):
+        return {
+            'note_id': self.note_id,
+            'user_id': self.user_id,
+            'model': self.model,
+            'dim': self.dim,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+    def __repr__(self):
+        return f'<NoteEmbedding {self.model} for Note {self.note_id}>'
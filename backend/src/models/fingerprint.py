@@ -0,0 +1,50 @@
+from datetime import datetime
+import numpy as np
+from src.models.user import db
+
+class NoteFingerprint(db.Model):
+    """Assinatura MinHash de uma anotação para detecção de quase-duplicatas"""
+    __tablename__ = 'note_fingerprints'
+
+    note_id = db.Column(db.String(36), db.ForeignKey('notes.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False, index=True)
+    signature = db.Column(db.LargeBinary, nullable=False)  # uint32 x num_perm
+    duplicate_of = db.Column(db.String(36), nullable=True, index=True)  # Nota original, se quase-duplicata
+    similarity = db.Column(db.Float, nullable=True)  # Jaccard estimado com a original
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def get_signature(self) -> np.ndarray:
+        """Retorna assinatura como array uint32"""
+        return np.frombuffer(self.signature, dtype=np.uint32)
+
+    def set_signature(self, signature):
+        """Define assinatura a partir de array"""
+        self.signature = np.asarray(signature, dtype=np.uint32).tobytes()
+
+    def to_dict(self):
+        return {
+            'note_id': self.note_id,
+            'duplicate_of': self.duplicate_of,
+            'similarity': self.similarity,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+    def __repr__(self):
+        return f'<NoteFingerprint for Note {self.note_id}>'
+
+
+class NoteLSHBucket(db.Model):
+    """Bucket LSH (por banda da assinatura MinHash) de uma anotação"""
+    __tablename__ = 'note_lsh_buckets'
+
+    note_id = db.Column(db.String(36), db.ForeignKey('notes.id', ondelete='CASCADE'), primary_key=True)
+    band = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
+    bucket = db.Column(db.String(16), nullable=False)  # Hash hexadecimal das linhas da banda
+
+    __table_args__ = (
+        db.Index('ix_note_lsh_buckets_lookup', 'user_id', 'band', 'bucket'),
+    )
+
+    def __repr__(self):
+        return f'<NoteLSHBucket band {self.band} for Note {self.note_id}>'
@@ -0,0 +1,261 @@
+from datetime import datetime, timedelta
+import uuid
+import json
+import random
+from src.models.user import db
+
+class ProcessingJob(db.Model):
+    """Job persistido da fila de processamento em background"""
+    __tablename__ = 'processing_jobs'
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False, index=True)
+    note_id = db.Column(db.String(36), db.ForeignKey('notes.id', ondelete='CASCADE'), nullable=True, index=True)
+    job_type = db.Column(db.String(50), nullable=False)  # 'process_note', ...
+    status = db.Column(db.String(20), default='queued', nullable=False)  # 'queued', 'running', 'succeeded', 'failed'
+    dedupe_key = db.Column(db.String(200), nullable=True, index=True)
+    payload = db.Column(db.Text, default='{}', nullable=False)  # JSON object
+    result = db.Column(db.Text, nullable=True)  # JSON object
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=5, nullable=False)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_by = db.Column(db.String(100), nullable=True)
+    locked_until = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_processing_jobs_status_run_after', 'status', 'run_after'),
+    )
+
+    # Backoff exponencial entre tentativas (segundos)
+    BACKOFF_BASE_SECONDS = 15
+    BACKOFF_MAX_SECONDS = 3600
+
+    def __init__(self, user_id, job_type, payload=None, note_id=None, dedupe_key=None, run_after=None, max_attempts=5):
+        self.user_id = user_id
+        self.job_type = job_type
+        self.note_id = note_id
+        self.dedupe_key = dedupe_key
+        self.status = 'queued'
+        self.attempts = 0
+        self.max_attempts = max_attempts
+        self.run_after = run_after or datetime.utcnow()
+        self.set_payload(payload or {})
+
+    def get_payload(self):
+        """Retorna payload como dicionário"""
+        try:
+            return json.loads(self.payload)
+        except:
+            return {}
+
+    def set_payload(self, payload_dict):
+        """Define payload a partir de dicionário"""
+        self.payload = json.dumps(payload_dict)
+
+    def get_result(self):
+        """Retorna resultado como dicionário"""
+        try:
+            return json.loads(self.result) if self.result else None
+        except:
+            return None
+
+    def is_finished(self):
+        """Verifica se o job terminou (com sucesso ou falha definitiva)"""
+        return self.status in ['succeeded', 'failed']
+
+    @staticmethod
+    def enqueue(user_id, job_type, payload=None, note_id=None, dedupe_key=None, run_after=None, max_attempts=5,
+                commit=True, dedupe_statuses=('queued', 'running')):
+        """Adiciona job à fila (reaproveita job com a mesma dedupe_key e status em dedupe_statuses)"""
+        if dedupe_key:
+            existing = ProcessingJob.query.filter(
+                ProcessingJob.dedupe_key == dedupe_key,
+                ProcessingJob.status.in_(list(dedupe_statuses))
+            ).first()
+            if existing:
+                return existing
+
+        job = ProcessingJob(
+            user_id=user_id,
+            job_type=job_type,
+            payload=payload,
+            note_id=note_id,
+            dedupe_key=dedupe_key,
+            run_after=run_after,
+            max_attempts=max_attempts
+        )
+        db.session.add(job)
+
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()
+
+        return job
+
+    @staticmethod
+    def claim_next(worker_id, lease_seconds=300, job_types=None, batch_size=10):
+        """Reivindica atomicamente o próximo job disponível para o worker.
+
+        A reivindicação é um compare-and-set sobre (status, attempts), portanto
+        é segura entre threads, processos e hosts que compartilham o banco.
+        Jobs em execução cujo lease expirou voltam a ser elegíveis.
+        """
+        now = datetime.utcnow()
+
+        query = db.session.query(
+            ProcessingJob.id, ProcessingJob.status, ProcessingJob.attempts
+        ).filter(
+            db.or_(
+                db.and_(ProcessingJob.status == 'queued', ProcessingJob.run_after <= now),
+                db.and_(ProcessingJob.status == 'running', ProcessingJob.locked_until < now)
+            ),
+            ProcessingJob.attempts < ProcessingJob.max_attempts
+        )
+
+        if job_types:
+            query = query.filter(ProcessingJob.job_type.in_(job_types))
+
+        candidates = query.order_by(ProcessingJob.run_after).limit(batch_size).all()
+        db.session.rollback()  # Encerra a transação de leitura antes do CAS
+
+        for job_id, status, attempts in candidates:
+            claimed = ProcessingJob.query.filter(
+                ProcessingJob.id == job_id,
+                ProcessingJob.status == status,
+                ProcessingJob.attempts == attempts
+            ).update({
+                'status': 'running',
+                'locked_by': worker_id,
+                'locked_until': now + timedelta(seconds=lease_seconds),
+                'attempts': attempts + 1,
+                'started_at': now,
+                'updated_at': now
+            }, synchronize_session=False)
+            db.session.commit()
+
+            if claimed:
+                return ProcessingJob.query.get(job_id)
+
+        return None
+
+    def has_running_duplicate(self):
+        """Verifica se outro job com a mesma dedupe_key está em execução com lease válido"""
+        if not self.dedupe_key:
+            return False
+        return ProcessingJob.query.filter(
+            ProcessingJob.dedupe_key == self.dedupe_key,
+            ProcessingJob.id != self.id,
+            ProcessingJob.status == 'running',
+            ProcessingJob.locked_until >= datetime.utcnow()
+        ).first() is not None
+
+    @staticmethod
+    def fail_expired():
+        """Marca como falha jobs com lease expirado que esgotaram as tentativas"""
+        now = datetime.utcnow()
+        failed = ProcessingJob.query.filter(
+            ProcessingJob.status == 'running',
+            ProcessingJob.locked_until < now,
+            ProcessingJob.attempts >= ProcessingJob.max_attempts
+        ).update({
+            'status': 'failed',
+            'last_error': 'Lease expirado após o número máximo de tentativas',
+            'finished_at': now,
+            'locked_by': None,
+            'locked_until': None,
+            'updated_at': now
+        }, synchronize_session=False)
+        db.session.commit()
+        return failed
+
+    def extend_lease(self, worker_id, lease_seconds=300):
+        """Renova o lease de um job longo; retorna False se o job foi perdido"""
+        now = datetime.utcnow()
+        renewed = ProcessingJob.query.filter(
+            ProcessingJob.id == self.id,
+            ProcessingJob.status == 'running',
+            ProcessingJob.locked_by == worker_id
+        ).update({
+            'locked_until': now + timedelta(seconds=lease_seconds),
+            'updated_at': now
+        }, synchronize_session=False)
+        db.session.commit()
+        return bool(renewed)
+
+    def mark_succeeded(self, worker_id, result=None):
+        """Conclui o job com sucesso (somente se o lease ainda pertence ao worker)"""
+        now = datetime.utcnow()
+        updated = ProcessingJob.query.filter(
+            ProcessingJob.id == self.id,
+            ProcessingJob.locked_by == worker_id
+        ).update({
+            'status': 'succeeded',
+            'result': json.dumps(result or {}),
+            'last_error': None,
+            'finished_at': now,
+            'locked_by': None,
+            'locked_until': None,
+            'updated_at': now
+        }, synchronize_session=False)
+        db.session.commit()
+        return bool(updated)
+
+    def mark_failed(self, worker_id, error_message, retryable=True):
+        """Registra falha; reagenda com backoff enquanto houver tentativas"""
+        now = datetime.utcnow()
+
+        if retryable and self.attempts < self.max_attempts:
+            values = {
+                'status': 'queued',
+                'run_after': now + timedelta(seconds=self.get_backoff_seconds()),
+            }
+        else:
+            values = {
+                'status': 'failed',
+                'finished_at': now,
+            }
+
+        values.update({
+            'last_error': error_message,
+            'locked_by': None,
+            'locked_until': None,
+            'updated_at': now
+        })
+
+        updated = ProcessingJob.query.filter(
+            ProcessingJob.id == self.id,
+            ProcessingJob.locked_by == worker_id
+        ).update(values, synchronize_session=False)
+        db.session.commit()
+        return bool(updated)
+
+    def get_backoff_seconds(self):
+        """Calcula atraso exponencial com jitter para a próxima tentativa"""
+        delay = min(self.BACKOFF_BASE_SECONDS * (2 ** max(self.attempts - 1, 0)), self.BACKOFF_MAX_SECONDS)
+        return delay * random.uniform(0.5, 1.0)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'note_id': self.note_id,
+            'job_type': self.job_type,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'run_after': self.run_after.isoformat() if self.run_after else None,
+            'last_error': self.last_error,
+            'result': self.get_result(),
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+    def __repr__(self):
+        return f'<ProcessingJob {self.job_type} {self.status} for User {self.user_id}>'
@@ -0,0 +1,46 @@
+from datetime import datetime
+import json
+from src.models.user import db
+
+class NoteKeywordSignature(db.Model):
+    """Assinatura de palavras-chave de uma anotação (calculada na escrita)"""
+    __tablename__ = 'note_keyword_signatures'
+
+    note_id = db.Column(db.String(36), db.ForeignKey('notes.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False, index=True)
+    terms = db.Column(db.Text, default='{}', nullable=False)  # JSON {termo: frequência}
+    length = db.Column(db.Integer, default=0, nullable=False)  # Total de termos da nota
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def get_terms(self):
+        """Retorna termos como dicionário"""
+        try:
+            return json.loads(self.terms)
+        except:
+            return {}
+
+    def set_terms(self, terms_dict):
+        """Define termos a partir de dicionário"""
+        self.terms = json.dumps(terms_dict, ensure_ascii=False)
+        self.length = sum(terms_dict.values())
+
+    def __repr__(self):
+        return f'<NoteKeywordSignature for Note {self.note_id}>'
+
+
+class NoteTerm(db.Model):
+    """Índice invertido (user_id, termo) -> anotação"""
+    __tablename__ = 'note_terms'
+
+    note_id = db.Column(db.String(36), db.ForeignKey('notes.id', ondelete='CASCADE'), primary_key=True)
+    term = db.Column(db.String(100), primary_key=True)
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
+    tf = db.Column(db.Integer, default=1, nullable=False)
+    doc_length = db.Column(db.Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_note_terms_user_term', 'user_id', 'term'),
+    )
+
+    def __repr__(self):
+        return f'<NoteTerm {self.term} for Note {self.note_id}>'
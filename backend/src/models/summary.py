@@ -0,0 +1,67 @@
+from datetime import datetime
+import uuid
+import json
+from src.models.user import db
+
+class DailySummary(db.Model):
+    """Resumo gerado (diário, semanal ou mensal), reutilizado enquanto suas fontes não mudam"""
+    __tablename__ = 'daily_summaries'
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
+    period = db.Column(db.String(10), default='day', nullable=False)  # 'day', 'week' ou 'month'
+    date = db.Column(db.Date, nullable=False)  # Início do período
+    fingerprint = db.Column(db.String(64), nullable=False)  # sha256 das fontes (notas ou resumos diários)
+    summary = db.Column(db.Text, nullable=False)  # JSON
+    notes_count = db.Column(db.Integer, default=0, nullable=False)
+    notes_omitted = db.Column(db.Integer, default=0, nullable=False)  # Notas fora da amostra (resumo parcial)
+    mode = db.Column(db.String(20), nullable=True)  # 'single_pass', 'map_reduce' ou 'batch'
+    tokens_used = db.Column(db.Integer, default=0, nullable=False)
+    cost = db.Column(db.Float, default=0.0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'period', 'date', name='uq_daily_summaries_user_period_date'),
+    )
+
+    def get_summary(self):
+        """Retorna resumo como dicionário"""
+        try:
+            return json.loads(self.summary)
+        except:
+            return {}
+
+    def set_summary(self, summary_dict):
+        """Define resumo a partir de dicionário"""
+        self.summary = json.dumps(summary_dict, ensure_ascii=False)
+
+    @staticmethod
+    def get_for_day(user_id, date):
+        """Busca resumo armazenado do usuário para o dia"""
+        return DailySummary.get_for_period(user_id, 'day', date)
+
+    @staticmethod
+    def get_for_period(user_id, period, date):
+        """Busca resumo armazenado do usuário para o período iniciado em date"""
+        return DailySummary.query.filter_by(user_id=user_id, period=period, date=date).first()
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'period': self.period,
+            'date': self.date.isoformat(),
+            'summary': self.get_summary(),
+            'notes_count': self.notes_count,
+            'notes_omitted': self.notes_omitted,
+            'partial': bool(self.notes_omitted),
+            'mode': self.mode,
+            'tokens_used': self.tokens_used,
+            'cost': self.cost,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+    def __repr__(self):
+        return f'<DailySummary {self.period} {self.date} for User {self.user_id}>'
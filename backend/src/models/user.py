@@ -1,11 +1,19 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from datetime import datetime, timedelta
+import os
 import uuid
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.exc import IntegrityError
 import json
 
 db = SQLAlchemy()
 
+# Contador diário usado na cota de IA dos usuários gratuitos
+AI_QUOTA_API_TYPE = 'ai_processing'
+
+# user_id das linhas de agregação global em usage_rollups
+GLOBAL_ROLLUP_USER = '*'
+
 class User(db.Model):
     __tablename__ = 'users'
     
@@ -58,15 +66,43 @@ class User(db.Model):
         """Verifica se usuário tem assinatura premium ativa"""
         return self.subscription_status in ['premium', 'premium_trial']
 
+    @staticmethod
+    def free_daily_ai_limit():
+        """Processamentos de IA por dia para usuários gratuitos"""
+        return int(os.getenv('FREE_DAILY_AI_LIMIT', 5))
+
     def can_use_ai_features(self):
         """Verifica se usuário pode usar features de IA"""
         if self.is_premium():
             return True
         
-        # Usuários gratuitos têm limite diário
-        from src.models.usage_log import UsageLog
-        today_usage = UsageLog.get_daily_usage(self.id)
-        return today_usage < 5  # Limite de 5 processamentos IA por dia
+        # Usuários gratuitos têm limite diário (leitura de uma linha indexada)
+        today_usage = UserDailyUsage.get_count(self.id, AI_QUOTA_API_TYPE)
+        return today_usage < self.free_daily_ai_limit()
+
+    def reserve_ai_usage(self):
+        """Reserva um processamento de IA do dia (atômico).
+        
+        Retorna o dia da reserva, para devolvê-la com release_ai_usage,
+        ou None se o limite diário foi atingido.
+        """
+        limit = None if self.is_premium() else self.free_daily_ai_limit()
+        return UserDailyUsage.try_reserve(self.id, AI_QUOTA_API_TYPE, limit)
+
+    def release_ai_usage(self, day):
+        """Devolve uma reserva de processamento que não chegou a ser usada"""
+        UserDailyUsage.release(self.id, AI_QUOTA_API_TYPE, day)
+
+    def monthly_spend_cap(self):
+        """Teto de gastos com IA no mês (USD); 0 desativa o teto"""
+        if self.is_premium():
+            return float(os.getenv('MONTHLY_SPEND_CAP_PREMIUM', 10.0))
+        return float(os.getenv('MONTHLY_SPEND_CAP_FREE', 0.5))
+
+    def within_spend_cap(self):
+        """Verifica se o gasto do mês (lido das agregações) está abaixo do teto"""
+        cap = self.monthly_spend_cap()
+        return cap <= 0 or UsageRollup.get_monthly_cost(self.id) < cap
 
     def to_dict(self, include_sensitive=False):
         """Converte usuário para dicionário"""
@@ -141,22 +177,30 @@ class UsageLog(db.Model):
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
-    api_type = db.Column(db.String(50), nullable=False)  # 'chatgpt', 'perplexity', etc.
+    api_type = db.Column(db.String(50), nullable=False)  # 'chatgpt', 'perplexity', 'embedding', etc.
     endpoint = db.Column(db.String(100), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     request_metadata = db.Column(db.Text, default='{}', nullable=False)
     tokens_used = db.Column(db.Integer, default=0, nullable=False)
     cost = db.Column(db.Float, default=0.0, nullable=False)
+    model = db.Column(db.String(100), nullable=True)
+    prompt_tokens = db.Column(db.Integer, default=0, nullable=False)
+    completion_tokens = db.Column(db.Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_usage_logs_user_created', 'user_id', 'created_at'),
+    )
 
     @staticmethod
     def get_daily_usage(user_id, api_type=None):
         """Retorna contagem de uso diário do usuário"""
-        from datetime import date
-        today = date.today()
+        start = datetime.combine(datetime.utcnow().date(), datetime.min.time())
         
+        # Intervalo em created_at (e não func.date) para usar o índice
         query = UsageLog.query.filter(
             UsageLog.user_id == user_id,
-            db.func.date(UsageLog.created_at) == today
+            UsageLog.created_at >= start,
+            UsageLog.created_at < start + timedelta(days=1)
         )
         
         if api_type:
@@ -165,19 +209,25 @@ class UsageLog(db.Model):
         return query.count()
 
     @staticmethod
-    def log_usage(user_id, api_type, endpoint=None, tokens_used=0, cost=0.0, metadata=None):
-        """Registra uso de API"""
-        log = UsageLog(
+    def log_usage(user_id, api_type, endpoint=None, tokens_used=0, cost=0.0, metadata=None,
+                  model=None, prompt_tokens=0, completion_tokens=0):
+        """Registra uso de API.
+        
+        O registro vai para o buffer de gravação em lote (conexão própria):
+        não faz commit na sessão atual.
+        """
+        from src.services.usage_buffer import get_usage_buffer
+        get_usage_buffer().add(
             user_id=user_id,
             api_type=api_type,
             endpoint=endpoint,
             tokens_used=tokens_used,
             cost=cost,
-            request_metadata=json.dumps(metadata or {})
+            metadata=metadata,
+            model=model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens
         )
-        db.session.add(log)
-        db.session.commit()
-        return log
 
     def get_metadata(self):
         """Retorna metadata como dicionário"""
@@ -194,6 +244,9 @@ class UsageLog(db.Model):
             'endpoint': self.endpoint,
             'created_at': self.created_at.isoformat(),
             'tokens_used': self.tokens_used,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'model': self.model,
             'cost': self.cost,
             'metadata': self.get_metadata()
         }
@@ -201,3 +254,259 @@ class UsageLog(db.Model):
     def __repr__(self):
         return f'<UsageLog {self.api_type} for User {self.user_id}>'
 
+
+class UserDailyUsage(db.Model):
+    """Contadores diários de uso por usuário e tipo de API"""
+    __tablename__ = 'user_daily_usage'
+
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)  # Dia em UTC
+    api_type = db.Column(db.String(50), primary_key=True)  # 'ai_processing', 'chatgpt', 'perplexity', etc.
+    requests = db.Column(db.Integer, default=0, nullable=False)
+    tokens_used = db.Column(db.Integer, default=0, nullable=False)
+    cost = db.Column(db.Float, default=0.0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    @staticmethod
+    def get_count(user_id, api_type, day=None):
+        """Requisições do usuário no dia para o tipo de API"""
+        count = db.session.query(UserDailyUsage.requests).filter_by(
+            user_id=user_id,
+            date=day or datetime.utcnow().date(),
+            api_type=api_type
+        ).scalar()
+        return count or 0
+
+    @staticmethod
+    def try_reserve(user_id, api_type, limit=None, day=None):
+        """Incrementa o contador se ainda abaixo do limite.
+        
+        Incremento condicional em um único UPDATE, em conexão própria e
+        confirmado na hora: requisições concorrentes não passam todas do
+        limite. Retorna o dia reservado ou None se o limite foi atingido.
+        """
+        day = day or datetime.utcnow().date()
+        table = UserDailyUsage.__table__
+        key = (table.c.user_id == user_id, table.c.date == day, table.c.api_type == api_type)
+        
+        for _ in range(2):
+            with db.engine.begin() as conn:
+                condition = key + ((table.c.requests < limit,) if limit is not None else ())
+                result = conn.execute(table.update().where(*condition).values(
+                    requests=table.c.requests + 1,
+                    updated_at=datetime.utcnow()
+                ))
+                if result.rowcount:
+                    return day
+                if conn.execute(db.select(table.c.requests).where(*key)).first() is not None:
+                    return None  # Limite atingido
+            
+            if limit is not None and limit <= 0:
+                return None
+            
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(table.insert().values(
+                        user_id=user_id,
+                        date=day,
+                        api_type=api_type,
+                        requests=1,
+                        tokens_used=0,
+                        cost=0.0,
+                        updated_at=datetime.utcnow()
+                    ))
+                return day
+            except IntegrityError:
+                continue  # Outra requisição criou a linha: tenta o UPDATE de novo
+        
+        return None
+
+    @staticmethod
+    def release(user_id, api_type, day):
+        """Desfaz uma reserva (chamada não realizada ou sem resultado)"""
+        table = UserDailyUsage.__table__
+        with db.engine.begin() as conn:
+            conn.execute(table.update().where(
+                table.c.user_id == user_id,
+                table.c.date == day,
+                table.c.api_type == api_type,
+                table.c.requests > 0
+            ).values(requests=table.c.requests - 1, updated_at=datetime.utcnow()))
+
+    @staticmethod
+    def add_usage(conn, usage_rows):
+        """Soma registros de uso (dicionários de UsageLog) aos contadores, na conexão dada"""
+        totals = {}
+        for row in usage_rows:
+            key = (row['user_id'], row['created_at'].date(), row['api_type'])
+            requests, tokens, cost = totals.get(key, (0, 0, 0.0))
+            totals[key] = (requests + 1, tokens + (row['tokens_used'] or 0), cost + (row['cost'] or 0.0))
+        
+        table = UserDailyUsage.__table__
+        now = datetime.utcnow()
+        for (user_id, day, api_type), (requests, tokens, cost) in totals.items():
+            result = conn.execute(table.update().where(
+                table.c.user_id == user_id,
+                table.c.date == day,
+                table.c.api_type == api_type
+            ).values(
+                requests=table.c.requests + requests,
+                tokens_used=table.c.tokens_used + tokens,
+                cost=table.c.cost + cost,
+                updated_at=now
+            ))
+            if not result.rowcount:
+                conn.execute(table.insert().values(
+                    user_id=user_id,
+                    date=day,
+                    api_type=api_type,
+                    requests=requests,
+                    tokens_used=tokens,
+                    cost=cost,
+                    updated_at=now
+                ))
+
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'date': self.date.isoformat(),
+            'api_type': self.api_type,
+            'requests': self.requests,
+            'tokens_used': self.tokens_used,
+            'cost': self.cost
+        }
+
+    def __repr__(self):
+        return f'<UserDailyUsage {self.api_type} {self.date} for User {self.user_id}>'
+
+
+class UsageRollup(db.Model):
+    """Totais de uso por hora e por dia, por usuário e globais.
+
+    Mantidos incrementalmente na mesma transação que grava os registros de
+    uso; consultas de custo e o teto mensal leem daqui em vez de varrer
+    usage_logs.
+    """
+    __tablename__ = 'usage_rollups'
+
+    period = db.Column(db.String(10), primary_key=True)  # 'hour', 'day'
+    bucket_start = db.Column(db.DateTime, primary_key=True)  # Início do período em UTC
+    user_id = db.Column(db.String(36), primary_key=True)  # GLOBAL_ROLLUP_USER = todos os usuários
+    api_type = db.Column(db.String(50), primary_key=True)
+    model = db.Column(db.String(100), primary_key=True, default='')
+    requests = db.Column(db.Integer, default=0, nullable=False)
+    prompt_tokens = db.Column(db.Integer, default=0, nullable=False)
+    completion_tokens = db.Column(db.Integer, default=0, nullable=False)
+    tokens_used = db.Column(db.Integer, default=0, nullable=False)
+    cost = db.Column(db.Float, default=0.0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_usage_rollups_user_period', 'user_id', 'period', 'bucket_start'),
+    )
+
+    PERIODS = ('hour', 'day')
+
+    @staticmethod
+    def bucket_for(period, moment):
+        """Início do período (hora ou dia) que contém o instante"""
+        if period == 'hour':
+            return moment.replace(minute=0, second=0, microsecond=0)
+        return datetime.combine(moment.date(), datetime.min.time())
+
+    @staticmethod
+    def add_usage(conn, usage_rows):
+        """Soma registros de uso às agregações por hora/dia, do usuário e globais"""
+        totals = {}
+        for row in usage_rows:
+            for period in UsageRollup.PERIODS:
+                bucket = UsageRollup.bucket_for(period, row['created_at'])
+                for user_id in (row['user_id'], GLOBAL_ROLLUP_USER):
+                    key = (period, bucket, user_id, row['api_type'], row.get('model') or '')
+                    current = totals.get(key, (0, 0, 0, 0, 0.0))
+                    totals[key] = (
+                        current[0] + 1,
+                        current[1] + (row.get('prompt_tokens') or 0),
+                        current[2] + (row.get('completion_tokens') or 0),
+                        current[3] + (row['tokens_used'] or 0),
+                        current[4] + (row['cost'] or 0.0)
+                    )
+
+        table = UsageRollup.__table__
+        now = datetime.utcnow()
+        for (period, bucket, user_id, api_type, model), values in totals.items():
+            requests, prompt_tokens, completion_tokens, tokens, cost = values
+            result = conn.execute(table.update().where(
+                table.c.period == period,
+                table.c.bucket_start == bucket,
+                table.c.user_id == user_id,
+                table.c.api_type == api_type,
+                table.c.model == model
+            ).values(
+                requests=table.c.requests + requests,
+                prompt_tokens=table.c.prompt_tokens + prompt_tokens,
+                completion_tokens=table.c.completion_tokens + completion_tokens,
+                tokens_used=table.c.tokens_used + tokens,
+                cost=table.c.cost + cost,
+                updated_at=now
+            ))
+            if not result.rowcount:
+                conn.execute(table.insert().values(
+                    period=period,
+                    bucket_start=bucket,
+                    user_id=user_id,
+                    api_type=api_type,
+                    model=model,
+                    requests=requests,
+                    prompt_tokens=prompt_tokens,
+                    completion_tokens=completion_tokens,
+                    tokens_used=tokens,
+                    cost=cost,
+                    updated_at=now
+                ))
+
+    @staticmethod
+    def get_cost(user_id, start, end=None):
+        """Custo do usuário (ou global) entre start e end, pelas agregações diárias"""
+        query = db.session.query(db.func.coalesce(db.func.sum(UsageRollup.cost), 0.0)).filter(
+            UsageRollup.user_id == user_id,
+            UsageRollup.period == 'day',
+            UsageRollup.bucket_start >= start
+        )
+        if end is not None:
+            query = query.filter(UsageRollup.bucket_start < end)
+        return float(query.scalar() or 0.0)
+
+    @staticmethod
+    def get_monthly_cost(user_id):
+        """Custo do usuário no mês corrente (UTC)"""
+        month_start = datetime.combine(datetime.utcnow().date().replace(day=1), datetime.min.time())
+        return UsageRollup.get_cost(user_id, month_start)
+
+    @staticmethod
+    def get_series(user_id, period='day', since=None):
+        """Linhas de agregação do usuário (ou globais) desde a data dada"""
+        query = UsageRollup.query.filter(
+            UsageRollup.user_id == user_id,
+            UsageRollup.period == period
+        )
+        if since is not None:
+            query = query.filter(UsageRollup.bucket_start >= since)
+        return query.order_by(UsageRollup.bucket_start, UsageRollup.api_type, UsageRollup.model).all()
+
+    def to_dict(self):
+        return {
+            'period': self.period,
+            'bucket_start': self.bucket_start.isoformat(),
+            'user_id': self.user_id,
+            'api_type': self.api_type,
+            'model': self.model or None,
+            'requests': self.requests,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'tokens_used': self.tokens_used,
+            'cost': round(self.cost, 6)
+        }
+
+    def __repr__(self):
+        return f'<UsageRollup {self.period} {self.bucket_start} {self.api_type} for User {self.user_id}>'
@@ -1,7 +1,16 @@
-from flask import Blueprint, request, jsonify
-from src.services.ai_processor import AIProcessor
+import math
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from src.controllers.ai_processor import AIProcessor
 from src.services.chatgpt_service import ChatGPTService
 from src.services.perplexity_service import PerplexityService
+from src.services.job_queue import enqueue_note_processing, enqueue_classifier_training
+from src.services.category_classifier import get_classifier_service
+from src.services.streaming import sse_event, iter_progress
+from src.models.job import ProcessingJob
+from src.models.classifier import CategoryClassifier
+from src.models.user import UsageRollup
 from src.routes.auth import token_required
 
 ai_bp = Blueprint('ai', __name__)
@@ -9,8 +18,49 @@ ai_processor = AIProcessor()
 chatgpt_service = ChatGPTService()
 perplexity_service = PerplexityService()
 
+def _wants_stream(data: dict) -> bool:
+    """Modo SSE: ?stream=true, {"stream": true} ou Accept: text/event-stream"""
+    return (
+        bool((data or {}).get('stream'))
+        or request.args.get('stream', 'false').lower() == 'true'
+        or 'text/event-stream' in request.headers.get('Accept', '')
+    )
+
+def spend_cap_required(f):
+    """Bloqueia chamadas pagas quando o usuário atingiu o teto mensal de gastos"""
+    @wraps(f)
+    def decorated(current_user, *args, **kwargs):
+        if not current_user.within_spend_cap():
+            return jsonify({
+                'error': 'Limite mensal de gastos com IA atingido',
+                'monthly_spend_cap': current_user.monthly_spend_cap()
+            }), 429
+        return f(current_user, *args, **kwargs)
+    return decorated
+
+def _failure_response(result: dict, status: int = 500):
+    """Resposta de erro de um serviço: provedor indisponível (circuito aberto) vira 503 com Retry-After"""
+    if result.get('provider_unavailable'):
+        response = jsonify({'error': result['error'], 'provider_unavailable': True})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(max(1, math.ceil(result.get('retry_after') or 30)))
+        return response
+    return jsonify({'error': result['error']}), status
+
+def _sse_response(events):
+    """Resposta Server-Sent Events a partir de um gerador de eventos formatados"""
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Evita buffering em proxies (nginx)
+        }
+    )
+
 @ai_bp.route('/process-note/<note_id>', methods=['POST'])
 @token_required
+@spend_cap_required
 def process_note(current_user, note_id):
     """Processa uma anotação específica com IA"""
     try:
@@ -24,6 +74,32 @@ def process_note(current_user, note_id):
         # Obtém preferências do usuário
         user_preferences = current_user.get_preferences()
         
+        # Modo assíncrono: agenda na fila e retorna imediatamente
+        data = request.get_json(silent=True) or {}
+        if data.get('async') or request.args.get('async', 'false').lower() == 'true':
+            job = enqueue_note_processing(note, user_preferences)
+            return jsonify({
+                'message': 'Processamento agendado',
+                'job': job.to_dict()
+            }), 202
+        
+        # Modo streaming: eventos de progresso por etapa e resultado final
+        if _wants_stream(data):
+            def events():
+                yield sse_event('started', {'note_id': note_id})
+                for kind, value in iter_progress(ai_processor.process_note, note_id, user_preferences):
+                    if kind == 'progress':
+                        yield sse_event('stage', value)
+                    elif kind == 'result' and value['success']:
+                        yield sse_event('done', {
+                            'message': 'Anotação processada com sucesso',
+                            'results': value['results']
+                        })
+                    else:
+                        yield sse_event('error', {'error': value['error'] if kind == 'result' else value})
+            
+            return _sse_response(events())
+        
         # Processa com IA
         result = ai_processor.process_note(note_id, user_preferences)
         
@@ -32,36 +108,100 @@ def process_note(current_user, note_id):
                 'message': 'Anotação processada com sucesso',
                 'results': result['results']
             }), 200
+        elif result.get('batch_pending'):
+            return jsonify({'error': result['error']}), 409
         else:
-            return jsonify({'error': result['error']}), 500
+            return _failure_response(result)
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@ai_bp.route('/jobs/<job_id>', methods=['GET'])
+@token_required
+def get_job_status(current_user, job_id):
+    """Retorna status de um job de processamento em background"""
+    try:
+        job = ProcessingJob.query.filter_by(id=job_id, user_id=current_user.id).first()
+        
+        if not job:
+            return jsonify({'error': 'Job não encontrado'}), 404
+        
+        return jsonify({'job': job.to_dict()}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @ai_bp.route('/process-daily', methods=['POST'])
 @token_required
+@spend_cap_required
 def process_daily_notes(current_user):
     """Processa anotações do dia e gera resumo"""
     try:
         data = request.get_json() or {}
         date = data.get('date')  # Formato YYYY-MM-DD, opcional
+        force = bool(data.get('force', False))  # Ignora o resumo armazenado
         
-        result = ai_processor.process_daily_notes(current_user.id, date)
+        result = ai_processor.process_daily_notes(current_user.id, date, force=force)
         
         if result['success']:
             return jsonify({
                 'message': 'Processamento diário concluído',
                 'summary': result.get('summary'),
-                'notes_processed': result.get('notes_processed', 0)
+                'notes_processed': result.get('notes_processed', 0),
+                'notes_omitted': result.get('notes_omitted', 0),
+                'chunks_failed': result.get('chunks_failed', 0),
+                'partial': result.get('partial', False),
+                'cached': result.get('cached', False)
             }), 200
         else:
-            return jsonify({'error': result['error']}), 500
+            return _failure_response(result)
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _period_summary_response(current_user, period):
+    """Resposta comum dos resumos semanal e mensal"""
+    try:
+        date = request.args.get('date')  # Qualquer dia do período (YYYY-MM-DD), opcional
+        force = request.args.get('force', 'false').lower() == 'true'
+        
+        result = ai_processor.build_period_summary(current_user.id, period, date, force=force)
+        
+        if result['success']:
+            return jsonify({
+                'period': result.get('period', period),
+                'start_date': result.get('start_date'),
+                'end_date': result.get('end_date'),
+                'summary': result.get('summary'),
+                'days_summarized': result.get('days_summarized', 0),
+                'days_generated': result.get('days_generated', 0),
+                'days_failed': result.get('days_failed', []),
+                'notes_processed': result.get('notes_processed', 0),
+                'cached': result.get('cached', False)
+            }), 200
+        else:
+            return _failure_response(result)
+            
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@ai_bp.route('/summaries/weekly', methods=['GET'])
+@token_required
+@spend_cap_required
+def weekly_summary(current_user):
+    """Resumo da semana, combinando os resumos diários"""
+    return _period_summary_response(current_user, 'week')
+
+@ai_bp.route('/summaries/monthly', methods=['GET'])
+@token_required
+@spend_cap_required
+def monthly_summary(current_user):
+    """Resumo do mês, combinando os resumos diários"""
+    return _period_summary_response(current_user, 'month')
+
 @ai_bp.route('/categorize-notes', methods=['POST'])
 @token_required
+@spend_cap_required
 def categorize_notes(current_user):
     """Categoriza anotações sem categoria"""
     try:
@@ -78,11 +218,168 @@ def categorize_notes(current_user):
                 'details': result.get('categorization_details')
             }), 200
         else:
-            return jsonify({'error': result['error']}), 500
+            return _failure_response(result)
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@ai_bp.route('/categorize-backlog', methods=['POST'])
+@token_required
+@spend_cap_required
+def categorize_backlog(current_user):
+    """Agenda categorização de todo o backlog de anotações sem categoria"""
+    try:
+        data = request.get_json() or {}
+        
+        try:
+            max_concurrency = int(data.get('max_concurrency') or 4)
+            chunk_token_budget = int(data['chunk_token_budget']) if data.get('chunk_token_budget') else None
+        except (TypeError, ValueError):
+            return jsonify({'error': 'max_concurrency e chunk_token_budget devem ser inteiros'}), 400
+        if max_concurrency < 1 or (chunk_token_budget is not None and chunk_token_budget < 1):
+            return jsonify({'error': 'max_concurrency e chunk_token_budget devem ser positivos'}), 400
+        
+        job = ProcessingJob.enqueue(
+            user_id=current_user.id,
+            job_type='categorize_backlog',
+            payload={
+                'chunk_token_budget': chunk_token_budget,
+                'max_concurrency': min(max_concurrency, 8)
+            },
+            dedupe_key=f"categorize_backlog:{current_user.id}"
+        )
+        
+        return jsonify({
+            'message': 'Categorização do backlog agendada',
+            'job': job.to_dict()
+        }), 202
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@ai_bp.route('/topic-clusters', methods=['POST'])
+@token_required
+@spend_cap_required
+def cluster_topics(current_user):
+    """Agenda agrupamento das anotações por assunto para propor categorias"""
+    try:
+        data = request.get_json() or {}
+        
+        n_clusters = data.get('n_clusters')
+        if n_clusters is not None:
+            try:
+                n_clusters = int(n_clusters)
+            except (TypeError, ValueError):
+                n_clusters = None
+            if n_clusters is None or not (2 <= n_clusters <= 100):
+                return jsonify({'error': 'n_clusters deve estar entre 2 e 100'}), 400
+        
+        job = ProcessingJob.enqueue(
+            user_id=current_user.id,
+            job_type='cluster_topics',
+            payload={
+                'n_clusters': n_clusters,
+                'use_llm': bool(data.get('use_llm', True)),
+                'include_categorized': bool(data.get('include_categorized', False))
+            },
+            dedupe_key=f"cluster_topics:{current_user.id}"
+        )
+        
+        return jsonify({
+            'message': 'Agrupamento por assunto agendado',
+            'job': job.to_dict()
+        }), 202
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@ai_bp.route('/topic-clusters/<job_id>/apply', methods=['POST'])
+@token_required
+def apply_topic_clusters(current_user, job_id):
+    """Aplica as categorias propostas por um job de agrupamento"""
+    try:
+        data = request.get_json() or {}
+        
+        job = ProcessingJob.query.filter_by(
+            id=job_id,
+            user_id=current_user.id,
+            job_type='cluster_topics'
+        ).first()
+        
+        if not job:
+            return jsonify({'error': 'Job não encontrado'}), 404
+        
+        if job.status != 'succeeded':
+            return jsonify({'error': 'Agrupamento ainda não concluído'}), 409
+        
+        clusters = {cluster['cluster_id']: cluster for cluster in (job.get_result() or {}).get('clusters', [])}
+        
+        # Sem seleção explícita aplica todas as propostas; categoria vazia ignora o cluster
+        selection = data.get('clusters')
+        if selection is None:
+            selection = [{'cluster_id': cluster_id} for cluster_id in clusters]
+        elif not isinstance(selection, list) or not all(isinstance(item, dict) for item in selection):
+            return jsonify({'error': 'clusters deve ser uma lista de objetos com cluster_id'}), 400
+        
+        assignments = {}
+        for item in selection:
+            cluster = clusters.get(item.get('cluster_id'))
+            if not cluster:
+                continue
+            category_name = item.get('category', cluster['proposed_category'])
+            if category_name:
+                assignments.setdefault(category_name, []).extend(cluster['note_ids'])
+        
+        result = ai_processor.apply_topic_clusters(
+            current_user.id,
+            assignments,
+            only_uncategorized=not data.get('overwrite', False)
+        )
+        
+        if result['success']:
+            return jsonify({
+                'message': 'Categorias aplicadas',
+                'notes_categorized': result['notes_categorized']
+            }), 200
+        else:
+            return _failure_response(result)
+            
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@ai_bp.route('/classifier', methods=['GET'])
+@token_required
+def get_classifier_status(current_user):
+    """Retorna estado do classificador local de categorias"""
+    try:
+        record = CategoryClassifier.query.get(current_user.id)
+        classifier = get_classifier_service()
+        
+        return jsonify({
+            'classifier': record.to_dict() if record else None,
+            'confidence_threshold': classifier.confidence_threshold,
+            'min_training_notes': classifier.min_training_notes,
+            'active': bool(record and record.trained_notes >= classifier.min_training_notes)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@ai_bp.route('/classifier/train', methods=['POST'])
+@token_required
+def train_classifier(current_user):
+    """Agenda retreino do classificador local com as anotações já categorizadas"""
+    try:
+        job = enqueue_classifier_training(current_user.id)
+        
+        return jsonify({
+            'message': 'Treino do classificador agendado',
+            'job': job.to_dict()
+        }), 202
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @ai_bp.route('/find-related/<note_id>', methods=['GET'])
 @token_required
 def find_related_notes(current_user, note_id):
@@ -102,13 +399,52 @@ def find_related_notes(current_user, note_id):
                 'related_notes': result['related_notes']
             }), 200
         else:
-            return jsonify({'error': result['error']}), 500
+            return _failure_response(result)
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@ai_bp.route('/embeddings/backfill', methods=['POST'])
+@token_required
+def backfill_embeddings(current_user):
+    """Agenda cálculo de embeddings de todas as anotações do usuário"""
+    try:
+        job = ProcessingJob.enqueue(
+            user_id=current_user.id,
+            job_type='embed_backlog',
+            dedupe_key=f"embed_backlog:{current_user.id}"
+        )
+        
+        return jsonify({
+            'message': 'Cálculo de embeddings agendado',
+            'job': job.to_dict()
+        }), 202
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@ai_bp.route('/keywords/backfill', methods=['POST'])
+@token_required
+def backfill_keywords(current_user):
+    """Agenda indexação de palavras-chave das anotações antigas do usuário"""
+    try:
+        job = ProcessingJob.enqueue(
+            user_id=current_user.id,
+            job_type='keyword_backlog',
+            dedupe_key=f"keyword_backlog:{current_user.id}"
+        )
+        
+        return jsonify({
+            'message': 'Indexação de palavras-chave agendada',
+            'job': job.to_dict()
+        }), 202
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @ai_bp.route('/search-external', methods=['POST'])
 @token_required
+@spend_cap_required
 def search_external_info(current_user):
     """Busca informações externas sobre um tópico"""
     try:
@@ -120,6 +456,30 @@ def search_external_info(current_user):
         query = data['query']
         search_focus = data.get('focus')
         
+        # Modo streaming: tokens da resposta à medida que chegam
+        if _wants_stream(data):
+            user_id = current_user.id
+            
+            def events():
+                for kind, value in perplexity_service.search_related_information_stream(
+                    user_id=user_id,
+                    note_content=query,
+                    search_focus=search_focus
+                ):
+                    if kind == 'delta':
+                        yield sse_event('delta', {'text': value})
+                    elif value['success']:
+                        yield sse_event('done', {
+                            'information': value['information'],
+                            'citations': value['citations'],
+                            'tokens_used': value['tokens_used'],
+                            'cost': value['cost']
+                        })
+                    else:
+                        yield sse_event('error', {'error': value['error']})
+            
+            return _sse_response(events())
+        
         result = perplexity_service.search_related_information(
             user_id=current_user.id,
             note_content=query,
@@ -134,13 +494,14 @@ def search_external_info(current_user):
                 'cost': result['cost']
             }), 200
         else:
-            return jsonify({'error': result['error']}), 500
+            return _failure_response(result)
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @ai_bp.route('/find-events', methods=['POST'])
 @token_required
+@spend_cap_required
 def find_events(current_user):
     """Busca eventos relacionados a um tópico"""
     try:
@@ -166,13 +527,14 @@ def find_events(current_user):
                 'cost': result['cost']
             }), 200
         else:
-            return jsonify({'error': result['error']}), 500
+            return _failure_response(result)
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @ai_bp.route('/suggest-tools', methods=['POST'])
 @token_required
+@spend_cap_required
 def suggest_tools(current_user):
     """Sugere ferramentas e apps para um tópico"""
     try:
@@ -198,13 +560,14 @@ def suggest_tools(current_user):
                 'cost': result['cost']
             }), 200
         else:
-            return jsonify({'error': result['error']}), 500
+            return _failure_response(result)
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @ai_bp.route('/market-insights', methods=['POST'])
 @token_required
+@spend_cap_required
 def get_market_insights(current_user):
     """Obtém insights de mercado sobre um tópico"""
     try:
@@ -230,13 +593,14 @@ def get_market_insights(current_user):
                 'cost': result['cost']
             }), 200
         else:
-            return jsonify({'error': result['error']}), 500
+            return _failure_response(result)
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @ai_bp.route('/fact-check', methods=['POST'])
 @token_required
+@spend_cap_required
 def fact_check(current_user):
     """Verifica veracidade de uma informação"""
     try:
@@ -260,13 +624,14 @@ def fact_check(current_user):
                 'cost': result['cost']
             }), 200
         else:
-            return jsonify({'error': result['error']}), 500
+            return _failure_response(result)
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @ai_bp.route('/analyze-text', methods=['POST'])
 @token_required
+@spend_cap_required
 def analyze_text(current_user):
     """Analisa texto livre com ChatGPT"""
     try:
@@ -278,6 +643,29 @@ def analyze_text(current_user):
         text = data['text']
         user_preferences = current_user.get_preferences()
         
+        # Modo streaming: tokens da resposta à medida que chegam
+        if _wants_stream(data):
+            user_id = current_user.id
+            
+            def events():
+                for kind, value in chatgpt_service.analyze_note_stream(
+                    user_id=user_id,
+                    note_content=text,
+                    user_preferences=user_preferences
+                ):
+                    if kind == 'delta':
+                        yield sse_event('delta', {'text': value})
+                    elif value['success']:
+                        yield sse_event('done', {
+                            'analysis': value['analysis'],
+                            'tokens_used': value['tokens_used'],
+                            'cost': value['cost']
+                        })
+                    else:
+                        yield sse_event('error', {'error': value['error']})
+            
+            return _sse_response(events())
+        
         result = chatgpt_service.analyze_note(
             user_id=current_user.id,
             note_content=text,
@@ -291,13 +679,14 @@ def analyze_text(current_user):
                 'cost': result['cost']
             }), 200
         else:
-            return jsonify({'error': result['error']}), 500
+            return _failure_response(result)
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @ai_bp.route('/extract-tasks', methods=['POST'])
 @token_required
+@spend_cap_required
 def extract_tasks(current_user):
     """Extrai tarefas e prazos de um texto"""
     try:
@@ -320,7 +709,7 @@ def extract_tasks(current_user):
                 'cost': result['cost']
             }), 200
         else:
-            return jsonify({'error': result['error']}), 500
+            return _failure_response(result)
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -335,11 +724,37 @@ def get_ai_stats(current_user):
         if result['success']:
             return jsonify(result['stats']), 200
         else:
-            return jsonify({'error': result['error']}), 500
+            return _failure_response(result)
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@ai_bp.route('/usage/costs', methods=['GET'])
+@token_required
+def get_usage_costs(current_user):
+    """Custos de IA do usuário por hora ou por dia (lidos das agregações)"""
+    try:
+        period = request.args.get('period', 'day')
+        if period not in UsageRollup.PERIODS:
+            return jsonify({'error': 'period deve ser hour ou day'}), 400
+        
+        days = min(max(request.args.get('days', 30, type=int), 1), 366)
+        since = UsageRollup.bucket_for(period, datetime.utcnow() - timedelta(days=days - 1))
+        
+        rows = UsageRollup.get_series(current_user.id, period, since)
+        
+        return jsonify({
+            'period': period,
+            'since': since.isoformat(),
+            'rollups': [row.to_dict() for row in rows],
+            'total_cost': round(sum(row.cost for row in rows), 6),
+            'month_to_date': round(UsageRollup.get_monthly_cost(current_user.id), 6),
+            'monthly_spend_cap': current_user.monthly_spend_cap()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @ai_bp.route('/test-connections', methods=['GET'])
 @token_required
 def test_ai_connections(current_user):
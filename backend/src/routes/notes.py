@@ -3,7 +3,12 @@ from datetime import datetime
 from src.models.user import db
 from src.models.note import Note, Insight, MediaFile
 from src.models.category import Category
+from src.models.job import ProcessingJob
+from src.models.fingerprint import NoteFingerprint
 from src.routes.auth import token_required
+from src.services.note_indexing import ingest_note, index_note_on_write, remove_notes_from_indexes
+from src.services.category_classifier import get_classifier_service, note_terms
+from src.services.job_queue import enqueue_classifier_training
 
 notes_bp = Blueprint('notes', __name__)
 
@@ -91,13 +96,17 @@ def create_note(current_user):
         )
         
         db.session.add(note)
-        db.session.commit()
+        db.session.flush()
         
-        # TODO: Adicionar à fila de processamento IA
+        # Indexa e agenda processamento IA na mesma transação da anotação
+        # (quase-duplicatas reaproveitam os resultados da original)
+        job = ingest_note(note)
+        db.session.commit()
         
         return jsonify({
             'message': 'Anotação criada com sucesso',
-            'note': note.to_dict()
+            'note': note.to_dict(),
+            'job_id': job.id if job else None
         }), 201
         
     except Exception as e:
@@ -143,6 +152,10 @@ def update_note(current_user, note_id):
         if not data:
             return jsonify({'error': 'Dados são obrigatórios'}), 400
         
+        # Rótulo e termos antes da edição, para corrigir o classificador local
+        learned_category = note.category if note.get_metadata().get('category_source') != 'classifier' else None
+        previous_terms = note_terms(note)
+        
         # Atualiza campos se fornecidos
         if 'content' in data:
             content = data['content'].strip()
@@ -157,6 +170,7 @@ def update_note(current_user, note_id):
                 note.category = cat_obj.name
             else:
                 note.category = None
+            note.update_metadata('category_source', 'user')
         
         if 'tags' in data:
             note.set_tags(data['tags'])
@@ -167,6 +181,12 @@ def update_note(current_user, note_id):
             note.set_metadata(current_metadata)
         
         note.updated_at = datetime.utcnow()
+        if 'content' in data:
+            index_note_on_write(note)
+        if note.get_metadata().get('category_source') != 'classifier':
+            get_classifier_service().learn_note(
+                note, previous_category=learned_category, previous_terms=previous_terms
+            )
         db.session.commit()
         
         # TODO: Re-processar com IA se conteúdo mudou significativamente
@@ -194,8 +214,10 @@ def delete_note(current_user, note_id):
             return jsonify({'error': 'Anotação não encontrada'}), 404
         
         # Remove anotação e relacionamentos (cascade)
+        get_classifier_service().forget_notes([note])
         db.session.delete(note)
         db.session.commit()
+        remove_notes_from_indexes(current_user.id, [note_id])
         
         return jsonify({'message': 'Anotação removida com sucesso'}), 200
         
@@ -461,6 +483,7 @@ def bulk_operations(current_user):
             return jsonify({'error': 'Algumas anotações não foram encontradas'}), 404
         
         if operation == 'delete':
+            get_classifier_service().forget_notes(notes)
             for note in notes:
                 db.session.delete(note)
             
@@ -472,6 +495,7 @@ def bulk_operations(current_user):
             
             for note in notes:
                 note.category = new_category
+                note.update_metadata('category_source', 'user')
                 note.updated_at = datetime.utcnow()
         
         elif operation == 'add_tags':
@@ -487,8 +511,14 @@ def bulk_operations(current_user):
         else:
             return jsonify({'error': 'Operação não suportada'}), 400
         
+        if operation == 'update_category':
+            enqueue_classifier_training(current_user.id, commit=False)
+        
         db.session.commit()
         
+        if operation == 'delete':
+            remove_notes_from_indexes(current_user.id, note_ids)
+        
         return jsonify({
             'message': f'Operação {operation} executada com sucesso',
             'affected_notes': len(notes)
@@ -498,3 +528,46 @@ def bulk_operations(current_user):
         db.session.rollback()
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
+@notes_bp.route('/dedupe', methods=['POST'])
+@token_required
+def dedupe_notes(current_user):
+    """Agenda detecção de quase-duplicatas nas anotações existentes"""
+    try:
+        job = ProcessingJob.enqueue(
+            user_id=current_user.id,
+            job_type='dedupe_backlog',
+            dedupe_key=f"dedupe_backlog:{current_user.id}"
+        )
+        
+        return jsonify({
+            'message': 'Detecção de duplicatas agendada',
+            'job': job.to_dict()
+        }), 202
+        
+    except Exception as e:
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@notes_bp.route('/duplicates', methods=['GET'])
+@token_required
+def list_duplicates(current_user):
+    """Lista quase-duplicatas agrupadas pela nota original"""
+    try:
+        fingerprints = NoteFingerprint.query.filter(
+            NoteFingerprint.user_id == current_user.id,
+            NoteFingerprint.duplicate_of.isnot(None)
+        ).all()
+        
+        groups = {}
+        for fingerprint in fingerprints:
+            groups.setdefault(fingerprint.duplicate_of, []).append(fingerprint.to_dict())
+        
+        return jsonify({
+            'groups': [
+                {'original_id': original_id, 'duplicates': duplicates}
+                for original_id, duplicates in groups.items()
+            ],
+            'total_duplicates': len(fingerprints)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Erro interno do servidor'}), 500
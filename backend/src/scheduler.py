@@ -0,0 +1,103 @@
+import os
+import sys
+# DON'T CHANGE THIS !!!
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import argparse
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from src.models.user import db, User
+from src.models.note import Note
+from src.services.job_queue import enqueue_daily_summary
+
+logger = logging.getLogger('scheduler')
+
+
+def _window_offset(user_id: str, window_seconds: int) -> int:
+    """Deslocamento estável do usuário dentro da janela (reexecuções não embaralham)"""
+    digest = hashlib.blake2b(user_id.encode('utf-8'), digest_size=4).digest()
+    return int.from_bytes(digest, 'little') * window_seconds // 2 ** 32
+
+
+def find_daily_summary_users(date: str, cursor: str = None, limit: int = 1000) -> list:
+    """Usuários com WhatsApp ativo e anotações no dia (uma consulta por página)"""
+    start_date = datetime.strptime(date, '%Y-%m-%d')
+    end_date = start_date + timedelta(days=1)
+
+    query = db.session.query(Note.user_id).join(User, User.id == Note.user_id).filter(
+        User.whatsapp_opt_in.is_(True),
+        User.is_active.is_(True),
+        User.phone_number.isnot(None),
+        Note.created_at >= start_date,
+        Note.created_at < end_date
+    )
+    if cursor:
+        query = query.filter(Note.user_id > cursor)
+
+    return [row[0] for row in query.group_by(Note.user_id).order_by(Note.user_id).limit(limit).all()]
+
+
+def schedule_daily_summaries(date: str = None, window_start: datetime = None, window_minutes: int = None,
+                             page_size: int = 1000) -> dict:
+    """Agenda um job 'daily_summary' por usuário, distribuído ao longo da janela.
+
+    Idempotente: jobs já agendados ou concluídos para o mesmo dia são
+    reaproveitados, então uma execução interrompida pode simplesmente ser
+    repetida. Os workers limitam concorrência e taxa por provedor.
+    """
+    date = date or datetime.utcnow().strftime('%Y-%m-%d')
+    window_start = window_start or datetime.utcnow()
+    window_minutes = window_minutes if window_minutes is not None else int(os.getenv('DAILY_SUMMARY_WINDOW_MINUTES', 120))
+    window_seconds = max(1, window_minutes * 60)
+
+    scheduled = 0
+    cursor = None
+    while True:
+        user_ids = find_daily_summary_users(date, cursor=cursor, limit=page_size)
+        if not user_ids:
+            break
+
+        for user_id in user_ids:
+            run_after = window_start + timedelta(seconds=_window_offset(user_id, window_seconds))
+            enqueue_daily_summary(user_id, date, run_after=run_after, commit=False)
+        db.session.commit()
+
+        scheduled += len(user_ids)
+        cursor = user_ids[-1]
+        logger.info('%s usuários agendados para o resumo de %s', scheduled, date)
+
+    return {
+        'date': date,
+        'users_scheduled': scheduled,
+        'window_start': window_start.isoformat(),
+        'window_end': (window_start + timedelta(seconds=window_seconds)).isoformat()
+    }
+
+
+def _parse_window_start(value: str) -> datetime:
+    """HH:MM (UTC) da próxima ocorrência a partir de agora"""
+    now = datetime.utcnow()
+    hour, minute = (int(part) for part in value.split(':'))
+    start = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    return start if start >= now else start + timedelta(days=1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Agenda os resumos diários de todos os usuários (executar via cron)')
+    parser.add_argument('--date', default=None, help='Dia a resumir (YYYY-MM-DD, UTC); padrão: hoje')
+    parser.add_argument('--window-start', default=os.getenv('DAILY_SUMMARY_WINDOW_START'),
+                        help='Início da janela de envio (HH:MM UTC); padrão: agora')
+    parser.add_argument('--window-minutes', type=int, default=int(os.getenv('DAILY_SUMMARY_WINDOW_MINUTES', 120)))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    from src.main import app
+    with app.app_context():
+        result = schedule_daily_summaries(
+            date=args.date,
+            window_start=_parse_window_start(args.window_start) if args.window_start else None,
+            window_minutes=args.window_minutes
+        )
+    logger.info('Agendamento concluído: %s', result)
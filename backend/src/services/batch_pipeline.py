@@ -0,0 +1,457 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import func
+from src.models.user import db, User, UsageRollup
+from src.models.note import Note
+from src.models.summary import DailySummary
+from src.models.batch import BatchSubmission, BatchItem
+from src.services.batch_service import OpenAIBatchClient, build_batch_line
+from src.services.pricing import calculate_cost
+
+logger = logging.getLogger(__name__)
+
+# Status da Batch API -> status local do lote
+_PROVIDER_STATUSES = {
+    'validating': 'in_progress',
+    'in_progress': 'in_progress',
+    'finalizing': 'in_progress',
+    'cancelling': 'in_progress',
+    'completed': 'completed',
+    'failed': 'failed',
+    'expired': 'expired',
+    'cancelled': 'cancelled'
+}
+
+# Status finais em que ainda pode haver resultados parciais a aplicar
+_PARTIAL_STATUSES = ('failed', 'expired', 'cancelled')
+
+# Status em que o lote pode ser assumido para aplicação
+_APPLICABLE_STATUSES = ('completed', 'applying') + _PARTIAL_STATUSES
+
+_stats = {'batches_submitted': 0, 'requests_submitted': 0, 'items_applied': 0, 'items_skipped': 0,
+          'items_failed': 0}
+_stats_lock = threading.Lock()
+
+
+def content_fingerprint(content: str) -> str:
+    """sha256 do conteúdo da anotação no momento do envio"""
+    return hashlib.sha256((content or '').encode('utf-8')).hexdigest()
+
+
+class BatchPipeline:
+    """Processamento offline do backlog pela Batch API da OpenAI.
+
+    Anotações pendentes antigas e resumos diários são gravados como
+    requisições JSONL, enviados em lote (custo menor, resposta em até
+    24h), acompanhados por poll() e aplicados com o mesmo código do
+    caminho síncrono do AIProcessor. A aplicação é idempotente: cada item
+    só é aplicado uma vez, e itens cuja entrada mudou desde o envio
+    (anotação editada, removida ou já processada; notas do dia alteradas)
+    são descartados em vez de sobrescrever dados mais novos.
+    """
+
+    def __init__(self, processor, client: OpenAIBatchClient = None):
+        self.processor = processor
+        self.chatgpt = processor.chatgpt
+        self.client = client or OpenAIBatchClient()
+        self.max_requests = int(os.getenv('BATCH_MAX_REQUESTS', 5000))
+        self.min_note_age = timedelta(minutes=int(os.getenv('BATCH_MIN_NOTE_AGE_MINUTES', 60)))
+        self.apply_lease = timedelta(seconds=int(os.getenv('BATCH_APPLY_LEASE_SECONDS', 900)))
+
+    # Envio
+
+    def submit_note_backlog(self, user_id: str = None, limit: int = None) -> dict:
+        """Envia em lote as anotações pendentes (ou com falha) sem lote em andamento.
+
+        Anotações recentes ficam para o caminho interativo (worker); o lote
+        não consome a cota diária de processamento, mas respeita o teto
+        mensal de gastos do usuário: o custo estimado de cada requisição é
+        somado ao gasto do mês e aos itens de lotes ainda não aplicados, e
+        as anotações do usuário param de entrar quando o teto seria passado.
+        Enquanto o item estiver pendente, process_note recusa a anotação.
+        """
+        in_flight = db.session.query(BatchItem.note_id).filter(
+            BatchItem.status == 'pending',
+            BatchItem.note_id.isnot(None)
+        )
+        query = Note.query.filter(
+            Note.status.in_(['pending', 'failed']),
+            Note.created_at <= datetime.utcnow() - self.min_note_age,
+            ~Note.id.in_(in_flight)
+        )
+        if user_id:
+            query = query.filter(Note.user_id == user_id)
+        notes = query.order_by(Note.created_at).limit(min(limit or self.max_requests, self.max_requests)).all()
+
+        items, lines, skipped_users = [], [], set()
+        users: Dict[str, User] = {}
+        budgets: Dict[str, Optional[float]] = {}
+        for note in notes:
+            user = users.get(note.user_id)
+            if user is None:
+                user = users[note.user_id] = User.query.get(note.user_id)
+
+            body = self.chatgpt.build_analysis_complete_request(note.content, user.get_preferences())
+            estimated_cost = self._estimate_cost(body)
+            if not self._reserve_budget(budgets, user, estimated_cost):
+                skipped_users.add(user.id)
+                continue
+
+            custom_id = f'note:{note.id}'
+            lines.append(build_batch_line(custom_id, body))
+            items.append(BatchItem(
+                custom_id=custom_id,
+                user_id=note.user_id,
+                note_id=note.id,
+                fingerprint=content_fingerprint(note.content),
+                estimated_cost=estimated_cost
+            ))
+
+        result = self._submit('note_analysis', items, lines)
+        result['users_over_spend_cap'] = len(skipped_users)
+        return result
+
+    def submit_daily_summaries(self, date: str = None, user_id: str = None) -> dict:
+        """Envia em lote os resumos do dia (padrão: ontem) dos usuários que os recebem.
+
+        Dias já resumidos com as mesmas notas, ou já em um lote em andamento,
+        são ignorados, assim como dias com anotações ainda não processadas
+        (aplicar a análise altera as notas e invalidaria o resumo): envie
+        antes o lote de anotações. Dias grandes demais para uma única
+        chamada ficam para o map-reduce síncrono. O job 'daily_summary'
+        encontra depois o resumo armazenado e apenas o envia.
+        """
+        # Importado aqui: o agendador é um script que importa os modelos
+        from src.scheduler import find_daily_summary_users
+
+        date = date or (datetime.utcnow() - timedelta(days=1)).strftime('%Y-%m-%d')
+        start_date = datetime.strptime(date, '%Y-%m-%d')
+        end_date = start_date + timedelta(days=1)
+
+        user_ids = [user_id] if user_id else self._all_summary_users(find_daily_summary_users, date)
+
+        items, lines = [], []
+        budgets: Dict[str, Optional[float]] = {}
+        counts = {'up_to_date': 0, 'in_flight': 0, 'notes_pending': 0, 'too_large': 0, 'over_spend_cap': 0}
+        for uid in user_ids:
+            day_filter = (Note.user_id == uid, Note.created_at >= start_date, Note.created_at < end_date)
+            versions = db.session.query(Note.id, Note.updated_at).filter(*day_filter).order_by(Note.id).all()
+            if not versions:
+                continue
+
+            fingerprint = self.processor._daily_fingerprint(versions)
+            stored = DailySummary.get_for_day(uid, start_date.date())
+            if stored and stored.fingerprint == fingerprint:
+                counts['up_to_date'] += 1
+                continue
+
+            if Note.query.filter(*day_filter, Note.status.in_(['pending', 'processing'])).first():
+                counts['notes_pending'] += 1
+                continue
+
+            custom_id = f'day:{uid}:{date}'
+            if BatchItem.query.filter_by(custom_id=custom_id, status='pending', fingerprint=fingerprint).first():
+                counts['in_flight'] += 1
+                continue
+
+            user = User.query.get(uid)
+            if not user:
+                continue
+
+            notes_data = self.processor._summary_notes_data(Note.query.filter(*day_filter).all())
+            body = self.chatgpt.build_daily_summary_request(notes_data, date)
+            if body is None:
+                counts['too_large'] += 1
+                continue
+
+            estimated_cost = self._estimate_cost(body)
+            if not self._reserve_budget(budgets, user, estimated_cost):
+                counts['over_spend_cap'] += 1
+                continue
+
+            lines.append(build_batch_line(custom_id, body))
+            items.append(BatchItem(
+                custom_id=custom_id,
+                user_id=uid,
+                target_date=start_date.date(),
+                fingerprint=fingerprint,
+                estimated_cost=estimated_cost
+            ))
+
+        result = self._submit('daily_summary', items, lines)
+        result.update(counts)
+        result['date'] = date
+        return result
+
+    def _estimate_cost(self, body: dict) -> float:
+        """Custo máximo da requisição no preço do lote (completion = max_tokens)"""
+        prompt_tokens = sum(self.chatgpt.estimate_tokens(message.get('content')) for message in body['messages'])
+        return calculate_cost(body['model'], prompt_tokens, body.get('max_tokens') or 0, batch=True)
+
+    @staticmethod
+    def _reserve_budget(budgets: Dict[str, Optional[float]], user: User, estimated_cost: float) -> bool:
+        """Desconta o custo estimado do saldo do mês do usuário; False se passaria do teto.
+
+        O saldo parte do teto menos o gasto já agregado e o custo estimado
+        dos itens de lotes anteriores ainda não aplicados.
+        """
+        if user.id not in budgets:
+            cap = user.monthly_spend_cap()
+            budgets[user.id] = (
+                cap - UsageRollup.get_monthly_cost(user.id) - BatchItem.pending_cost(user.id) if cap > 0 else None
+            )
+
+        remaining = budgets[user.id]
+        if remaining is None:
+            return True
+        if estimated_cost > remaining:
+            return False
+        budgets[user.id] = remaining - estimated_cost
+        return True
+
+    @staticmethod
+    def _all_summary_users(find_users, date: str, page_size: int = 1000) -> List[str]:
+        user_ids, cursor = [], None
+        while True:
+            page = find_users(date, cursor=cursor, limit=page_size)
+            if not page:
+                return user_ids
+            user_ids.extend(page)
+            cursor = page[-1]
+
+    def _submit(self, kind: str, items: List[BatchItem], lines: List[str]) -> dict:
+        """Grava lote e itens antes do envio; falha no provedor marca o lote como 'failed'"""
+        if not items:
+            return {'success': True, 'batch_id': None, 'requests': 0}
+
+        batch = BatchSubmission(kind=kind, status='pending', request_count=len(items))
+        db.session.add(batch)
+        db.session.flush()
+        for item in items:
+            item.batch_id = batch.id
+            db.session.add(item)
+        db.session.commit()
+
+        try:
+            batch.input_file_id = self.client.upload_jsonl(lines, filename=f'{kind}-{batch.id}.jsonl')
+            provider_batch = self.client.create_batch(batch.input_file_id, metadata={'batch_id': batch.id, 'kind': kind})
+            batch.provider_batch_id = provider_batch['id']
+            batch.status = 'submitted'
+            batch.submitted_at = datetime.utcnow()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            batch.status = 'failed'
+            batch.last_error = str(e)
+            self._fail_pending_items(batch, f'Falha no envio do lote: {e}')
+            db.session.commit()
+            logger.warning('Falha ao enviar lote %s (%s): %s', batch.id, kind, e)
+            return {'success': False, 'batch_id': batch.id, 'requests': 0, 'error': str(e)}
+
+        self._count('batches_submitted')
+        self._count('requests_submitted', len(items))
+        logger.info('Lote %s (%s) enviado com %s requisições: %s', batch.id, kind, len(items), batch.provider_batch_id)
+        return {'success': True, 'batch_id': batch.id, 'requests': len(items)}
+
+    # Acompanhamento
+
+    def poll(self) -> dict:
+        """Atualiza os lotes em andamento e aplica os que terminaram"""
+        summary = {'checked': 0, 'applied': 0, 'errors': 0}
+
+        for batch in BatchSubmission.query.filter(BatchSubmission.status.in_(BatchSubmission.OPEN_STATUSES)).all():
+            summary['checked'] += 1
+            try:
+                self._refresh(batch)
+            except Exception as e:
+                db.session.rollback()
+                summary['errors'] += 1
+                logger.warning('Falha ao consultar lote %s: %s', batch.id, e)
+
+        # Concluídos ainda não aplicados e aplicações interrompidas (lease vencido)
+        stale = datetime.utcnow() - self.apply_lease
+        ready = BatchSubmission.query.filter(
+            (BatchSubmission.status == 'completed')
+            | ((BatchSubmission.status == 'applying') & (BatchSubmission.updated_at < stale))
+        ).all()
+        for batch in ready:
+            try:
+                if self.apply_batch(batch):
+                    summary['applied'] += 1
+            except Exception as e:
+                db.session.rollback()
+                summary['errors'] += 1
+                logger.exception('Falha ao aplicar lote %s: %s', batch.id, e)
+
+        return summary
+
+    def _refresh(self, batch: BatchSubmission):
+        provider_batch = self.client.retrieve_batch(batch.provider_batch_id)
+        status = _PROVIDER_STATUSES.get(provider_batch.get('status'), 'in_progress')
+
+        batch.output_file_id = provider_batch.get('output_file_id') or batch.output_file_id
+        batch.error_file_id = provider_batch.get('error_file_id') or batch.error_file_id
+        if status == batch.status:
+            db.session.commit()
+            return
+
+        batch.status = status
+        if status == 'completed':
+            batch.completed_at = datetime.utcnow()
+        elif status in _PARTIAL_STATUSES:
+            errors = (provider_batch.get('errors') or {}).get('data') or []
+            batch.last_error = '; '.join(error.get('message', '') for error in errors) or f'Lote {status}'
+            batch.completed_at = datetime.utcnow()
+        db.session.commit()
+        logger.info('Lote %s: %s', batch.id, status)
+
+        # Lote encerrado sem concluir: aplica o que houver e libera os itens restantes
+        if status in _PARTIAL_STATUSES:
+            self.apply_batch(batch)
+
+    # Aplicação
+
+    def apply_batch(self, batch: BatchSubmission) -> bool:
+        """Aplica os resultados do lote; retorna False se já foi aplicado ou outro processo o assumiu"""
+        if batch.status not in _APPLICABLE_STATUSES:
+            return False
+        final_status = 'applied' if batch.status in ('completed', 'applying') else batch.status
+        if not self._claim(batch):
+            return False
+
+        results = {}
+        for file_id in (batch.error_file_id, batch.output_file_id):
+            if file_id:
+                for line in self.client.download_results(file_id):
+                    results[line['custom_id']] = line
+
+        for item in BatchItem.query.filter_by(batch_id=batch.id, status='pending').all():
+            line = results.get(item.custom_id)
+            try:
+                status, error = self._apply_item(batch, item, line)
+            except Exception as e:
+                db.session.rollback()
+                status, error = 'failed', str(e)
+            self._finish_item(batch, item, status, error)
+
+        batch.status = final_status
+        batch.applied_at = datetime.utcnow()
+        db.session.commit()
+        logger.info('Lote %s aplicado: %s aplicados, %s descartados, %s com falha',
+                    batch.id, batch.applied_count, batch.skipped_count, batch.failed_count)
+        return True
+
+    def _claim(self, batch: BatchSubmission) -> bool:
+        """Assume a aplicação do lote com UPDATE condicional (um único processo aplica)"""
+        claimed = BatchSubmission.query.filter(
+            BatchSubmission.id == batch.id,
+            BatchSubmission.status == batch.status,
+            BatchSubmission.updated_at == batch.updated_at
+        ).update({'status': 'applying', 'updated_at': datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            db.session.refresh(batch)
+        return bool(claimed)
+
+    def _apply_item(self, batch: BatchSubmission, item: BatchItem, line: dict) -> tuple:
+        """Aplica um resultado; retorna (status, erro) do item"""
+        if line is None:
+            return 'failed', 'Sem resultado no lote'
+
+        response = line.get('response') or {}
+        if line.get('error') or response.get('status_code') != 200:
+            error = line.get('error') or (response.get('body') or {}).get('error') or response.get('status_code')
+            return 'failed', json.dumps(error, ensure_ascii=False) if isinstance(error, dict) else str(error)
+
+        body = response['body']
+        if batch.kind == 'note_analysis':
+            return self._apply_note_analysis(batch, item, body)
+        if batch.kind == 'daily_summary':
+            return self._apply_daily_summary(item, body)
+        return 'failed', f'Tipo de lote desconhecido: {batch.kind}'
+
+    def _apply_note_analysis(self, batch: BatchSubmission, item: BatchItem, body: dict) -> tuple:
+        # Pago mesmo quando o resultado é descartado
+        self.chatgpt.record_batch_usage(item.user_id, 'note_analysis_combined', body, prompt='note_analysis_combined')
+
+        note = Note.query.get(item.note_id)
+        if not note:
+            return 'skipped', 'Anotação removida'
+        if content_fingerprint(note.content) != item.fingerprint:
+            return 'skipped', 'Anotação editada após o envio'
+        if note.ai_processed_at and batch.submitted_at and note.ai_processed_at >= batch.submitted_at:
+            return 'skipped', 'Anotação já processada'
+
+        parsed = self.chatgpt.parse_analysis_complete(body)
+        stage_results = {
+            'analysis': {'status': 'ok', 'value': {'analysis': parsed['analysis']}, 'error': None, 'duration': 0.0},
+            'tasks': {'status': 'ok', 'value': {'extraction': parsed['extraction']}, 'error': None, 'duration': 0.0}
+        }
+
+        # Mesmo caminho do processamento síncrono (sem envio de insights pelo WhatsApp)
+        self.processor._apply_stage_results(note, stage_results)
+        note.update_metadata('ai_batch', batch.id)
+        note.mark_as_processed()
+        return 'applied', None
+
+    def _apply_daily_summary(self, item: BatchItem, body: dict) -> tuple:
+        tokens_used, cost = self.chatgpt.record_batch_usage(item.user_id, 'daily_summary', body, prompt='daily_summary')
+
+        start_date = datetime.combine(item.target_date, datetime.min.time())
+        versions = db.session.query(Note.id, Note.updated_at).filter(
+            Note.user_id == item.user_id,
+            Note.created_at >= start_date,
+            Note.created_at < start_date + timedelta(days=1)
+        ).order_by(Note.id).all()
+        if self.processor._daily_fingerprint(versions) != item.fingerprint:
+            return 'skipped', 'Notas do dia alteradas após o envio'
+
+        stored = DailySummary.get_for_day(item.user_id, item.target_date)
+        if stored and stored.fingerprint == item.fingerprint:
+            return 'skipped', 'Resumo já gerado'
+
+        summary = json.loads(body['choices'][0]['message']['content'])
+        self.processor._store_summary(item.user_id, 'day', item.target_date, item.fingerprint, len(versions), {
+            'summary': summary,
+            'mode': 'batch',
+            'tokens_used': tokens_used,
+            'cost': cost
+        })
+        return 'applied', None
+
+    def _finish_item(self, batch: BatchSubmission, item: BatchItem, status: str, error: str = None):
+        """Grava o resultado do item e os contadores do lote em um único commit"""
+        item.status = status
+        item.error = error
+        item.applied_at = datetime.utcnow()
+        counter = {'applied': 'applied_count', 'skipped': 'skipped_count', 'failed': 'failed_count'}[status]
+        setattr(batch, counter, getattr(batch, counter) + 1)
+        batch.updated_at = datetime.utcnow()  # Renova o lease da aplicação
+        db.session.commit()
+        self._count(f'items_{status}')
+
+    @staticmethod
+    def _fail_pending_items(batch: BatchSubmission, error: str):
+        for item in BatchItem.query.filter_by(batch_id=batch.id, status='pending').all():
+            item.status = 'failed'
+            item.error = error
+            batch.failed_count += 1
+
+    @staticmethod
+    def _count(name: str, amount: int = 1):
+        with _stats_lock:
+            _stats[name] += amount
+
+
+def get_batch_stats() -> dict:
+    """Lotes por status e itens aplicados/descartados desde o início do processo"""
+    with _stats_lock:
+        stats = dict(_stats)
+    rows = db.session.query(BatchSubmission.status, func.count(BatchSubmission.id)).group_by(BatchSubmission.status).all()
+    stats['batches'] = {status: count for status, count in rows}
+    return stats
@@ -0,0 +1,85 @@
+import os
+import json
+from typing import Iterator, List
+from src.services import http_client
+from src.services.resilience import guarded_request
+
+# Provedor próprio para circuito, limite de concorrência e pool HTTP:
+# uploads e downloads de lotes não disputam vaga com as chamadas interativas
+BATCH_PROVIDER = 'openai_batch'
+
+CHAT_COMPLETIONS_ENDPOINT = '/v1/chat/completions'
+
+
+def build_batch_line(custom_id: str, body: dict) -> str:
+    """Linha JSONL de entrada da Batch API"""
+    return json.dumps({
+        'custom_id': custom_id,
+        'method': 'POST',
+        'url': CHAT_COMPLETIONS_ENDPOINT,
+        'body': body
+    }, ensure_ascii=False)
+
+
+def parse_jsonl(text: str) -> Iterator[dict]:
+    """Linhas de um arquivo JSONL (ignora linhas vazias)"""
+    for line in text.splitlines():
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+class OpenAIBatchClient:
+    """Cliente da Batch API da OpenAI (arquivos e lotes)"""
+
+    def __init__(self):
+        self.api_key = os.getenv('OPENAI_API_KEY')
+        self.base_url = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1').rstrip('/')
+        self.completion_window = os.getenv('OPENAI_BATCH_COMPLETION_WINDOW', '24h')
+
+    def _request(self, method: str, path: str, **kwargs):
+        if not self.api_key:
+            raise ValueError("OPENAI_API_KEY não configurada")
+
+        headers = {'Authorization': f'Bearer {self.api_key}'}
+        response = guarded_request(
+            BATCH_PROVIDER,
+            method,
+            f"{self.base_url}/{path}",
+            headers=headers,
+            timeout=http_client.get_timeout(BATCH_PROVIDER, float(os.getenv('OPENAI_BATCH_HTTP_READ_TIMEOUT', 120))),
+            **kwargs
+        )
+
+        if response.status_code != 200:
+            raise Exception(f"Erro na Batch API OpenAI: {response.status_code} - {response.text}")
+        return response
+
+    def upload_jsonl(self, lines: List[str], filename: str = 'batch.jsonl') -> str:
+        """Envia o arquivo de entrada do lote; retorna o id do arquivo"""
+        content = ('\n'.join(lines) + '\n').encode('utf-8')
+        response = self._request(
+            'POST',
+            'files',
+            data={'purpose': 'batch'},
+            files={'file': (filename, content, 'application/jsonl')}
+        )
+        return response.json()['id']
+
+    def create_batch(self, input_file_id: str, metadata: dict = None) -> dict:
+        """Cria o lote a partir do arquivo enviado"""
+        response = self._request('POST', 'batches', json={
+            'input_file_id': input_file_id,
+            'endpoint': CHAT_COMPLETIONS_ENDPOINT,
+            'completion_window': self.completion_window,
+            'metadata': metadata or {}
+        })
+        return response.json()
+
+    def retrieve_batch(self, batch_id: str) -> dict:
+        """Estado atual do lote no provedor"""
+        return self._request('GET', f'batches/{batch_id}').json()
+
+    def download_results(self, file_id: str) -> List[dict]:
+        """Linhas do arquivo de saída (ou de erros) do lote"""
+        return list(parse_jsonl(self._request('GET', f'files/{file_id}/content').text))
@@ -0,0 +1,361 @@
+import os
+import json
+import math
+import zlib
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+from src.models.user import db
+from src.models.note import Note
+from src.models.classifier import CategoryClassifier, ClassifierDelta
+from src.models.keyword_index import NoteKeywordSignature
+from src.services.text_processing import term_frequencies
+from src.services.job_queue import enqueue_classifier_fold
+
+
+# Trecho do JSON de metadata das notas categorizadas pelo classificador
+CLASSIFIER_SOURCE_MARKER = '"category_source": "classifier"'
+
+
+class NaiveBayesModel:
+    """Naive Bayes multinomial sobre termos com feature hashing.
+
+    Mantém apenas contagens, então aprender ou esquecer uma nota é O(termos)
+    e o modelo pode ser atualizado incrementalmente.
+    """
+
+    def __init__(self, num_features: int = 2 ** 18, alpha: float = 1.0):
+        self.num_features = num_features
+        self.alpha = alpha
+        self.class_docs: Dict[str, int] = {}  # categoria -> notas
+        self.class_totals: Dict[str, int] = {}  # categoria -> soma das contagens
+        self.feature_counts: Dict[str, Dict[int, int]] = {}  # categoria -> {feature: contagem}
+        self.feature_totals: Dict[int, int] = {}  # feature -> contagem em todas as categorias
+
+    @property
+    def trained_notes(self) -> int:
+        return sum(self.class_docs.values())
+
+    def features(self, terms: Dict[str, int]) -> Dict[int, int]:
+        """Mapeia termos para índices de feature"""
+        features: Dict[int, int] = {}
+        for term, tf in terms.items():
+            index = int.from_bytes(hashlib.blake2b(term.encode('utf-8'), digest_size=4).digest(), 'little') % self.num_features
+            features[index] = features.get(index, 0) + tf
+        return features
+
+    def learn(self, terms: Dict[str, int], category: str, weight: int = 1):
+        """Adiciona (weight=1) ou remove (weight=-1) uma nota do modelo"""
+        features = self.features(terms)
+        if not features:
+            return
+
+        self.class_docs[category] = self.class_docs.get(category, 0) + weight
+        counts = self.feature_counts.setdefault(category, {})
+        for index, tf in features.items():
+            delta = weight * tf
+            counts[index] = counts.get(index, 0) + delta
+            self.feature_totals[index] = self.feature_totals.get(index, 0) + delta
+            if counts[index] <= 0:
+                del counts[index]
+            if self.feature_totals[index] <= 0:
+                del self.feature_totals[index]
+            self.class_totals[category] = self.class_totals.get(category, 0) + delta
+
+        if self.class_docs[category] <= 0:
+            self.class_docs.pop(category, None)
+            self.class_totals.pop(category, None)
+            self.feature_counts.pop(category, None)
+
+    def predict(self, terms: Dict[str, int]) -> Tuple[Optional[str], float]:
+        """Retorna (categoria, probabilidade a posteriori) ou (None, 0.0)"""
+        if len(self.class_docs) < 2:
+            return None, 0.0
+
+        # Features nunca vistas não ajudam a separar categorias
+        features = {index: tf for index, tf in self.features(terms).items() if index in self.feature_totals}
+        if not features:
+            return None, 0.0
+
+        vocabulary = len(self.feature_totals)
+        total_docs = self.trained_notes
+        scores = {}
+        for category, docs in self.class_docs.items():
+            counts = self.feature_counts.get(category, {})
+            denominator = math.log(self.class_totals.get(category, 0) + self.alpha * vocabulary)
+            score = math.log(docs / total_docs)
+            for index, tf in features.items():
+                score += tf * (math.log(counts.get(index, 0) + self.alpha) - denominator)
+            scores[category] = score
+
+        best = max(scores, key=scores.get)
+        normalizer = sum(math.exp(score - scores[best]) for score in scores.values())
+        return best, 1.0 / normalizer
+
+    def copy(self) -> 'NaiveBayesModel':
+        model = NaiveBayesModel(num_features=self.num_features, alpha=self.alpha)
+        model.class_docs = dict(self.class_docs)
+        model.class_totals = dict(self.class_totals)
+        model.feature_counts = {category: dict(counts) for category, counts in self.feature_counts.items()}
+        model.feature_totals = dict(self.feature_totals)
+        return model
+
+    def to_bytes(self) -> bytes:
+        return zlib.compress(json.dumps({
+            'num_features': self.num_features,
+            'alpha': self.alpha,
+            'class_docs': self.class_docs,
+            'class_totals': self.class_totals,
+            'feature_counts': {
+                category: {str(index): count for index, count in counts.items()}
+                for category, counts in self.feature_counts.items()
+            }
+        }, ensure_ascii=False).encode('utf-8'))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'NaiveBayesModel':
+        state = json.loads(zlib.decompress(data).decode('utf-8'))
+        model = cls(num_features=state['num_features'], alpha=state['alpha'])
+        model.class_docs = state['class_docs']
+        model.class_totals = state['class_totals']
+        model.feature_counts = {
+            category: {int(index): count for index, count in counts.items()}
+            for category, counts in state['feature_counts'].items()
+        }
+        for counts in model.feature_counts.values():
+            for index, count in counts.items():
+                model.feature_totals[index] = model.feature_totals.get(index, 0) + count
+        return model
+
+
+def note_terms(note: Note) -> Dict[str, int]:
+    """Termos da nota a partir da assinatura já calculada (ou do conteúdo)"""
+    signature = NoteKeywordSignature.query.get(note.id)
+    return signature.get_terms() if signature else term_frequencies(note.content)
+
+
+class CategoryClassifierService:
+    """Treina, persiste e consulta o classificador local de cada usuário.
+
+    Requisições não reescrevem o modelo: learn() só insere um
+    ClassifierDelta, e o job fold_classifier incorpora os deltas ao modelo
+    serializado. Enquanto isso, get_model aplica os deltas pendentes sobre
+    o modelo armazenado, então as previsões já refletem as edições.
+    """
+
+    def __init__(self, num_features: int = None, max_cached_users: int = None):
+        self.num_features = num_features or int(os.getenv('NB_NUM_FEATURES', 2 ** 18))
+        self.confidence_threshold = float(os.getenv('NB_CONFIDENCE_THRESHOLD', 0.9))
+        self.min_training_notes = int(os.getenv('NB_MIN_TRAINING_NOTES', 50))
+        self.max_cached_users = max_cached_users or int(os.getenv('NB_MAX_CACHED_USERS', 200))
+        self._cache: Dict[str, Tuple[int, int, NaiveBayesModel]] = {}  # usuário -> (versão, último delta, modelo)
+        self._lock = threading.Lock()
+
+    def get_model(self, user_id: str) -> Optional[NaiveBayesModel]:
+        """Modelo do usuário com os deltas pendentes, recarregado só quando a versão ou os deltas mudam"""
+        # Versão antes dos deltas: um fold concluído entre as consultas não conta delta duas vezes
+        version = db.session.query(CategoryClassifier.version).filter_by(user_id=user_id).scalar()
+        last_delta = self._last_delta_id(user_id)
+        if version is None and not last_delta:
+            return None
+
+        with self._lock:
+            cached = self._cache.get(user_id)
+        if cached and cached[0] == version and cached[1] == last_delta:
+            return cached[2]
+
+        if cached and cached[0] == version and cached[1] <= last_delta:
+            # Só chegaram deltas novos: aplica sobre uma cópia do modelo em cache
+            model, applied = cached[2].copy(), cached[1]
+        else:
+            record = CategoryClassifier.query.get(user_id)
+            version = record.version if record else None
+            model = NaiveBayesModel.from_bytes(record.model_data) if record else NaiveBayesModel(num_features=self.num_features)
+            applied = 0
+
+        for delta in ClassifierDelta.query.filter(
+            ClassifierDelta.user_id == user_id,
+            ClassifierDelta.id > applied,
+            ClassifierDelta.id <= last_delta
+        ).order_by(ClassifierDelta.id).all():
+            self._apply(model, delta)
+
+        self._remember(user_id, version, last_delta, model)
+        return model
+
+    def predict(self, note: Note) -> Tuple[Optional[str], float]:
+        """Categoria prevista para a nota e confiança"""
+        return self.predict_terms(note.user_id, note_terms(note))
+
+    def predict_terms(self, user_id: str, terms: Dict[str, int]) -> Tuple[Optional[str], float]:
+        """Categoria prevista e confiança; (None, 0.0) se o modelo ainda é imaturo"""
+        model = self.get_trained_model(user_id)
+        if model is None:
+            return None, 0.0
+        return model.predict(terms)
+
+    def get_trained_model(self, user_id: str) -> Optional[NaiveBayesModel]:
+        """Modelo do usuário, se já treinado com notas suficientes"""
+        model = self.get_model(user_id)
+        if model is None or model.trained_notes < self.min_training_notes:
+            return None
+        return model
+
+    def classify_on_ingest(self, note: Note) -> bool:
+        """Atribui categoria a uma nota nova se o classificador estiver confiante (sem commit)"""
+        if note.category:
+            return False
+
+        category, confidence = self.predict(note)
+        if category is None or confidence < self.confidence_threshold:
+            return False
+
+        note.category = category
+        note.update_metadata('category_source', 'classifier')
+        note.update_metadata('category_confidence', round(confidence, 4))
+        return True
+
+    def learn(self, user_id: str, add: List[Tuple[Dict[str, int], str]] = None,
+              remove: List[Tuple[Dict[str, int], str]] = None):
+        """Registra notas (termos, categoria) adicionadas/removidas como delta pendente (sem commit)"""
+        changes = [(terms, category, -1) for terms, category in (remove or []) if category]
+        changes += [(terms, category, 1) for terms, category in (add or []) if category]
+        if not changes:
+            return
+
+        delta = ClassifierDelta(user_id=user_id)
+        delta.set_changes(changes)
+        db.session.add(delta)
+        enqueue_classifier_fold(user_id, commit=False)
+
+    def learn_note(self, note: Note, previous_category: str = None, previous_terms: Dict[str, int] = None):
+        """Aprende a categoria atual da nota, esquecendo o rótulo/conteúdo anterior (sem commit)"""
+        terms = note_terms(note)
+        if previous_category == note.category and (previous_terms is None or previous_terms == terms):
+            return
+
+        self.learn(
+            note.user_id,
+            add=[(terms, note.category)],
+            remove=[(previous_terms if previous_terms is not None else terms, previous_category)]
+        )
+
+    def forget_notes(self, notes: List[Note]):
+        """Esquece notas que serão apagadas: um delta negativo por nota categorizada (sem commit)"""
+        for note in notes:
+            # Categorias atribuídas pelo próprio classificador nunca foram aprendidas
+            if note.category and note.get_metadata().get('category_source') != 'classifier':
+                self.learn(note.user_id, remove=[(note_terms(note), note.category)])
+
+    def fold(self, user_id: str, page_size: int = 1000) -> int:
+        """Incorpora os deltas pendentes ao modelo armazenado, em ordem (faz commit por página)"""
+        folded = 0
+
+        while True:
+            # Bloqueia a linha para não concorrer com outro fold ou com o retreino
+            record = CategoryClassifier.query.filter_by(user_id=user_id).with_for_update().first()
+            deltas = ClassifierDelta.query.filter_by(user_id=user_id).order_by(ClassifierDelta.id).limit(page_size).all()
+            if not deltas:
+                db.session.rollback()
+                break
+
+            if record is None:
+                model = NaiveBayesModel(num_features=self.num_features)
+                record = CategoryClassifier(user_id=user_id, num_features=self.num_features, version=0)
+                db.session.add(record)
+            else:
+                model = NaiveBayesModel.from_bytes(record.model_data)
+
+            for delta in deltas:
+                self._apply(model, delta)
+
+            self._save(record, model, deltas[-1].id)
+            db.session.commit()
+            folded += len(deltas)
+
+        return folded
+
+    def rebuild(self, user_id: str, page_size: int = 1000, on_progress=None) -> int:
+        """Treina do zero com todas as notas categorizadas do usuário (faz commit)"""
+        model = NaiveBayesModel(num_features=self.num_features)
+        cursor = None
+
+        # Deltas anteriores à leitura das notas já estão refletidos nelas
+        snapshot = self._last_delta_id(user_id)
+
+        while True:
+            query = db.session.query(Note.id, Note.content, Note.category, NoteKeywordSignature.terms).outerjoin(
+                NoteKeywordSignature, NoteKeywordSignature.note_id == Note.id
+            ).filter(
+                Note.user_id == user_id,
+                Note.category.isnot(None),
+                # Categorias atribuídas pelo próprio classificador não viram treino
+                Note.note_metadata.notlike(f'%{CLASSIFIER_SOURCE_MARKER}%')
+            )
+            if cursor:
+                query = query.filter(Note.id > cursor)
+            page = query.order_by(Note.id).limit(page_size).all()
+            if not page:
+                break
+
+            for note_id, content, category, terms in page:
+                model.learn(json.loads(terms) if terms else term_frequencies(content), category)
+
+            cursor = page[-1].id
+            if on_progress:
+                on_progress(cursor, model.trained_notes)
+
+        record = CategoryClassifier.query.filter_by(user_id=user_id).with_for_update().first()
+        if record is None:
+            record = CategoryClassifier(user_id=user_id, num_features=self.num_features, version=0)
+            db.session.add(record)
+        self._save(record, model, snapshot)
+        db.session.commit()
+
+        return model.trained_notes
+
+    @staticmethod
+    def _last_delta_id(user_id: str) -> int:
+        return db.session.query(db.func.coalesce(db.func.max(ClassifierDelta.id), 0)).filter(
+            ClassifierDelta.user_id == user_id
+        ).scalar()
+
+    @staticmethod
+    def _apply(model: NaiveBayesModel, delta: ClassifierDelta):
+        for terms, category, weight in delta.get_changes():
+            model.learn(terms, category, weight=weight)
+
+    def _save(self, record: CategoryClassifier, model: NaiveBayesModel, last_delta: int):
+        """Grava o modelo e remove os deltas até last_delta, já incorporados a ele"""
+        record.model_data = model.to_bytes()
+        record.num_features = model.num_features
+        record.trained_notes = model.trained_notes
+        record.num_categories = len(model.class_docs)
+        record.version = (record.version or 0) + 1
+        ClassifierDelta.query.filter(
+            ClassifierDelta.user_id == record.user_id,
+            ClassifierDelta.id <= last_delta
+        ).delete(synchronize_session=False)
+        db.session.flush()
+        self._remember(record.user_id, record.version, last_delta, model)
+
+    def _remember(self, user_id: str, version: int, last_delta: int, model: NaiveBayesModel):
+        with self._lock:
+            self._cache.pop(user_id, None)
+            self._cache[user_id] = (version, last_delta, model)
+            while len(self._cache) > self.max_cached_users:
+                self._cache.pop(next(iter(self._cache)))
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_classifier_service() -> CategoryClassifierService:
+    """Retorna o serviço de classificação compartilhado pelo processo"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = CategoryClassifierService()
+    return _service
@@ -1,21 +1,38 @@
 import os
 import json
-import requests
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 from src.models.user import UsageLog
+from src.services import http_client
+from src.services.resilience import guarded_request, unavailable_info
+from src.services.response_cache import ResponseCache, get_response_cache
+from src.services.concurrency import run_bounded
+from src.services.streaming import stream_chat_completion
+from src.services.pricing import calculate_cost, cached_prompt_tokens, get_price_table_version, split_usage
+from src.services.prompt_registry import get_prompt_registry, preference_params
+
 
 class ChatGPTService:
     """Serviço para integração com API do ChatGPT/OpenAI"""
     
     def __init__(self):
         self.api_key = os.getenv('OPENAI_API_KEY')
-        self.base_url = 'https://api.openai.com/v1'
+        self.base_url = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1').rstrip('/')
         self.model = 'gpt-4o-mini'  # Modelo mais econômico
+        self.cache = get_response_cache('openai')
+        self.prompts = get_prompt_registry()
         self.max_tokens = 1000
         
-    def _make_request(self, endpoint: str, data: dict) -> dict:
-        """Faz requisição para API do OpenAI"""
+    def _make_request(self, endpoint: str, data: dict, use_cache: bool = True) -> dict:
+        """Faz requisição para API do OpenAI (com cache de respostas)"""
+        cache_key = None
+        if use_cache and self.cache.enabled:
+            cache_key = ResponseCache.make_key('openai', endpoint, data)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                cached['cache_hit'] = True
+                return cached
+        
         if not self.api_key:
             raise ValueError("OPENAI_API_KEY não configurada")
         
@@ -24,65 +41,217 @@ class ChatGPTService:
             'Content-Type': 'application/json'
         }
         
-        response = requests.post(
+        response = guarded_request(
+            'openai',
+            'POST',
             f"{self.base_url}/{endpoint}",
             headers=headers,
             json=data,
-            timeout=30
+            timeout=http_client.get_timeout('openai')
         )
         
         if response.status_code != 200:
             raise Exception(f"Erro na API OpenAI: {response.status_code} - {response.text}")
         
-        return response.json()
+        result = response.json()
+        if cache_key:
+            self.cache.set(cache_key, result)
+        
+        return result
     
-    def _log_usage(self, user_id: str, endpoint: str, tokens_used: int, cost: float):
+    def _make_stream_request(self, endpoint: str, data: dict, use_cache: bool = True) -> Iterator[Tuple[str, object]]:
+        """Requisição em streaming: gera ('delta', texto) e por fim ('response', resposta).
+        
+        Compartilha o cache com _make_request: um acerto é entregue como um
+        único delta e a resposta montada do streaming é armazenada.
+        """
+        cache_key = None
+        if use_cache and self.cache.enabled:
+            cache_key = ResponseCache.make_key('openai', endpoint, data)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                cached['cache_hit'] = True
+                yield 'delta', cached['choices'][0]['message']['content']
+                yield 'response', cached
+                return
+        
+        if not self.api_key:
+            raise ValueError("OPENAI_API_KEY não configurada")
+        
+        headers = {
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json'
+        }
+        
+        for kind, value in stream_chat_completion(
+            'openai',
+            f"{self.base_url}/{endpoint}",
+            headers,
+            {**data, 'stream_options': {'include_usage': True}},
+            'Erro na API OpenAI'
+        ):
+            if kind == 'response' and cache_key:
+                self.cache.set(cache_key, value)
+            yield kind, value
+    
+    def _log_usage(self, user_id: str, endpoint: str, tokens_used: int, cost: float, response: dict = None,
+                   prompt: str = None, batch: bool = False):
         """Registra uso da API para controle de custos"""
+        response = response or {}
+        metadata = {'price_version': get_price_table_version()}
+        if batch:
+            metadata['batch'] = True
+        if prompt:
+            # Versão do prompt: permite comparar custo e qualidade entre versões
+            metadata['prompt_version'] = self.prompts.version(prompt)
+        prompt_tokens = completion_tokens = 0
+        if response.get('cache_hit'):
+            # Acerto de cache: registrado com custo zero e tokens economizados
+            metadata.update({
+                'cache_hit': True,
+                'tokens_saved': response.get('usage', {}).get('total_tokens', 0)
+            })
+        elif response:
+            prompt_tokens, completion_tokens, _ = split_usage(response.get('usage'))
+            metadata['cached_tokens'] = cached_prompt_tokens(response.get('usage'))
+        
         UsageLog.log_usage(
             user_id=user_id,
             api_type='chatgpt',
             endpoint=endpoint,
             tokens_used=tokens_used,
-            cost=cost
+            cost=cost,
+            metadata=metadata,
+            model=response.get('model') or self.model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens
         )
     
+    def _get_usage(self, response: dict, batch: bool = False) -> tuple:
+        """Retorna (tokens, custo) da resposta; acertos de cache custam zero"""
+        if response.get('cache_hit'):
+            return 0, 0.0
+        
+        usage = response.get('usage')
+        prompt_tokens, completion_tokens, tokens_used = split_usage(usage)
+        cost = calculate_cost(response.get('model') or self.model, prompt_tokens, completion_tokens,
+                              cached_tokens=cached_prompt_tokens(usage), batch=batch)
+        return tokens_used, cost
+    
+    def record_batch_usage(self, user_id: str, endpoint: str, response: dict, prompt: str = None) -> tuple:
+        """Registra o uso de uma resposta da Batch API (preço do lote); retorna (tokens, custo)"""
+        tokens_used, cost = self._get_usage(response, batch=True)
+        self._log_usage(user_id, f'batch:{endpoint}', tokens_used, cost, response, prompt=prompt, batch=True)
+        return tokens_used, cost
+    
     def analyze_note(self, user_id: str, note_content: str, user_preferences: dict = None) -> dict:
         """Analisa uma anotação e retorna insights organizados"""
         
-        # Prompt personalizado baseado nas preferências do usuário
-        system_prompt = self._build_analysis_prompt(user_preferences)
+        data = self._build_analysis_request(note_content, user_preferences)
+        
+        try:
+            response = self._make_request('chat/completions', data)
+            
+            # Extrai informações de uso (respostas do cache não têm custo)
+            tokens_used, cost = self._get_usage(response)
+            
+            # Registra uso
+            self._log_usage(user_id, 'analyze_note', tokens_used, cost, response, prompt='note_analysis')
+            
+            # Processa resposta
+            content = response['choices'][0]['message']['content']
+            analysis = json.loads(content)
+            
+            return {
+                'success': True,
+                'analysis': analysis,
+                'tokens_used': tokens_used,
+                'cost': cost
+            }
+            
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+                **unavailable_info(e),
+                'tokens_used': 0,
+                'cost': 0
+            }
+    
+    def analyze_note_stream(self, user_id: str, note_content: str,
+                            user_preferences: dict = None) -> Iterator[Tuple[str, object]]:
+        """Versão em streaming de analyze_note.
+        
+        Gera ('delta', texto) com os tokens da resposta e, ao final,
+        ('result', resultado) no mesmo formato de analyze_note.
+        """
+        data = self._build_analysis_request(note_content, user_preferences)
+        
+        try:
+            response = None
+            for kind, value in self._make_stream_request('chat/completions', data):
+                if kind == 'delta':
+                    yield 'delta', value
+                else:
+                    response = value
+            
+            tokens_used, cost = self._get_usage(response)
+            
+            self._log_usage(user_id, 'analyze_note', tokens_used, cost, response, prompt='note_analysis')
+            
+            analysis = json.loads(response['choices'][0]['message']['content'])
+            
+            yield 'result', {
+                'success': True,
+                'analysis': analysis,
+                'tokens_used': tokens_used,
+                'cost': cost
+            }
+            
+        except Exception as e:
+            yield 'result', {
+                'success': False,
+                'error': str(e),
+                **unavailable_info(e),
+                'tokens_used': 0,
+                'cost': 0
+            }
+    
+    def _build_analysis_request(self, note_content: str, user_preferences: dict = None) -> dict:
+        """Corpo da requisição de análise de uma anotação"""
+        
+        # Instruções e schema fixos primeiro; preferências do usuário no fim do prompt
+        system_prompt = self.prompts.render('note_analysis', **preference_params(user_preferences))
         
         messages = [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": f"Analise esta anotação:\n\n{note_content}"}
         ]
         
-        data = {
+        return {
             "model": self.model,
             "messages": messages,
             "max_tokens": self.max_tokens,
             "temperature": 0.3,
             "response_format": {"type": "json_object"}
         }
+    
+    def analyze_note_complete(self, user_id: str, note_content: str, user_preferences: dict = None) -> dict:
+        """Analisa a anotação e extrai tarefas e datas em uma única chamada"""
+        
+        data = self.build_analysis_complete_request(note_content, user_preferences)
         
         try:
             response = self._make_request('chat/completions', data)
             
-            # Extrai informações de uso
-            usage = response.get('usage', {})
-            tokens_used = usage.get('total_tokens', 0)
-            cost = self._calculate_cost(tokens_used)
+            tokens_used, cost = self._get_usage(response)
             
-            # Registra uso
-            self._log_usage(user_id, 'analyze_note', tokens_used, cost)
-            
-            # Processa resposta
-            content = response['choices'][0]['message']['content']
-            analysis = json.loads(content)
+            self._log_usage(user_id, 'analyze_note_combined', tokens_used, cost, response,
+                            prompt='note_analysis_combined')
             
             return {
                 'success': True,
-                'analysis': analysis,
+                **self.parse_analysis_complete(response),
                 'tokens_used': tokens_used,
                 'cost': cost
             }
@@ -91,47 +260,48 @@ class ChatGPTService:
             return {
                 'success': False,
                 'error': str(e),
+                **unavailable_info(e),
                 'tokens_used': 0,
                 'cost': 0
             }
     
-    def categorize_notes(self, user_id: str, notes: List[dict], existing_categories: List[str] = None) -> dict:
-        """Categoriza múltiplas anotações de uma vez"""
+    def build_analysis_complete_request(self, note_content: str, user_preferences: dict = None) -> dict:
+        """Corpo da requisição de análise combinada (também usado nos lotes da Batch API)"""
+        system_prompt = self.prompts.render('note_analysis_combined', **preference_params(user_preferences))
+        
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"Analise esta anotação:\n\n{note_content}"}
+        ]
         
-        # Prepara contexto das categorias existentes
-        categories_context = ""
-        if existing_categories:
-            categories_context = f"Categorias existentes: {', '.join(existing_categories)}\n"
+        return {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": self.max_tokens + 500,
+            "temperature": 0.2,
+            "response_format": {"type": "json_object"}
+        }
+    
+    @staticmethod
+    def parse_analysis_complete(response: dict) -> dict:
+        """Separa análise e tarefas/datas (no formato de extract_tasks_and_deadlines)"""
+        analysis = json.loads(response['choices'][0]['message']['content'])
+        extraction = {
+            'tasks': analysis.pop('tasks', []) or [],
+            'dates_mentioned': analysis.pop('dates_mentioned', []) or []
+        }
+        return {'analysis': analysis, 'extraction': extraction}
+    
+    def categorize_notes(self, user_id: str, notes: List[dict], existing_categories: List[str] = None,
+                         max_chars: int = 200, max_tokens: int = None) -> dict:
+        """Categoriza múltiplas anotações de uma vez"""
         
         # Prepara notas para análise
         notes_text = ""
         for i, note in enumerate(notes, 1):
-            notes_text += f"{i}. {note.get('content', '')[:200]}...\n"
-        
-        system_prompt = f"""Você é um assistente especializado em organização de informações.
+            notes_text += f"{i}. {note.get('content', '')[:max_chars]}...\n"
         
-{categories_context}
-Analise as anotações abaixo e sugira a melhor categoria para cada uma.
-Prefira usar categorias existentes quando apropriado, mas pode sugerir novas se necessário.
-
-Retorne um JSON com esta estrutura:
-{{
-    "categorizations": [
-        {{
-            "note_index": 1,
-            "suggested_category": "nome_da_categoria",
-            "confidence": 0.85,
-            "reason": "explicação breve"
-        }}
-    ],
-    "new_categories": [
-        {{
-            "name": "nova_categoria",
-            "description": "descrição da categoria",
-            "suggested_icon": "📝"
-        }}
-    ]
-}}"""
+        system_prompt = self.prompts.render('categorize_notes', existing_categories=tuple(existing_categories or ()))
 
         messages = [
             {"role": "system", "content": system_prompt},
@@ -141,7 +311,7 @@ Retorne um JSON com esta estrutura:
         data = {
             "model": self.model,
             "messages": messages,
-            "max_tokens": self.max_tokens,
+            "max_tokens": max_tokens or self.max_tokens,
             "temperature": 0.2,
             "response_format": {"type": "json_object"}
         }
@@ -149,11 +319,9 @@ Retorne um JSON com esta estrutura:
         try:
             response = self._make_request('chat/completions', data)
             
-            usage = response.get('usage', {})
-            tokens_used = usage.get('total_tokens', 0)
-            cost = self._calculate_cost(tokens_used)
+            tokens_used, cost = self._get_usage(response)
             
-            self._log_usage(user_id, 'categorize_notes', tokens_used, cost)
+            self._log_usage(user_id, 'categorize_notes', tokens_used, cost, response, prompt='categorize_notes')
             
             content = response['choices'][0]['message']['content']
             categorization = json.loads(content)
@@ -169,75 +337,297 @@ Retorne um JSON com esta estrutura:
             return {
                 'success': False,
                 'error': str(e),
+                **unavailable_info(e),
                 'tokens_used': 0,
                 'cost': 0
             }
     
-    def generate_daily_summary(self, user_id: str, notes: List[dict], date: str) -> dict:
-        """Gera resumo diário das anotações"""
-        
-        # Agrupa notas por categoria
-        notes_by_category = {}
-        for note in notes:
-            category = note.get('category', 'Sem categoria')
-            if category not in notes_by_category:
-                notes_by_category[category] = []
-            notes_by_category[category].append(note.get('content', ''))
-        
-        # Prepara contexto
-        context = f"Resumo das anotações do dia {date}:\n\n"
-        for category, category_notes in notes_by_category.items():
-            context += f"**{category}:**\n"
-            for note_content in category_notes:
-                context += f"- {note_content[:150]}...\n"
-            context += "\n"
-        
-        system_prompt = """Você é um assistente especializado em criar resumos organizados.
-
-Analise as anotações do dia e crie um resumo estruturado que inclua:
-1. Principais temas abordados
-2. Tarefas e compromissos identificados
-3. Insights e ideias importantes
-4. Sugestões de ações para os próximos dias
-
-Retorne um JSON com esta estrutura:
-{
-    "summary": {
-        "main_themes": ["tema1", "tema2"],
-        "tasks_identified": [
-            {
-                "task": "descrição da tarefa",
-                "priority": "alta|média|baixa",
-                "suggested_deadline": "YYYY-MM-DD ou null"
-            }
-        ],
-        "key_insights": ["insight1", "insight2"],
-        "action_suggestions": ["sugestão1", "sugestão2"],
-        "overall_summary": "resumo geral do dia em 2-3 frases"
-    }
-}"""
-
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": context}
-        ]
+    def label_topic_cluster(self, user_id: str, top_terms: List[str], sample_notes: List[str],
+                            existing_categories: List[str] = None, max_chars: int = 150) -> dict:
+        """Sugere uma categoria para um grupo de anotações (uma chamada por cluster)"""
+        
+        system_prompt = self.prompts.render('label_topic_cluster', existing_categories=tuple(existing_categories or ()))
+        
+        notes_text = f"Termos mais frequentes: {', '.join(top_terms)}\n\nExemplos:\n"
+        for i, content in enumerate(sample_notes, 1):
+            notes_text += f"{i}. {content[:max_chars]}\n"
         
         data = {
             "model": self.model,
-            "messages": messages,
-            "max_tokens": self.max_tokens,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": notes_text}
+            ],
+            "max_tokens": 150,
+            "temperature": 0.2,
+            "response_format": {"type": "json_object"}
+        }
+        
+        try:
+            response = self._make_request('chat/completions', data)
+            
+            tokens_used, cost = self._get_usage(response)
+            
+            self._log_usage(user_id, 'label_topic_cluster', tokens_used, cost, response, prompt='label_topic_cluster')
+            
+            content = response['choices'][0]['message']['content']
+            label = json.loads(content)
+            
+            return {
+                'success': True,
+                'label': label,
+                'tokens_used': tokens_used,
+                'cost': cost
+            }
+            
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+                **unavailable_info(e),
+                'tokens_used': 0,
+                'cost': 0
+            }
+    
+    def generate_daily_summary(self, user_id: str, notes: List[dict], date: str, before_call=None) -> dict:
+        """Gera resumo diário das anotações.
+        
+        Dias leves cabem em uma chamada; dias pesados usam map-reduce:
+        resumos parciais por chunk (agrupados por categoria e limitados por
+        tokens estimados) em paralelo e uma chamada final que os combina.
+        A entrada é limitada a DAILY_SUMMARY_MAX_CHUNKS chunks: acima de
+        chunk_tokens * max_chunks, cada categoria entra com uma amostra
+        proporcional das suas notas. Assim o número de chamadas e a entrada
+        da redução (no máximo max_chunks resumos parciais) não crescem com
+        o número de notas.
+        
+        before_call, se informado, é chamado antes de cada requisição ao
+        LLM (ex.: acquire do limitador de taxa do worker).
+        
+        O resultado indica resumo parcial em notes_omitted (notas fora da
+        amostra) e, no map-reduce, chunks_failed.
+        """
+        entries = self._daily_entries(notes)
+        before_call = before_call or (lambda: None)
+        
+        if self._fits_single_pass(entries):
+            before_call()
+            result = self._summarize_day_single_pass(user_id, entries, date)
+            result['mode'] = 'single_pass'
+        else:
+            result = self._summarize_day_map_reduce(user_id, entries, date,
+                                                    int(os.getenv('DAILY_SUMMARY_CHUNK_TOKENS', 3000)), before_call)
+        
+        # Uma entrada por nota mantida
+        result['notes_omitted'] = len(notes) - len(entries)
+        return result
+    
+    def build_daily_summary_request(self, notes: List[dict], date: str) -> Optional[dict]:
+        """Corpo da requisição do resumo do dia em chamada única (para a Batch API).
+        
+        Retorna None para dias pesados, que precisam de map-reduce e
+        continuam no caminho síncrono.
+        """
+        entries = self._daily_entries(notes)
+        if not self._fits_single_pass(entries):
+            return None
+        return self._summary_request('daily_summary', *self._single_pass_content(entries, date))
+    
+    def _daily_entries(self, notes: List[dict]) -> List[dict]:
+        """Notas do dia agrupadas por categoria e truncadas ao orçamento por nota.
+        
+        Com mais notas do que o orçamento total comporta no limite mínimo
+        por nota, cada categoria é amostrada proporcionalmente e o
+        cabeçalho da categoria indica quantas notas ficaram de fora.
+        """
+        chunk_tokens = int(os.getenv('DAILY_SUMMARY_CHUNK_TOKENS', 3000))
+        max_chunks = int(os.getenv('DAILY_SUMMARY_MAX_CHUNKS', 12))
+        total_budget = chunk_tokens * max_chunks
+        min_note_tokens = 60
+        
+        by_category = {}
+        for note in sorted(notes, key=lambda n: n.get('category') or 'Sem categoria'):
+            by_category.setdefault(note.get('category') or 'Sem categoria', []).append(note)
+        totals = {category: len(group) for category, group in by_category.items()}
+        
+        # Notas que cabem no orçamento no limite mínimo (5 tokens de formatação por nota)
+        max_notes = max(1, total_budget // (min_note_tokens + 5))
+        if len(notes) > max_notes:
+            by_category = self._sample_by_category(by_category, max_notes)
+        kept = sum(len(group) for group in by_category.values())
+        
+        # Limite por nota: distribui o orçamento total entre as notas mantidas
+        note_budget = max(min_note_tokens, min(500, total_budget // max(1, kept) - 5))
+        
+        entries = []
+        for category, group in by_category.items():
+            for index, note in enumerate(group):
+                content = self._truncate_to_tokens(note.get('content', ''), note_budget)
+                entry = {
+                    'category': category,
+                    'content': content,
+                    'tokens': self.estimate_tokens(content) + 5
+                }
+                if index == 0 and totals[category] > len(group):
+                    entry['category_label'] = f"{category} ({len(group)} de {totals[category]} anotações)"
+                entries.append(entry)
+        return entries
+    
+    @staticmethod
+    def _sample_by_category(by_category: Dict[str, List[dict]], max_notes: int) -> Dict[str, List[dict]]:
+        """Amostra proporcional por categoria, com notas espaçadas ao longo do grupo.
+        
+        Toda categoria mantém ao menos uma nota enquanto couber; havendo
+        mais categorias que max_notes, ficam as maiores.
+        """
+        total_notes = sum(len(group) for group in by_category.values())
+        quotas = {category: max(1, len(group) * max_notes // total_notes) for category, group in by_category.items()}
+        
+        # Arredondamento para cima (mínimo de 1) pode passar do limite: retira das maiores cotas,
+        # e por fim das menores categorias
+        while sum(quotas.values()) > max_notes:
+            largest = max(quotas, key=quotas.get)
+            if quotas[largest] > 1:
+                quotas[largest] -= 1
+            else:
+                del quotas[min(quotas, key=lambda category: len(by_category[category]))]
+        
+        sampled = {}
+        for category, group in by_category.items():
+            quota = quotas.get(category)
+            if quota:
+                step = len(group) / quota
+                sampled[category] = [group[int(i * step)] for i in range(quota)]
+        return sampled
+    
+    @staticmethod
+    def _fits_single_pass(entries: List[dict]) -> bool:
+        single_pass_tokens = int(os.getenv('DAILY_SUMMARY_SINGLE_PASS_TOKENS', 3000))
+        return sum(entry['tokens'] for entry in entries) <= single_pass_tokens
+    
+    def _single_pass_content(self, entries: List[dict], date: str) -> tuple:
+        """(conteúdo, max_tokens) do resumo do dia em chamada única"""
+        context = f"Resumo das anotações do dia {date}:\n\n" + self._format_entries(entries)
+        
+        # Resposta proporcional ao volume do dia
+        return context, min(self.max_tokens, 300 + self.estimate_tokens(context) // 2)
+    
+    def _summarize_day_single_pass(self, user_id: str, entries: List[dict], date: str) -> dict:
+        """Resumo do dia em uma única chamada"""
+        context, max_tokens = self._single_pass_content(entries, date)
+        return self._request_summary(user_id, 'daily_summary', context, max_tokens)
+    
+    def _summarize_day_map_reduce(self, user_id: str, entries: List[dict], date: str, chunk_tokens: int,
+                                  before_call) -> dict:
+        """Resumos parciais em paralelo seguidos de uma chamada de redução"""
+        # Capacidade ajustada para que o empacotamento guloso gere no máximo max_chunks chunks
+        max_chunks = int(os.getenv('DAILY_SUMMARY_MAX_CHUNKS', 12))
+        total_tokens = sum(entry['tokens'] for entry in entries)
+        largest_entry = max(entry['tokens'] for entry in entries)
+        chunk_tokens = max(chunk_tokens, -(-total_tokens // max(1, max_chunks - 1)) + largest_entry)
+        
+        chunks = []
+        current = []
+        current_tokens = 0
+        for entry in entries:
+            if current and current_tokens + entry['tokens'] > chunk_tokens:
+                chunks.append(current)
+                current = []
+                current_tokens = 0
+            current.append(entry)
+            current_tokens += entry['tokens']
+        if current:
+            chunks.append(current)
+        
+        def summarize_chunk(chunk):
+            before_call()
+            return self._request_summary(user_id, 'daily_summary_map', self._format_entries(chunk), 400, date=date)
+        
+        max_concurrency = int(os.getenv('DAILY_SUMMARY_MAX_CONCURRENCY', 4))
+        partials = []
+        tokens_used = 0
+        cost = 0.0
+        for chunk, result, error in run_bounded(summarize_chunk, chunks, max_workers=max_concurrency):
+            if error or not result['success']:
+                continue
+            partials.append(result['summary'])
+            tokens_used += result['tokens_used']
+            cost += result['cost']
+        
+        if not partials:
+            return {
+                'success': False,
+                'error': 'Falha ao gerar resumos parciais do dia',
+                'tokens_used': tokens_used,
+                'cost': cost
+            }
+        
+        before_call()
+        result = self._request_summary(
+            user_id, 'daily_summary_reduce',
+            json.dumps(partials, ensure_ascii=False), self.max_tokens, date=date
+        )
+        result['tokens_used'] += tokens_used
+        result['cost'] += cost
+        result['mode'] = 'map_reduce'
+        result['chunks'] = len(chunks)
+        result['chunks_failed'] = len(chunks) - len(partials)
+        return result
+    
+    def generate_period_summary(self, user_id: str, daily_summaries: List[dict], period_label: str) -> dict:
+        """Combina resumos diários já gerados em um resumo semanal/mensal.
+        
+        Recebe [{'date': 'YYYY-MM-DD', 'summary': {...}}] e faz uma única
+        chamada de redução sobre a versão compacta de cada dia, sem reler
+        as anotações.
+        """
+        days = []
+        for day in daily_summaries:
+            summary = day['summary'].get('summary', day['summary'])
+            days.append({
+                'date': day['date'],
+                'themes': summary.get('main_themes', [])[:5],
+                'tasks': [
+                    {
+                        'task': task.get('task'),
+                        'priority': task.get('priority'),
+                        'deadline': task.get('suggested_deadline')
+                    }
+                    for task in summary.get('tasks_identified', [])[:10]
+                    if isinstance(task, dict)
+                ],
+                'insights': summary.get('key_insights', [])[:5],
+                'summary': summary.get('overall_summary', '')
+            })
+        
+        return self._request_summary(
+            user_id, 'period_summary',
+            json.dumps(days, ensure_ascii=False), self.max_tokens, period_label=period_label
+        )
+    
+    def _summary_request(self, prompt: str, content: str, max_tokens: int, **prompt_params) -> dict:
+        """Corpo da requisição de resumo com resposta JSON"""
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": self.prompts.render(prompt, **prompt_params)},
+                {"role": "user", "content": content}
+            ],
+            "max_tokens": max_tokens,
             "temperature": 0.4,
             "response_format": {"type": "json_object"}
         }
+    
+    def _request_summary(self, user_id: str, prompt: str, content: str, max_tokens: int, **prompt_params) -> dict:
+        """Chamada de resumo com resposta JSON (prompt do registro, também usado como endpoint no log)"""
+        data = self._summary_request(prompt, content, max_tokens, **prompt_params)
         
         try:
             response = self._make_request('chat/completions', data)
             
-            usage = response.get('usage', {})
-            tokens_used = usage.get('total_tokens', 0)
-            cost = self._calculate_cost(tokens_used)
+            tokens_used, cost = self._get_usage(response)
             
-            self._log_usage(user_id, 'daily_summary', tokens_used, cost)
+            self._log_usage(user_id, prompt, tokens_used, cost, response, prompt=prompt)
             
             content = response['choices'][0]['message']['content']
             summary = json.loads(content)
@@ -253,37 +643,37 @@ Retorne um JSON com esta estrutura:
             return {
                 'success': False,
                 'error': str(e),
+                **unavailable_info(e),
                 'tokens_used': 0,
                 'cost': 0
             }
     
+    def _format_entries(self, entries: List[dict]) -> str:
+        """Formata notas agrupadas por categoria"""
+        text = ""
+        current_category = None
+        for entry in entries:
+            if entry['category'] != current_category:
+                current_category = entry['category']
+                text += f"\n**{entry.get('category_label', current_category)}:**\n"
+            text += f"- {entry['content']}\n"
+        return text
+    
+    def _truncate_to_tokens(self, text: str, max_tokens: int) -> str:
+        """Corta o texto no último espaço antes do limite estimado de tokens"""
+        max_chars = max_tokens * 4
+        if len(text) <= max_chars:
+            return text
+        truncated = text[:max_chars]
+        last_space = truncated.rfind(' ')
+        if last_space > 0:
+            truncated = truncated[:last_space]
+        return truncated + "..."
+    
     def extract_tasks_and_deadlines(self, user_id: str, note_content: str) -> dict:
         """Extrai tarefas e prazos de uma anotação"""
         
-        system_prompt = """Você é um assistente especializado em identificar tarefas e prazos.
-
-Analise o texto e identifique:
-1. Tarefas explícitas ou implícitas
-2. Datas e prazos mencionados
-3. Prioridades sugeridas
-
-Retorne um JSON com esta estrutura:
-{
-    "tasks": [
-        {
-            "task": "descrição da tarefa",
-            "deadline": "YYYY-MM-DD ou null",
-            "priority": "alta|média|baixa",
-            "confidence": 0.85
-        }
-    ],
-    "dates_mentioned": [
-        {
-            "date": "YYYY-MM-DD",
-            "context": "contexto da data mencionada"
-        }
-    ]
-}"""
+        system_prompt = self.prompts.render('extract_tasks')
 
         messages = [
             {"role": "system", "content": system_prompt},
@@ -301,11 +691,9 @@ Retorne um JSON com esta estrutura:
         try:
             response = self._make_request('chat/completions', data)
             
-            usage = response.get('usage', {})
-            tokens_used = usage.get('total_tokens', 0)
-            cost = self._calculate_cost(tokens_used)
+            tokens_used, cost = self._get_usage(response)
             
-            self._log_usage(user_id, 'extract_tasks', tokens_used, cost)
+            self._log_usage(user_id, 'extract_tasks', tokens_used, cost, response, prompt='extract_tasks')
             
             content = response['choices'][0]['message']['content']
             extraction = json.loads(content)
@@ -321,55 +709,15 @@ Retorne um JSON com esta estrutura:
             return {
                 'success': False,
                 'error': str(e),
+                **unavailable_info(e),
                 'tokens_used': 0,
                 'cost': 0
             }
     
-    def _build_analysis_prompt(self, user_preferences: dict = None) -> str:
-        """Constrói prompt personalizado baseado nas preferências do usuário"""
-        
-        base_prompt = """Você é um assistente especializado em análise e organização de anotações pessoais.
-
-Analise a anotação fornecida e retorne insights úteis em formato JSON.
-"""
-        
-        # Personaliza baseado nas preferências
-        if user_preferences:
-            focus_areas = user_preferences.get('focus_areas', [])
-            if focus_areas:
-                base_prompt += f"\nFoque especialmente em: {', '.join(focus_areas)}\n"
-            
-            organization_style = user_preferences.get('organization_style', 'balanced')
-            if organization_style == 'detailed':
-                base_prompt += "Forneça análises detalhadas e abrangentes.\n"
-            elif organization_style == 'concise':
-                base_prompt += "Mantenha as análises concisas e diretas.\n"
-        
-        base_prompt += """
-Retorne um JSON com esta estrutura:
-{
-    "category_suggestion": "categoria sugerida",
-    "tags": ["tag1", "tag2", "tag3"],
-    "summary": "resumo em 1-2 frases",
-    "key_points": ["ponto1", "ponto2"],
-    "action_items": [
-        {
-            "action": "ação sugerida",
-            "priority": "alta|média|baixa"
-        }
-    ],
-    "related_topics": ["tópico1", "tópico2"],
-    "sentiment": "positivo|neutro|negativo",
-    "confidence_score": 0.85
-}"""
-        
-        return base_prompt
-    
-    def _calculate_cost(self, tokens: int) -> float:
-        """Calcula custo baseado no número de tokens (GPT-4o-mini)"""
-        # Preços aproximados por 1K tokens (input + output)
-        cost_per_1k_tokens = 0.0002  # $0.0002 por 1K tokens
-        return (tokens / 1000) * cost_per_1k_tokens
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """Estimativa rápida de tokens (~4 caracteres por token em português)"""
+        return max(1, len(text or '') // 4)
     
     def test_connection(self) -> bool:
         """Testa conexão com a API"""
@@ -379,7 +727,7 @@ Retorne um JSON com esta estrutura:
                 "messages": [{"role": "user", "content": "Hello"}],
                 "max_tokens": 5
             }
-            response = self._make_request('chat/completions', data)
+            response = self._make_request('chat/completions', data, use_cache=False)
             return True
         except:
             return False
@@ -0,0 +1,196 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
+from functools import wraps
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from flask import current_app, has_app_context
+from src.models.user import db
+
+# Pool compartilhado pelo processo para execução de etapas de IA
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Retorna o pool de threads compartilhado (criado sob demanda)"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=int(os.getenv('AI_STAGE_WORKERS', 8)),
+                    thread_name_prefix='ai-stage'
+                )
+    return _executor
+
+
+def bind_app_context(func: Callable) -> Callable:
+    """Envolve a função para rodar em outra thread com o app context atual.
+
+    Cada thread recebe sua própria sessão do SQLAlchemy, descartada ao final.
+    """
+    app = current_app._get_current_object() if has_app_context() else None
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if app is None:
+            return func(*args, **kwargs)
+        with app.app_context():
+            try:
+                return func(*args, **kwargs)
+            finally:
+                db.session.remove()
+
+    return wrapper
+
+
+def run_bounded(func: Callable, items: Iterable, max_workers: int = 4) -> Iterator[Tuple[object, object, Optional[Exception]]]:
+    """Executa func(item) com concorrência limitada.
+
+    Gera (item, resultado, erro) à medida que cada item termina.
+    """
+    bound = bind_app_context(func)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bounded') as executor:
+        futures = {executor.submit(bound, item): item for item in items}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+
+
+class StageSkipped(Exception):
+    """Etapa descartada sem ser uma falha (ex.: provedor indisponível)"""
+
+
+class Stage:
+    """Etapa de um pipeline: função, dependências e timeout"""
+
+    def __init__(self, name: str, func: Callable, depends_on: List[str] = None, timeout: float = None):
+        self.name = name
+        self.func = func
+        self.depends_on = depends_on or []
+        self.timeout = timeout
+
+
+class StageGraph:
+    """Executa etapas independentes em paralelo respeitando dependências.
+
+    Cada função de etapa recebe um dicionário com os valores das etapas
+    das quais depende. O resultado de cada etapa é um dicionário com
+    status ('ok', 'failed', 'timeout' ou 'skipped'), valor, erro e duração.
+
+    O timeout e a duração contam a partir do início real da etapa, não da
+    submissão: com o pool compartilhado cheio, uma etapa na fila não
+    expira antes de rodar (e não é abandonada ocupando uma thread).
+    """
+
+    # Intervalo de verificação enquanto há etapas submetidas que ainda não começaram
+    QUEUED_POLL_SECONDS = 0.1
+
+    def __init__(self, stages: List[Stage], executor: ThreadPoolExecutor = None):
+        self.stages = {stage.name: stage for stage in stages}
+        self.executor = executor or get_executor()
+
+        for stage in stages:
+            for dependency in stage.depends_on:
+                if dependency not in self.stages:
+                    raise ValueError(f"Etapa '{stage.name}' depende de etapa inexistente '{dependency}'")
+
+    def run(self, on_stage: Callable[[str, dict], None] = None) -> Dict[str, dict]:
+        """Executa o grafo e retorna o resultado de cada etapa.
+
+        on_stage(nome, resultado), se informado, é chamado assim que cada
+        etapa termina (inclusive falha, timeout ou descarte).
+        """
+        results = {}
+        running = {}  # future -> stage
+        started = {}  # nome da etapa -> início real (gravado pela thread do pool)
+
+        def finish(name: str, result: dict):
+            results[name] = result
+            if on_stage:
+                on_stage(name, result)
+
+        while len(results) < len(self.stages):
+            # Descarta etapas cujas dependências não terminaram com sucesso
+            for name, stage in self.stages.items():
+                if name in results or self._is_running(running, name):
+                    continue
+                failed_deps = [d for d in stage.depends_on if d in results and results[d]['status'] != 'ok']
+                if failed_deps:
+                    finish(name, self._stage_result('skipped', error=f"Dependência falhou: {', '.join(failed_deps)}"))
+
+            # Submete etapas prontas
+            for name, stage in self.stages.items():
+                if name in results or self._is_running(running, name):
+                    continue
+                if all(d in results and results[d]['status'] == 'ok' for d in stage.depends_on):
+                    inputs = {d: results[d]['value'] for d in stage.depends_on}
+                    future = self.executor.submit(self._timed(stage, started), inputs)
+                    running[future] = stage
+
+            if not running:
+                break
+
+            done, _ = wait(list(running.keys()), timeout=self._next_deadline(running, started),
+                           return_when=FIRST_COMPLETED)
+
+            for future in done:
+                stage = running.pop(future)
+                duration = time.monotonic() - started.get(stage.name, time.monotonic())
+                try:
+                    result = self._stage_result('ok', value=future.result(), duration=duration)
+                except StageSkipped as e:
+                    result = self._stage_result('skipped', error=str(e), duration=duration)
+                except Exception as e:
+                    result = self._stage_result('failed', error=str(e), duration=duration)
+                finish(stage.name, result)
+
+            # Abandona etapas em execução que excederam o timeout (a thread termina sozinha)
+            now = time.monotonic()
+            for future, stage in list(running.items()):
+                stage_started = started.get(stage.name)
+                if stage.timeout is not None and stage_started is not None and now - stage_started >= stage.timeout:
+                    running.pop(future)
+                    finish(stage.name, self._stage_result(
+                        'timeout', error=f"Timeout após {stage.timeout}s", duration=now - stage_started
+                    ))
+
+        return results
+
+    @staticmethod
+    def _timed(stage: Stage, started: dict) -> Callable:
+        """Função da etapa que registra o próprio início ao sair da fila do pool"""
+        func = bind_app_context(stage.func)
+
+        def run(inputs):
+            started[stage.name] = time.monotonic()
+            return func(inputs)
+        return run
+
+    def _is_running(self, running: dict, name: str) -> bool:
+        return any(stage.name == name for stage in running.values())
+
+    def _next_deadline(self, running: dict, started: dict) -> Optional[float]:
+        """Tempo até o próximo timeout de etapa em execução (ou até reavaliar as que estão na fila)"""
+        now = time.monotonic()
+        remaining = []
+        for stage in running.values():
+            if stage.timeout is None:
+                continue
+            if stage.name in started:
+                remaining.append(stage.timeout - (now - started[stage.name]))
+            else:
+                remaining.append(self.QUEUED_POLL_SECONDS)
+        return max(min(remaining), 0) if remaining else None
+
+    @staticmethod
+    def _stage_result(status: str, value=None, error: str = None, duration: float = 0.0) -> dict:
+        return {
+            'status': status,
+            'value': value,
+            'error': error,
+            'duration': round(duration, 3)
+        }
@@ -0,0 +1,253 @@
+import os
+import re
+import hashlib
+from datetime import datetime
+from typing import List, Optional, Set
+import numpy as np
+from src.models.user import db
+from src.models.note import Note, Insight
+from src.models.fingerprint import NoteFingerprint, NoteLSHBucket
+from src.services.text_processing import normalize_text
+
+# Primo de Mersenne 2^31 - 1: (a * x + b) cabe em uint64 sem overflow
+_PRIME = np.uint64((1 << 31) - 1)
+
+
+class MinHasher:
+    """Assinaturas MinHash sobre shingles de palavras e buckets LSH por banda"""
+
+    def __init__(self, num_perm: int = 128, bands: int = 16, shingle_size: int = 3, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm deve ser múltiplo de bands")
+
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        # Permutações fixas: assinaturas persistidas continuam comparáveis
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, int(_PRIME), size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, int(_PRIME), size=num_perm).astype(np.uint64)
+
+    def shingles(self, text: str) -> Set[int]:
+        """Hashes dos n-gramas de palavras do texto normalizado"""
+        words = re.findall(r'\w+', normalize_text(text))
+        if not words:
+            return set()
+
+        if len(words) < self.shingle_size:
+            grams = [' '.join(words)]
+        else:
+            grams = [' '.join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)]
+
+        return {
+            int.from_bytes(hashlib.blake2b(gram.encode('utf-8'), digest_size=4).digest(), 'little') % int(_PRIME)
+            for gram in grams
+        }
+
+    def signature(self, text: str) -> np.ndarray:
+        """Assinatura MinHash (uint32 x num_perm); vazia se não há palavras"""
+        shingles = self.shingles(text)
+        if not shingles:
+            return np.zeros(0, dtype=np.uint32)
+
+        hashes = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+        values = (np.outer(hashes, self._a) + self._b) % _PRIME
+        return values.min(axis=0).astype(np.uint32)
+
+    def band_buckets(self, signature: np.ndarray) -> List[str]:
+        """Hash de cada banda da assinatura"""
+        if signature.size != self.num_perm:
+            return []
+        return [
+            hashlib.blake2b(signature[band * self.rows:(band + 1) * self.rows].tobytes(), digest_size=8).hexdigest()
+            for band in range(self.bands)
+        ]
+
+    @staticmethod
+    def similarity(signature1: np.ndarray, signature2: np.ndarray) -> float:
+        """Jaccard estimado entre duas assinaturas"""
+        if signature1.size == 0 or signature1.size != signature2.size:
+            return 0.0
+        return float(np.mean(signature1 == signature2))
+
+
+class DuplicateDetector:
+    """Detecta quase-duplicatas de anotações por MinHash/LSH"""
+
+    def __init__(self, hasher: MinHasher = None, threshold: float = None):
+        self.hasher = hasher or MinHasher()
+        self.threshold = threshold if threshold is not None else float(os.getenv('DEDUP_SIMILARITY_THRESHOLD', 0.85))
+
+    def register_note(self, note: Note) -> Optional[Note]:
+        """Calcula assinatura e buckets da nota e retorna a original, se duplicata (sem commit)"""
+        signature = self.hasher.signature(note.content)
+        buckets = self.hasher.band_buckets(signature)
+
+        fingerprint = NoteFingerprint.query.get(note.id)
+        if fingerprint is None:
+            fingerprint = NoteFingerprint(note_id=note.id, user_id=note.user_id)
+            db.session.add(fingerprint)
+        fingerprint.set_signature(signature)
+
+        NoteLSHBucket.query.filter_by(note_id=note.id).delete(synchronize_session=False)
+        if buckets:
+            db.session.execute(NoteLSHBucket.__table__.insert(), [{
+                'note_id': note.id,
+                'user_id': note.user_id,
+                'band': band,
+                'bucket': bucket
+            } for band, bucket in enumerate(buckets)])
+
+        # Nota que já é original de outras não vira duplicata ao ser editada
+        # (suas duplicatas ficariam apontando para uma duplicata)
+        is_original = NoteFingerprint.query.filter(
+            NoteFingerprint.duplicate_of == note.id,
+            NoteFingerprint.note_id != note.id
+        ).first() is not None
+        original, similarity = (None, 0.0) if is_original else self._find_original(note, signature, buckets)
+        fingerprint.duplicate_of = original.id if original else None
+        fingerprint.similarity = round(similarity, 4) if original else None
+
+        metadata = note.get_metadata()
+        if original:
+            metadata['duplicate_of'] = original.id
+        else:
+            metadata.pop('duplicate_of', None)
+        note.set_metadata(metadata)
+
+        db.session.flush()
+        return original
+
+    def _find_original(self, note: Note, signature: np.ndarray, buckets: List[str]):
+        """Nota mais antiga (ou sua original) com Jaccard estimado acima do limiar.
+
+        Só notas criadas antes desta podem ser a original: uma nota antiga
+        editada para parecer uma nova não vira duplicata da nova.
+        """
+        if not buckets:
+            return None, 0.0
+
+        candidate_ids = [row[0] for row in db.session.query(NoteLSHBucket.note_id).filter(
+            NoteLSHBucket.user_id == note.user_id,
+            NoteLSHBucket.note_id != note.id,
+            db.or_(*[
+                db.and_(NoteLSHBucket.band == band, NoteLSHBucket.bucket == bucket)
+                for band, bucket in enumerate(buckets)
+            ])
+        ).distinct().all()]
+        if not candidate_ids:
+            return None, 0.0
+
+        matches = {}
+        for candidate in NoteFingerprint.query.filter(NoteFingerprint.note_id.in_(candidate_ids)).all():
+            similarity = self.hasher.similarity(signature, candidate.get_signature())
+            if similarity >= self.threshold:
+                original_id = candidate.duplicate_of or candidate.note_id
+                if original_id != note.id:
+                    matches[original_id] = max(matches.get(original_id, 0.0), similarity)
+        if not matches:
+            return None, 0.0
+
+        created = (note.created_at or datetime.utcnow(), note.id)
+        originals = [
+            other for other in Note.query.filter(Note.id.in_(list(matches.keys()))).all()
+            if (other.created_at, other.id) < created
+        ]
+        if not originals:
+            return None, 0.0
+
+        original = min(originals, key=lambda other: (other.created_at, other.id))
+        return original, matches[original.id]
+
+    def remove_notes(self, note_ids: List[str]):
+        """Remove assinaturas das notas e libera as duplicatas que apontavam para elas (sem commit)"""
+        if not note_ids:
+            return
+
+        NoteLSHBucket.query.filter(NoteLSHBucket.note_id.in_(note_ids)).delete(synchronize_session=False)
+        NoteFingerprint.query.filter(NoteFingerprint.note_id.in_(note_ids)).delete(synchronize_session=False)
+
+        orphans = NoteFingerprint.query.filter(NoteFingerprint.duplicate_of.in_(note_ids)).all()
+        for fingerprint in orphans:
+            fingerprint.duplicate_of = None
+            fingerprint.similarity = None
+            note = Note.query.get(fingerprint.note_id)
+            if note:
+                metadata = note.get_metadata()
+                metadata.pop('duplicate_of', None)
+                note.set_metadata(metadata)
+
+    def duplicate_ids(self, user_id: str) -> Set[str]:
+        """IDs das notas marcadas como quase-duplicatas do usuário"""
+        return {row[0] for row in db.session.query(NoteFingerprint.note_id).filter(
+            NoteFingerprint.user_id == user_id,
+            NoteFingerprint.duplicate_of.isnot(None)
+        ).all()}
+
+    def related_exclusions(self, note: Note) -> Set[str]:
+        """Notas que não devem aparecer como relacionadas: duplicatas e o grupo da própria nota"""
+        excluded = self.duplicate_ids(note.user_id)
+
+        fingerprint = NoteFingerprint.query.get(note.id)
+        if fingerprint and fingerprint.duplicate_of:
+            excluded.add(fingerprint.duplicate_of)
+        return excluded
+
+    def backfill(self, user_id: str, batch_size: int = 200, on_progress=None) -> dict:
+        """Calcula assinaturas das notas antigas em ordem cronológica, marcando duplicatas"""
+        processed = 0
+        duplicates = 0
+
+        while True:
+            notes = Note.query.outerjoin(
+                NoteFingerprint, NoteFingerprint.note_id == Note.id
+            ).filter(
+                Note.user_id == user_id,
+                NoteFingerprint.note_id.is_(None)
+            ).order_by(Note.created_at, Note.id).limit(batch_size).all()
+            if not notes:
+                break
+
+            for note in notes:
+                if self.register_note(note):
+                    duplicates += 1
+            db.session.commit()
+
+            processed += len(notes)
+            if on_progress:
+                on_progress(notes[-1].id, processed)
+
+        return {'notes_fingerprinted': processed, 'duplicates_found': duplicates}
+
+
+def copy_ai_results(original: Note, note: Note):
+    """Reaproveita categoria, tags, prazo e insights da nota original (sem commit)"""
+    note.category = original.category
+    note.set_tags(original.get_tags())
+    note.deadline_suggested = original.deadline_suggested
+
+    for insight in original.insights:
+        db.session.add(Insight(
+            user_id=note.user_id,
+            note_id=note.id,
+            insight_type=insight.insight_type,
+            content=insight.content,
+            confidence_score=insight.confidence_score,
+            insight_metadata=insight.get_metadata()
+        ))
+
+    note.update_metadata('ai_reused_from', original.id)
+    note.mark_as_processed()
+
+
+_detector = None
+
+
+def get_duplicate_detector() -> DuplicateDetector:
+    """Retorna o detector de duplicatas compartilhado pelo processo"""
+    global _detector
+    if _detector is None:
+        _detector = DuplicateDetector()
+    return _detector
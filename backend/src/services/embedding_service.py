@@ -0,0 +1,368 @@
+import os
+import re
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from src.models.user import db, UsageLog
+from src.models.note import Note
+from src.models.embedding import NoteEmbedding
+from src.services import http_client
+from src.services.resilience import guarded_request
+from src.services.pricing import calculate_cost, get_price_table_version, split_usage
+
+
+class EmbeddingProvider:
+    """Interface para provedores de embeddings"""
+
+    name = 'base'
+    dim = 0
+    is_local = False
+
+    def embed(self, texts: List[str], user_id: str = None) -> np.ndarray:
+        """Retorna matriz (len(texts), dim) float32"""
+        raise NotImplementedError
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """Embeddings locais e determinísticos por feature hashing.
+
+    Não faz chamadas externas: útil em testes, desenvolvimento e como
+    fallback sem chave de API. Usa palavras e bigramas normalizados.
+    """
+
+    is_local = True
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f'local-hashing-{dim}'
+
+    def embed(self, texts: List[str], user_id: str = None) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+
+        for row, text in enumerate(texts):
+            words = _normalize_words(text)
+            features = words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+            for feature in features:
+                digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+                value = int.from_bytes(digest, 'little')
+                sign = 1.0 if value & 1 else -1.0
+                matrix[row, (value >> 1) % self.dim] += sign
+
+        return _l2_normalize(matrix)
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """Embeddings via API da OpenAI"""
+
+    def __init__(self, model: str = 'text-embedding-3-small', dim: int = 512):
+        self.api_key = os.getenv('OPENAI_API_KEY')
+        self.base_url = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1').rstrip('/')
+        self.model = model
+        self.dim = dim
+        self.name = f'{model}-{dim}'
+
+    def embed(self, texts: List[str], user_id: str = None) -> np.ndarray:
+        if not self.api_key:
+            raise ValueError("OPENAI_API_KEY não configurada")
+
+        response = guarded_request(
+            'openai',
+            'POST',
+            f"{self.base_url}/embeddings",
+            headers={
+                'Authorization': f'Bearer {self.api_key}',
+                'Content-Type': 'application/json'
+            },
+            json={
+                'model': self.model,
+                'input': [text[:8000] for text in texts],
+                'dimensions': self.dim
+            },
+            timeout=http_client.get_timeout('openai')
+        )
+
+        if response.status_code != 200:
+            raise Exception(f"Erro na API OpenAI: {response.status_code} - {response.text}")
+
+        data = response.json()
+
+        if user_id:
+            prompt_tokens, _, tokens_used = split_usage(data.get('usage'))
+            UsageLog.log_usage(
+                user_id=user_id,
+                api_type='embedding',
+                endpoint='embeddings',
+                tokens_used=tokens_used,
+                cost=calculate_cost(self.model, prompt_tokens, 0),
+                metadata={'price_version': get_price_table_version()},
+                model=self.model,
+                prompt_tokens=prompt_tokens
+            )
+
+        vectors = [item['embedding'] for item in sorted(data['data'], key=lambda item: item['index'])]
+        return _l2_normalize(np.asarray(vectors, dtype=np.float32))
+
+
+def _normalize_words(text: str) -> List[str]:
+    """Minúsculas, sem acentos, apenas palavras alfanuméricas"""
+    text = unicodedata.normalize('NFKD', (text or '').lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return re.findall(r'\w+', text)
+
+
+def _l2_normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+def get_embedding_provider() -> EmbeddingProvider:
+    """Seleciona provedor de embeddings pela variável EMBEDDING_PROVIDER"""
+    provider = os.getenv('EMBEDDING_PROVIDER')
+    if provider is None:
+        provider = 'openai' if os.getenv('OPENAI_API_KEY') else 'local'
+
+    dim = int(os.getenv('EMBEDDING_DIMENSIONS', 512))
+    if provider == 'openai':
+        return OpenAIEmbeddingProvider(model=os.getenv('EMBEDDING_MODEL', 'text-embedding-3-small'), dim=dim)
+    if provider == 'local':
+        return HashingEmbeddingProvider(dim=dim)
+
+    raise ValueError(f"Provedor de embeddings desconhecido: {provider}")
+
+
+class UserVectorIndex:
+    """Matriz NumPy com os embeddings normalizados de um usuário.
+
+    Suporta inserção, atualização e remoção incrementais (O(d) cada) e
+    consultas top-k por similaridade de cosseno sobre todo o acervo.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self._matrix = np.zeros((16, dim), dtype=np.float32)
+        self._ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self.stamp = None  # (quantidade, último updated_at) do banco na última sincronização
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, note_id: str):
+        return note_id in self._positions
+
+    def upsert(self, note_id: str, vector: np.ndarray):
+        position = self._positions.get(note_id)
+        if position is None:
+            if len(self._ids) == self._matrix.shape[0]:
+                grown = np.zeros((self._matrix.shape[0] * 2, self.dim), dtype=np.float32)
+                grown[:len(self._ids)] = self._matrix[:len(self._ids)]
+                self._matrix = grown
+            position = len(self._ids)
+            self._ids.append(note_id)
+            self._positions[note_id] = position
+        self._matrix[position] = vector
+
+    def remove(self, note_id: str):
+        position = self._positions.pop(note_id, None)
+        if position is None:
+            return
+
+        # Move a última linha para a posição removida
+        last = len(self._ids) - 1
+        if position != last:
+            moved_id = self._ids[last]
+            self._matrix[position] = self._matrix[last]
+            self._ids[position] = moved_id
+            self._positions[moved_id] = position
+        self._ids.pop()
+
+    def query(self, vector: np.ndarray, k: int = 10, exclude_ids: set = None) -> List[Tuple[str, float]]:
+        size = len(self._ids)
+        if size == 0:
+            return []
+
+        scores = self._matrix[:size] @ vector
+        for note_id in exclude_ids or ():
+            position = self._positions.get(note_id)
+            if position is not None:
+                scores[position] = -np.inf
+
+        k = min(k, size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self._ids[i], float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+
+class EmbeddingService:
+    """Calcula, persiste e consulta embeddings de anotações"""
+
+    def __init__(self, provider: EmbeddingProvider = None, max_cached_users: int = None):
+        self.provider = provider or get_embedding_provider()
+        self.max_cached_users = max_cached_users or int(os.getenv('VECTOR_INDEX_MAX_USERS', 50))
+        self._indexes: 'OrderedDict[str, UserVectorIndex]' = OrderedDict()
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def content_hash(content: str) -> str:
+        return hashlib.sha256((content or '').encode('utf-8')).hexdigest()
+
+    def embed_notes(self, notes: List[Note], commit: bool = True) -> int:
+        """Calcula embeddings das notas cujo conteúdo mudou (em uma chamada)"""
+        existing = {
+            emb.note_id: emb for emb in NoteEmbedding.query.filter(
+                NoteEmbedding.note_id.in_([note.id for note in notes])
+            ).all()
+        }
+
+        pending = [
+            note for note in notes
+            if note.id not in existing
+            or existing[note.id].content_hash != self.content_hash(note.content)
+            or existing[note.id].model != self.provider.name
+        ]
+        if not pending:
+            return 0
+
+        vectors = self.provider.embed([note.content for note in pending], user_id=pending[0].user_id)
+
+        for note, vector in zip(pending, vectors):
+            embedding = existing.get(note.id)
+            if embedding is None:
+                embedding = NoteEmbedding(note_id=note.id, user_id=note.user_id)
+                db.session.add(embedding)
+            embedding.model = self.provider.name
+            embedding.content_hash = self.content_hash(note.content)
+            embedding.updated_at = datetime.utcnow()
+            embedding.set_vector(vector)
+
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()
+
+        for note, vector in zip(pending, vectors):
+            self._index_upsert(note.user_id, note.id, vector)
+
+        return len(pending)
+
+    def embed_note(self, note: Note, commit: bool = True) -> bool:
+        """Calcula o embedding de uma nota se o conteúdo mudou"""
+        return self.embed_notes([note], commit=commit) > 0
+
+    def remove_note(self, user_id: str, note_id: str):
+        """Remove embedding da nota do banco e do índice em memória"""
+        # O ON DELETE CASCADE não é aplicado em bancos sem FKs ativas (ex.: SQLite)
+        NoteEmbedding.query.filter_by(note_id=note_id).delete(synchronize_session=False)
+        db.session.commit()
+
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is not None:
+                index.remove(note_id)
+                index.stamp = None  # Força conferência na próxima consulta
+
+    def backfill(self, user_id: str, batch_size: int = 100, on_progress=None) -> int:
+        """Calcula embeddings das notas do usuário que ainda não têm vetor atualizado"""
+        total = 0
+        cursor = None
+
+        while True:
+            query = Note.query.filter(Note.user_id == user_id)
+            if cursor:
+                query = query.filter(Note.id > cursor)
+            notes = query.order_by(Note.id).limit(batch_size).all()
+            if not notes:
+                break
+
+            total += self.embed_notes(notes)
+            cursor = notes[-1].id
+            if on_progress:
+                on_progress(cursor, total)
+
+        return total
+
+    def find_similar(self, note: Note, k: int = 10, exclude_ids: set = None) -> Optional[List[Tuple[str, float]]]:
+        """Retorna as k notas mais similares (note_id, cosseno) do usuário.
+
+        None quando não há com o que comparar: a nota não tem vetor do
+        modelo/dimensão atual ou nenhuma outra nota do usuário tem.
+        """
+        embedding = NoteEmbedding.query.get(note.id)
+        if embedding is None or embedding.model != self.provider.name or embedding.dim != self.provider.dim:
+            return None
+
+        index = self._get_index(note.user_id)
+        excluded = set(exclude_ids or ())
+        excluded.add(note.id)
+        with self._lock:
+            if len(index) - sum(1 for note_id in excluded if note_id in index) <= 0:
+                return None
+            return index.query(embedding.get_vector(), k=k, exclude_ids=excluded)
+
+    def _db_stamp(self, user_id: str):
+        return db.session.query(
+            db.func.count(NoteEmbedding.note_id),
+            db.func.max(NoteEmbedding.updated_at)
+        ).filter(
+            NoteEmbedding.user_id == user_id,
+            NoteEmbedding.model == self.provider.name
+        ).one()
+
+    def _get_index(self, user_id: str) -> UserVectorIndex:
+        """Retorna índice do usuário, recarregando se outro processo alterou o banco"""
+        stamp = tuple(self._db_stamp(user_id))
+
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is not None and index.stamp == stamp:
+                self._indexes.move_to_end(user_id)
+                return index
+
+        index = UserVectorIndex(self.provider.dim)
+        rows = db.session.query(NoteEmbedding.note_id, NoteEmbedding.vector).filter(
+            NoteEmbedding.user_id == user_id,
+            NoteEmbedding.model == self.provider.name
+        ).all()
+        for note_id, blob in rows:
+            index.upsert(note_id, np.frombuffer(blob, dtype=np.float32))
+        index.stamp = stamp
+
+        with self._lock:
+            self._indexes[user_id] = index
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > self.max_cached_users:
+                self._indexes.popitem(last=False)
+
+        return index
+
+    def _index_upsert(self, user_id: str, note_id: str, vector: np.ndarray):
+        """Atualiza índice já carregado e sincroniza o carimbo com o banco"""
+        with self._lock:
+            index = self._indexes.get(user_id)
+        if index is None:
+            return
+
+        stamp = tuple(self._db_stamp(user_id))
+        with self._lock:
+            index.upsert(note_id, vector)
+            index.stamp = stamp
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_embedding_service() -> EmbeddingService:
+    """Retorna o serviço de embeddings compartilhado pelo processo"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = EmbeddingService()
+    return _service
+
@@ -0,0 +1,108 @@
+import os
+import random
+import threading
+from typing import Dict, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Status transitórios que devem ser reenviados
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class JitteredRetry(Retry):
+    """Retry com backoff exponencial e jitter completo.
+
+    Quando a resposta traz Retry-After, o urllib3 respeita o cabeçalho
+    antes de recorrer ao backoff calculado aqui.
+    """
+
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) if backoff > 0 else 0
+
+
+class PostSafeRetry(JitteredRetry):
+    """Retry que só reenvia POST quando o provedor recusou a requisição.
+
+    Para chamadas não idempotentes (envio de mensagem, criação de lote) um
+    5xx pode chegar depois do efeito colateral; reenviar duplicaria a
+    mensagem ou o lote. POST só é repetido em 429 (requisição rejeitada) ou
+    em erro de conexão (que o urllib3 trata antes de enviar a requisição).
+    """
+
+    def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+        if method and method.upper() == 'POST' and status_code not in POST_RETRY_STATUS_CODES:
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+# Status em que um POST não idempotente pode ser reenviado com segurança
+POST_RETRY_STATUS_CODES = (429,)
+
+# Provedores cujo POST tem efeito colateral e não aceita chave de idempotência
+NON_IDEMPOTENT_POST_PROVIDERS = frozenset(['whatsapp', 'openai_batch'])
+
+# Timeout de leitura padrão por provedor (segundos)
+DEFAULT_READ_TIMEOUTS = {
+    'openai': 30.0,
+    'perplexity': 30.0,
+    'whatsapp': 10.0
+}
+
+_sessions: Dict[Tuple[int, str], requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def _get_setting(provider: str, name: str, default):
+    """Lê configuração específica do provedor com fallback global"""
+    value = os.getenv(f'{provider.upper()}_{name}', os.getenv(name))
+    return type(default)(value) if value is not None else default
+
+
+def _build_session(provider: str) -> requests.Session:
+    pool_size = _get_setting(provider, 'HTTP_POOL_SIZE', 10)
+
+    retry_class = PostSafeRetry if provider in NON_IDEMPOTENT_POST_PROVIDERS else JitteredRetry
+    retry = retry_class(
+        total=_get_setting(provider, 'HTTP_MAX_RETRIES', 3),
+        connect=_get_setting(provider, 'HTTP_MAX_RETRIES', 3),
+        read=0,  # Não reenvia após timeout de leitura (a requisição pode ter sido processada)
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(['GET', 'POST']),
+        backoff_factor=_get_setting(provider, 'HTTP_BACKOFF_FACTOR', 0.5),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session(provider: str) -> requests.Session:
+    """Retorna sessão HTTP com pool keep-alive do provedor.
+
+    As sessões são por processo: após um fork (ex.: gunicorn com preload)
+    cada worker cria as suas, sem compartilhar sockets com o processo pai.
+    """
+    key = (os.getpid(), provider)
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _build_session(provider)
+                _sessions[key] = session
+    return session
+
+
+def get_timeout(provider: str, read_timeout: float = None) -> Tuple[float, float]:
+    """Retorna (timeout de conexão, timeout de leitura) do provedor"""
+    connect = _get_setting(provider, 'HTTP_CONNECT_TIMEOUT', 5.0)
+    if read_timeout is None:
+        read_timeout = _get_setting(provider, 'HTTP_READ_TIMEOUT', DEFAULT_READ_TIMEOUTS.get(provider, 30.0))
+    return connect, read_timeout
@@ -0,0 +1,91 @@
+import os
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+from src.models.job import ProcessingJob
+
+# Registro de handlers por tipo de job (preenchido por src/worker.py)
+JOB_HANDLERS: Dict[str, Callable] = {}
+
+
+class PermanentJobError(Exception):
+    """Falha que não deve ser reprocessada (ex.: nota removida, limite atingido)"""
+
+
+def job_handler(job_type: str):
+    """Decorator que registra o handler de um tipo de job"""
+    def decorator(func):
+        JOB_HANDLERS[job_type] = func
+        return func
+    return decorator
+
+
+def get_handler(job_type: str) -> Optional[Callable]:
+    """Retorna o handler registrado para o tipo de job"""
+    return JOB_HANDLERS.get(job_type)
+
+
+def enqueue_note_processing(note, user_preferences: dict = None, commit: bool = True) -> ProcessingJob:
+    """Agenda processamento IA de uma anotação.
+
+    Só reaproveita job ainda na fila: um job em execução já leu o conteúdo
+    anterior, então uma edição feita durante ele precisa de um job novo.
+    """
+    return ProcessingJob.enqueue(
+        user_id=note.user_id,
+        job_type='process_note',
+        note_id=note.id,
+        payload={'user_preferences': user_preferences},
+        dedupe_key=f"process_note:{note.id}",
+        commit=commit,
+        dedupe_statuses=('queued',)
+    )
+
+
+def enqueue_note_embedding(note, commit: bool = True) -> ProcessingJob:
+    """Agenda cálculo do embedding de uma anotação"""
+    return ProcessingJob.enqueue(
+        user_id=note.user_id,
+        job_type='embed_note',
+        note_id=note.id,
+        dedupe_key=f"embed_note:{note.id}",
+        commit=commit
+    )
+
+
+def enqueue_classifier_training(user_id: str, commit: bool = True) -> ProcessingJob:
+    """Agenda retreino completo do classificador de categorias do usuário"""
+    return ProcessingJob.enqueue(
+        user_id=user_id,
+        job_type='train_classifier',
+        dedupe_key=f"train_classifier:{user_id}",
+        commit=commit
+    )
+
+
+def enqueue_classifier_fold(user_id: str, commit: bool = True) -> ProcessingJob:
+    """Agenda a incorporação dos deltas pendentes ao classificador do usuário.
+
+    O atraso de NB_FOLD_DELAY_SECONDS agrupa edições seguidas em um único
+    job; um job já em execução não impede agendar o próximo.
+    """
+    return ProcessingJob.enqueue(
+        user_id=user_id,
+        job_type='fold_classifier',
+        dedupe_key=f"fold_classifier:{user_id}",
+        run_after=datetime.utcnow() + timedelta(seconds=float(os.getenv('NB_FOLD_DELAY_SECONDS', 30))),
+        commit=commit,
+        dedupe_statuses=('queued',)
+    )
+
+
+def enqueue_daily_summary(user_id: str, date: str, run_after=None, commit: bool = True) -> ProcessingJob:
+    """Agenda geração e envio do resumo diário (um por usuário e dia, mesmo após concluído)"""
+    return ProcessingJob.enqueue(
+        user_id=user_id,
+        job_type='daily_summary',
+        payload={'date': date},
+        dedupe_key=f"daily_summary:{user_id}:{date}",
+        run_after=run_after,
+        commit=commit,
+        dedupe_statuses=('queued', 'running', 'succeeded')
+    )
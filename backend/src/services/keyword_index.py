@@ -0,0 +1,145 @@
+import math
+from typing import Dict, List, Tuple
+from src.models.user import db
+from src.models.note import Note
+from src.models.keyword_index import NoteKeywordSignature, NoteTerm
+from src.services.text_processing import term_frequencies
+
+
+class KeywordIndex:
+    """Índice invertido de termos por usuário com ranking BM25.
+
+    As assinaturas são calculadas na escrita da nota; a busca de
+    relacionadas é um join indexado em (user_id, termo), sem reler
+    o conteúdo das outras notas.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, max_query_terms: int = 20):
+        self.k1 = k1
+        self.b = b
+        self.max_query_terms = max_query_terms
+
+    def index_note(self, note: Note) -> Dict[str, int]:
+        """Recalcula assinatura e postings da nota (sem commit)"""
+        frequencies = term_frequencies(note.content)
+
+        signature = NoteKeywordSignature.query.get(note.id)
+        if signature is None:
+            signature = NoteKeywordSignature(note_id=note.id, user_id=note.user_id)
+            db.session.add(signature)
+        signature.set_terms(frequencies)
+
+        NoteTerm.query.filter_by(note_id=note.id).delete(synchronize_session=False)
+        if frequencies:
+            db.session.execute(NoteTerm.__table__.insert(), [{
+                'note_id': note.id,
+                'user_id': note.user_id,
+                'term': term,
+                'tf': tf,
+                'doc_length': signature.length
+            } for term, tf in frequencies.items()])
+
+        db.session.flush()
+        return frequencies
+
+    def remove_notes(self, note_ids: List[str]):
+        """Remove assinaturas e postings das notas (sem commit)"""
+        if not note_ids:
+            return
+        NoteTerm.query.filter(NoteTerm.note_id.in_(note_ids)).delete(synchronize_session=False)
+        NoteKeywordSignature.query.filter(
+            NoteKeywordSignature.note_id.in_(note_ids)
+        ).delete(synchronize_session=False)
+
+    def backfill(self, user_id: str, batch_size: int = 200, on_progress=None) -> int:
+        """Indexa notas do usuário que ainda não têm assinatura"""
+        total = 0
+        cursor = None
+
+        while True:
+            query = Note.query.outerjoin(
+                NoteKeywordSignature, NoteKeywordSignature.note_id == Note.id
+            ).filter(
+                Note.user_id == user_id,
+                NoteKeywordSignature.note_id.is_(None)
+            )
+            if cursor:
+                query = query.filter(Note.id > cursor)
+            notes = query.order_by(Note.id).limit(batch_size).all()
+            if not notes:
+                break
+
+            for note in notes:
+                self.index_note(note)
+            db.session.commit()
+
+            total += len(notes)
+            cursor = notes[-1].id
+            if on_progress:
+                on_progress(cursor, total)
+
+        return total
+
+    def find_similar(self, note: Note, k: int = 10, exclude_ids: set = None) -> List[Tuple[str, float]]:
+        """Top-k notas do usuário por BM25, normalizado pelo score da própria nota (0-1)"""
+        signature = NoteKeywordSignature.query.get(note.id)
+        terms = signature.get_terms() if signature else term_frequencies(note.content)
+        if not terms:
+            return []
+        length = sum(terms.values())
+
+        total_docs, avg_length = db.session.query(
+            db.func.count(NoteKeywordSignature.note_id),
+            db.func.avg(NoteKeywordSignature.length)
+        ).filter(NoteKeywordSignature.user_id == note.user_id).one()
+        if not total_docs:
+            return []
+        avg_length = float(avg_length or length or 1)
+
+        doc_freqs = dict(db.session.query(NoteTerm.term, db.func.count(NoteTerm.note_id)).filter(
+            NoteTerm.user_id == note.user_id,
+            NoteTerm.term.in_(list(terms.keys()))
+        ).group_by(NoteTerm.term).all())
+
+        idf = {
+            term: math.log(1 + (total_docs - doc_freqs.get(term, 0) + 0.5) / (doc_freqs.get(term, 0) + 0.5))
+            for term in terms
+        }
+
+        # Consulta apenas os termos mais discriminativos da nota de origem
+        query_terms = sorted(terms, key=lambda term: (-terms[term] * idf[term], term))[:self.max_query_terms]
+        self_score = sum(self._term_score(idf[term], terms[term], length, avg_length) for term in query_terms)
+        if self_score <= 0:
+            return []
+
+        excluded = set(exclude_ids or ())
+        excluded.add(note.id)
+
+        postings = db.session.query(NoteTerm.note_id, NoteTerm.term, NoteTerm.tf, NoteTerm.doc_length).filter(
+            NoteTerm.user_id == note.user_id,
+            NoteTerm.term.in_(query_terms)
+        ).all()
+
+        scores: Dict[str, float] = {}
+        for note_id, term, tf, doc_length in postings:
+            if note_id in excluded:
+                continue
+            scores[note_id] = scores.get(note_id, 0.0) + self._term_score(idf[term], tf, doc_length, avg_length)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+        return [(note_id, min(score / self_score, 1.0)) for note_id, score in ranked]
+
+    def _term_score(self, idf: float, tf: int, doc_length: int, avg_length: float) -> float:
+        norm = self.k1 * (1 - self.b + self.b * doc_length / avg_length)
+        return idf * tf * (self.k1 + 1) / (tf + norm)
+
+
+_index = None
+
+
+def get_keyword_index() -> KeywordIndex:
+    """Retorna o índice de palavras-chave compartilhado pelo processo"""
+    global _index
+    if _index is None:
+        _index = KeywordIndex()
+    return _index
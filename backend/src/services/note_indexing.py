@@ -0,0 +1,69 @@
+import os
+from typing import List, Optional
+from src.models.user import db
+from src.models.note import Note
+from src.models.job import ProcessingJob
+from src.services.embedding_service import get_embedding_service
+from src.services.keyword_index import get_keyword_index
+from src.services.dedup_service import get_duplicate_detector, copy_ai_results
+from src.services.category_classifier import get_classifier_service
+from src.services.job_queue import enqueue_note_embedding, enqueue_note_processing
+
+
+def index_note_on_write(note: Note) -> Optional[Note]:
+    """Atualiza os índices da nota após criar/editar (sem commit).
+
+    Assinatura de palavras-chave e MinHash são sempre calculadas na hora.
+    Embeddings de provedores locais também; provedores remotos são
+    agendados na fila para não prender a requisição web.
+
+    Retorna a nota original se esta for uma quase-duplicata.
+    """
+    original = get_duplicate_detector().register_note(note)
+    get_keyword_index().index_note(note)
+
+    service = get_embedding_service()
+    if service.provider.is_local:
+        service.embed_note(note, commit=False)
+    else:
+        enqueue_note_embedding(note, commit=False)
+
+    return original
+
+
+def ingest_note(note: Note, user_preferences: dict = None) -> Optional[ProcessingJob]:
+    """Indexa uma nota nova e agenda o processamento IA (sem commit).
+
+    Quase-duplicatas de uma nota já processada reaproveitam os resultados
+    da original (DEDUP_REUSE_AI_RESULTS) e não são enviadas aos LLMs.
+    Notas sem categoria passam antes pelo classificador local.
+    Retorna o job agendado, ou None se os resultados foram reaproveitados.
+    """
+    original = index_note_on_write(note)
+
+    reuse = os.getenv('DEDUP_REUSE_AI_RESULTS', 'true').lower() == 'true'
+    if original is not None and reuse and original.is_processed():
+        copy_ai_results(original, note)
+        return None
+
+    # Categoria informada pelo usuário treina o classificador; sem ela,
+    # o classificador local tenta categorizar antes do LLM
+    classifier = get_classifier_service()
+    if note.category:
+        note.update_metadata('category_source', 'user')
+        classifier.learn_note(note)
+    else:
+        classifier.classify_on_ingest(note)
+
+    return enqueue_note_processing(note, user_preferences=user_preferences, commit=False)
+
+
+def remove_notes_from_indexes(user_id: str, note_ids: List[str]):
+    """Remove notas apagadas dos índices (faz commit)"""
+    get_keyword_index().remove_notes(note_ids)
+    get_duplicate_detector().remove_notes(note_ids)
+    db.session.commit()
+
+    service = get_embedding_service()
+    for note_id in note_ids:
+        service.remove_note(user_id, note_id)
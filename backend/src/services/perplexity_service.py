@@ -1,20 +1,37 @@
 import os
 import json
-import requests
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 from src.models.user import UsageLog
+from src.services import http_client
+from src.services.resilience import guarded_request, unavailable_info
+from src.services.response_cache import ResponseCache, get_response_cache
+from src.services.streaming import stream_chat_completion
+from src.services.pricing import calculate_cost, get_price_table_version, split_usage
+from src.services.prompt_registry import get_prompt_registry
+from src.services.topic_cache import get_topic_cache, extract_topic
 
 class PerplexityService:
     """Serviço para integração com API do Perplexity"""
     
     def __init__(self):
         self.api_key = os.getenv('PERPLEXITY_API_KEY')
-        self.base_url = 'https://api.perplexity.ai'
+        self.base_url = os.getenv('PERPLEXITY_BASE_URL', 'https://api.perplexity.ai').rstrip('/')
         self.model = 'llama-3.1-sonar-small-128k-online'  # Modelo com acesso à web
+        self.cache = get_response_cache('perplexity')
+        self.prompts = get_prompt_registry()
+        self.topic_cache = get_topic_cache()
+        
+    def _make_request(self, endpoint: str, data: dict, use_cache: bool = True) -> dict:
+        """Faz requisição para API do Perplexity (com cache de respostas)"""
+        cache_key = None
+        if use_cache and self.cache.enabled:
+            cache_key = ResponseCache.make_key('perplexity', endpoint, data)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                cached['cache_hit'] = True
+                return cached
         
-    def _make_request(self, endpoint: str, data: dict) -> dict:
-        """Faz requisição para API do Perplexity"""
         if not self.api_key:
             raise ValueError("PERPLEXITY_API_KEY não configurada")
         
@@ -23,75 +40,130 @@ class PerplexityService:
             'Content-Type': 'application/json'
         }
         
-        response = requests.post(
+        response = guarded_request(
+            'perplexity',
+            'POST',
             f"{self.base_url}/{endpoint}",
             headers=headers,
             json=data,
-            timeout=30
+            timeout=http_client.get_timeout('perplexity')
         )
         
         if response.status_code != 200:
             raise Exception(f"Erro na API Perplexity: {response.status_code} - {response.text}")
         
-        return response.json()
+        result = response.json()
+        if cache_key:
+            self.cache.set(cache_key, result)
+        
+        return result
     
-    def _log_usage(self, user_id: str, endpoint: str, tokens_used: int, cost: float):
+    def _make_stream_request(self, endpoint: str, data: dict, use_cache: bool = True) -> Iterator[Tuple[str, object]]:
+        """Requisição em streaming: gera ('delta', texto) e por fim ('response', resposta).
+        
+        Compartilha o cache com _make_request: um acerto é entregue como um
+        único delta e a resposta montada do streaming é armazenada.
+        """
+        cache_key = None
+        if use_cache and self.cache.enabled:
+            cache_key = ResponseCache.make_key('perplexity', endpoint, data)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                cached['cache_hit'] = True
+                yield 'delta', cached['choices'][0]['message']['content']
+                yield 'response', cached
+                return
+        
+        if not self.api_key:
+            raise ValueError("PERPLEXITY_API_KEY não configurada")
+        
+        headers = {
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json'
+        }
+        
+        for kind, value in stream_chat_completion(
+            'perplexity',
+            f"{self.base_url}/{endpoint}",
+            headers,
+            data,
+            'Erro na API Perplexity'
+        ):
+            if kind == 'response' and cache_key:
+                self.cache.set(cache_key, value)
+            yield kind, value
+    
+    def _log_usage(self, user_id: str, endpoint: str, tokens_used: int, cost: float, response: dict = None,
+                   prompt: str = None):
         """Registra uso da API para controle de custos"""
+        response = response or {}
+        metadata = {'price_version': get_price_table_version()}
+        if prompt:
+            metadata['prompt_version'] = self.prompts.version(prompt)
+        prompt_tokens = completion_tokens = 0
+        if response.get('cache_hit'):
+            # Acerto de cache: registrado com custo zero e tokens economizados
+            metadata.update({
+                'cache_hit': True,
+                'tokens_saved': response.get('usage', {}).get('total_tokens', 0)
+            })
+        elif response:
+            prompt_tokens, completion_tokens, _ = split_usage(response.get('usage'))
+        
         UsageLog.log_usage(
             user_id=user_id,
             api_type='perplexity',
             endpoint=endpoint,
             tokens_used=tokens_used,
-            cost=cost
+            cost=cost,
+            metadata=metadata,
+            model=response.get('model') or self.model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens
         )
     
-    def search_related_information(self, user_id: str, note_content: str, search_focus: str = None) -> dict:
-        """Busca informações relacionadas ao conteúdo da anotação"""
+    def _topic_request(self, user_id: str, kind: str, endpoint: str, data: dict, topic: str, **qualifiers) -> dict:
+        """Busca sobre tópico genérico, compartilhada entre usuários pelo cache de tópicos.
         
-        # Constrói query de busca baseada no conteúdo
-        if search_focus:
-            query = f"Busque informações atualizadas sobre: {search_focus}. Contexto: {note_content[:300]}"
-        else:
-            query = f"Busque informações relevantes e atualizadas relacionadas a: {note_content[:300]}"
+        Só a chamada que de fato vai ao provedor é registrada com custo (para
+        o usuário que a disparou); acertos, inclusive os servidos enquanto o
+        tópico é atualizado em segundo plano, são registrados com custo zero.
+        """
+        key = self.topic_cache.make_key(kind, topic, f'{self.model}:{self.prompts.version(endpoint)}', **qualifiers)
         
-        messages = [
-            {
-                "role": "system",
-                "content": """Você é um assistente de pesquisa especializado. 
-                Busque informações atualizadas e relevantes sobre o tópico fornecido.
-                Foque em:
-                - Informações recentes e verificadas
-                - Dados estatísticos quando relevantes
-                - Tendências e desenvolvimentos atuais
-                - Recursos úteis e referências
-                
-                Organize a resposta de forma clara e estruturada."""
-            },
-            {
-                "role": "user",
-                "content": query
-            }
-        ]
+        def fetch():
+            response = self._make_request('chat/completions', data, use_cache=False)
+            tokens_used, cost = self._get_usage(response)
+            self._log_usage(user_id, endpoint, tokens_used, cost, response, prompt=endpoint)
+            return response
         
-        data = {
-            "model": self.model,
-            "messages": messages,
-            "max_tokens": 1000,
-            "temperature": 0.2,
-            "return_citations": True,
-            "return_images": False
-        }
+        response = self.topic_cache.get_or_fetch(kind, key, fetch)
+        if response.get('cache_hit'):
+            self._log_usage(user_id, endpoint, 0, 0.0, response, prompt=endpoint)
+        return response
+    
+    def _get_usage(self, response: dict) -> tuple:
+        """Retorna (tokens, custo) da resposta; acertos de cache custam zero"""
+        if response.get('cache_hit'):
+            return 0, 0.0
+        
+        prompt_tokens, completion_tokens, tokens_used = split_usage(response.get('usage'))
+        cost = calculate_cost(response.get('model') or self.model, prompt_tokens, completion_tokens)
+        return tokens_used, cost
+    
+    def search_related_information(self, user_id: str, note_content: str, search_focus: str = None) -> dict:
+        """Busca informações relacionadas ao conteúdo da anotação"""
+        
+        data = self._build_search_request(note_content, search_focus)
         
         try:
             response = self._make_request('chat/completions', data)
             
-            # Extrai informações de uso
-            usage = response.get('usage', {})
-            tokens_used = usage.get('total_tokens', 0)
-            cost = self._calculate_cost(tokens_used)
+            # Extrai informações de uso (respostas do cache não têm custo)
+            tokens_used, cost = self._get_usage(response)
             
             # Registra uso
-            self._log_usage(user_id, 'search_information', tokens_used, cost)
+            self._log_usage(user_id, 'search_information', tokens_used, cost, response, prompt='external_search')
             
             # Processa resposta
             content = response['choices'][0]['message']['content']
@@ -109,33 +181,92 @@ class PerplexityService:
             return {
                 'success': False,
                 'error': str(e),
+                **unavailable_info(e),
+                'tokens_used': 0,
+                'cost': 0
+            }
+    
+    def search_related_information_stream(self, user_id: str, note_content: str,
+                                          search_focus: str = None) -> Iterator[Tuple[str, object]]:
+        """Versão em streaming de search_related_information.
+        
+        Gera ('delta', texto) com os tokens da resposta e, ao final,
+        ('result', resultado) no mesmo formato da versão sem streaming.
+        """
+        data = self._build_search_request(note_content, search_focus)
+        
+        try:
+            response = None
+            for kind, value in self._make_stream_request('chat/completions', data):
+                if kind == 'delta':
+                    yield 'delta', value
+                else:
+                    response = value
+            
+            tokens_used, cost = self._get_usage(response)
+            
+            self._log_usage(user_id, 'search_information', tokens_used, cost, response, prompt='external_search')
+            
+            yield 'result', {
+                'success': True,
+                'information': response['choices'][0]['message']['content'],
+                'citations': response.get('citations', []),
+                'tokens_used': tokens_used,
+                'cost': cost
+            }
+            
+        except Exception as e:
+            yield 'result', {
+                'success': False,
+                'error': str(e),
+                **unavailable_info(e),
                 'tokens_used': 0,
                 'cost': 0
             }
     
+    def _build_search_request(self, note_content: str, search_focus: str = None) -> dict:
+        """Corpo da requisição de busca de informações relacionadas"""
+        
+        # Constrói query de busca baseada no conteúdo
+        if search_focus:
+            query = f"Busque informações atualizadas sobre: {search_focus}. Contexto: {note_content[:300]}"
+        else:
+            query = f"Busque informações relevantes e atualizadas relacionadas a: {note_content[:300]}"
+        
+        messages = [
+            {
+                "role": "system",
+                "content": self.prompts.render('external_search')
+            },
+            {
+                "role": "user",
+                "content": query
+            }
+        ]
+        
+        return {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": 1000,
+            "temperature": 0.2,
+            "return_citations": True,
+            "return_images": False
+        }
+    
     def find_related_events(self, user_id: str, note_content: str, location: str = None) -> dict:
         """Busca eventos relacionados ao conteúdo da anotação"""
         
+        topic = extract_topic(note_content)
+        if not topic:
+            return {'success': False, 'error': 'Tópico sem termos para busca', 'tokens_used': 0, 'cost': 0}
+        
         location_context = f" em {location}" if location else ""
-        query = f"Busque eventos, conferências, workshops ou atividades relacionadas a: {note_content[:200]}{location_context}. Inclua datas, locais e informações de inscrição quando disponíveis."
+        query = f"Busque eventos, conferências, workshops ou atividades relacionadas a: {topic}{location_context}. Inclua datas, locais e informações de inscrição quando disponíveis."
         
         messages = [
             {
                 "role": "system",
-                "content": """Você é um assistente especializado em encontrar eventos e atividades.
-                Busque informações sobre:
-                - Eventos próximos relacionados ao tópico
-                - Conferências e workshops
-                - Cursos e treinamentos
-                - Meetups e networking
-                - Webinars e eventos online
-                
-                Para cada evento encontrado, inclua:
-                - Nome e descrição
-                - Data e horário
-                - Local (presencial/online)
-                - Informações de inscrição
-                - Custo (se aplicável)"""
+                "content": self.prompts.render('find_events')
             },
             {
                 "role": "user",
@@ -152,13 +283,9 @@ class PerplexityService:
         }
         
         try:
-            response = self._make_request('chat/completions', data)
-            
-            usage = response.get('usage', {})
-            tokens_used = usage.get('total_tokens', 0)
-            cost = self._calculate_cost(tokens_used)
+            response = self._topic_request(user_id, 'events', 'find_events', data, topic, location=location)
             
-            self._log_usage(user_id, 'find_events', tokens_used, cost)
+            tokens_used, cost = self._get_usage(response)
             
             content = response['choices'][0]['message']['content']
             citations = response.get('citations', [])
@@ -175,6 +302,7 @@ class PerplexityService:
             return {
                 'success': False,
                 'error': str(e),
+                **unavailable_info(e),
                 'tokens_used': 0,
                 'cost': 0
             }
@@ -182,27 +310,17 @@ class PerplexityService:
     def suggest_tools_and_apps(self, user_id: str, note_content: str, platform: str = None) -> dict:
         """Sugere ferramentas e aplicativos relacionados ao conteúdo"""
         
+        topic = extract_topic(note_content)
+        if not topic:
+            return {'success': False, 'error': 'Tópico sem termos para busca', 'tokens_used': 0, 'cost': 0}
+        
         platform_context = f" para {platform}" if platform else ""
-        query = f"Sugira ferramentas, aplicativos e recursos úteis relacionados a: {note_content[:200]}{platform_context}. Inclua opções gratuitas e pagas, com descrições e links quando possível."
+        query = f"Sugira ferramentas, aplicativos e recursos úteis relacionados a: {topic}{platform_context}. Inclua opções gratuitas e pagas, com descrições e links quando possível."
         
         messages = [
             {
                 "role": "system",
-                "content": """Você é um especialista em ferramentas e tecnologia.
-                Sugira recursos úteis como:
-                - Aplicativos móveis e web
-                - Ferramentas online
-                - Software especializado
-                - Extensões de navegador
-                - APIs e serviços
-                
-                Para cada sugestão, inclua:
-                - Nome e descrição
-                - Plataformas suportadas
-                - Preço (gratuito/pago)
-                - Principais funcionalidades
-                - Link oficial quando possível
-                - Alternativas similares"""
+                "content": self.prompts.render('suggest_tools')
             },
             {
                 "role": "user",
@@ -219,13 +337,9 @@ class PerplexityService:
         }
         
         try:
-            response = self._make_request('chat/completions', data)
-            
-            usage = response.get('usage', {})
-            tokens_used = usage.get('total_tokens', 0)
-            cost = self._calculate_cost(tokens_used)
+            response = self._topic_request(user_id, 'tools', 'suggest_tools', data, topic, platform=platform)
             
-            self._log_usage(user_id, 'suggest_tools', tokens_used, cost)
+            tokens_used, cost = self._get_usage(response)
             
             content = response['choices'][0]['message']['content']
             citations = response.get('citations', [])
@@ -242,6 +356,7 @@ class PerplexityService:
             return {
                 'success': False,
                 'error': str(e),
+                **unavailable_info(e),
                 'tokens_used': 0,
                 'cost': 0
             }
@@ -255,17 +370,7 @@ class PerplexityService:
         messages = [
             {
                 "role": "system",
-                "content": """Você é um analista de mercado especializado.
-                Forneça insights abrangentes incluindo:
-                - Tendências atuais do mercado
-                - Estatísticas e dados relevantes
-                - Oportunidades emergentes
-                - Principais desafios
-                - Previsões e projeções
-                - Principais players do mercado
-                - Fatores de crescimento
-                
-                Base suas análises em dados recentes e fontes confiáveis."""
+                "content": self.prompts.render('market_insights')
             },
             {
                 "role": "user",
@@ -282,13 +387,9 @@ class PerplexityService:
         }
         
         try:
-            response = self._make_request('chat/completions', data)
+            response = self._topic_request(user_id, 'market', 'market_insights', data, topic, industry=industry)
             
-            usage = response.get('usage', {})
-            tokens_used = usage.get('total_tokens', 0)
-            cost = self._calculate_cost(tokens_used)
-            
-            self._log_usage(user_id, 'market_insights', tokens_used, cost)
+            tokens_used, cost = self._get_usage(response)
             
             content = response['choices'][0]['message']['content']
             citations = response.get('citations', [])
@@ -305,6 +406,7 @@ class PerplexityService:
             return {
                 'success': False,
                 'error': str(e),
+                **unavailable_info(e),
                 'tokens_used': 0,
                 'cost': 0
             }
@@ -317,15 +419,7 @@ class PerplexityService:
         messages = [
             {
                 "role": "system",
-                "content": """Você é um verificador de fatos especializado.
-                Para cada verificação, forneça:
-                - Status da verificação (verdadeiro/falso/parcialmente verdadeiro/inconclusivo)
-                - Explicação detalhada
-                - Fontes confiáveis que sustentam ou refutam a informação
-                - Contexto adicional relevante
-                - Nuances importantes
-                
-                Seja imparcial e baseie-se apenas em fontes verificáveis."""
+                "content": self.prompts.render('fact_check')
             },
             {
                 "role": "user",
@@ -344,11 +438,9 @@ class PerplexityService:
         try:
             response = self._make_request('chat/completions', data)
             
-            usage = response.get('usage', {})
-            tokens_used = usage.get('total_tokens', 0)
-            cost = self._calculate_cost(tokens_used)
+            tokens_used, cost = self._get_usage(response)
             
-            self._log_usage(user_id, 'fact_check', tokens_used, cost)
+            self._log_usage(user_id, 'fact_check', tokens_used, cost, response, prompt='fact_check')
             
             content = response['choices'][0]['message']['content']
             citations = response.get('citations', [])
@@ -365,16 +457,11 @@ class PerplexityService:
             return {
                 'success': False,
                 'error': str(e),
+                **unavailable_info(e),
                 'tokens_used': 0,
                 'cost': 0
             }
     
-    def _calculate_cost(self, tokens: int) -> float:
-        """Calcula custo baseado no número de tokens"""
-        # Preços aproximados do Perplexity por 1K tokens
-        cost_per_1k_tokens = 0.001  # $0.001 por 1K tokens (estimativa)
-        return (tokens / 1000) * cost_per_1k_tokens
-    
     def test_connection(self) -> bool:
         """Testa conexão com a API"""
         try:
@@ -383,7 +470,7 @@ class PerplexityService:
                 "messages": [{"role": "user", "content": "Hello"}],
                 "max_tokens": 5
             }
-            response = self._make_request('chat/completions', data)
+            response = self._make_request('chat/completions', data, use_cache=False)
             return True
         except:
             return False
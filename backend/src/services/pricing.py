@@ -0,0 +1,89 @@
+import os
+import logging
+from typing import Dict, Optional, Tuple
+
+# Tabelas de preço versionadas (USD). Nunca altere uma versão publicada:
+# crie uma nova e aponte PRICE_TABLE_VERSION para ela, para que custos
+# já registrados continuem reproduzíveis.
+#   input/output: por 1M de tokens de prompt/completion
+#   cached_input: por 1M de tokens de prompt lidos do cache do provedor
+#   request: taxa fixa por requisição
+PRICE_TABLES: Dict[str, Dict[str, Dict[str, float]]] = {
+    '2024-10': {
+        'gpt-4o-mini': {'input': 0.15, 'output': 0.60, 'request': 0.0},
+        'gpt-4o': {'input': 2.50, 'output': 10.00, 'request': 0.0},
+        'text-embedding-3-small': {'input': 0.02, 'output': 0.0, 'request': 0.0},
+        'text-embedding-3-large': {'input': 0.13, 'output': 0.0, 'request': 0.0},
+        'llama-3.1-sonar-small-128k-online': {'input': 0.20, 'output': 0.20, 'request': 0.005},
+        'llama-3.1-sonar-large-128k-online': {'input': 1.00, 'output': 1.00, 'request': 0.005},
+    }
+}
+
+# Desconto de tokens de prompt em cache (cache automático de prefixo da OpenAI)
+PRICE_TABLES['2024-10-cached'] = {
+    **PRICE_TABLES['2024-10'],
+    'gpt-4o-mini': {'input': 0.15, 'cached_input': 0.075, 'output': 0.60, 'request': 0.0},
+    'gpt-4o': {'input': 2.50, 'cached_input': 1.25, 'output': 10.00, 'request': 0.0},
+}
+
+DEFAULT_PRICE_TABLE_VERSION = '2024-10-cached'
+
+# Batch API da OpenAI: mesmo modelo com desconto sobre o preço interativo
+BATCH_PRICE_MULTIPLIER = 0.5
+
+logger = logging.getLogger(__name__)
+_unknown_models = set()
+
+
+def get_price_table_version() -> str:
+    """Versão de preços em vigor (PRICE_TABLE_VERSION)"""
+    version = os.getenv('PRICE_TABLE_VERSION', DEFAULT_PRICE_TABLE_VERSION)
+    return version if version in PRICE_TABLES else DEFAULT_PRICE_TABLE_VERSION
+
+
+def get_model_price(model: str, version: str = None) -> Optional[Dict[str, float]]:
+    """Preço do modelo; aceita nomes com sufixo de data (ex.: gpt-4o-mini-2024-07-18)"""
+    table = PRICE_TABLES[version or get_price_table_version()]
+    if model in table:
+        return table[model]
+
+    # Prefixo mais longo: 'gpt-4o-mini-2024-07-18' -> 'gpt-4o-mini', não 'gpt-4o'
+    matches = [name for name in table if model and model.startswith(name + '-')]
+    return table[max(matches, key=len)] if matches else None
+
+
+def split_usage(usage: dict) -> Tuple[int, int, int]:
+    """(prompt, completion, total) a partir do campo usage da resposta"""
+    usage = usage or {}
+    prompt = usage.get('prompt_tokens', 0) or 0
+    completion = usage.get('completion_tokens', 0) or 0
+    total = usage.get('total_tokens', 0) or (prompt + completion)
+    if not prompt and not completion:
+        # Provedor sem detalhamento: trata tudo como prompt
+        prompt = total
+    return prompt, completion, total
+
+
+def cached_prompt_tokens(usage: dict) -> int:
+    """Tokens de prompt servidos pelo cache de prefixo do provedor"""
+    details = (usage or {}).get('prompt_tokens_details') or {}
+    return details.get('cached_tokens', 0) or 0
+
+
+def calculate_cost(model: str, prompt_tokens: int, completion_tokens: int, requests: int = 1,
+                   version: str = None, cached_tokens: int = 0, batch: bool = False) -> float:
+    """Custo exato (USD) de uma chamada pelos tokens de prompt e de completion"""
+    price = get_model_price(model, version)
+    if price is None:
+        if model not in _unknown_models:
+            _unknown_models.add(model)
+            logger.warning('Modelo sem preço na tabela %s: %s', version or get_price_table_version(), model)
+        return 0.0
+    cached_tokens = min(cached_tokens, prompt_tokens)
+    cost = (
+        (prompt_tokens - cached_tokens) * price['input'] / 1_000_000
+        + cached_tokens * price.get('cached_input', price['input']) / 1_000_000
+        + completion_tokens * price['output'] / 1_000_000
+        + requests * price['request']
+    )
+    return round(cost * BATCH_PRICE_MULTIPLIER if batch else cost, 8)
@@ -0,0 +1,384 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+# Estrutura do resumo diário (chamada única e etapa de redução)
+DAILY_SUMMARY_SCHEMA = """{
+    "summary": {
+        "main_themes": ["tema1", "tema2"],
+        "tasks_identified": [
+            {
+                "task": "descrição da tarefa",
+                "priority": "alta|média|baixa",
+                "suggested_deadline": "YYYY-MM-DD ou null"
+            }
+        ],
+        "key_insights": ["insight1", "insight2"],
+        "action_suggestions": ["sugestão1", "sugestão2"],
+        "overall_summary": "resumo geral do dia em 2-3 frases"
+    }
+}"""
+
+PERIOD_SUMMARY_SCHEMA = DAILY_SUMMARY_SCHEMA.replace(
+    "resumo geral do dia em 2-3 frases", "resumo geral do período em 3-5 frases"
+)
+
+NOTE_ANALYSIS_SCHEMA = """{
+    "category_suggestion": "categoria sugerida",
+    "tags": ["tag1", "tag2", "tag3"],
+    "summary": "resumo em 1-2 frases",
+    "key_points": ["ponto1", "ponto2"],
+    "action_items": [
+        {
+            "action": "ação sugerida",
+            "priority": "alta|média|baixa"
+        }
+    ],
+    "related_topics": ["tópico1", "tópico2"],
+    "sentiment": "positivo|neutro|negativo",
+    "confidence_score": 0.85"""
+
+TASKS_SCHEMA_FIELDS = """    "tasks": [
+        {
+            "task": "descrição da tarefa",
+            "deadline": "YYYY-MM-DD ou null",
+            "priority": "alta|média|baixa",
+            "confidence": 0.85
+        }
+    ],
+    "dates_mentioned": [
+        {
+            "date": "YYYY-MM-DD",
+            "context": "contexto da data mencionada"
+        }
+    ]"""
+
+
+class PromptTemplate:
+    """Prompt versionado.
+
+    A parte estática (instruções e schema) vem sempre primeiro e é idêntica
+    para todos os usuários; a parte variável (preferências, categorias,
+    datas) vai no fim. Assim o prefixo se repete entre chamadas e o cache
+    automático de prompt do provedor pode reaproveitá-lo.
+    """
+
+    def __init__(self, name: str, version: int, static: str, suffix: Callable[..., str] = None):
+        self.name = name
+        self.version = version
+        self.static = static.strip()
+        self.suffix = suffix
+
+    @property
+    def key(self) -> str:
+        """Identificador registrado no uso da API (ex.: note_analysis@v1)"""
+        return f'{self.name}@v{self.version}'
+
+    def render(self, **params) -> str:
+        suffix = self.suffix(**params).strip() if self.suffix else ''
+        return f'{self.static}\n\n{suffix}' if suffix else self.static
+
+
+class PromptRegistry:
+    """Templates de prompt compilados uma vez, com variantes memoizadas"""
+
+    def __init__(self, max_variants: int = None):
+        self.max_variants = max_variants or int(os.getenv('PROMPT_VARIANT_CACHE_SIZE', 1024))
+        self._templates: Dict[str, PromptTemplate] = {}
+        self._variants: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def register(self, template: PromptTemplate):
+        with self._lock:
+            self._templates[template.name] = template
+            # Versão nova invalida as variantes da anterior
+            for key in [key for key in self._variants if key[0] == template.name]:
+                del self._variants[key]
+
+    def get(self, name: str) -> PromptTemplate:
+        return self._templates[name]
+
+    def version(self, name: str) -> str:
+        return self._templates[name].key
+
+    def render(self, name: str, **params) -> str:
+        """Texto do prompt para os parâmetros dados (memoizado)"""
+        key = (name, _freeze(params))
+        with self._lock:
+            text = self._variants.get(key)
+            if text is not None:
+                self._variants.move_to_end(key)
+                self._hits += 1
+                return text
+            self._misses += 1
+
+        text = self._templates[name].render(**params)
+
+        with self._lock:
+            self._variants[key] = text
+            while len(self._variants) > self.max_variants:
+                self._variants.popitem(last=False)
+        return text
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                'templates': {name: template.key for name, template in self._templates.items()},
+                'variants': len(self._variants),
+                'hits': self._hits,
+                'misses': self._misses
+            }
+
+
+def _freeze(value):
+    """Versão hashable dos parâmetros (listas viram tuplas)"""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def preference_params(user_preferences: dict = None) -> dict:
+    """Apenas as preferências que alteram o prompt (evita variantes desnecessárias)"""
+    user_preferences = user_preferences or {}
+    return {
+        'focus_areas': tuple(user_preferences.get('focus_areas') or ()),
+        'organization_style': user_preferences.get('organization_style', 'balanced')
+    }
+
+
+def _preferences_suffix(focus_areas=(), organization_style: str = 'balanced') -> str:
+    lines = []
+    if focus_areas:
+        lines.append(f"Foque especialmente em: {', '.join(focus_areas)}")
+    if organization_style == 'detailed':
+        lines.append("Forneça análises detalhadas e abrangentes.")
+    elif organization_style == 'concise':
+        lines.append("Mantenha as análises concisas e diretas.")
+    return '\n'.join(lines)
+
+
+def _categories_suffix(existing_categories=()) -> str:
+    return f"Categorias existentes: {', '.join(existing_categories)}" if existing_categories else ''
+
+
+def _build_default_registry() -> PromptRegistry:
+    registry = PromptRegistry()
+
+    registry.register(PromptTemplate('note_analysis', 1, """
+Você é um assistente especializado em análise e organização de anotações pessoais.
+
+Analise a anotação fornecida e retorne insights úteis em formato JSON.
+Siga as preferências do usuário indicadas ao final, quando houver.
+
+Retorne um JSON com esta estrutura:
+""" + NOTE_ANALYSIS_SCHEMA + "\n}", _preferences_suffix))
+
+    registry.register(PromptTemplate('note_analysis_combined', 1, """
+Você é um assistente especializado em análise e organização de anotações pessoais.
+
+Analise a anotação fornecida e, na mesma resposta:
+1. Sugira categoria, tags, resumo e ações
+2. Identifique tarefas explícitas ou implícitas com prazos e prioridades
+3. Liste as datas mencionadas no texto
+Siga as preferências do usuário indicadas ao final, quando houver.
+
+Retorne um JSON com esta estrutura:
+""" + NOTE_ANALYSIS_SCHEMA + ",\n" + TASKS_SCHEMA_FIELDS + "\n}", _preferences_suffix))
+
+    registry.register(PromptTemplate('extract_tasks', 1, """
+Você é um assistente especializado em identificar tarefas e prazos.
+
+Analise o texto e identifique:
+1. Tarefas explícitas ou implícitas
+2. Datas e prazos mencionados
+3. Prioridades sugeridas
+
+Retorne um JSON com esta estrutura:
+{
+""" + TASKS_SCHEMA_FIELDS + "\n}"))
+
+    registry.register(PromptTemplate('categorize_notes', 1, """
+Você é um assistente especializado em organização de informações.
+
+Analise as anotações fornecidas e sugira a melhor categoria para cada uma.
+Prefira usar as categorias existentes (listadas ao final) quando apropriado,
+mas pode sugerir novas se necessário.
+
+Retorne um JSON com esta estrutura:
+{
+    "categorizations": [
+        {
+            "note_index": 1,
+            "suggested_category": "nome_da_categoria",
+            "confidence": 0.85,
+            "reason": "explicação breve"
+        }
+    ],
+    "new_categories": [
+        {
+            "name": "nova_categoria",
+            "description": "descrição da categoria",
+            "suggested_icon": "📝"
+        }
+    ]
+}""", _categories_suffix))
+
+    registry.register(PromptTemplate('label_topic_cluster', 1, """
+Você é um assistente especializado em organização de informações.
+
+As anotações fornecidas pertencem ao mesmo grupo de assunto.
+Sugira UMA categoria curta que descreva o grupo inteiro.
+Prefira usar uma das categorias existentes (listadas ao final) quando apropriado.
+
+Retorne um JSON com esta estrutura:
+{
+    "category": "nome_da_categoria",
+    "description": "descrição breve do grupo",
+    "confidence": 0.85
+}""", _categories_suffix))
+
+    registry.register(PromptTemplate('daily_summary', 1, """
+Você é um assistente especializado em criar resumos organizados.
+
+Analise as anotações do dia e crie um resumo estruturado que inclua:
+1. Principais temas abordados
+2. Tarefas e compromissos identificados
+3. Insights e ideias importantes
+4. Sugestões de ações para os próximos dias
+
+Retorne um JSON com esta estrutura:
+""" + DAILY_SUMMARY_SCHEMA))
+
+    registry.register(PromptTemplate('daily_summary_map', 1, """
+Você é um assistente especializado em criar resumos organizados.
+
+As anotações fornecidas são PARTE das anotações de um dia (indicado ao final).
+Extraia apenas o que for relevante desta parte, de forma concisa.
+
+Retorne um JSON com esta estrutura:
+{
+    "main_themes": ["tema1"],
+    "tasks_identified": [
+        {
+            "task": "descrição da tarefa",
+            "priority": "alta|média|baixa",
+            "suggested_deadline": "YYYY-MM-DD ou null"
+        }
+    ],
+    "key_insights": ["insight1"],
+    "partial_summary": "resumo desta parte em 1-2 frases"
+}""", lambda date: f"Dia: {date}"))
+
+    registry.register(PromptTemplate('daily_summary_reduce', 1, """
+Você é um assistente especializado em criar resumos organizados.
+
+Você receberá resumos parciais das anotações de um dia (indicado ao final).
+Combine-os em um único resumo do dia: una temas repetidos, remova tarefas
+duplicadas e priorize os insights mais importantes.
+
+Retorne um JSON com esta estrutura:
+""" + DAILY_SUMMARY_SCHEMA, lambda date: f"Dia: {date}"))
+
+    registry.register(PromptTemplate('period_summary', 1, """
+Você é um assistente especializado em criar resumos organizados.
+
+Você receberá os resumos diários de um período (indicado ao final).
+Combine-os em um único resumo do período: destaque os temas recorrentes,
+liste as tarefas ainda relevantes (sem duplicatas) e os insights mais importantes.
+
+Retorne um JSON com esta estrutura:
+""" + PERIOD_SUMMARY_SCHEMA, lambda period_label: f"Período: {period_label}"))
+
+    registry.register(PromptTemplate('external_search', 1, """
+Você é um assistente de pesquisa especializado.
+Busque informações atualizadas e relevantes sobre o tópico fornecido.
+Foque em:
+- Informações recentes e verificadas
+- Dados estatísticos quando relevantes
+- Tendências e desenvolvimentos atuais
+- Recursos úteis e referências
+
+Organize a resposta de forma clara e estruturada."""))
+
+    registry.register(PromptTemplate('find_events', 1, """
+Você é um assistente especializado em encontrar eventos e atividades.
+Busque informações sobre:
+- Eventos próximos relacionados ao tópico
+- Conferências e workshops
+- Cursos e treinamentos
+- Meetups e networking
+- Webinars e eventos online
+
+Para cada evento encontrado, inclua:
+- Nome e descrição
+- Data e horário
+- Local (presencial/online)
+- Informações de inscrição
+- Custo (se aplicável)"""))
+
+    registry.register(PromptTemplate('suggest_tools', 1, """
+Você é um especialista em ferramentas e tecnologia.
+Sugira recursos úteis como:
+- Aplicativos móveis e web
+- Ferramentas online
+- Software especializado
+- Extensões de navegador
+- APIs e serviços
+
+Para cada sugestão, inclua:
+- Nome e descrição
+- Plataformas suportadas
+- Preço (gratuito/pago)
+- Principais funcionalidades
+- Link oficial quando possível
+- Alternativas similares"""))
+
+    registry.register(PromptTemplate('market_insights', 1, """
+Você é um analista de mercado especializado.
+Forneça insights abrangentes incluindo:
+- Tendências atuais do mercado
+- Estatísticas e dados relevantes
+- Oportunidades emergentes
+- Principais desafios
+- Previsões e projeções
+- Principais players do mercado
+- Fatores de crescimento
+
+Base suas análises em dados recentes e fontes confiáveis."""))
+
+    registry.register(PromptTemplate('fact_check', 1, """
+Você é um verificador de fatos especializado.
+Para cada verificação, forneça:
+- Status da verificação (verdadeiro/falso/parcialmente verdadeiro/inconclusivo)
+- Explicação detalhada
+- Fontes confiáveis que sustentam ou refutam a informação
+- Contexto adicional relevante
+- Nuances importantes
+
+Seja imparcial e baseie-se apenas em fontes verificáveis."""))
+
+    return registry
+
+
+_registry: Optional[PromptRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_prompt_registry() -> PromptRegistry:
+    """Retorna o registro de prompts compartilhado pelo processo"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = _build_default_registry()
+    return _registry
+
+
+def get_prompt_stats() -> dict:
+    """Versões em uso e aproveitamento das variantes memoizadas"""
+    return get_prompt_registry().get_stats()
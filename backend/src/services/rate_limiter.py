@@ -0,0 +1,68 @@
+import os
+import time
+import threading
+from typing import Dict
+
+# Limites padrão por provedor (requisições por minuto)
+DEFAULT_RATE_LIMITS = {
+    'openai': 500,
+    'perplexity': 50,
+    'whatsapp': 600
+}
+
+
+class TokenBucket:
+    """Token bucket thread-safe: até `capacity` requisições em rajada, `rate` por segundo em média"""
+
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """Consome tokens se disponíveis; senão retorna quantos segundos esperar"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1, timeout: float = None) -> bool:
+        """Bloqueia até obter os tokens (ou até o timeout)"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0.0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+_limiters: Dict[str, TokenBucket] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str) -> TokenBucket:
+    """Limitador do provedor, compartilhado por todas as threads do processo.
+
+    Configurável por {PROVEDOR}_RATE_LIMIT_PER_MINUTE e {PROVEDOR}_RATE_LIMIT_BURST.
+    O limite vale por processo: com N processos, divida o limite da conta por N.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            prefix = provider.upper()
+            per_minute = float(os.getenv(f'{prefix}_RATE_LIMIT_PER_MINUTE', DEFAULT_RATE_LIMITS.get(provider, 60)))
+            burst = float(os.getenv(f'{prefix}_RATE_LIMIT_BURST', max(1.0, per_minute / 60)))
+            limiter = TokenBucket(per_minute / 60, burst)
+            _limiters[provider] = limiter
+        return limiter
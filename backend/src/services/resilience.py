@@ -0,0 +1,226 @@
+import os
+import time
+import threading
+from collections import deque
+from typing import Dict
+import requests
+from src.services import http_client
+
+# Chamadas simultâneas padrão por provedor (por processo)
+DEFAULT_MAX_CONCURRENCY = {
+    'openai': 16,
+    'perplexity': 8,
+    'whatsapp': 8
+}
+
+
+class ProviderUnavailable(Exception):
+    """Provedor com circuito aberto ou sem vaga para novas chamadas"""
+
+    def __init__(self, provider: str, reason: str, retry_after: float = 1.0):
+        super().__init__(f"Provedor {provider} indisponível: {reason}")
+        self.provider = provider
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def unavailable_info(error: Exception) -> dict:
+    """Campos de falha dos serviços: provider_unavailable e, se for o caso, retry_after (segundos)"""
+    if isinstance(error, ProviderUnavailable):
+        return {'provider_unavailable': True, 'retry_after': error.retry_after}
+    return {'provider_unavailable': False}
+
+
+def _setting(provider: str, name: str, default):
+    """Lê {PROVEDOR}_{NOME} com fallback para {NOME} e para o padrão"""
+    value = os.getenv(f'{provider.upper()}_{name}', os.getenv(name))
+    return type(default)(value) if value is not None else default
+
+
+class CircuitBreaker:
+    """Circuit breaker por taxa de falhas em janela deslizante.
+
+    - fechado: chamadas passam; abre quando, com pelo menos min_calls na
+      janela, a taxa de falhas atinge failure_rate;
+    - aberto: chamadas falham imediatamente por open_seconds;
+    - meio-aberto: deixa passar até half_open_calls sondagens; sucesso
+      fecha o circuito, falha o reabre.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, provider: str, failure_rate: float = 0.5, min_calls: int = 10,
+                 window_seconds: float = 60.0, open_seconds: float = 30.0, half_open_calls: int = 1):
+        self.provider = provider
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.state = self.CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._calls = deque()  # (instante, sucesso)
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Reserva a chamada ou levanta ProviderUnavailable"""
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self.open_seconds - (time.monotonic() - self._opened_at)
+                if remaining > 0:
+                    raise ProviderUnavailable(self.provider, 'circuito aberto', retry_after=remaining)
+                self.state = self.HALF_OPEN
+                self._probes = 0
+
+            if self.state == self.HALF_OPEN:
+                if self._probes >= self.half_open_calls:
+                    raise ProviderUnavailable(self.provider, 'circuito em teste')
+                self._probes += 1
+
+    def cancel_call(self):
+        """Devolve a reserva de uma chamada que não chegou a ser feita"""
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def record_success(self):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._close()
+            self._record(True)
+
+    def record_failure(self):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._open()
+                return
+
+            self._record(False)
+            failures = sum(1 for _, success in self._calls if not success)
+            if len(self._calls) >= self.min_calls and failures / len(self._calls) >= self.failure_rate:
+                self._open()
+
+    def _record(self, success: bool):
+        now = time.monotonic()
+        self._calls.append((now, success))
+        while self._calls and now - self._calls[0][0] > self.window_seconds:
+            self._calls.popleft()
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._calls.clear()
+
+    def _close(self):
+        self.state = self.CLOSED
+        self._probes = 0
+        self._calls.clear()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            failures = sum(1 for _, success in self._calls if not success)
+            return {
+                'state': self.state,
+                'calls_in_window': len(self._calls),
+                'failures_in_window': failures
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+_registry_lock = threading.Lock()
+
+
+def get_circuit_breaker(provider: str) -> CircuitBreaker:
+    """Circuit breaker do provedor, compartilhado pelo processo.
+
+    Configurável por {PROVEDOR}_CIRCUIT_FAILURE_RATE, _CIRCUIT_MIN_CALLS,
+    _CIRCUIT_WINDOW_SECONDS e _CIRCUIT_OPEN_SECONDS.
+    """
+    with _registry_lock:
+        breaker = _breakers.get(provider)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                provider,
+                failure_rate=_setting(provider, 'CIRCUIT_FAILURE_RATE', 0.5),
+                min_calls=_setting(provider, 'CIRCUIT_MIN_CALLS', 10),
+                window_seconds=_setting(provider, 'CIRCUIT_WINDOW_SECONDS', 60.0),
+                open_seconds=_setting(provider, 'CIRCUIT_OPEN_SECONDS', 30.0)
+            )
+            _breakers[provider] = breaker
+        return breaker
+
+
+def get_concurrency_limit(provider: str) -> threading.BoundedSemaphore:
+    """Semáforo de chamadas simultâneas do provedor ({PROVEDOR}_MAX_CONCURRENCY)"""
+    with _registry_lock:
+        semaphore = _semaphores.get(provider)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(
+                _setting(provider, 'MAX_CONCURRENCY', DEFAULT_MAX_CONCURRENCY.get(provider, 8))
+            )
+            _semaphores[provider] = semaphore
+        return semaphore
+
+
+def guarded_request(provider: str, method: str, url: str, **kwargs) -> requests.Response:
+    """Requisição HTTP ao provedor protegida por circuit breaker e limite de concorrência.
+
+    Falha em milissegundos com ProviderUnavailable quando o circuito está
+    aberto ou quando não há vaga em {PROVEDOR}_CONCURRENCY_WAIT_SECONDS.
+    Erros de rede, 429 e 5xx contam como falha; demais respostas, como sucesso.
+
+    Com stream=True a vaga só é devolvida no close() da resposta: a geração
+    do corpo também conta no limite de chamadas simultâneas, então quem
+    chama deve sempre fechar a resposta.
+    """
+    breaker = get_circuit_breaker(provider)
+    breaker.before_call()
+
+    semaphore = get_concurrency_limit(provider)
+    if not semaphore.acquire(timeout=_setting(provider, 'CONCURRENCY_WAIT_SECONDS', 2.0)):
+        breaker.cancel_call()
+        raise ProviderUnavailable(provider, 'limite de chamadas simultâneas atingido')
+
+    try:
+        response = http_client.get_session(provider).request(method, url, **kwargs)
+    except Exception:
+        semaphore.release()
+        breaker.record_failure()
+        raise
+
+    if kwargs.get('stream'):
+        _release_on_close(response, semaphore)
+    else:
+        semaphore.release()
+
+    if response.status_code in http_client.RETRY_STATUS_CODES:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
+
+
+def _release_on_close(response: requests.Response, semaphore: threading.BoundedSemaphore):
+    """Devolve a vaga uma única vez, quando a resposta em streaming for fechada"""
+    close = response.close
+    once = threading.Lock()
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            if once.acquire(blocking=False):
+                semaphore.release()
+
+    response.close = close_and_release
+
+
+def get_resilience_stats() -> dict:
+    """Estado dos circuitos de cada provedor"""
+    with _registry_lock:
+        breakers = dict(_breakers)
+    return {provider: breaker.get_stats() for provider, breaker in breakers.items()}
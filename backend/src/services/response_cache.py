@@ -0,0 +1,250 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from flask import has_app_context
+from src.models.user import db
+from src.models.cache import ResponseCacheEntry
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """Cache de respostas de APIs de IA em duas camadas.
+
+    A primeira camada é um LRU em memória do processo; a segunda é a tabela
+    response_cache, compartilhada entre processos, com TTL e limite de
+    entradas. O acesso ao banco usa conexão própria para nunca fazer commit
+    da sessão do chamador.
+    """
+
+    # A limpeza da camada persistente roda a cada N gravações
+    EVICTION_INTERVAL = 100
+
+    def __init__(self, namespace: str, ttl_seconds: int, max_memory_entries: int = 1000,
+                 max_db_entries: int = 50000, enabled: bool = True):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_entries = max_memory_entries
+        self.max_db_entries = max_db_entries
+        self.enabled = enabled
+
+        self._memory = OrderedDict()  # key -> (expires_at_epoch, json)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._stats = {
+            'memory_hits': 0,
+            'db_hits': 0,
+            'misses': 0,
+            'writes': 0,
+            'evictions': 0
+        }
+
+    @staticmethod
+    def make_key(namespace: str, endpoint: str, data: dict) -> str:
+        """Gera chave determinística a partir de endpoint, modelo, mensagens e parâmetros"""
+        raw = json.dumps(
+            {'namespace': namespace, 'endpoint': endpoint, 'data': data},
+            sort_keys=True,
+            ensure_ascii=False,
+            separators=(',', ':')
+        )
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        """Busca resposta no cache (memória e depois banco)"""
+        if not self.enabled:
+            return None
+
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return json.loads(value)
+                del self._memory[key]
+
+        value = self._db_get(key)
+        if value is not None:
+            expires_at_epoch, raw = value
+            self._memory_set(key, raw, expires_at_epoch)
+            with self._lock:
+                self._stats['db_hits'] += 1
+            return json.loads(raw)
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def set(self, key: str, value: dict):
+        """Armazena resposta nas duas camadas"""
+        if not self.enabled:
+            return
+
+        raw = json.dumps(value, ensure_ascii=False)
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl_seconds)
+
+        self._memory_set(key, raw, time.time() + self.ttl_seconds)
+        self._db_set(key, raw, expires_at)
+
+        with self._lock:
+            self._stats['writes'] += 1
+            self._writes += 1
+            should_evict = self._writes % self.EVICTION_INTERVAL == 0
+
+        if should_evict:
+            self.evict()
+
+    def _memory_set(self, key: str, raw: str, expires_at_epoch: float):
+        with self._lock:
+            self._memory[key] = (expires_at_epoch, raw)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def _db_get(self, key: str):
+        """Lê entrada válida da camada persistente"""
+        if not has_app_context():
+            return None
+
+        table = ResponseCacheEntry.__table__
+        now = datetime.utcnow()
+
+        try:
+            with db.engine.begin() as conn:
+                row = conn.execute(
+                    db.select(table.c.value, table.c.expires_at).where(
+                        table.c.key == key,
+                        table.c.expires_at > now
+                    )
+                ).first()
+
+                if row is None:
+                    return None
+
+                conn.execute(
+                    table.update().where(table.c.key == key).values(
+                        last_accessed_at=now,
+                        hits=table.c.hits + 1
+                    )
+                )
+
+            expires_in = (row.expires_at - now).total_seconds()
+            return time.time() + expires_in, row.value
+        except Exception as e:
+            logger.warning('Falha ao ler cache persistente: %s', e)
+            return None
+
+    def _db_set(self, key: str, raw: str, expires_at: datetime):
+        """Grava (ou substitui) entrada na camada persistente"""
+        if not has_app_context():
+            return
+
+        table = ResponseCacheEntry.__table__
+        now = datetime.utcnow()
+
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(table.delete().where(table.c.key == key))
+                conn.execute(table.insert().values(
+                    key=key,
+                    namespace=self.namespace,
+                    value=raw,
+                    created_at=now,
+                    expires_at=expires_at,
+                    last_accessed_at=now,
+                    hits=0
+                ))
+        except Exception as e:
+            logger.warning('Falha ao gravar cache persistente: %s', e)
+
+    def evict(self) -> int:
+        """Remove entradas expiradas e as menos acessadas acima do limite"""
+        if not has_app_context():
+            return 0
+
+        table = ResponseCacheEntry.__table__
+        removed = 0
+
+        try:
+            with db.engine.begin() as conn:
+                result = conn.execute(table.delete().where(
+                    table.c.namespace == self.namespace,
+                    table.c.expires_at <= datetime.utcnow()
+                ))
+                removed += result.rowcount or 0
+
+                total = conn.execute(
+                    db.select(db.func.count()).select_from(table).where(table.c.namespace == self.namespace)
+                ).scalar()
+
+                excess = total - self.max_db_entries
+                if excess > 0:
+                    oldest = db.select(table.c.key).where(
+                        table.c.namespace == self.namespace
+                    ).order_by(table.c.last_accessed_at).limit(excess)
+                    result = conn.execute(table.delete().where(table.c.key.in_(oldest.scalar_subquery())))
+                    removed += result.rowcount or 0
+        except Exception as e:
+            logger.warning('Falha na limpeza do cache persistente: %s', e)
+
+        with self._lock:
+            self._stats['evictions'] += removed
+        return removed
+
+    def clear_memory(self):
+        """Esvazia a camada em memória"""
+        with self._lock:
+            self._memory.clear()
+
+    def get_stats(self) -> dict:
+        """Retorna métricas de acerto/erro do cache"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+
+        lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['db_hits']) / lookups, 4) if lookups else 0.0
+        return stats
+
+
+# Instâncias compartilhadas por processo, uma por provedor
+_caches: Dict[str, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+_DEFAULT_TTLS = {
+    'openai': 7 * 24 * 3600,
+    'perplexity': 6 * 3600  # Resultados de busca na web envelhecem rápido
+}
+
+
+def get_response_cache(namespace: str, ttl_seconds: int = None) -> ResponseCache:
+    """Retorna o cache compartilhado do provedor (ttl_seconds: padrão do namespace)"""
+    with _caches_lock:
+        if namespace not in _caches:
+            env_prefix = namespace.upper()
+            default_ttl = ttl_seconds or _DEFAULT_TTLS.get(namespace, 24 * 3600)
+            _caches[namespace] = ResponseCache(
+                namespace=namespace,
+                ttl_seconds=int(os.getenv(f'{env_prefix}_CACHE_TTL_SECONDS', default_ttl)),
+                max_memory_entries=int(os.getenv('LLM_CACHE_MEMORY_ENTRIES', 1000)),
+                max_db_entries=int(os.getenv('LLM_CACHE_DB_MAX_ENTRIES', 50000)),
+                enabled=os.getenv('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+            )
+        return _caches[namespace]
+
+
+def get_cache_stats() -> dict:
+    """Retorna métricas de todos os caches do processo"""
+    with _caches_lock:
+        caches = list(_caches.values())
+    return {cache.namespace: cache.get_stats() for cache in caches}
@@ -0,0 +1,181 @@
+import os
+import re
+import logging
+import threading
+from typing import Dict
+from src.models.user import db, User, UserDailyUsage
+from src.models.note import Insight
+from src.services.resilience import get_circuit_breaker, CircuitBreaker
+from src.services.text_processing import tokenize, stem
+
+logger = logging.getLogger(__name__)
+
+# Termos (já com stemming) que sugerem necessidade de informação atualizada
+EXTERNAL_TRIGGER_TERMS = {stem(word) for word in [
+    'preco', 'precos', 'cotacao', 'mercado', 'noticia', 'noticias', 'evento', 'eventos',
+    'conferencia', 'curso', 'cursos', 'empresa', 'empresas', 'startup', 'investimento',
+    'investimentos', 'tendencia', 'tendencias', 'lancamento', 'concorrente', 'concorrentes',
+    'comparacao', 'comparar', 'pesquisar', 'alternativa', 'alternativas'
+]}
+
+# Termos (já com stemming) que sugerem tarefas ou prazos
+TASK_CUE_TERMS = {stem(word) for word in [
+    'preciso', 'precisa', 'fazer', 'comprar', 'ligar', 'enviar', 'mandar', 'pagar', 'agendar',
+    'marcar', 'reuniao', 'prazo', 'entregar', 'lembrar', 'tarefa', 'tarefas', 'amanha',
+    'segunda', 'terca', 'quarta', 'quinta', 'sexta', 'sabado', 'domingo', 'semana', 'devo',
+    'arrumar', 'lavar', 'limpar', 'estudar', 'resolver', 'terminar', 'organizar', 'revisar',
+    'responder', 'consertar', 'renovar', 'cancelar', 'buscar', 'levar'
+]}
+
+_URL_RE = re.compile(r'https?://|www\.', re.IGNORECASE)
+_MONEY_RE = re.compile(r'(R\$|US\$|€|\$)\s?\d|\d+(,\d+)?\s?%')
+_DATE_RE = re.compile(r'\b\d{1,2}/\d{1,2}(/\d{2,4})?\b|\b\d{1,2}h\d{0,2}\b')
+_SENTENCE_RE = re.compile(r'[.!?\n]+')
+
+_stats = {'notes_routed': 0, 'external_info_selected': 0, 'external_info_skipped': 0, 'tasks_skipped': 0}
+_stats_lock = threading.Lock()
+
+
+def count_entities(content: str) -> int:
+    """Nomes próprios e siglas: palavras capitalizadas fora do início da frase"""
+    entities = 0
+    for sentence in _SENTENCE_RE.split(content or ''):
+        words = re.findall(r'[^\W\d_][\w-]*', sentence)
+        for word in words[1:]:
+            if len(word) >= 2 and (word[0].isupper() or word.isupper()):
+                entities += 1
+    return entities
+
+
+class StageRouter:
+    """Decide quais etapas pagas rodar para cada anotação.
+
+    Usa apenas sinais locais e baratos (tamanho, perguntas, URLs, entidades,
+    termos-gatilho, áreas de interesse, histórico de insights externos
+    dispensados) e o orçamento restante do usuário no dia.
+    """
+
+    def __init__(self):
+        self.external_threshold = float(os.getenv('ROUTER_EXTERNAL_MIN_SCORE', 0.5))
+        self.external_daily_limit_free = int(os.getenv('ROUTER_EXTERNAL_DAILY_LIMIT_FREE', 2))
+        self.external_daily_limit_premium = int(os.getenv('ROUTER_EXTERNAL_DAILY_LIMIT_PREMIUM', 20))
+        self.history_size = int(os.getenv('ROUTER_HISTORY_SIZE', 50))
+        self.min_history = int(os.getenv('ROUTER_MIN_HISTORY', 5))
+
+    def route(self, user: User, content: str, user_preferences: dict = None,
+              combined_analysis: bool = True, note_id: str = None) -> dict:
+        """Retorna as etapas escolhidas, as descartadas (com motivo) e os sinais usados"""
+        terms = tokenize(content)
+        term_set = set(terms)
+        features = {
+            'terms': len(terms),
+            'questions': (content or '').count('?'),
+            'urls': len(_URL_RE.findall(content or '')),
+            'entities': count_entities(content),
+            'money': bool(_MONEY_RE.search(content or '')),
+            'trigger_terms': sorted(term_set & EXTERNAL_TRIGGER_TERMS),
+            'focus_match': self._matches_focus_areas(term_set, user_preferences)
+        }
+
+        stages = ['analysis']
+        skipped = {}
+
+        # Tarefas: grátis na análise combinada; em chamada separada, só com indícios de tarefa
+        has_task_cues = bool(term_set & TASK_CUE_TERMS) or bool(_DATE_RE.search(content or ''))
+        if combined_analysis or has_task_cues:
+            stages.append('tasks')
+        else:
+            skipped['tasks'] = 'sem indícios de tarefa'
+
+        # Informações externas: pontuação local contra limiar ajustado ao orçamento
+        dismissal_rate = self._external_dismissal_rate(user.id)
+        features['external_dismissal_rate'] = dismissal_rate
+        score = self._external_score(features, dismissal_rate)
+
+        used, limit = self._external_budget(user)
+        threshold = self.external_threshold + 0.3 * (used / limit if limit else 1.0)
+
+        if limit <= used:
+            skipped['external_info'] = 'orçamento diário esgotado'
+        elif get_circuit_breaker('perplexity').state == CircuitBreaker.OPEN:
+            skipped['external_info'] = 'provedor indisponível'
+        elif score < threshold:
+            skipped['external_info'] = 'pontuação abaixo do limiar'
+        else:
+            stages.append('external_info')
+
+        decision = {
+            'stages': stages,
+            'skipped': skipped,
+            'external_score': round(score, 3),
+            'external_threshold': round(threshold, 3),
+            'external_budget': {'used': used, 'limit': limit},
+            'features': features
+        }
+
+        self._record(decision)
+        logger.info('Roteamento da nota %s (usuário %s): etapas=%s descartadas=%s score=%.2f limiar=%.2f',
+                    note_id, user.id, stages, skipped, score, threshold)
+        return decision
+
+    @staticmethod
+    def _external_score(features: dict, dismissal_rate: float) -> float:
+        """Pontuação de utilidade da busca externa (0 = inútil)"""
+        score = 0.0
+        if features['questions']:
+            score += 0.35
+        if features['urls']:
+            score += 0.25
+        if features['trigger_terms']:
+            score += min(0.5, 0.3 + 0.1 * (len(features['trigger_terms']) - 1))
+        score += min(0.3, 0.1 * features['entities'])
+        if features['money']:
+            score += 0.2
+        if features['focus_match']:
+            score += 0.2
+        if features['terms'] < 4:
+            score -= 0.3
+
+        # Usuário que costuma dispensar insights externos recebe menos buscas
+        return score - 0.6 * dismissal_rate
+
+    @staticmethod
+    def _matches_focus_areas(term_set: set, user_preferences: dict = None) -> bool:
+        focus_areas = (user_preferences or {}).get('focus_areas') or []
+        focus_terms = set()
+        for area in focus_areas:
+            focus_terms.update(tokenize(str(area)))
+        return bool(term_set & focus_terms)
+
+    def _external_dismissal_rate(self, user_id: str) -> float:
+        """Fração dos insights externos recentes que o usuário dispensou"""
+        recent = [row[0] for row in db.session.query(Insight.is_dismissed).filter(
+            Insight.user_id == user_id,
+            Insight.insight_type == 'external_info'
+        ).order_by(Insight.created_at.desc()).limit(self.history_size).all()]
+
+        if len(recent) < self.min_history:
+            return 0.0
+        return sum(1 for dismissed in recent if dismissed) / len(recent)
+
+    def _external_budget(self, user: User) -> tuple:
+        """(buscas externas usadas hoje, limite diário)"""
+        limit = self.external_daily_limit_premium if user.is_premium() else self.external_daily_limit_free
+        return UserDailyUsage.get_count(user.id, 'perplexity'), limit
+
+    @staticmethod
+    def _record(decision: dict):
+        with _stats_lock:
+            _stats['notes_routed'] += 1
+            if 'external_info' in decision['stages']:
+                _stats['external_info_selected'] += 1
+            else:
+                _stats['external_info_skipped'] += 1
+            if 'tasks' in decision['skipped']:
+                _stats['tasks_skipped'] += 1
+
+
+def get_router_stats() -> Dict[str, int]:
+    """Decisões de roteamento desde o início do processo (chamadas pagas evitadas)"""
+    with _stats_lock:
+        return dict(_stats)
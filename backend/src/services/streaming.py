@@ -0,0 +1,89 @@
+import json
+import queue
+import threading
+from typing import Callable, Iterator, Tuple
+from src.services import http_client
+from src.services.resilience import guarded_request
+from src.services.concurrency import bind_app_context
+
+
+def sse_event(event: str, data) -> str:
+    """Formata um evento Server-Sent Events com dados em JSON"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def iter_stream_chunks(response) -> Iterator[dict]:
+    """Chunks JSON de uma resposta em streaming no formato da OpenAI (linhas 'data: ...')"""
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith('data:'):
+            continue
+        payload = line[5:].strip()
+        if payload == '[DONE]':
+            break
+        yield json.loads(payload)
+
+
+def stream_chat_completion(provider: str, url: str, headers: dict, data: dict,
+                           error_label: str) -> Iterator[Tuple[str, object]]:
+    """Chamada de chat completion em streaming.
+
+    Gera ('delta', texto) à medida que os tokens chegam e, ao final,
+    ('response', resposta) montada no mesmo formato da chamada sem
+    streaming, para que uso, custo e cache sejam tratados igualmente.
+    """
+    response = guarded_request(
+        provider,
+        'POST',
+        url,
+        headers=headers,
+        json={**data, 'stream': True},
+        timeout=http_client.get_timeout(provider),
+        stream=True
+    )
+
+    content = []
+    assembled = {'usage': {}}
+    try:
+        if response.status_code != 200:
+            raise Exception(f"{error_label}: {response.status_code} - {response.text}")
+
+        for chunk in iter_stream_chunks(response):
+            if chunk.get('usage'):
+                assembled['usage'] = chunk['usage']
+            if chunk.get('model'):
+                assembled['model'] = chunk['model']
+            if chunk.get('citations'):
+                assembled['citations'] = chunk['citations']
+            for choice in chunk.get('choices') or []:
+                delta = (choice.get('delta') or {}).get('content')
+                if delta:
+                    content.append(delta)
+                    yield 'delta', delta
+    finally:
+        response.close()
+
+    assembled['choices'] = [{'message': {'role': 'assistant', 'content': ''.join(content)}}]
+    yield 'response', assembled
+
+
+def iter_progress(func: Callable, *args, **kwargs) -> Iterator[Tuple[str, object]]:
+    """Executa func(..., on_progress=callback) em outra thread.
+
+    Gera ('progress', dado) a cada chamada do callback e, ao final,
+    ('result', retorno) ou ('error', mensagem).
+    """
+    events = queue.Queue()
+
+    def target():
+        try:
+            events.put(('result', func(*args, on_progress=lambda data: events.put(('progress', data)), **kwargs)))
+        except Exception as e:
+            events.put(('error', str(e)))
+
+    threading.Thread(target=bind_app_context(target), daemon=True, name='progress-stream').start()
+
+    while True:
+        kind, value = events.get()
+        yield kind, value
+        if kind != 'progress':
+            break
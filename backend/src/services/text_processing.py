@@ -0,0 +1,65 @@
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, List
+
+# Stop words do português (sem acentos, já normalizadas)
+PORTUGUESE_STOP_WORDS = {
+    'a', 'ao', 'aos', 'aquela', 'aquelas', 'aquele', 'aqueles', 'aquilo', 'as', 'ate', 'com', 'como',
+    'da', 'das', 'de', 'dela', 'delas', 'dele', 'deles', 'depois', 'do', 'dos', 'e', 'ela', 'elas',
+    'ele', 'eles', 'em', 'entre', 'era', 'eram', 'essa', 'essas', 'esse', 'esses', 'esta', 'estas',
+    'este', 'estes', 'estou', 'eu', 'foi', 'foram', 'ha', 'isso', 'isto', 'ja', 'lhe', 'lhes', 'mais',
+    'mas', 'me', 'mesmo', 'meu', 'meus', 'minha', 'minhas', 'muito', 'na', 'nao', 'nas', 'nem', 'no',
+    'nos', 'nossa', 'nossas', 'nosso', 'nossos', 'num', 'numa', 'o', 'os', 'ou', 'para', 'pela',
+    'pelas', 'pelo', 'pelos', 'por', 'pra', 'qual', 'quando', 'que', 'quem', 'se', 'sem', 'ser',
+    'seu', 'seus', 'so', 'sua', 'suas', 'tambem', 'te', 'tem', 'ter', 'teu', 'tua', 'um', 'uma',
+    'umas', 'uns', 'vai', 'vou', 'voce', 'voces', 'sao', 'esta', 'estao', 'fazer', 'hoje', 'aqui',
+    'ali', 'la', 'onde', 'sobre', 'ainda', 'bem', 'cada', 'pode', 'podem', 'tudo', 'todos', 'todas'
+}
+
+# Sufixos removidos pelo stemmer leve (do mais longo para o mais curto)
+_SUFFIXES = [
+    ('amentos', ''), ('imentos', ''), ('amento', ''), ('imento', ''),
+    ('acoes', 'acao'), ('icoes', 'icao'), ('mente', ''), ('idades', 'idade'),
+    ('oes', 'ao'), ('aes', 'ao'), ('ais', 'al'), ('eis', 'el'), ('is', 'il'),
+    ('ando', ''), ('endo', ''), ('indo', ''), ('ado', ''), ('ada', ''), ('ados', ''), ('adas', ''),
+    ('ido', ''), ('ida', ''), ('idos', ''), ('idas', ''),
+    ('res', 'r'), ('zes', 'z'), ('ns', 'm'), ('s', '')
+]
+
+_MIN_STEM_LENGTH = 4
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas e sem acentos"""
+    text = unicodedata.normalize('NFKD', (text or '').lower())
+    return ''.join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def stem(word: str) -> str:
+    """Stemmer leve para português: remove plurais e sufixos comuns"""
+    for suffix, replacement in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) + len(replacement) >= _MIN_STEM_LENGTH:
+            return word[:-len(suffix)] + replacement
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Extrai termos normalizados, sem stop words e com stemming"""
+    terms = []
+    for word in re.findall(r'[a-z0-9]+', normalize_text(text)):
+        if len(word) < 3 or len(word) > 40 or word in PORTUGUESE_STOP_WORDS or word.isdigit():
+            continue
+        terms.append(stem(word))
+    return terms
+
+
+def term_frequencies(text: str) -> Dict[str, int]:
+    """Frequência de cada termo no texto"""
+    return dict(Counter(tokenize(text)))
+
+
+def top_keywords(text: str, limit: int = 10) -> List[str]:
+    """Termos mais frequentes, com desempate alfabético (determinístico)"""
+    frequencies = term_frequencies(text)
+    return [term for term, _ in sorted(frequencies.items(), key=lambda item: (-item[1], item[0]))[:limit]]
@@ -0,0 +1,191 @@
+import os
+import re
+import time
+import json
+import hashlib
+import logging
+import threading
+from typing import Callable, Dict
+from flask import current_app, has_app_context
+from src.services.response_cache import get_response_cache
+from src.services.text_processing import tokenize, top_keywords
+
+logger = logging.getLogger(__name__)
+
+# (TTL fresco, janela extra em que a resposta vencida ainda é servida) em segundos
+_DEFAULT_TTLS = {
+    'events': (6 * 3600, 6 * 3600),  # Eventos mudam rápido
+    'market': (24 * 3600, 24 * 3600),
+    'tools': (7 * 24 * 3600, 7 * 24 * 3600)  # Listas de ferramentas envelhecem devagar
+}
+
+
+def normalize_topic(text: str) -> str:
+    """Forma canônica do tópico: termos normalizados, sem stop words, ordenados.
+
+    "Conferências de Python em São Paulo" e "python conferencia sao paulo"
+    viram a mesma chave.
+    """
+    return ' '.join(sorted(set(tokenize(text or ''))))
+
+
+def extract_topic(text: str, limit: int = None) -> str:
+    """Tópico genérico do texto: os termos mais frequentes, na forma em que aparecem.
+
+    É o que vai na busca e na chave: anotações diferentes sobre o mesmo
+    assunto compartilham a resposta, e o restante do texto pessoal não é
+    enviado ao provedor.
+    """
+    if limit is None:
+        limit = int(os.getenv('TOPIC_CACHE_KEYWORDS', 5))
+    keywords = top_keywords(text or '', limit)
+
+    # Primeira ocorrência de cada termo no texto original (sem o stemming)
+    surface = {}
+    for word in re.findall(r'\w+', (text or '').lower()):
+        terms = tokenize(word)
+        if len(terms) == 1 and terms[0] in keywords:
+            surface.setdefault(terms[0], word)
+    return ' '.join(surface.get(term, term) for term in keywords)
+
+
+class TopicCache:
+    """Cache entre usuários para buscas sobre tópicos genéricos.
+
+    A chave é a forma normalizada de tópico, local, plataforma e setor; o
+    TTL depende do tipo de busca. Dentro do TTL a resposta é servida
+    direto; depois dele, e até o fim da janela de stale, a resposta vencida
+    é servida na hora enquanto uma única atualização roda em segundo plano
+    (stale-while-revalidate). Requisições simultâneas pelo mesmo tópico
+    esperam a mesma chamada paga.
+    """
+
+    def __init__(self, namespace: str = 'perplexity_topics'):
+        self.namespace = namespace
+        self.enabled = os.getenv('TOPIC_CACHE_ENABLED', 'true').lower() == 'true'
+        self._ttls = {}
+        for kind, (ttl, stale) in _DEFAULT_TTLS.items():
+            env_prefix = f'TOPIC_CACHE_{kind.upper()}'
+            self._ttls[kind] = (
+                int(os.getenv(f'{env_prefix}_TTL_SECONDS', ttl)),
+                int(os.getenv(f'{env_prefix}_STALE_SECONDS', stale))
+            )
+        # Validade máxima no cache persistente: TTL + janela de stale do tipo mais longo
+        self.store = get_response_cache(namespace, ttl_seconds=max(sum(ttls) for ttls in self._ttls.values()))
+        self._inflight: Dict[str, threading.Event] = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._stats = {'fresh_hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0, 'refresh_failures': 0}
+
+    def make_key(self, kind: str, topic: str, version: str = '', **qualifiers) -> str:
+        """Chave a partir do tipo, do tópico e dos qualificadores (local, plataforma, setor) normalizados"""
+        raw = json.dumps({
+            'kind': kind,
+            'topic': normalize_topic(topic),
+            'qualifiers': {name: normalize_topic(value) for name, value in sorted(qualifiers.items()) if value},
+            'version': version
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get_or_fetch(self, kind: str, key: str, fetch: Callable[[], dict]) -> dict:
+        """Resposta do cache ou de fetch(); marca cache_hit e topic_cache ('fresh', 'stale', 'miss')"""
+        if not self.enabled:
+            return fetch()
+
+        while True:
+            entry = self.store.get(key)
+            if entry is not None and entry['stale_until'] > time.time():
+                response = entry['response']
+                response['cache_hit'] = True
+                if entry['fresh_until'] > time.time():
+                    self._count('fresh_hits')
+                    response['topic_cache'] = 'fresh'
+                else:
+                    self._count('stale_hits')
+                    response['topic_cache'] = 'stale'
+                    self._refresh_in_background(kind, key, fetch)
+                return response
+
+            with self._lock:
+                waiting = self._inflight.get(key)
+                if waiting is None:
+                    self._inflight[key] = threading.Event()
+                    break
+            # Outra requisição já está buscando este tópico: espera e relê o cache
+            if not waiting.wait(timeout=float(os.getenv('TOPIC_CACHE_WAIT_SECONDS', 30))):
+                return fetch()
+
+        try:
+            self._count('misses')
+            response = fetch()
+            self._store(kind, key, response)
+            response['topic_cache'] = 'miss'
+            return response
+        finally:
+            with self._lock:
+                self._inflight.pop(key).set()
+
+    def _store(self, kind: str, key: str, response: dict):
+        ttl, stale = self._ttls[kind]
+        now = time.time()
+        self.store.set(key, {
+            'fresh_until': now + ttl,
+            'stale_until': now + ttl + stale,
+            'response': {k: v for k, v in response.items() if k not in ('cache_hit', 'topic_cache')}
+        })
+
+    def _refresh_in_background(self, kind: str, key: str, fetch: Callable[[], dict]):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        app = current_app._get_current_object() if has_app_context() else None
+
+        def refresh():
+            try:
+                if app is not None:
+                    with app.app_context():
+                        self._store(kind, key, fetch())
+                else:
+                    self._store(kind, key, fetch())
+                self._count('refreshes')
+            except Exception as e:
+                self._count('refresh_failures')
+                logger.warning('Falha ao atualizar tópico em cache (%s): %s', kind, e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True, name='topic-cache-refresh').start()
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['refreshing'] = len(self._refreshing)
+        lookups = stats['fresh_hits'] + stats['stale_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['fresh_hits'] + stats['stale_hits']) / lookups, 4) if lookups else 0.0
+        return stats
+
+
+_topic_cache = None
+_topic_cache_lock = threading.Lock()
+
+
+def get_topic_cache() -> TopicCache:
+    """Retorna o cache de tópicos compartilhado pelo processo"""
+    global _topic_cache
+    if _topic_cache is None:
+        with _topic_cache_lock:
+            if _topic_cache is None:
+                _topic_cache = TopicCache()
+    return _topic_cache
+
+
+def get_topic_cache_stats() -> dict:
+    """Acertos frescos/vencidos e atualizações do cache de tópicos"""
+    return _topic_cache.get_stats() if _topic_cache is not None else {}
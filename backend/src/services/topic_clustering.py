@@ -0,0 +1,142 @@
+import math
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from scipy import sparse
+
+
+def build_tfidf_matrix(documents: List[Dict[str, int]], min_df: int = 2,
+                       max_df_ratio: float = 0.5) -> Tuple[sparse.csr_matrix, List[str]]:
+    """Matriz TF-IDF esparsa (linhas L2-normalizadas) a partir de frequências de termos.
+
+    Termos presentes em menos de min_df notas ou em mais de max_df_ratio
+    do acervo são descartados: não ajudam a separar assuntos.
+    """
+    doc_freqs: Dict[str, int] = {}
+    for terms in documents:
+        for term in terms:
+            doc_freqs[term] = doc_freqs.get(term, 0) + 1
+
+    total = len(documents)
+    max_df = max(min_df, int(max_df_ratio * total))
+    vocabulary = sorted(term for term, df in doc_freqs.items() if min_df <= df <= max_df)
+    columns = {term: i for i, term in enumerate(vocabulary)}
+    idf = np.array([math.log((1 + total) / (1 + doc_freqs[term])) + 1 for term in vocabulary], dtype=np.float32)
+
+    rows, cols, values = [], [], []
+    for row, terms in enumerate(documents):
+        for term, tf in terms.items():
+            column = columns.get(term)
+            if column is not None:
+                rows.append(row)
+                cols.append(column)
+                values.append((1 + math.log(tf)) * idf[column])
+
+    matrix = sparse.csr_matrix(
+        (np.asarray(values, dtype=np.float32), (rows, cols)),
+        shape=(total, len(vocabulary)),
+        dtype=np.float32
+    )
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    matrix = sparse.diags(1.0 / norms).dot(matrix).tocsr().astype(np.float32)
+
+    return matrix, vocabulary
+
+
+class MiniBatchKMeans:
+    """K-means esférico (similaridade de cosseno) com mini-batches.
+
+    Cada iteração usa uma amostra de batch_size linhas, então o custo não
+    cresce com o tamanho do acervo. Inicialização k-means++ em uma amostra.
+    """
+
+    def __init__(self, n_clusters: int, batch_size: int = 256, max_iter: int = 100,
+                 tol: float = 1e-4, n_init: int = 3, seed: int = 0):
+        self.n_clusters = n_clusters
+        self.batch_size = batch_size
+        self.max_iter = max_iter
+        self.tol = tol
+        self.n_init = n_init
+        self._rng = np.random.RandomState(seed)
+        self.centers: Optional[np.ndarray] = None
+
+    def fit(self, matrix: sparse.csr_matrix) -> 'MiniBatchKMeans':
+        """Executa n_init inicializações e mantém a de maior coesão"""
+        if matrix.shape[0] == 0 or matrix.shape[1] == 0:
+            raise ValueError('Matriz TF-IDF vazia: não há termos para agrupar')
+
+        best_centers, best_score = None, -np.inf
+        for _ in range(self.n_init):
+            centers = self._fit_once(matrix)
+            score = np.asarray(matrix @ centers.T).max(axis=1).sum()
+            if score > best_score:
+                best_centers, best_score = centers, score
+
+        self.centers = best_centers
+        return self
+
+    def _fit_once(self, matrix: sparse.csr_matrix) -> np.ndarray:
+        size = matrix.shape[0]
+        k = min(self.n_clusters, size)
+        self.centers = self._init_centers(matrix, k)
+        counts = np.zeros(k, dtype=np.float64)
+
+        for _ in range(self.max_iter):
+            batch = matrix[self._rng.choice(size, min(self.batch_size, size), replace=False)]
+            labels = np.asarray((batch @ self.centers.T).argmax(axis=1)).ravel()
+
+            previous = self.centers.copy()
+            for center in np.unique(labels):
+                members = batch[labels == center]
+                counts[center] += members.shape[0]
+                total = np.asarray(members.sum(axis=0)).ravel()
+                self.centers[center] += (total - members.shape[0] * self.centers[center]) / counts[center]
+
+            self._normalize_centers()
+            if np.abs(self.centers - previous).max() < self.tol:
+                break
+
+        return self.centers
+
+    def predict(self, matrix: sparse.csr_matrix) -> Tuple[np.ndarray, np.ndarray]:
+        """Retorna (cluster, similaridade com o centro) de cada linha"""
+        similarities = np.asarray(matrix @ self.centers.T)
+        labels = similarities.argmax(axis=1)
+        return labels, similarities[np.arange(len(labels)), labels]
+
+    def _init_centers(self, matrix: sparse.csr_matrix, k: int) -> np.ndarray:
+        """k-means++ sobre uma amostra (distância = 1 - cosseno)"""
+        size = matrix.shape[0]
+        sample = matrix[self._rng.choice(size, min(size, max(10 * k, 1000)), replace=False)]
+
+        chosen = [self._rng.randint(sample.shape[0])]
+        distances = 1 - np.asarray(sample @ sample[chosen[0]].T.toarray()).ravel()
+        for _ in range(1, k):
+            weights = np.clip(distances, 0, None)
+            if weights.sum() <= 0:
+                chosen.append(self._rng.randint(sample.shape[0]))
+            else:
+                chosen.append(self._rng.choice(sample.shape[0], p=weights / weights.sum()))
+            new_distances = 1 - np.asarray(sample @ sample[chosen[-1]].T.toarray()).ravel()
+            distances = np.minimum(distances, new_distances)
+
+        self.centers = sample[chosen].toarray().astype(np.float64)
+        self._normalize_centers()
+        return self.centers
+
+    def _normalize_centers(self):
+        norms = np.linalg.norm(self.centers, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.centers /= norms
+
+
+def suggest_cluster_count(size: int, max_clusters: int = 30) -> int:
+    """Heurística k ~ sqrt(n/2), limitada a [2, max_clusters]"""
+    return int(max(2, min(max_clusters, round(math.sqrt(size / 2)))))
+
+
+def top_terms(center: np.ndarray, vocabulary: List[str], limit: int = 5) -> List[str]:
+    """Termos de maior peso no centro do cluster"""
+    order = np.argsort(-center)[:limit]
+    return [vocabulary[i] for i in order if center[i] > 0]
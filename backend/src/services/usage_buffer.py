@@ -0,0 +1,143 @@
+import os
+import json
+import uuid
+import atexit
+import logging
+import threading
+from datetime import datetime
+from typing import List
+from flask import current_app, has_app_context
+from src.models.user import db, UsageLog, UserDailyUsage, UsageRollup
+
+logger = logging.getLogger(__name__)
+
+
+class UsageLogBuffer:
+    """Buffer em memória dos registros de uso de API.
+
+    Os registros são gravados em lote, em conexão própria (fora da sessão
+    do chamador), quando o buffer atinge max_size ou a cada flush_interval
+    segundos, e uma última vez no encerramento do processo. Assim as
+    chamadas de IA não pagam um commit por requisição nem confirmam
+    alterações pendentes da sessão de quem as chamou.
+    """
+
+    def __init__(self, max_size: int = None, flush_interval: float = None, max_pending: int = None):
+        self.max_size = max_size or int(os.getenv('USAGE_LOG_BATCH_SIZE', 100))
+        self.flush_interval = flush_interval or float(os.getenv('USAGE_LOG_FLUSH_SECONDS', 2.0))
+        self.max_pending = max_pending or int(os.getenv('USAGE_LOG_MAX_PENDING', 10000))
+        # Desabilitado: grava na hora, ainda em conexão própria
+        self.enabled = os.getenv('USAGE_LOG_BUFFER_ENABLED', 'true').lower() == 'true'
+        self._rows: List[dict] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._app = None
+        self._thread = None
+
+    def add(self, user_id: str, api_type: str, endpoint: str = None, tokens_used: int = 0,
+            cost: float = 0.0, metadata: dict = None, model: str = None, prompt_tokens: int = 0,
+            completion_tokens: int = 0):
+        """Enfileira um registro de uso (não toca na sessão do chamador)"""
+        row = {
+            'id': str(uuid.uuid4()),
+            'user_id': user_id,
+            'api_type': api_type,
+            'endpoint': endpoint,
+            'created_at': datetime.utcnow(),
+            'request_metadata': json.dumps(metadata or {}),
+            'tokens_used': tokens_used or 0,
+            'cost': cost or 0.0,
+            'model': model,
+            'prompt_tokens': prompt_tokens or 0,
+            'completion_tokens': completion_tokens or 0
+        }
+
+        with self._lock:
+            if self._app is None and has_app_context():
+                self._app = current_app._get_current_object()
+            self._rows.append(row)
+            if len(self._rows) > self.max_pending:
+                # Banco indisponível por muito tempo: descarta os mais antigos
+                dropped = len(self._rows) - self.max_pending
+                del self._rows[:dropped]
+                logger.warning('Buffer de uso cheio: %s registros descartados', dropped)
+            full = len(self._rows) >= self.max_size
+
+        if not self.enabled and self.flush():
+            return
+
+        self._ensure_thread()
+        if full:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """Grava os registros pendentes em um único INSERT em lote"""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+                app = self._app
+            if not rows:
+                return 0
+
+            try:
+                if has_app_context():
+                    self._insert(rows)
+                elif app is not None:
+                    with app.app_context():
+                        self._insert(rows)
+                else:
+                    raise RuntimeError('Sem app context para gravar registros de uso')
+            except Exception as e:
+                logger.warning('Falha ao gravar %s registros de uso: %s', len(rows), e)
+                with self._lock:
+                    self._rows[:0] = rows
+                return 0
+
+            return len(rows)
+
+    @staticmethod
+    def _insert(rows: List[dict]):
+        # Registros, contadores diários e agregações de custo na mesma transação
+        with db.engine.begin() as conn:
+            conn.execute(UsageLog.__table__.insert(), rows)
+            UserDailyUsage.add_usage(conn, rows)
+            UsageRollup.add_usage(conn, rows)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._rows)
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True, name='usage-log-flusher')
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_usage_buffer() -> UsageLogBuffer:
+    """Retorna o buffer de registros de uso compartilhado pelo processo"""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = UsageLogBuffer()
+                atexit.register(_buffer.flush)
+    return _buffer
+
+
+def flush_usage_logs() -> int:
+    """Grava imediatamente os registros de uso pendentes"""
+    return get_usage_buffer().flush() if _buffer is not None else 0
@@ -1,6 +1,5 @@
 import os
 import json
-import requests
 import hashlib
 import hmac
 from datetime import datetime
@@ -8,6 +7,9 @@ from typing import Dict, List, Optional
 from src.models.user import db, User
 from src.models.note import Note
 from src.models.category import Category
+from src.services import http_client
+from src.services.resilience import guarded_request
+from src.services.note_indexing import ingest_note
 
 class WhatsAppService:
     """Serviço para integração com WhatsApp Business API"""
@@ -17,7 +19,7 @@ class WhatsAppService:
         self.phone_number_id = os.getenv('WHATSAPP_PHONE_NUMBER_ID')
         self.webhook_verify_token = os.getenv('WHATSAPP_WEBHOOK_VERIFY_TOKEN')
         self.app_secret = os.getenv('WHATSAPP_APP_SECRET')
-        self.base_url = 'https://graph.facebook.com/v18.0'
+        self.base_url = os.getenv('WHATSAPP_GRAPH_BASE_URL', 'https://graph.facebook.com/v18.0').rstrip('/')
         
     def verify_webhook(self, mode: str, token: str, challenge: str) -> Optional[str]:
         """Verifica webhook do WhatsApp"""
@@ -112,19 +114,22 @@ class WhatsAppService:
             )
             
             db.session.add(note)
+            db.session.flush()
+            
+            # Indexa e agenda processamento IA na mesma transação da anotação
+            # (quase-duplicatas reaproveitam os resultados da original)
+            job = ingest_note(note)
             db.session.commit()
             
             # Envia confirmação
             self._send_confirmation_message(from_number, note.id)
             
-            # Agenda processamento IA (seria implementado com Celery/Redis)
-            # self._schedule_ai_processing(note.id)
-            
             return {
                 'success': True,
                 'action': 'note_created',
                 'note_id': note.id,
-                'user_id': user.id
+                'user_id': user.id,
+                'job_id': job.id if job else None
             }
             
         except Exception as e:
@@ -230,13 +235,13 @@ Você receberá insights organizados em breve no app."""
         }
         
         try:
-            response = requests.post(url, headers=headers, json=data, timeout=10)
+            response = guarded_request('whatsapp', 'POST', url, headers=headers, json=data, timeout=http_client.get_timeout('whatsapp'))
             return response.status_code == 200
         except:
             return False
     
-    def send_daily_summary(self, user_id: str, summary_data: dict):
-        """Envia resumo diário para o usuário via WhatsApp"""
+    def send_daily_summary(self, user_id: str, summary_data: dict, notes_omitted: int = 0, chunks_failed: int = 0):
+        """Envia resumo diário para o usuário via WhatsApp (avisando quando o resumo é parcial)"""
         user = User.query.get(user_id)
         if not user or not user.phone_number or not user.whatsapp_opt_in:
             return False
@@ -265,6 +270,11 @@ Você receberá insights organizados em breve no app."""
 
 📱 Veja mais detalhes no app!"""
         
+        if chunks_failed:
+            message += "\n\n⚠️ Resumo parcial: parte das anotações do dia não pôde ser resumida."
+        if notes_omitted:
+            message += f"\n\n⚠️ Resumo baseado em uma amostra: {notes_omitted} anotações ficaram de fora."
+        
         return self._send_text_message(user.phone_number, message)
     
     def send_ai_insights(self, user_id: str, note_id: str, insights: dict):
@@ -320,7 +330,7 @@ Você receberá insights organizados em breve no app."""
         }
         
         try:
-            response = requests.get(url, headers=headers, timeout=10)
+            response = guarded_request('whatsapp', 'GET', url, headers=headers, timeout=http_client.get_timeout('whatsapp'))
             if response.status_code == 200:
                 data = response.json()
                 return data.get('url')
@@ -339,7 +349,7 @@ Você receberá insights organizados em breve no app."""
         }
         
         try:
-            response = requests.get(media_url, headers=headers, timeout=30)
+            response = guarded_request('whatsapp', 'GET', media_url, headers=headers, timeout=http_client.get_timeout('whatsapp', 30))
             if response.status_code == 200:
                 with open(save_path, 'wb') as f:
                     f.write(response.content)
@@ -360,7 +370,7 @@ Você receberá insights organizados em breve no app."""
         }
         
         try:
-            response = requests.get(url, headers=headers, timeout=10)
+            response = guarded_request('whatsapp', 'GET', url, headers=headers, timeout=http_client.get_timeout('whatsapp'))
             return response.status_code == 200
         except:
             return False
@@ -0,0 +1,361 @@
+import os
+import sys
+# DON'T CHANGE THIS !!!
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import argparse
+import logging
+import signal
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime
+from src.models.user import db, User
+from src.models.note import Note
+from src.models.job import ProcessingJob
+from src.services.job_queue import job_handler, get_handler, PermanentJobError, enqueue_classifier_training
+from src.services.embedding_service import get_embedding_service
+from src.services.keyword_index import get_keyword_index
+from src.services.dedup_service import get_duplicate_detector
+from src.services.category_classifier import get_classifier_service
+from src.services.rate_limiter import get_rate_limiter
+from src.services.usage_buffer import flush_usage_logs
+from src.controllers.ai_processor import AIProcessor
+
+logger = logging.getLogger('worker')
+
+ai_processor = AIProcessor()
+
+
+def require_spend_cap(user_id: str):
+    """Interrompe o job (sem nova tentativa) quando o usuário atingiu o teto mensal de gastos"""
+    user = User.query.get(user_id)
+    if user and not user.within_spend_cap():
+        raise PermanentJobError('Limite mensal de gastos com IA atingido')
+
+
+@job_handler('process_note')
+def handle_process_note(job: ProcessingJob) -> dict:
+    """Processa uma anotação com IA"""
+    note = Note.query.get(job.note_id)
+    if not note:
+        raise PermanentJobError('Anotação não encontrada')
+
+    # Job anterior da mesma nota ainda rodando (edição durante o processamento):
+    # espera ele terminar para não gravar os dois resultados fora de ordem
+    if job.has_running_duplicate():
+        raise Exception('Anotação em processamento por outro job')
+
+    user_preferences = job.get_payload().get('user_preferences')
+    if user_preferences is None:
+        user = User.query.get(job.user_id)
+        user_preferences = user.get_preferences() if user else {}
+
+    result = ai_processor.process_note(note.id, user_preferences)
+
+    if not result['success']:
+        if result.get('error') in ['Anotação não encontrada', 'Limite de uso de IA atingido',
+                                   'Limite mensal de gastos com IA atingido',
+                                   'Anotação aguardando processamento em lote']:
+            raise PermanentJobError(result['error'])
+        raise Exception(result.get('error', 'Falha no processamento'))
+
+    return {'note_id': result['note_id']}
+
+
+@job_handler('categorize_backlog')
+def handle_categorize_backlog(job: ProcessingJob) -> dict:
+    """Categoriza todo o backlog de anotações sem categoria do usuário"""
+    worker_id = job.locked_by
+    payload = job.get_payload()
+
+    def save_checkpoint(state):
+        # Grava o checkpoint e renova o lease no mesmo commit da página
+        payload['checkpoint'] = state
+        job.set_payload(payload)
+        if not job.extend_lease(worker_id):
+            raise Exception('Lease do job perdido durante a execução')
+
+    result = ai_processor.categorize_backlog(
+        job.user_id,
+        checkpoint=payload.get('checkpoint'),
+        on_checkpoint=save_checkpoint,
+        chunk_token_budget=payload.get('chunk_token_budget'),
+        max_concurrency=payload.get('max_concurrency')
+    )
+    if not result['success']:
+        raise PermanentJobError(result['error'])
+
+    # Categorias aplicadas em lote entram no classificador local pelo retreino
+    if result.get('notes_categorized'):
+        enqueue_classifier_training(job.user_id)
+
+    return result
+
+
+
+@job_handler('cluster_topics')
+def handle_cluster_topics(job: ProcessingJob) -> dict:
+    """Agrupa anotações por assunto e propõe categorias"""
+    payload = job.get_payload()
+
+    result = ai_processor.cluster_topics(
+        job.user_id,
+        n_clusters=payload.get('n_clusters'),
+        use_llm=payload.get('use_llm', True),
+        include_categorized=payload.get('include_categorized', False)
+    )
+    if not result['success']:
+        raise Exception(result.get('error', 'Falha no agrupamento'))
+
+    return result
+
+
+@job_handler('daily_summary')
+def handle_daily_summary(job: ProcessingJob) -> dict:
+    """Gera e envia o resumo diário, com checkpoint entre as duas etapas"""
+    worker_id = job.locked_by
+    payload = job.get_payload()
+
+    def save_checkpoint():
+        job.set_payload(payload)
+        if not job.extend_lease(worker_id):
+            raise Exception('Lease do job perdido durante a execução')
+
+    # 1. Geração (não repete a chamada ao LLM em uma nova tentativa)
+    if 'summary' not in payload:
+        require_spend_cap(job.user_id)
+
+        # Um token por chamada ao LLM (dias pesados fazem N chamadas de map + redução)
+        result = ai_processor.build_daily_summary(job.user_id, payload['date'],
+                                                  before_call=get_rate_limiter('openai').acquire)
+        if not result['success']:
+            raise Exception(result.get('error', 'Falha ao gerar resumo'))
+        if not result.get('summary'):
+            return {'date': payload['date'], 'notes_processed': 0, 'sent': False}
+        # Chunks com falha: tenta de novo enquanto houver tentativas; na última, envia avisando
+        if result.get('chunks_failed') and job.attempts < job.max_attempts:
+            raise Exception(f"Resumo parcial: {result['chunks_failed']} chunks falharam")
+
+        payload['summary'] = result['summary']
+        payload['notes_processed'] = result['notes_processed']
+        payload['notes_omitted'] = result.get('notes_omitted', 0)
+        payload['chunks_failed'] = result.get('chunks_failed', 0)
+        save_checkpoint()
+
+    # 2. Envio (não reenvia se já foi entregue)
+    if not payload.get('sent_at'):
+        user = User.query.get(job.user_id)
+        if not user or not user.whatsapp_opt_in or not user.phone_number:
+            return {'date': payload['date'], 'notes_processed': payload['notes_processed'], 'sent': False}
+
+        get_rate_limiter('whatsapp').acquire()
+        if not ai_processor.whatsapp.send_daily_summary(job.user_id, payload['summary'],
+                                                        notes_omitted=payload.get('notes_omitted', 0),
+                                                        chunks_failed=payload.get('chunks_failed', 0)):
+            raise Exception('Falha ao enviar resumo via WhatsApp')
+
+        payload['sent_at'] = datetime.utcnow().isoformat()
+        save_checkpoint()
+
+    return {'date': payload['date'], 'notes_processed': payload['notes_processed'], 'sent': True,
+            'partial': bool(payload.get('notes_omitted') or payload.get('chunks_failed'))}
+
+@job_handler('embed_note')
+def handle_embed_note(job: ProcessingJob) -> dict:
+    """Calcula o embedding de uma anotação"""
+    note = Note.query.get(job.note_id)
+    if not note:
+        raise PermanentJobError('Anotação não encontrada')
+
+    require_spend_cap(job.user_id)
+    updated = get_embedding_service().embed_note(note)
+    return {'note_id': note.id, 'updated': updated}
+
+
+@job_handler('embed_backlog')
+def handle_embed_backlog(job: ProcessingJob) -> dict:
+    """Calcula embeddings de todas as anotações do usuário"""
+    worker_id = job.locked_by
+
+    def on_progress(cursor, total):
+        if not job.extend_lease(worker_id):
+            raise Exception('Lease do job perdido durante a execução')
+        # O teto pode ser atingido no meio do backlog: verifica a cada página
+        require_spend_cap(job.user_id)
+
+    require_spend_cap(job.user_id)
+    total = get_embedding_service().backfill(job.user_id, on_progress=on_progress)
+    return {'notes_embedded': total}
+
+
+
+@job_handler('keyword_backlog')
+def handle_keyword_backlog(job: ProcessingJob) -> dict:
+    """Indexa palavras-chave das anotações antigas do usuário"""
+    worker_id = job.locked_by
+
+    def on_progress(cursor, total):
+        if not job.extend_lease(worker_id):
+            raise Exception('Lease do job perdido durante a execução')
+
+    total = get_keyword_index().backfill(job.user_id, on_progress=on_progress)
+    return {'notes_indexed': total}
+
+
+@job_handler('dedupe_backlog')
+def handle_dedupe_backlog(job: ProcessingJob) -> dict:
+    """Calcula assinaturas MinHash das anotações antigas e marca quase-duplicatas"""
+    worker_id = job.locked_by
+
+    def on_progress(cursor, total):
+        if not job.extend_lease(worker_id):
+            raise Exception('Lease do job perdido durante a execução')
+
+    return get_duplicate_detector().backfill(job.user_id, on_progress=on_progress)
+
+
+@job_handler('train_classifier')
+def handle_train_classifier(job: ProcessingJob) -> dict:
+    """Retreina do zero o classificador de categorias do usuário"""
+    worker_id = job.locked_by
+
+    def on_progress(cursor, total):
+        if not job.extend_lease(worker_id):
+            raise Exception('Lease do job perdido durante a execução')
+
+    trained = get_classifier_service().rebuild(job.user_id, on_progress=on_progress)
+    return {'notes_trained': trained}
+
+
+@job_handler('fold_classifier')
+def handle_fold_classifier(job: ProcessingJob) -> dict:
+    """Incorpora ao classificador os deltas registrados pelas requisições"""
+    folded = get_classifier_service().fold(job.user_id)
+    return {'deltas_folded': folded}
+
+class Worker(threading.Thread):
+    """Thread que consome jobs da fila persistida"""
+
+    def __init__(self, app, worker_id: str, stop_event: threading.Event, poll_interval: float = 2.0,
+                 lease_seconds: int = 300, job_types: list = None):
+        super().__init__(name=worker_id, daemon=True)
+        self.app = app
+        self.worker_id = worker_id
+        self.stop_event = stop_event
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.job_types = job_types
+
+    def run(self):
+        while not self.stop_event.is_set():
+            with self.app.app_context():
+                try:
+                    job = ProcessingJob.claim_next(
+                        self.worker_id,
+                        lease_seconds=self.lease_seconds,
+                        job_types=self.job_types
+                    )
+                except Exception:
+                    logger.exception('Erro ao buscar próximo job')
+                    db.session.rollback()
+                    job = None
+
+                if job:
+                    self._run_job(job)
+                db.session.remove()
+
+            if not job:
+                self.stop_event.wait(self.poll_interval)
+
+    def _run_job(self, job: ProcessingJob):
+        """Executa o handler do job e registra o resultado"""
+        handler = get_handler(job.job_type)
+        started = time.monotonic()
+
+        try:
+            if not handler:
+                raise PermanentJobError(f"Tipo de job desconhecido: {job.job_type}")
+
+            result = handler(job)
+            job.mark_succeeded(self.worker_id, result)
+            logger.info('Job %s (%s) concluído em %.2fs', job.id, job.job_type, time.monotonic() - started)
+
+        except PermanentJobError as e:
+            db.session.rollback()
+            job.mark_failed(self.worker_id, str(e), retryable=False)
+            logger.warning('Job %s (%s) falhou definitivamente: %s', job.id, job.job_type, e)
+
+        except Exception as e:
+            db.session.rollback()
+            job.mark_failed(self.worker_id, str(e))
+            logger.warning('Job %s (%s) falhou (tentativa %s/%s): %s',
+                           job.id, job.job_type, job.attempts, job.max_attempts, e)
+
+
+def run_workers(app, concurrency: int = 4, poll_interval: float = 2.0, lease_seconds: int = 300, job_types: list = None):
+    """Executa N workers concorrentes até receber SIGINT/SIGTERM"""
+    stop_event = threading.Event()
+
+    def handle_signal(signum, frame):
+        logger.info('Sinal %s recebido, finalizando workers...', signum)
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    workers = [
+        Worker(
+            app,
+            worker_id=f"{prefix}:{i}:{uuid.uuid4().hex[:6]}",
+            stop_event=stop_event,
+            poll_interval=poll_interval,
+            lease_seconds=lease_seconds,
+            job_types=job_types
+        )
+        for i in range(concurrency)
+    ]
+
+    for worker in workers:
+        worker.start()
+
+    logger.info('%s workers iniciados (%s)', concurrency, prefix)
+
+    # Falha jobs cujo lease expirou após esgotar tentativas
+    while not stop_event.is_set():
+        with app.app_context():
+            try:
+                ProcessingJob.fail_expired()
+            except Exception:
+                logger.exception('Erro ao verificar jobs expirados')
+            db.session.remove()
+        stop_event.wait(60)
+
+    for worker in workers:
+        worker.join()
+
+    # Grava os registros de uso ainda no buffer
+    with app.app_context():
+        flush_usage_logs()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Worker de processamento em background')
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv('WORKER_CONCURRENCY', 4)))
+    parser.add_argument('--poll-interval', type=float, default=float(os.getenv('WORKER_POLL_INTERVAL', 2.0)))
+    parser.add_argument('--lease-seconds', type=int, default=int(os.getenv('WORKER_LEASE_SECONDS', 300)))
+    parser.add_argument('--job-types', nargs='*', default=None, help='Restringe os tipos de job consumidos')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(threadName)s %(levelname)s %(message)s')
+
+    from src.main import app
+    run_workers(
+        app,
+        concurrency=args.concurrency,
+        poll_interval=args.poll_interval,
+        lease_seconds=args.lease_seconds,
+        job_types=args.job_types
+    )
@@ -0,0 +1,39 @@
+import os
+import sys
+# DON'T CHANGE THIS !!!
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import pytest
+from flask import Flask
+from src.models.user import db
+# Registra todos os modelos (relacionamentos por nome) antes do create_all
+from src.models.note import Note, Insight, MediaFile
+from src.models.category import Category
+from src.models.job import ProcessingJob
+from src.models.cache import ResponseCacheEntry
+from src.models.embedding import NoteEmbedding
+from src.models.keyword_index import NoteKeywordSignature, NoteTerm
+from src.models.fingerprint import NoteFingerprint, NoteLSHBucket
+from src.models.classifier import CategoryClassifier, ClassifierDelta
+from src.models.summary import DailySummary
+from src.models.batch import BatchSubmission, BatchItem
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Aplicação mínima com banco SQLite descartável.
+
+    Arquivo temporário em vez de ':memory:': o banco em memória do
+    Flask-SQLAlchemy usa uma única conexão, e o cache compartilhado do
+    SQLite não suporta conexões concorrentes em threads.
+    """
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'testes.db'}"
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
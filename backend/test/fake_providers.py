@@ -0,0 +1,519 @@
+#!/usr/bin/env python3
+"""
+Servidor local que imita as APIs da OpenAI, do Perplexity e do WhatsApp
+(Graph) para benchmarks e testes de carga sem chaves reais.
+
+Uso:
+    python test/fake_providers.py --port 8090 --latency lognormal:0.8,0.4 --error-rate 0.02
+
+E no backend:
+    OPENAI_BASE_URL=http://localhost:8090/openai/v1
+    PERPLEXITY_BASE_URL=http://localhost:8090/perplexity
+    WHATSAPP_GRAPH_BASE_URL=http://localhost:8090/graph/v18.0
+    OPENAI_API_KEY=fake PERPLEXITY_API_KEY=fake
+
+Latências (segundos): fixed:0.2 | uniform:0.1,0.5 | normal:0.5,0.1 | lognormal:mediana,sigma
+Respostas gravadas (--recordings arquivo.json), repetidas em rodízio:
+    {"openai:chat/completions": [resposta, ...], "perplexity:chat/completions": [...]}
+Sem gravação, as respostas de chat seguem o JSON de exemplo do próprio prompt.
+
+Batch API da OpenAI (/files e /batches): o lote fica 'in_progress' por
+--batch-delay segundos e depois conclui com uma resposta por linha; a
+taxa de erro do provedor openai decide quais linhas vão para o arquivo
+de erros.
+
+Durante o teste, POST /_fake/config altera a configuração de um provedor
+(ex.: {"provider": "perplexity", "latency": "fixed:8", "error_rate": 0.5})
+para reproduzir incidentes; GET /_fake/stats mostra o que foi servido.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import date
+from flask import Flask, Response, jsonify, request
+
+PROVIDERS = ('openai', 'perplexity', 'whatsapp')
+
+
+class LatencyModel:
+    """Distribuição de latência a partir de uma especificação em texto"""
+
+    def __init__(self, spec: str = 'fixed:0'):
+        self.spec = spec
+        kind, _, params = spec.partition(':')
+        if not params:
+            kind, params = 'fixed', kind
+        self.kind = kind
+        self.params = [float(value) for value in params.split(',') if value]
+        if kind not in ('fixed', 'uniform', 'normal', 'lognormal'):
+            raise ValueError(f'Distribuição de latência desconhecida: {kind}')
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == 'fixed':
+            value = self.params[0]
+        elif self.kind == 'uniform':
+            value = rng.uniform(self.params[0], self.params[1])
+        elif self.kind == 'normal':
+            value = rng.gauss(self.params[0], self.params[1])
+        else:
+            value = self.params[0] * math.exp(rng.gauss(0, self.params[1]))
+        return max(0.0, value)
+
+
+class ProviderConfig:
+    """Comportamento simulado de um provedor"""
+
+    def __init__(self, latency: str = 'fixed:0', error_rate: float = 0.0, error_statuses=(429, 500, 503),
+                 stream_chunk_delay: float = 0.02):
+        self.update(latency=latency, error_rate=error_rate, error_statuses=error_statuses,
+                    stream_chunk_delay=stream_chunk_delay)
+
+    def update(self, latency: str = None, error_rate: float = None, error_statuses=None,
+               stream_chunk_delay: float = None):
+        if latency is not None:
+            self.latency = LatencyModel(latency)
+        if error_rate is not None:
+            self.error_rate = float(error_rate)
+        if error_statuses is not None:
+            self.error_statuses = [int(status) for status in error_statuses]
+        if stream_chunk_delay is not None:
+            self.stream_chunk_delay = float(stream_chunk_delay)
+
+    def to_dict(self):
+        return {
+            'latency': self.latency.spec,
+            'error_rate': self.error_rate,
+            'error_statuses': self.error_statuses,
+            'stream_chunk_delay': self.stream_chunk_delay
+        }
+
+
+class FakeProviders:
+    """Estado do servidor: configuração, gravações, sorteios e estatísticas"""
+
+    def __init__(self, configs: dict, recordings: dict = None, seed: int = None, batch_delay: float = 5.0):
+        self.configs = configs
+        self.recordings = recordings or {}
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.replay_positions = {}
+        self.stats = {}
+        self.batch_delay = batch_delay
+        self.files = {}  # id -> conteúdo JSONL
+        self.batches = {}  # id -> objeto batch
+
+    def draw(self, provider: str):
+        """(latência, status de erro ou None) da próxima requisição"""
+        config = self.configs[provider]
+        with self.lock:
+            latency = config.latency.sample(self.rng)
+            failed = self.rng.random() < config.error_rate
+            status = self.rng.choice(config.error_statuses) if failed else None
+        return latency, status
+
+    def next_recording(self, key: str):
+        responses = self.recordings.get(key)
+        if not responses:
+            return None
+        with self.lock:
+            position = self.replay_positions.get(key, 0)
+            self.replay_positions[key] = position + 1
+        return json.loads(json.dumps(responses[position % len(responses)]))
+
+    def record(self, provider: str, endpoint: str, status: int, latency: float):
+        with self.lock:
+            entry = self.stats.setdefault(f'{provider}:{endpoint}', {
+                'requests': 0, 'errors': 0, 'latency_total': 0.0, 'statuses': {}
+            })
+            entry['requests'] += 1
+            entry['errors'] += 1 if status >= 400 else 0
+            entry['latency_total'] += latency
+            entry['statuses'][str(status)] = entry['statuses'].get(str(status), 0) + 1
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                key: {
+                    **{k: v for k, v in entry.items() if k != 'latency_total'},
+                    'avg_latency': round(entry['latency_total'] / entry['requests'], 4)
+                }
+                for key, entry in self.stats.items()
+            }
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text or '') // 4)
+
+
+def _fill_example(value):
+    """Troca os valores de exemplo do schema por valores plausíveis"""
+    if isinstance(value, dict):
+        return {key: _fill_example(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_fill_example(item) for item in value]
+    if isinstance(value, str):
+        if 'ou null' in value:
+            return None
+        if value.startswith('YYYY-MM-DD'):
+            return date.today().isoformat()
+        if '|' in value:
+            return value.split('|')[0]
+    return value
+
+
+def canned_chat_content(messages: list, json_mode: bool) -> str:
+    """Resposta de chat determinística: o JSON de exemplo do prompt, preenchido"""
+    prompt = '\n'.join(str(message.get('content', '')) for message in messages)
+    if json_mode:
+        for match in re.finditer(r'\{', prompt):
+            depth = 0
+            for end in range(match.start(), len(prompt)):
+                depth += {'{': 1, '}': -1}.get(prompt[end], 0)
+                if depth == 0:
+                    try:
+                        return json.dumps(_fill_example(json.loads(prompt[match.start():end + 1])),
+                                          ensure_ascii=False)
+                    except ValueError:
+                        break
+        return '{}'
+
+    digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:8]
+    return (f'Resposta simulada ({digest}). Informações relevantes sobre o assunto da anotação, '
+            'com tendências recentes, ferramentas recomendadas e próximos passos sugeridos.')
+
+
+def fake_embedding(text: str, dimensions: int) -> list:
+    """Vetor determinístico por texto"""
+    rng = random.Random(hashlib.sha256((text or '').encode('utf-8')).hexdigest())
+    return [rng.gauss(0, 1) for _ in range(dimensions)]
+
+
+def create_app(state: FakeProviders) -> Flask:
+    app = Flask(__name__)
+
+    def simulate(provider: str, endpoint: str):
+        """Aplica latência e erro sorteados; retorna a resposta de erro, se houver"""
+        latency, status = state.draw(provider)
+        time.sleep(latency)
+        if status is None:
+            state.record(provider, endpoint, 200, latency)
+            return None
+        state.record(provider, endpoint, status, latency)
+        response = jsonify({'error': {'message': f'Erro simulado {status}', 'type': 'fake_provider_error'}})
+        response.status_code = status
+        if status == 429:
+            response.headers['Retry-After'] = '1'
+        return response
+
+    def chat_completion(provider: str):
+        error = simulate(provider, 'chat/completions')
+        if error is not None:
+            return error
+
+        body = request.get_json(silent=True) or {}
+        response = build_chat_response(provider, body)
+        if body.get('stream'):
+            return stream_completion(provider, body, response)
+        return jsonify(response)
+
+    def build_chat_response(provider: str, body: dict) -> dict:
+        messages = body.get('messages') or []
+        model = body.get('model', 'fake-model')
+        response = state.next_recording(f'{provider}:chat/completions')
+        if response is None:
+            json_mode = (body.get('response_format') or {}).get('type') == 'json_object'
+            content = canned_chat_content(messages, json_mode)
+            prompt_tokens = sum(estimate_tokens(str(message.get('content', ''))) for message in messages)
+            completion_tokens = estimate_tokens(content)
+            response = {
+                'id': f'chatcmpl-{uuid.uuid4().hex[:12]}',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': content},
+                    'finish_reason': 'stop'
+                }],
+                'usage': {
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': completion_tokens,
+                    'total_tokens': prompt_tokens + completion_tokens
+                }
+            }
+            if provider == 'perplexity' and body.get('return_citations'):
+                response['citations'] = ['https://example.com/fonte-1', 'https://example.com/fonte-2']
+        return response
+
+    def stream_completion(provider: str, body: dict, response: dict):
+        content = response['choices'][0]['message']['content']
+        delay = state.configs[provider].stream_chunk_delay
+        include_usage = provider == 'perplexity' or (body.get('stream_options') or {}).get('include_usage')
+
+        def events():
+            base = {'id': response.get('id'), 'object': 'chat.completion.chunk', 'model': response.get('model')}
+            for start in range(0, len(content), 16):
+                chunk = {**base, 'choices': [{'index': 0, 'delta': {'content': content[start:start + 16]}}]}
+                if response.get('citations'):
+                    chunk['citations'] = response['citations']
+                yield f'data: {json.dumps(chunk, ensure_ascii=False)}\n\n'
+                time.sleep(delay)
+            final = {**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]}
+            if include_usage:
+                final['usage'] = response.get('usage')
+            yield f'data: {json.dumps(final)}\n\n'
+            yield 'data: [DONE]\n\n'
+
+        return Response(events(), mimetype='text/event-stream')
+
+    @app.route('/openai/v1/chat/completions', methods=['POST'])
+    def openai_chat():
+        return chat_completion('openai')
+
+    @app.route('/openai/v1/embeddings', methods=['POST'])
+    def openai_embeddings():
+        error = simulate('openai', 'embeddings')
+        if error is not None:
+            return error
+
+        body = request.get_json(silent=True) or {}
+        texts = body.get('input') or []
+        if isinstance(texts, str):
+            texts = [texts]
+        dimensions = int(body.get('dimensions') or 1536)
+        tokens = sum(estimate_tokens(text) for text in texts)
+        return jsonify({
+            'object': 'list',
+            'model': body.get('model', 'text-embedding-3-small'),
+            'data': [
+                {'object': 'embedding', 'index': i, 'embedding': fake_embedding(text, dimensions)}
+                for i, text in enumerate(texts)
+            ],
+            'usage': {'prompt_tokens': tokens, 'total_tokens': tokens}
+        })
+
+    @app.route('/openai/v1/files', methods=['POST'])
+    def openai_upload_file():
+        error = simulate('openai', 'files')
+        if error is not None:
+            return error
+
+        upload = request.files.get('file')
+        if upload is None:
+            return jsonify({'error': {'message': 'Arquivo ausente', 'type': 'invalid_request_error'}}), 400
+        content = upload.read().decode('utf-8')
+        file_id = f'file-{uuid.uuid4().hex[:12]}'
+        with state.lock:
+            state.files[file_id] = content
+        return jsonify({'id': file_id, 'object': 'file', 'bytes': len(content), 'purpose': request.form.get('purpose'),
+                        'filename': upload.filename, 'created_at': int(time.time())})
+
+    @app.route('/openai/v1/files/<file_id>/content', methods=['GET'])
+    def openai_file_content(file_id):
+        error = simulate('openai', 'files/content')
+        if error is not None:
+            return error
+
+        with state.lock:
+            content = state.files.get(file_id)
+        if content is None:
+            return jsonify({'error': {'message': 'Arquivo não encontrado', 'type': 'invalid_request_error'}}), 404
+        return Response(content, mimetype='application/jsonl')
+
+    @app.route('/openai/v1/batches', methods=['POST'])
+    def openai_create_batch():
+        error = simulate('openai', 'batches')
+        if error is not None:
+            return error
+
+        body = request.get_json(silent=True) or {}
+        with state.lock:
+            content = state.files.get(body.get('input_file_id'))
+        if content is None:
+            return jsonify({'error': {'message': 'input_file_id inválido', 'type': 'invalid_request_error'}}), 400
+
+        lines = [line for line in content.splitlines() if line.strip()]
+        batch = {
+            'id': f'batch_{uuid.uuid4().hex[:12]}',
+            'object': 'batch',
+            'endpoint': body.get('endpoint'),
+            'input_file_id': body['input_file_id'],
+            'completion_window': body.get('completion_window', '24h'),
+            'status': 'in_progress',
+            'output_file_id': None,
+            'error_file_id': None,
+            'created_at': int(time.time()),
+            'completed_at': None,
+            'request_counts': {'total': len(lines), 'completed': 0, 'failed': 0},
+            'metadata': body.get('metadata') or {}
+        }
+        with state.lock:
+            state.batches[batch['id']] = batch
+        return jsonify(batch)
+
+    @app.route('/openai/v1/batches/<batch_id>', methods=['GET'])
+    def openai_retrieve_batch(batch_id):
+        error = simulate('openai', 'batches/retrieve')
+        if error is not None:
+            return error
+
+        with state.lock:
+            batch = state.batches.get(batch_id)
+        if batch is None:
+            return jsonify({'error': {'message': 'Lote não encontrado', 'type': 'invalid_request_error'}}), 404
+        if batch['status'] == 'in_progress' and time.time() - batch['created_at'] >= state.batch_delay:
+            complete_batch(batch)
+        return jsonify(batch)
+
+    def complete_batch(batch: dict):
+        """Gera os arquivos de saída e de erros do lote (uma vez)"""
+        with state.lock:
+            if batch['status'] != 'in_progress':
+                return
+            batch['status'] = 'finalizing'
+            content = state.files[batch['input_file_id']]
+
+        outputs, errors = [], []
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            _, status = state.draw('openai')
+            if status is not None:
+                errors.append({'id': f'batch_req_{uuid.uuid4().hex[:12]}', 'custom_id': entry['custom_id'], 'response': {
+                    'status_code': status,
+                    'body': {'error': {'message': f'Erro simulado {status}', 'type': 'fake_provider_error'}}
+                }, 'error': None})
+                continue
+            outputs.append({'id': f'batch_req_{uuid.uuid4().hex[:12]}', 'custom_id': entry['custom_id'], 'response': {
+                'status_code': 200,
+                'body': build_chat_response('openai', entry.get('body') or {})
+            }, 'error': None})
+
+        with state.lock:
+            for key, rows in (('output_file_id', outputs), ('error_file_id', errors)):
+                if rows:
+                    file_id = f'file-{uuid.uuid4().hex[:12]}'
+                    state.files[file_id] = ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+                    batch[key] = file_id
+            batch['request_counts'].update(completed=len(outputs), failed=len(errors))
+            batch['completed_at'] = int(time.time())
+            batch['status'] = 'completed'
+
+    @app.route('/perplexity/chat/completions', methods=['POST'])
+    def perplexity_chat():
+        return chat_completion('perplexity')
+
+    @app.route('/graph/<version>/<phone_number_id>/messages', methods=['POST'])
+    def whatsapp_send(version, phone_number_id):
+        error = simulate('whatsapp', 'messages')
+        if error is not None:
+            return error
+
+        body = request.get_json(silent=True) or {}
+        return jsonify({
+            'messaging_product': 'whatsapp',
+            'contacts': [{'input': body.get('to'), 'wa_id': body.get('to')}],
+            'messages': [{'id': f'wamid.{uuid.uuid4().hex}'}]
+        })
+
+    @app.route('/graph/<version>/<object_id>', methods=['GET'])
+    def whatsapp_object(version, object_id):
+        error = simulate('whatsapp', 'object')
+        if error is not None:
+            return error
+
+        # Serve tanto o teste de conexão (phone_number_id) quanto a URL de mídia
+        return jsonify({
+            'id': object_id,
+            'url': f'{request.host_url}graph/media/{object_id}',
+            'mime_type': 'audio/ogg',
+            'display_phone_number': '+55 11 90000-0000'
+        })
+
+    @app.route('/graph/media/<media_id>', methods=['GET'])
+    def whatsapp_media(media_id):
+        error = simulate('whatsapp', 'media')
+        if error is not None:
+            return error
+        return Response(hashlib.sha256(media_id.encode()).digest() * 64, mimetype='application/octet-stream')
+
+    @app.route('/_fake/config', methods=['GET', 'POST'])
+    def fake_config():
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            targets = [data['provider']] if data.get('provider') else list(PROVIDERS)
+            for provider in targets:
+                if provider not in state.configs:
+                    return jsonify({'error': f'Provedor desconhecido: {provider}'}), 400
+                try:
+                    state.configs[provider].update(
+                        latency=data.get('latency'),
+                        error_rate=data.get('error_rate'),
+                        error_statuses=data.get('error_statuses'),
+                        stream_chunk_delay=data.get('stream_chunk_delay')
+                    )
+                except ValueError as e:
+                    return jsonify({'error': str(e)}), 400
+        return jsonify({provider: config.to_dict() for provider, config in state.configs.items()})
+
+    @app.route('/_fake/stats', methods=['GET', 'DELETE'])
+    def fake_stats():
+        if request.method == 'DELETE':
+            with state.lock:
+                state.stats.clear()
+        return jsonify(state.get_stats())
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Provedores de IA simulados para benchmarks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency', default='fixed:0', help='latência padrão de todos os provedores')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fração de respostas com erro')
+    parser.add_argument('--error-statuses', default='429,500,503')
+    parser.add_argument('--stream-chunk-delay', type=float, default=0.02, help='intervalo entre chunks (s)')
+    parser.add_argument('--config', help='JSON com ajustes por provedor: {"perplexity": {"latency": ...}}')
+    parser.add_argument('--recordings', help='JSON com respostas gravadas por "provedor:endpoint"')
+    parser.add_argument('--seed', type=int, help='semente dos sorteios (execuções reproduzíveis)')
+    parser.add_argument('--batch-delay', type=float, default=5.0, help='tempo até um lote da Batch API concluir (s)')
+    args = parser.parse_args()
+
+    configs = {
+        provider: ProviderConfig(
+            latency=args.latency,
+            error_rate=args.error_rate,
+            error_statuses=args.error_statuses.split(','),
+            stream_chunk_delay=args.stream_chunk_delay
+        )
+        for provider in PROVIDERS
+    }
+    if args.config:
+        with open(args.config, encoding='utf-8') as f:
+            for provider, overrides in json.load(f).items():
+                configs[provider].update(**overrides)
+
+    recordings = None
+    if args.recordings:
+        with open(args.recordings, encoding='utf-8') as f:
+            recordings = json.load(f)
+
+    state = FakeProviders(configs, recordings, args.seed, batch_delay=args.batch_delay)
+    print(f'🧪 Provedores simulados em http://{args.host}:{args.port}')
+    print(f'   OPENAI_BASE_URL=http://{args.host}:{args.port}/openai/v1')
+    print(f'   PERPLEXITY_BASE_URL=http://{args.host}:{args.port}/perplexity')
+    print(f'   WHATSAPP_GRAPH_BASE_URL=http://{args.host}:{args.port}/graph/v18.0')
+    create_app(state).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
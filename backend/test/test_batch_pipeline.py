@@ -0,0 +1,203 @@
+import json
+from datetime import datetime, timedelta
+import pytest
+from src.models.user import db, User, UsageLog
+from src.models.note import Note
+from src.models.batch import BatchSubmission, BatchItem
+from src.services.batch_pipeline import BatchPipeline, content_fingerprint
+from src.controllers.ai_processor import AIProcessor
+
+
+class FakeBatchClient:
+    """Batch API em memória: guarda as linhas enviadas e devolve resultados montados pelo teste"""
+
+    def __init__(self, fail_upload=False):
+        self.fail_upload = fail_upload
+        self.lines = []
+        self.status = 'in_progress'
+        self.results = []
+        self.downloads = 0
+
+    def upload_jsonl(self, lines, filename=None):
+        if self.fail_upload:
+            raise Exception('Erro na API OpenAI: 500')
+        self.lines.extend(json.loads(line) for line in lines)
+        return 'file-entrada'
+
+    def create_batch(self, input_file_id, metadata=None):
+        return {'id': f"batch-{metadata['batch_id']}"}
+
+    def retrieve_batch(self, provider_batch_id):
+        return {'status': self.status, 'output_file_id': 'file-saida' if self.results else None}
+
+    def download_results(self, file_id):
+        self.downloads += 1
+        return list(self.results)
+
+    def answer(self, custom_id, analysis=None, status_code=200):
+        content = json.dumps(analysis or {'summary': 'Resumo do lote', 'tasks': [], 'dates_mentioned': []})
+        self.results.append({'custom_id': custom_id, 'response': {'status_code': status_code, 'body': {
+            'model': 'gpt-4o-mini',
+            'choices': [{'message': {'content': content}}],
+            'usage': {'prompt_tokens': 100, 'completion_tokens': 50, 'total_tokens': 150}
+        }}})
+
+
+@pytest.fixture(autouse=True)
+def usage(monkeypatch):
+    """Registros de uso em memória (o buffer grava em conexão própria, fora do teste)"""
+    logged = []
+    monkeypatch.setattr(UsageLog, 'log_usage', staticmethod(lambda **kwargs: logged.append(kwargs)))
+    return logged
+
+
+@pytest.fixture
+def user(app):
+    user = User('lotes@exemplo.com', 'Senha123')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def add_notes(user, contents, hours_ago=3):
+    notes = []
+    for content in contents:
+        note = Note(user_id=user.id, content=content)
+        note.created_at = datetime.utcnow() - timedelta(hours=hours_ago)
+        notes.append(note)
+    db.session.add_all(notes)
+    db.session.commit()
+    return notes
+
+
+def make_pipeline(client=None):
+    return BatchPipeline(AIProcessor(), client=client or FakeBatchClient())
+
+
+def test_envio_inclui_somente_notas_antigas_sem_lote_em_andamento(user, monkeypatch):
+    monkeypatch.setenv('MONTHLY_SPEND_CAP_FREE', '0')
+    old = add_notes(user, ['Nota antiga um', 'Nota antiga dois'])
+    add_notes(user, ['Nota recente'], hours_ago=0)
+    pipeline = make_pipeline()
+
+    result = pipeline.submit_note_backlog()
+
+    assert result['success'] and result['requests'] == 2
+    assert sorted(line['custom_id'] for line in pipeline.client.lines) == sorted(f'note:{n.id}' for n in old)
+    batch = BatchSubmission.query.one()
+    assert batch.status == 'submitted' and batch.provider_batch_id == f'batch-{batch.id}'
+    assert BatchItem.pending_for_note(old[0].id).fingerprint == content_fingerprint('Nota antiga um')
+
+    assert pipeline.submit_note_backlog()['requests'] == 0  # Já estão em um lote em andamento
+
+
+def test_envio_respeita_o_teto_mensal_de_gastos(user, monkeypatch):
+    pipeline = make_pipeline()
+    add_notes(user, [f'Nota antiga {i}' for i in range(4)])
+    body = pipeline.chatgpt.build_analysis_complete_request('Nota antiga 0', user.get_preferences())
+    # Teto para pouco mais de duas requisições
+    monkeypatch.setenv('MONTHLY_SPEND_CAP_FREE', str(pipeline._estimate_cost(body) * 2.5))
+
+    result = pipeline.submit_note_backlog()
+
+    assert result['requests'] == 2
+    assert result['users_over_spend_cap'] == 1
+    assert BatchItem.pending_cost(user.id) <= user.monthly_spend_cap()
+
+
+def test_falha_no_envio_marca_lote_e_itens_como_falha(user, monkeypatch):
+    monkeypatch.setenv('MONTHLY_SPEND_CAP_FREE', '0')
+    note, = add_notes(user, ['Nota antiga'])
+
+    result = make_pipeline(FakeBatchClient(fail_upload=True)).submit_note_backlog()
+
+    assert not result['success']
+    assert BatchSubmission.query.one().status == 'failed'
+    assert BatchItem.query.one().status == 'failed'
+    assert BatchItem.pending_for_note(note.id) is None  # Volta a ser elegível para o worker
+
+
+def test_aplicacao_descarta_notas_alteradas_e_e_idempotente(user, usage, monkeypatch):
+    monkeypatch.setenv('MONTHLY_SPEND_CAP_FREE', '0')
+    applied, edited, removed, missing, failed = add_notes(user, [f'Nota antiga {i}' for i in range(5)])
+    pipeline = make_pipeline()
+    pipeline.submit_note_backlog()
+
+    edited.content = 'Conteúdo editado depois do envio'
+    db.session.delete(removed)
+    db.session.commit()
+
+    client = pipeline.client
+    for note in (applied, edited, removed):
+        client.answer(f'note:{note.id}')
+    client.answer(f'note:{failed.id}', status_code=500)
+    client.status = 'completed'
+
+    assert pipeline.poll() == {'checked': 1, 'applied': 1, 'errors': 0}
+
+    batch = BatchSubmission.query.one()
+    assert batch.status == 'applied'
+    assert (batch.applied_count, batch.skipped_count, batch.failed_count) == (1, 2, 2)
+    items = {item.note_id: item for item in BatchItem.query.all()}
+    assert items[edited.id].error == 'Anotação editada após o envio'
+    assert items[removed.id].error == 'Anotação removida'
+    assert items[missing.id].error == 'Sem resultado no lote'
+    # Resultados descartados também foram pagos
+    assert len(usage) == 3
+    assert all(entry['endpoint'] == 'batch:note_analysis_combined' for entry in usage)
+
+    note = Note.query.get(applied.id)
+    assert note.is_processed()
+    assert note.get_metadata()['ai_batch'] == batch.id
+
+    # Um segundo poll (ou outro processo) não aplica de novo
+    assert pipeline.poll() == {'checked': 0, 'applied': 0, 'errors': 0}
+    assert pipeline.apply_batch(batch) is False
+    assert client.downloads == 1
+
+
+def test_aplicacao_interrompida_e_retomada_apos_o_lease(user, monkeypatch):
+    monkeypatch.setenv('MONTHLY_SPEND_CAP_FREE', '0')
+    monkeypatch.setenv('BATCH_APPLY_LEASE_SECONDS', '60')
+    first, second = add_notes(user, ['Nota antiga um', 'Nota antiga dois'])
+    pipeline = make_pipeline()
+    pipeline.submit_note_backlog()
+    pipeline.client.answer(f'note:{first.id}')
+    pipeline.client.answer(f'note:{second.id}')
+
+    # Processo caiu depois de aplicar o primeiro item
+    batch = BatchSubmission.query.one()
+    batch.status = 'applying'
+    batch.output_file_id = 'file-saida'
+    item = BatchItem.pending_for_note(first.id)
+    item.status = 'applied'
+    batch.applied_count = 1
+    db.session.commit()
+
+    assert pipeline.poll()['applied'] == 0  # Lease ainda válido: outro processo pode estar aplicando
+
+    BatchSubmission.query.update({'updated_at': datetime.utcnow() - timedelta(seconds=61)})
+    db.session.commit()
+    assert pipeline.poll()['applied'] == 1
+
+    batch = BatchSubmission.query.one()
+    assert batch.status == 'applied'
+    assert (batch.applied_count, batch.skipped_count, batch.failed_count) == (2, 0, 0)
+    assert Note.query.get(second.id).is_processed()
+    assert not Note.query.get(first.id).is_processed()  # Item já aplicado não é reaplicado
+
+
+def test_lote_expirado_aplica_resultados_parciais(user, monkeypatch):
+    monkeypatch.setenv('MONTHLY_SPEND_CAP_FREE', '0')
+    done, pending = add_notes(user, ['Nota antiga um', 'Nota antiga dois'])
+    pipeline = make_pipeline()
+    pipeline.submit_note_backlog()
+    pipeline.client.answer(f'note:{done.id}')
+    pipeline.client.status = 'expired'
+
+    pipeline.poll()
+
+    batch = BatchSubmission.query.one()
+    assert batch.status == 'expired'
+    assert (batch.applied_count, batch.failed_count) == (1, 1)
+    assert BatchItem.pending_for_note(pending.id) is None
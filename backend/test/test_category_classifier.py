@@ -0,0 +1,129 @@
+from src.models.user import db, User
+from src.models.note import Note
+from src.models.job import ProcessingJob
+from src.models.classifier import CategoryClassifier, ClassifierDelta
+from src.services.category_classifier import NaiveBayesModel, CategoryClassifierService, note_terms
+
+WORK = {'reuniao': 2, 'cliente': 1, 'projeto': 1}
+SHOPPING = {'pao': 1, 'leite': 2, 'mercado': 1}
+
+
+def make_user():
+    user = User('classificador@exemplo.com', 'Senha123')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def make_service():
+    service = CategoryClassifierService(num_features=1024)
+    service.min_training_notes = 2
+    return service
+
+
+def test_naive_bayes_aprende_e_esquece():
+    model = NaiveBayesModel(num_features=1024)
+    for _ in range(3):
+        model.learn(WORK, 'Trabalho')
+        model.learn(SHOPPING, 'Compras')
+
+    category, confidence = model.predict({'reuniao': 1, 'cliente': 1})
+    assert category == 'Trabalho'
+    assert confidence > 0.9
+    assert model.predict({'desconhecido': 1}) == (None, 0.0)
+
+    for _ in range(3):
+        model.learn(SHOPPING, 'Compras', weight=-1)
+    assert 'Compras' not in model.class_docs
+    assert model.predict(WORK) == (None, 0.0)  # Uma categoria só não separa nada
+
+
+def test_serializacao_preserva_o_modelo():
+    model = NaiveBayesModel(num_features=1024)
+    model.learn(WORK, 'Trabalho')
+    model.learn(SHOPPING, 'Compras')
+
+    restored = NaiveBayesModel.from_bytes(model.to_bytes())
+    assert restored.class_docs == model.class_docs
+    assert restored.feature_totals == model.feature_totals
+    assert restored.predict({'leite': 1}) == model.predict({'leite': 1})
+
+
+def test_learn_grava_delta_e_previsao_ja_o_considera(app):
+    user = make_user()
+    service = make_service()
+    for _ in range(3):
+        service.learn(user.id, add=[(WORK, 'Trabalho')])
+        service.learn(user.id, add=[(SHOPPING, 'Compras')])
+    db.session.commit()
+
+    assert ClassifierDelta.query.count() == 6
+    assert CategoryClassifier.query.get(user.id) is None
+    assert ProcessingJob.query.filter_by(job_type='fold_classifier').count() == 1
+    assert service.predict_terms(user.id, {'pao': 1})[0] == 'Compras'
+    assert service.get_model(user.id).trained_notes == 6
+
+
+def test_fold_incorpora_deltas_em_ordem_e_os_remove(app):
+    user = make_user()
+    service = make_service()
+    for _ in range(3):
+        service.learn(user.id, add=[(WORK, 'Trabalho')])
+        service.learn(user.id, add=[(SHOPPING, 'Compras')])
+    service.learn(user.id, remove=[(WORK, 'Trabalho')])
+    db.session.commit()
+    pending = service.get_model(user.id)
+
+    assert service.fold(user.id) == 7
+    record = CategoryClassifier.query.get(user.id)
+    assert ClassifierDelta.query.count() == 0
+    assert record.trained_notes == 5
+
+    # Outro processo (sem cache) carrega o mesmo modelo do banco
+    fresh = make_service().get_model(user.id)
+    assert fresh.class_docs == pending.class_docs
+    assert fresh.feature_totals == pending.feature_totals
+
+    service.learn(user.id, add=[(SHOPPING, 'Compras')])
+    db.session.commit()
+    assert service.get_model(user.id).trained_notes == 6
+
+
+def test_forget_notes_desaprende_notas_apagadas(app):
+    user = make_user()
+    service = make_service()
+    notes = []
+    for content, category, source in [('reunião com cliente', 'Trabalho', 'user'),
+                                      ('comprar pão e leite', 'Compras', 'ai'),
+                                      ('reunião de projeto', 'Trabalho', 'classifier')]:
+        note = Note(user_id=user.id, content=content, category=category)
+        note.update_metadata('category_source', source)
+        db.session.add(note)
+        notes.append(note)
+    db.session.flush()
+    service.learn(user.id, add=[(note_terms(note), note.category) for note in notes[:2]])
+    db.session.commit()
+    assert service.get_model(user.id).trained_notes == 2
+
+    service.forget_notes(notes)
+    db.session.commit()
+
+    # A nota categorizada pelo classificador não foi aprendida e não gera delta
+    assert ClassifierDelta.query.count() == 3
+    assert service.get_model(user.id).trained_notes == 0
+    service.fold(user.id)
+    assert CategoryClassifier.query.get(user.id).trained_notes == 0
+
+
+def test_rebuild_descarta_deltas_anteriores(app):
+    user = make_user()
+    service = make_service()
+    for content, category in [('reunião com cliente', 'Trabalho'), ('comprar pão e leite', 'Compras')]:
+        db.session.add(Note(user_id=user.id, content=content, category=category))
+    db.session.commit()
+    service.learn(user.id, add=[(WORK, 'Trabalho')])
+    db.session.commit()
+
+    assert service.rebuild(user.id) == 2
+    assert ClassifierDelta.query.count() == 0
+    assert service.get_model(user.id).trained_notes == 2
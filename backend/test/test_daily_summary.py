@@ -0,0 +1,175 @@
+import sys
+import threading
+from datetime import datetime
+import pytest
+from src.models.user import db, User
+from src.models.note import Note
+from src.models.job import ProcessingJob
+from src.models.summary import DailySummary
+from src.services.chatgpt_service import ChatGPTService
+from src.controllers.ai_processor import AIProcessor
+
+DAY = '2026-03-10'
+
+
+class FakeSummaries:
+    """Substitui _request_summary contando as chamadas de map e de redução"""
+
+    def __init__(self, fail_maps=0):
+        self.maps = 0
+        self.reduces = 0
+        self.fail_maps = fail_maps
+        self.lock = threading.Lock()
+
+    def __call__(self, user_id, prompt, content, max_tokens, **params):
+        with self.lock:
+            if prompt == 'daily_summary_map':
+                self.maps += 1
+                if self.maps <= self.fail_maps:
+                    return {'success': False, 'error': 'falha simulada', 'tokens_used': 0, 'cost': 0}
+            else:
+                self.reduces += 1
+        return {'success': True, 'summary': {'summary': {'main_themes': ['tema']}}, 'tokens_used': 10, 'cost': 0.001}
+
+
+def notes_data(count, words=40):
+    return [{
+        'id': str(i),
+        'content': ' '.join(f'palavra{i}x{j}' for j in range(words)),
+        'category': f'Categoria {i % 5}',
+        'tags': [],
+        'created_at': f'{DAY}T10:00:00'
+    } for i in range(count)]
+
+
+@pytest.fixture
+def chunk_limits(monkeypatch):
+    monkeypatch.setenv('DAILY_SUMMARY_SINGLE_PASS_TOKENS', '3000')
+    monkeypatch.setenv('DAILY_SUMMARY_CHUNK_TOKENS', '3000')
+    monkeypatch.setenv('DAILY_SUMMARY_MAX_CHUNKS', '12')
+
+
+def test_dia_leve_usa_uma_chamada(chunk_limits):
+    service = ChatGPTService()
+    service._request_summary = fake = FakeSummaries()
+    calls = []
+
+    result = service.generate_daily_summary('u1', notes_data(3, words=10), DAY, before_call=lambda: calls.append(1))
+
+    assert result['mode'] == 'single_pass'
+    assert result['notes_omitted'] == 0
+    assert (fake.maps, fake.reduces, len(calls)) == (0, 1, 1)
+
+
+@pytest.mark.parametrize('count', [300, 2000, 5000])
+def test_map_reduce_nao_passa_de_max_chunks(chunk_limits, count):
+    service = ChatGPTService()
+    service._request_summary = fake = FakeSummaries()
+    calls = []
+
+    result = service.generate_daily_summary('u1', notes_data(count), DAY, before_call=lambda: calls.append(1))
+
+    assert result['mode'] == 'map_reduce'
+    assert 1 < fake.maps <= 12
+    assert fake.reduces == 1
+    assert len(calls) == fake.maps + 1  # Um token do limitador por chamada
+    assert result['chunks_failed'] == 0
+
+
+def test_dia_muito_grande_e_amostrado_e_marcado_como_parcial(chunk_limits):
+    service = ChatGPTService()
+    service._request_summary = FakeSummaries()
+
+    result = service.generate_daily_summary('u1', notes_data(5000), DAY)
+
+    assert result['notes_omitted'] > 0
+    assert result['notes_omitted'] < 5000
+
+
+def test_chunks_com_falha_sao_informados(chunk_limits):
+    service = ChatGPTService()
+    service._request_summary = FakeSummaries(fail_maps=2)
+
+    result = service.generate_daily_summary('u1', notes_data(300), DAY)
+
+    assert result['success']
+    assert result['chunks_failed'] == 2
+
+
+def make_day(count):
+    user = User('resumo@exemplo.com', 'Senha123')
+    db.session.add(user)
+    db.session.commit()
+    for i in range(count):
+        note = Note(user_id=user.id, content=f'anotação {i} ' + 'texto ' * 40)
+        note.created_at = datetime(2026, 3, 10, 9, i % 60)
+        db.session.add(note)
+    db.session.commit()
+    return user
+
+
+def test_resumo_parcial_por_falha_nao_e_armazenado(app, chunk_limits):
+    user = make_day(300)
+    processor = AIProcessor()
+    processor.chatgpt._request_summary = FakeSummaries(fail_maps=1)
+
+    result = processor.build_daily_summary(user.id, DAY)
+
+    assert result['partial'] and result['chunks_failed'] == 1
+    assert DailySummary.query.count() == 0
+
+
+def test_resumo_amostrado_fica_armazenado_como_parcial(app, chunk_limits, monkeypatch):
+    monkeypatch.setenv('DAILY_SUMMARY_MAX_CHUNKS', '2')
+    user = make_day(300)
+    processor = AIProcessor()
+    processor.chatgpt._request_summary = FakeSummaries()
+
+    result = processor.build_daily_summary(user.id, DAY)
+    stored = DailySummary.query.one()
+
+    assert result['partial'] and result['notes_omitted'] > 0
+    assert stored.notes_omitted == result['notes_omitted']
+    assert stored.to_dict()['partial']
+
+    cached = processor.build_daily_summary(user.id, DAY)
+    assert cached['cached'] and cached['partial']
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    monkeypatch.setattr(sys, 'argv', ['worker'])
+    import src.worker as worker
+    return worker
+
+
+def test_job_repete_enquanto_ha_chunks_com_falha(app, worker, monkeypatch):
+    user = make_day(1)
+    user.whatsapp_opt_in = True
+    user.phone_number = '5511999999999'
+    db.session.commit()
+    monkeypatch.setattr(worker.ai_processor, 'build_daily_summary', lambda *args, **kwargs: {
+        'success': True, 'summary': {'summary': {}}, 'notes_processed': 300,
+        'notes_omitted': 0, 'chunks_failed': 1, 'partial': True
+    })
+    sent = []
+    monkeypatch.setattr(worker.ai_processor.whatsapp, 'send_daily_summary',
+                        lambda user_id, summary, **partial: sent.append(partial) or True)
+
+    ProcessingJob.enqueue(user.id, 'daily_summary', payload={'date': DAY}, max_attempts=2)
+
+    job = ProcessingJob.claim_next('w1')
+    with pytest.raises(Exception, match='Resumo parcial'):
+        worker.handle_daily_summary(job)
+    assert sent == []
+
+    # Última tentativa: envia avisando que o resumo é parcial
+    job.mark_failed('w1', 'Resumo parcial')
+    ProcessingJob.query.update({'run_after': datetime.utcnow()})
+    db.session.commit()
+    job = ProcessingJob.claim_next('w1')
+    assert job.attempts == 2
+
+    result = worker.handle_daily_summary(job)
+    assert result['partial']
+    assert sent == [{'notes_omitted': 0, 'chunks_failed': 1}]
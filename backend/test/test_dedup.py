@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta
+from src.models.user import db, User
+from src.models.note import Note
+from src.models.fingerprint import NoteFingerprint
+from src.services.dedup_service import MinHasher, DuplicateDetector
+
+BASE = 'Reunião com o cliente na sexta para revisar o orçamento do projeto de marketing digital e definir o cronograma'
+NEAR = BASE + ' final'
+OTHER = 'Comprar pão, leite, ovos e frutas no mercado do bairro antes do almoço de domingo com a família'
+
+
+def make_user():
+    user = User('dedup@exemplo.com', 'Senha123')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def add_note(user, content, minutes_ago):
+    note = Note(user_id=user.id, content=content)
+    note.created_at = datetime.utcnow() - timedelta(minutes=minutes_ago)
+    db.session.add(note)
+    db.session.flush()
+    return note
+
+
+def test_minhash_estima_jaccard_alto_para_quase_duplicatas():
+    hasher = MinHasher()
+    base = hasher.signature(BASE)
+
+    assert hasher.similarity(base, hasher.signature(NEAR)) >= 0.85
+    assert hasher.similarity(base, hasher.signature(OTHER)) < 0.2
+    assert hasher.signature('').size == 0
+    assert hasher.similarity(hasher.signature(''), base) == 0.0
+
+
+def test_quase_duplicata_aponta_para_a_nota_mais_antiga(app):
+    user = make_user()
+    detector = DuplicateDetector()
+    original = add_note(user, BASE, 30)
+    assert detector.register_note(original) is None
+    assert detector.register_note(add_note(user, OTHER, 20)) is None
+
+    duplicate = add_note(user, NEAR, 10)
+    assert detector.register_note(duplicate).id == original.id
+    assert NoteFingerprint.query.get(duplicate.id).duplicate_of == original.id
+    assert duplicate.get_metadata()['duplicate_of'] == original.id
+
+
+def test_nota_antiga_editada_nao_vira_duplicata_de_nota_mais_nova(app):
+    user = make_user()
+    detector = DuplicateDetector()
+    old = add_note(user, OTHER, 30)
+    detector.register_note(old)
+    new = add_note(user, BASE, 10)
+    detector.register_note(new)
+
+    old.content = NEAR
+    assert detector.register_note(old) is None
+    assert NoteFingerprint.query.get(old.id).duplicate_of is None
+
+    # A nova, reindexada, passa a apontar para a antiga (criada antes)
+    assert detector.register_note(new).id == old.id
+
+
+def test_original_editada_nao_e_reparentada(app):
+    user = make_user()
+    detector = DuplicateDetector()
+    oldest = add_note(user, OTHER, 30)
+    detector.register_note(oldest)
+    original = add_note(user, BASE, 20)
+    detector.register_note(original)
+    duplicate = add_note(user, NEAR, 10)
+    assert detector.register_note(duplicate).id == original.id
+
+    original.content = OTHER + ' hoje'
+    assert detector.register_note(original) is None
+    assert NoteFingerprint.query.get(original.id).duplicate_of is None
+    assert NoteFingerprint.query.get(duplicate.id).duplicate_of == original.id
+
+
+def test_remover_original_libera_as_duplicatas(app):
+    user = make_user()
+    detector = DuplicateDetector()
+    original = add_note(user, BASE, 20)
+    detector.register_note(original)
+    duplicate = add_note(user, NEAR, 10)
+    detector.register_note(duplicate)
+
+    detector.remove_notes([original.id])
+
+    assert NoteFingerprint.query.get(original.id) is None
+    assert NoteFingerprint.query.get(duplicate.id).duplicate_of is None
+    assert 'duplicate_of' not in duplicate.get_metadata()
+    assert detector.duplicate_ids(user.id) == set()
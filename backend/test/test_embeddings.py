@@ -0,0 +1,142 @@
+import sys
+import numpy as np
+import pytest
+from src.models.user import db, User, UsageLog
+from src.models.note import Note
+from src.models.embedding import NoteEmbedding
+from src.models.job import ProcessingJob
+from src.services import embedding_service
+from src.services.embedding_service import (
+    EmbeddingService, HashingEmbeddingProvider, OpenAIEmbeddingProvider, UserVectorIndex
+)
+from src.controllers.ai_processor import AIProcessor
+
+BUDGET = 'Revisar o orçamento do projeto de marketing digital com o cliente na sexta'
+BUDGET_2 = 'Orçamento do projeto de marketing digital: revisar valores com o cliente'
+MARKET = 'Comprar pão, leite, ovos e frutas no mercado do bairro'
+
+
+def make_user():
+    user = User('vetores@exemplo.com', 'Senha123')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def add_note(user, content):
+    note = Note(user_id=user.id, content=content)
+    db.session.add(note)
+    db.session.commit()
+    return note
+
+
+def test_embeddings_locais_sao_deterministicos_e_normalizados():
+    provider = HashingEmbeddingProvider(dim=64)
+    vectors = provider.embed([BUDGET, BUDGET, MARKET, ''])
+
+    assert vectors.shape == (4, 64) and vectors.dtype == np.float32
+    assert np.allclose(vectors[0], vectors[1])
+    assert np.isclose(np.linalg.norm(vectors[0]), 1.0)
+    assert not vectors[3].any()
+
+
+def test_indice_vetorial_ordena_por_cosseno_e_remove():
+    index = UserVectorIndex(dim=3)
+    index.upsert('a', np.array([1, 0, 0], dtype=np.float32))
+    index.upsert('b', np.array([0.8, 0.6, 0], dtype=np.float32))
+    index.upsert('c', np.array([0, 0, 1], dtype=np.float32))
+
+    query = np.array([1, 0, 0], dtype=np.float32)
+    assert [note_id for note_id, _ in index.query(query, k=2)] == ['a', 'b']
+    assert [note_id for note_id, _ in index.query(query, k=2, exclude_ids={'a'})] == ['b', 'c']
+
+    index.remove('a')
+    assert 'a' not in index and len(index) == 2
+    assert index.query(query, k=1)[0][0] == 'b'
+
+
+def test_find_similar_ranqueia_notas_parecidas_primeiro(app):
+    user = make_user()
+    service = EmbeddingService(provider=HashingEmbeddingProvider(dim=256))
+    notes = [add_note(user, content) for content in (BUDGET, BUDGET_2, MARKET)]
+    assert service.embed_notes(notes) == 3
+    assert service.embed_notes(notes) == 0  # Conteúdo não mudou: nada a recalcular
+
+    ranked = service.find_similar(notes[0])
+    assert [note_id for note_id, _ in ranked] == [notes[1].id, notes[2].id]
+    assert ranked[0][1] > ranked[1][1]
+
+
+def test_find_similar_retorna_none_sem_vetores_comparaveis(app):
+    user = make_user()
+    service = EmbeddingService(provider=HashingEmbeddingProvider(dim=256))
+    first, second = add_note(user, BUDGET), add_note(user, BUDGET_2)
+
+    assert service.find_similar(first) is None  # Nota sem vetor
+    service.embed_note(first)
+    assert service.find_similar(first) is None  # Nenhuma outra nota com vetor
+    service.embed_note(second)
+    assert service.find_similar(first)[0][0] == second.id
+
+    # Troca de modelo: os vetores antigos não são comparáveis
+    assert EmbeddingService(provider=HashingEmbeddingProvider(dim=128)).find_similar(first) is None
+
+
+def test_notas_relacionadas_caem_para_bm25_sem_embeddings(app):
+    user = make_user()
+    processor = AIProcessor()
+    processor.embeddings = EmbeddingService(provider=HashingEmbeddingProvider(dim=256))
+    notes = [add_note(user, content) for content in (BUDGET, BUDGET_2, MARKET)]
+    for note in notes[1:]:
+        processor.keywords.index_note(note)
+    db.session.commit()
+
+    result = processor.find_related_notes(notes[0].id)
+    assert result['success']
+    assert [related['note_id'] for related in result['related_notes']] == [notes[1].id]
+    assert NoteEmbedding.query.count() == 0
+
+    # Com vetores de todo o acervo, o ranking vem dos embeddings
+    processor.embeddings.embed_notes(notes)
+    result = processor.find_related_notes(notes[0].id)
+    assert result['related_notes'][0]['note_id'] == notes[1].id
+    assert Note.query.get(notes[0].id).get_related_notes()[0] == notes[1].id
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+
+def test_uso_de_embeddings_remotos_e_registrado_como_embedding(monkeypatch):
+    monkeypatch.setenv('OPENAI_API_KEY', 'chave-teste')
+    monkeypatch.setattr(embedding_service, 'guarded_request', lambda *args, **kwargs: FakeResponse({
+        'data': [{'index': 1, 'embedding': [0.0, 2.0]}, {'index': 0, 'embedding': [3.0, 0.0]}],
+        'usage': {'prompt_tokens': 12, 'total_tokens': 12}
+    }))
+    logged = []
+    monkeypatch.setattr(UsageLog, 'log_usage', staticmethod(lambda **kwargs: logged.append(kwargs)))
+
+    vectors = OpenAIEmbeddingProvider(dim=2).embed(['a', 'b'], user_id='u1')
+
+    assert np.allclose(vectors, [[1, 0], [0, 1]])
+    assert logged[0]['api_type'] == 'embedding'
+    assert logged[0]['prompt_tokens'] == 12 and logged[0]['cost'] > 0
+
+
+def test_job_de_embedding_respeita_o_teto_de_gastos(app, monkeypatch):
+    monkeypatch.setattr(sys, 'argv', ['worker'])
+    import src.worker as worker
+    user = make_user()
+    note = add_note(user, BUDGET)
+    job = ProcessingJob(user_id=user.id, job_type='embed_note', note_id=note.id)
+    monkeypatch.setattr(User, 'within_spend_cap', lambda self: False)
+
+    with pytest.raises(worker.PermanentJobError):
+        worker.handle_embed_note(job)
+    assert NoteEmbedding.query.count() == 0
@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+from src.models.user import db, User
+from src.models.note import Note
+from src.models.job import ProcessingJob
+from src.services.job_queue import enqueue_note_processing
+
+
+def make_note(content='Ligar para o cliente amanhã'):
+    user = User('fila@exemplo.com', 'Senha123')
+    db.session.add(user)
+    db.session.commit()
+    note = Note(user_id=user.id, content=content)
+    db.session.add(note)
+    db.session.commit()
+    return note
+
+
+def test_claim_next_entrega_o_job_a_um_unico_worker(app):
+    note = make_note()
+    job = enqueue_note_processing(note)
+
+    claimed = ProcessingJob.claim_next('worker-a')
+    assert claimed.id == job.id
+    assert claimed.status == 'running'
+    assert claimed.locked_by == 'worker-a'
+    assert claimed.attempts == 1
+
+    assert ProcessingJob.claim_next('worker-b') is None
+
+
+def test_lease_expirado_volta_para_a_fila_e_invalida_o_worker_antigo(app):
+    note = make_note()
+    job = enqueue_note_processing(note)
+    first = ProcessingJob.claim_next('worker-a', lease_seconds=60)
+
+    first.locked_until = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+    second = ProcessingJob.claim_next('worker-b')
+    assert second.id == job.id
+    assert second.locked_by == 'worker-b'
+    assert second.attempts == 2
+
+    assert not first.mark_succeeded('worker-a')
+    assert second.mark_succeeded('worker-b', {'ok': True})
+    assert ProcessingJob.query.get(job.id).status == 'succeeded'
+
+
+def test_falha_reagenda_com_backoff_ate_esgotar_tentativas(app):
+    note = make_note()
+    job = enqueue_note_processing(note)
+    job.max_attempts = 2
+    db.session.commit()
+
+    claimed = ProcessingJob.claim_next('worker-a')
+    before = datetime.utcnow()
+    assert claimed.mark_failed('worker-a', 'erro transitório')
+
+    requeued = ProcessingJob.query.get(job.id)
+    assert requeued.status == 'queued'
+    delay = (requeued.run_after - before).total_seconds()
+    assert ProcessingJob.BACKOFF_BASE_SECONDS * 0.5 - 1 <= delay <= ProcessingJob.BACKOFF_BASE_SECONDS + 1
+    assert ProcessingJob.claim_next('worker-a') is None  # Ainda no backoff
+
+    requeued.run_after = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    claimed = ProcessingJob.claim_next('worker-a')
+    assert claimed.attempts == 2
+    claimed.mark_failed('worker-a', 'erro transitório')
+    assert ProcessingJob.query.get(job.id).status == 'failed'
+
+
+def test_falha_permanente_nao_reagenda(app):
+    note = make_note()
+    enqueue_note_processing(note)
+    claimed = ProcessingJob.claim_next('worker-a')
+
+    claimed.mark_failed('worker-a', 'Anotação não encontrada', retryable=False)
+    assert ProcessingJob.query.get(claimed.id).status == 'failed'
+
+
+def test_fail_expired_encerra_jobs_sem_tentativas_restantes(app):
+    note = make_note()
+    job = enqueue_note_processing(note)
+    job.max_attempts = 1
+    db.session.commit()
+    claimed = ProcessingJob.claim_next('worker-a')
+    claimed.locked_until = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+    assert ProcessingJob.claim_next('worker-b') is None
+    assert ProcessingJob.fail_expired() == 1
+    assert ProcessingJob.query.get(job.id).status == 'failed'
+
+
+def test_process_note_reaproveita_job_na_fila_mas_nao_job_em_execucao(app):
+    note = make_note()
+    first = enqueue_note_processing(note)
+    assert enqueue_note_processing(note).id == first.id
+
+    running = ProcessingJob.claim_next('worker-a')
+    assert not running.has_running_duplicate()
+
+    # Edição durante o processamento: o job em execução já leu o conteúdo antigo
+    second = enqueue_note_processing(note)
+    assert second.id != first.id
+    assert second.status == 'queued'
+    assert second.has_running_duplicate()
+
+    running.mark_succeeded('worker-a')
+    assert not second.has_running_duplicate()
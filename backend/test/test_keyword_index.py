@@ -0,0 +1,95 @@
+from src.models.user import db, User
+from src.models.note import Note
+from src.models.keyword_index import NoteKeywordSignature, NoteTerm
+from src.services.keyword_index import KeywordIndex
+from src.services.text_processing import tokenize, term_frequencies
+
+
+def make_user(email='bm25@exemplo.com'):
+    user = User(email, 'Senha123')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def add_notes(user, index, contents):
+    notes = [Note(user_id=user.id, content=content) for content in contents]
+    db.session.add_all(notes)
+    db.session.flush()
+    for note in notes:
+        index.index_note(note)
+    db.session.commit()
+    return notes
+
+
+def test_tokenizacao_normaliza_acentos_stop_words_e_plurais():
+    assert tokenize('As Reuniões com os Clientes e o Orçamento de 2024') == ['reuniao', 'cliente', 'orcamento']
+    assert term_frequencies('cliente, clientes e CLIENTE') == {'cliente': 3}
+    assert tokenize('') == []
+
+
+def test_index_note_grava_assinatura_e_postings(app):
+    user = make_user()
+    index = KeywordIndex()
+    note, = add_notes(user, index, ['Reunião com cliente sobre orçamento do cliente'])
+
+    assert NoteKeywordSignature.query.get(note.id).get_terms() == {'reuniao': 1, 'cliente': 2, 'orcamento': 1}
+    assert NoteKeywordSignature.query.get(note.id).length == 4
+
+    # Reindexar após edição substitui os postings antigos
+    note.content = 'Comprar pão no mercado'
+    index.index_note(note)
+    db.session.commit()
+    assert sorted(term.term for term in NoteTerm.query.filter_by(note_id=note.id)) == sorted(term_frequencies('Comprar pão no mercado'))
+
+
+def test_bm25_ranqueia_por_termos_em_comum_e_raridade(app):
+    user = make_user()
+    index = KeywordIndex()
+    source, strong, weak, unrelated = add_notes(user, index, [
+        'Orçamento do projeto de marketing com o cliente',
+        'Revisar orçamento do projeto de marketing',
+        'Ligar para o cliente amanhã',
+        'Comprar pão no mercado',
+    ])
+    # Termo presente em todas as notas pesa pouco
+    add_notes(user, index, ['cliente cliente', 'cliente novo'])
+
+    ranked = index.find_similar(source)
+
+    scores = dict(ranked)
+    assert ranked[0][0] == strong.id
+    assert unrelated.id not in scores
+    assert 0 < scores[weak.id] < scores[strong.id] <= 1.0
+
+
+def test_bm25_respeita_usuario_exclusoes_e_remocao(app):
+    user, other_user = make_user(), make_user('outro@exemplo.com')
+    index = KeywordIndex()
+    source, duplicate, related = add_notes(user, index, [
+        'Planejamento da viagem para Lisboa em julho',
+        'Planejamento da viagem para Lisboa em julho!',
+        'Reservar hotel para a viagem a Lisboa',
+    ])
+    add_notes(other_user, index, ['Planejamento da viagem para Lisboa em julho'])
+
+    assert [note_id for note_id, _ in index.find_similar(source)] == [duplicate.id, related.id]
+    assert [note_id for note_id, _ in index.find_similar(source, exclude_ids={duplicate.id})] == [related.id]
+
+    index.remove_notes([related.id])
+    db.session.commit()
+    assert [note_id for note_id, _ in index.find_similar(source)] == [duplicate.id]
+
+
+def test_backfill_indexa_somente_notas_sem_assinatura(app):
+    user = make_user()
+    index = KeywordIndex()
+    add_notes(user, index, ['Nota já indexada sobre orçamento'])
+    db.session.add_all([Note(user_id=user.id, content=f'Nota antiga {i} sobre orçamento') for i in range(5)])
+    db.session.commit()
+    progress = []
+
+    assert index.backfill(user.id, batch_size=2, on_progress=lambda cursor, total: progress.append(total)) == 5
+    assert progress == [2, 4, 5]
+    assert NoteKeywordSignature.query.count() == 6
+    assert index.backfill(user.id) == 0
@@ -0,0 +1,47 @@
+import pytest
+from src.services.pricing import calculate_cost, cached_prompt_tokens, get_model_price
+
+
+def test_tokens_em_cache_usam_preco_reduzido():
+    # gpt-4o-mini: 0.15/M de entrada, 0.075/M em cache
+    cost = calculate_cost('gpt-4o-mini', 1_000_000, 0, version='2024-10-cached', cached_tokens=400_000)
+    assert cost == pytest.approx(0.6 * 0.15 + 0.4 * 0.075)
+
+
+def test_tokens_em_cache_nao_passam_do_prompt():
+    capped = calculate_cost('gpt-4o-mini', 1000, 0, version='2024-10-cached', cached_tokens=5000)
+    assert capped == calculate_cost('gpt-4o-mini', 1000, 0, version='2024-10-cached', cached_tokens=1000)
+
+
+def test_tabela_sem_preco_de_cache_cobra_preco_cheio():
+    full = calculate_cost('gpt-4o-mini', 1_000_000, 0, version='2024-10')
+    assert calculate_cost('gpt-4o-mini', 1_000_000, 0, version='2024-10', cached_tokens=500_000) == full
+
+
+def test_batch_custa_metade_do_interativo():
+    interactive = calculate_cost('gpt-4o-mini', 1_000_000, 1_000_000, version='2024-10-cached')
+    assert interactive == pytest.approx(0.15 + 0.60)
+    assert calculate_cost('gpt-4o-mini', 1_000_000, 1_000_000, version='2024-10-cached', batch=True) == pytest.approx(interactive / 2)
+
+
+def test_batch_com_cache_aplica_os_dois_descontos():
+    cost = calculate_cost('gpt-4o', 1_000_000, 0, version='2024-10-cached', cached_tokens=1_000_000, batch=True)
+    assert cost == pytest.approx(1.25 / 2)
+
+
+def test_taxa_por_requisicao():
+    assert calculate_cost('llama-3.1-sonar-small-128k-online', 0, 0, version='2024-10-cached', requests=3) == pytest.approx(0.015)
+
+
+def test_modelo_com_sufixo_de_data_usa_prefixo_mais_longo():
+    assert get_model_price('gpt-4o-mini-2024-07-18', '2024-10-cached') == get_model_price('gpt-4o-mini', '2024-10-cached')
+
+
+def test_modelo_desconhecido_custa_zero():
+    assert calculate_cost('modelo-inexistente', 1000, 1000) == 0.0
+
+
+def test_cached_prompt_tokens():
+    assert cached_prompt_tokens({'prompt_tokens': 100, 'prompt_tokens_details': {'cached_tokens': 64}}) == 64
+    assert cached_prompt_tokens({'prompt_tokens': 100}) == 0
+    assert cached_prompt_tokens(None) == 0
@@ -0,0 +1,194 @@
+import threading
+import pytest
+from src.services import http_client, resilience
+from src.services.resilience import CircuitBreaker, ProviderUnavailable, guarded_request, unavailable_info
+
+
+class FakeClock:
+    """Relógio monotônico controlado pelo teste"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        status = self.statuses.pop(0)
+        if isinstance(status, Exception):
+            raise status
+        return FakeResponse(status)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience, 'time', clock)
+    return clock
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    """Circuitos e semáforos novos a cada teste (o registro é global do processo)"""
+    monkeypatch.setattr(resilience, '_breakers', {})
+    monkeypatch.setattr(resilience, '_semaphores', {})
+
+
+def fail_times(breaker, count):
+    for _ in range(count):
+        breaker.before_call()
+        breaker.record_failure()
+
+
+def test_abre_somente_com_chamadas_minimas_e_taxa_de_falhas(clock):
+    breaker = CircuitBreaker('openai', failure_rate=0.5, min_calls=4)
+    fail_times(breaker, 3)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED  # 3 falhas em 4 chamadas, mas abre só na falha
+
+    fail_times(breaker, 1)
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_falhas_fora_da_janela_sao_esquecidas(clock):
+    breaker = CircuitBreaker('openai', failure_rate=0.5, min_calls=3, window_seconds=60)
+    fail_times(breaker, 2)
+
+    clock.now += 61
+    fail_times(breaker, 1)
+
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.get_stats()['calls_in_window'] == 1
+
+
+def test_circuito_aberto_falha_rapido_e_informa_retry_after(clock):
+    breaker = CircuitBreaker('perplexity', min_calls=1, open_seconds=30)
+    fail_times(breaker, 1)
+
+    clock.now += 10
+    with pytest.raises(ProviderUnavailable) as error:
+        breaker.before_call()
+    assert error.value.provider == 'perplexity'
+    assert error.value.retry_after == pytest.approx(20)
+    assert unavailable_info(error.value) == {'provider_unavailable': True, 'retry_after': pytest.approx(20)}
+
+
+def test_meio_aberto_deixa_uma_sondagem_e_fecha_no_sucesso(clock):
+    breaker = CircuitBreaker('openai', min_calls=1, open_seconds=30)
+    fail_times(breaker, 1)
+    clock.now += 30
+
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(ProviderUnavailable):
+        breaker.before_call()  # Só uma sondagem por vez
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+def test_meio_aberto_reabre_na_falha(clock):
+    breaker = CircuitBreaker('openai', min_calls=1, open_seconds=30)
+    fail_times(breaker, 1)
+    clock.now += 30
+
+    fail_times(breaker, 1)
+
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(ProviderUnavailable):
+        breaker.before_call()
+
+
+def test_cancel_call_devolve_a_sondagem(clock):
+    breaker = CircuitBreaker('openai', min_calls=1, open_seconds=30)
+    fail_times(breaker, 1)
+    clock.now += 30
+
+    breaker.before_call()
+    breaker.cancel_call()
+    breaker.before_call()
+
+
+def test_guarded_request_conta_429_e_5xx_como_falha(monkeypatch, clock):
+    monkeypatch.setenv('OPENAI_CIRCUIT_MIN_CALLS', '3')
+    session = FakeSession([200, 503, 429])
+    monkeypatch.setattr(http_client, 'get_session', lambda provider: session)
+
+    assert guarded_request('openai', 'POST', 'http://fake').status_code == 200
+    assert guarded_request('openai', 'POST', 'http://fake').status_code == 503
+    guarded_request('openai', 'POST', 'http://fake')
+    assert resilience.get_circuit_breaker('openai').state == CircuitBreaker.OPEN
+
+    with pytest.raises(ProviderUnavailable):
+        guarded_request('openai', 'POST', 'http://fake')
+    assert session.calls == 3  # Circuito aberto não chega a chamar o provedor
+
+
+def test_guarded_request_propaga_erro_de_rede_e_devolve_a_vaga(monkeypatch, clock):
+    monkeypatch.setenv('WHATSAPP_MAX_CONCURRENCY', '1')
+    session = FakeSession([ConnectionError('rede'), 200])
+    monkeypatch.setattr(http_client, 'get_session', lambda provider: session)
+
+    with pytest.raises(ConnectionError):
+        guarded_request('whatsapp', 'POST', 'http://fake')
+    assert guarded_request('whatsapp', 'POST', 'http://fake').status_code == 200
+
+
+def test_limite_de_concorrencia_falha_sem_vaga(monkeypatch):
+    monkeypatch.setenv('OPENAI_MAX_CONCURRENCY', '1')
+    monkeypatch.setenv('OPENAI_CONCURRENCY_WAIT_SECONDS', '0.05')
+    inside, release = threading.Event(), threading.Event()
+
+    class BlockingSession:
+        def request(self, method, url, **kwargs):
+            inside.set()
+            release.wait(2)
+            return FakeResponse(200)
+
+    monkeypatch.setattr(http_client, 'get_session', lambda provider: BlockingSession())
+    worker = threading.Thread(target=guarded_request, args=('openai', 'POST', 'http://fake'))
+    worker.start()
+    inside.wait(2)
+
+    with pytest.raises(ProviderUnavailable) as error:
+        guarded_request('openai', 'POST', 'http://fake')
+    assert error.value.reason == 'limite de chamadas simultâneas atingido'
+
+    release.set()
+    worker.join(2)
+    assert guarded_request('openai', 'POST', 'http://fake').status_code == 200
+
+
+def test_resposta_em_streaming_segura_a_vaga_ate_o_close(monkeypatch):
+    monkeypatch.setenv('OPENAI_MAX_CONCURRENCY', '1')
+    monkeypatch.setenv('OPENAI_CONCURRENCY_WAIT_SECONDS', '0.05')
+    monkeypatch.setattr(http_client, 'get_session', lambda provider: FakeSession([200, 200, 200]))
+
+    stream = guarded_request('openai', 'POST', 'http://fake', stream=True)
+    with pytest.raises(ProviderUnavailable):
+        guarded_request('openai', 'POST', 'http://fake')
+
+    stream.close()
+    stream.close()  # Fechar de novo não devolve a vaga duas vezes
+    assert stream.closed
+    assert guarded_request('openai', 'POST', 'http://fake').status_code == 200
@@ -0,0 +1,117 @@
+import time
+from datetime import datetime, timedelta
+import pytest
+from src.models.user import db
+from src.models.cache import ResponseCacheEntry
+from src.services import response_cache
+from src.services.response_cache import ResponseCache
+
+REQUEST = {'model': 'gpt-4o-mini', 'messages': [{'role': 'user', 'content': 'Olá'}], 'temperature': 0.3}
+
+
+class FakeClock:
+    """Relógio da camada em memória controlado pelo teste"""
+
+    def __init__(self):
+        self.now = time.time()
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(response_cache, 'time', clock)
+    return clock
+
+
+def test_chave_depende_de_endpoint_modelo_mensagens_e_parametros():
+    key = ResponseCache.make_key('openai', 'chat/completions', REQUEST)
+
+    assert key == ResponseCache.make_key('openai', 'chat/completions', dict(reversed(list(REQUEST.items()))))
+    assert key != ResponseCache.make_key('openai', 'chat/completions', {**REQUEST, 'temperature': 0.7})
+    assert key != ResponseCache.make_key('openai', 'chat/completions', {**REQUEST, 'model': 'gpt-4o'})
+    assert key != ResponseCache.make_key('perplexity', 'chat/completions', REQUEST)
+
+
+def test_camada_persistente_e_compartilhada_entre_processos(app):
+    cache = ResponseCache('openai', ttl_seconds=60)
+    cache.set('k1', {'resposta': 'oi'})
+    assert cache.get('k1') == {'resposta': 'oi'}
+
+    other_process = ResponseCache('openai', ttl_seconds=60)
+    assert other_process.get('k1') == {'resposta': 'oi'}
+    assert other_process.get('k1') == {'resposta': 'oi'}
+    assert other_process.get('k2') is None
+
+    stats = other_process.get_stats()
+    assert (stats['db_hits'], stats['memory_hits'], stats['misses']) == (1, 1, 1)
+    assert ResponseCacheEntry.query.get('k1').hits == 1
+
+
+def test_entradas_expiram_pelo_ttl(app, clock):
+    cache = ResponseCache('perplexity', ttl_seconds=60)
+    cache.set('k1', {'resposta': 'oi'})
+
+    clock.now += 30
+    assert cache.get('k1') == {'resposta': 'oi'}
+
+    clock.now += 31
+    ResponseCacheEntry.query.filter_by(key='k1').update({'expires_at': datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+    assert cache.get('k1') is None
+    assert cache.get_stats()['memory_entries'] == 0
+
+
+def test_lru_em_memoria_descarta_a_menos_usada(clock):
+    cache = ResponseCache('openai', ttl_seconds=60, max_memory_entries=2)
+    cache.set('a', {'v': 1})
+    cache.set('b', {'v': 2})
+    assert cache.get('a') == {'v': 1}  # 'b' passa a ser a menos usada
+
+    cache.set('c', {'v': 3})
+
+    assert cache.get('b') is None  # Sem app context não há camada persistente
+    assert cache.get('a') == {'v': 1}
+    assert cache.get('c') == {'v': 3}
+
+
+def test_limpeza_remove_expiradas_e_menos_acessadas_acima_do_limite(app):
+    cache = ResponseCache('openai', ttl_seconds=60, max_db_entries=2)
+    other = ResponseCache('perplexity', ttl_seconds=60, max_db_entries=2)
+    for index, key in enumerate(['velha', 'media', 'nova', 'expirada']):
+        cache.set(key, {'v': key})
+        ResponseCacheEntry.query.filter_by(key=key).update(
+            {'last_accessed_at': datetime.utcnow() - timedelta(minutes=10 - index)}
+        )
+        db.session.commit()  # O cache grava por conexão própria: não segura o lock do SQLite
+    other.set('outro_namespace', {'v': 1})
+    ResponseCacheEntry.query.filter_by(key='expirada').update({'expires_at': datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+
+    assert cache.evict() == 2
+
+    assert sorted(entry.key for entry in ResponseCacheEntry.query.all()) == ['media', 'nova', 'outro_namespace']
+    assert cache.get_stats()['evictions'] == 2
+
+
+def test_limpeza_automatica_a_cada_intervalo_de_gravacoes(app, monkeypatch):
+    monkeypatch.setattr(ResponseCache, 'EVICTION_INTERVAL', 3)
+    cache = ResponseCache('openai', ttl_seconds=60, max_db_entries=1)
+
+    for key in ['a', 'b']:
+        cache.set(key, {'v': key})
+    assert ResponseCacheEntry.query.count() == 2
+    db.session.commit()
+
+    cache.set('c', {'v': 'c'})
+    assert ResponseCacheEntry.query.count() == 1
+
+
+def test_cache_desativado_nao_grava_nem_le(app):
+    cache = ResponseCache('openai', ttl_seconds=60, enabled=False)
+    cache.set('k1', {'resposta': 'oi'})
+
+    assert cache.get('k1') is None
+    assert ResponseCacheEntry.query.count() == 0
@@ -0,0 +1,117 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from src.services.concurrency import Stage, StageGraph, StageSkipped, run_bounded
+
+
+@pytest.fixture
+def executor():
+    executor = ThreadPoolExecutor(max_workers=4)
+    yield executor
+    executor.shutdown(wait=False)
+
+
+def test_etapas_independentes_rodam_em_paralelo(executor):
+    barrier = threading.Barrier(2, timeout=2)
+
+    def meet(inputs):
+        barrier.wait()  # Só passa se as duas etapas estiverem rodando ao mesmo tempo
+        return 'ok'
+
+    results = StageGraph([Stage('a', meet), Stage('b', meet)], executor=executor).run()
+
+    assert results['a']['status'] == results['b']['status'] == 'ok'
+
+
+def test_dependencias_recebem_o_valor_das_etapas_anteriores(executor):
+    results = StageGraph([
+        Stage('soma', lambda inputs: inputs['a'] + inputs['b'], depends_on=['a', 'b']),
+        Stage('a', lambda inputs: 1),
+        Stage('b', lambda inputs: 2),
+    ], executor=executor).run()
+
+    assert results['soma']['value'] == 3
+
+
+def test_dependencia_inexistente_e_rejeitada(executor):
+    with pytest.raises(ValueError):
+        StageGraph([Stage('a', lambda inputs: 1, depends_on=['x'])], executor=executor)
+
+
+def test_falha_descarta_dependentes_sem_afetar_as_demais(executor):
+    def fail(inputs):
+        raise RuntimeError('erro do provedor')
+
+    events = []
+    results = StageGraph([
+        Stage('analise', fail),
+        Stage('tarefas', lambda inputs: 'ok', depends_on=['analise']),
+        Stage('pesquisa', lambda inputs: 'ok'),
+    ], executor=executor).run(on_stage=lambda name, result: events.append((name, result['status'])))
+
+    assert results['analise']['status'] == 'failed'
+    assert results['analise']['error'] == 'erro do provedor'
+    assert results['tarefas']['status'] == 'skipped'
+    assert 'analise' in results['tarefas']['error']
+    assert results['pesquisa']['status'] == 'ok'
+    assert sorted(events) == [('analise', 'failed'), ('pesquisa', 'ok'), ('tarefas', 'skipped')]
+
+
+def test_stage_skipped_nao_conta_como_falha(executor):
+    def unavailable(inputs):
+        raise StageSkipped('circuito aberto')
+
+    results = StageGraph([
+        Stage('pesquisa', unavailable),
+        Stage('depois', lambda inputs: 'ok', depends_on=['pesquisa']),
+    ], executor=executor).run()
+
+    assert results['pesquisa']['status'] == 'skipped'
+    assert results['pesquisa']['error'] == 'circuito aberto'
+    assert results['depois']['status'] == 'skipped'
+
+
+def test_etapa_lenta_expira_sem_bloquear_o_grafo(executor):
+    release = threading.Event()
+    start = time.monotonic()
+
+    results = StageGraph([
+        Stage('lenta', lambda inputs: release.wait(5), timeout=0.2),
+        Stage('depois', lambda inputs: 'ok', depends_on=['lenta']),
+        Stage('rapida', lambda inputs: 'ok', timeout=0.2),
+    ], executor=executor).run()
+    release.set()
+
+    assert time.monotonic() - start < 2
+    assert results['lenta']['status'] == 'timeout'
+    assert results['lenta']['duration'] >= 0.2
+    assert results['depois']['status'] == 'skipped'
+    assert results['rapida']['status'] == 'ok'
+
+
+def test_timeout_conta_do_inicio_real_da_etapa():
+    # Pool de uma thread: a segunda etapa espera na fila mais que o próprio timeout
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        results = StageGraph([
+            Stage('primeira', lambda inputs: time.sleep(0.4) or 'ok', timeout=2),
+            Stage('na_fila', lambda inputs: 'ok', timeout=0.2),
+        ], executor=executor).run()
+    finally:
+        executor.shutdown(wait=False)
+
+    assert results['primeira']['status'] == 'ok'
+    assert results['na_fila']['status'] == 'ok'
+    assert results['na_fila']['duration'] < 0.2
+
+
+def test_run_bounded_devolve_resultados_e_erros_por_item():
+    def square(value):
+        if value == 3:
+            raise ValueError('três')
+        return value * value
+
+    outcomes = {item: (result, str(error) if error else None) for item, result, error in run_bounded(square, range(5), 2)}
+
+    assert outcomes == {0: (0, None), 1: (1, None), 2: (4, None), 3: (None, 'três'), 4: (16, None)}
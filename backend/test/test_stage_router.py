@@ -0,0 +1,113 @@
+import pytest
+from src.models.user import db, User, UserDailyUsage
+from src.models.note import Note, Insight
+from src.services import resilience
+from src.services.stage_router import StageRouter, count_entities
+
+RESEARCH = 'Quanto custa o curso de Python da Alura? Comparar preços com a Udemy e outras alternativas'
+QUESTION = 'Quanto custa o curso de Python?'
+SHORT = 'ok, anotado'
+PLAIN = 'Pensamentos soltos sobre o livro que terminei de ler, gostei bastante do final da história'
+
+
+@pytest.fixture(autouse=True)
+def breakers(monkeypatch):
+    """Circuitos novos a cada teste (o registro é global do processo)"""
+    monkeypatch.setattr(resilience, '_breakers', {})
+
+
+@pytest.fixture
+def user(app):
+    user = User('rotas@exemplo.com', 'Senha123')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def test_contagem_de_entidades_ignora_inicio_de_frase():
+    assert count_entities('Reunião com Ana e João na ACME. Depois almoço') == 3
+    assert count_entities('') == 0
+
+
+def test_nota_curta_nao_chama_busca_externa(user):
+    decision = StageRouter().route(user, SHORT)
+
+    assert decision['stages'] == ['analysis', 'tasks']
+    assert decision['skipped'] == {'external_info': 'pontuação abaixo do limiar'}
+    assert decision['external_score'] < 0
+
+
+def test_pergunta_com_gatilhos_e_entidades_chama_busca_externa(user):
+    decision = StageRouter().route(user, RESEARCH)
+
+    assert 'external_info' in decision['stages']
+    assert decision['features']['questions'] == 1
+    assert decision['features']['trigger_terms']
+    assert decision['external_score'] >= decision['external_threshold']
+
+
+def test_area_de_interesse_soma_pontos(user):
+    router = StageRouter()
+    without = router.route(user, PLAIN)
+    with_focus = router.route(user, PLAIN, user_preferences={'focus_areas': ['Livros']})
+
+    assert with_focus['features']['focus_match'] and not without['features']['focus_match']
+    assert with_focus['external_score'] == pytest.approx(without['external_score'] + 0.2)
+
+
+def test_tarefas_em_chamada_separada_somente_com_indicios(user):
+    router = StageRouter()
+
+    assert router.route(user, PLAIN, combined_analysis=False)['skipped']['tasks'] == 'sem indícios de tarefa'
+    assert 'tasks' in router.route(user, 'Preciso ligar para o banco amanhã', combined_analysis=False)['stages']
+    assert 'tasks' in router.route(user, 'Dentista dia 12/05 às 14h', combined_analysis=False)['stages']
+
+
+def test_limiar_sobe_com_o_uso_e_orcamento_esgotado_descarta(user):
+    router = StageRouter()
+    fresh = router.route(user, RESEARCH)
+
+    UserDailyUsage.try_reserve(user.id, 'perplexity')
+    half = router.route(user, RESEARCH)
+    assert half['external_threshold'] > fresh['external_threshold']
+    assert half['external_budget'] == {'used': 1, 'limit': 2}
+
+    UserDailyUsage.try_reserve(user.id, 'perplexity')
+    exhausted = router.route(user, RESEARCH)
+    assert exhausted['skipped']['external_info'] == 'orçamento diário esgotado'
+
+
+def test_premium_tem_orcamento_maior(user):
+    user.subscription_status = 'premium'
+    db.session.commit()
+
+    assert StageRouter().route(user, RESEARCH)['external_budget']['limit'] == 20
+
+
+def test_circuito_aberto_descarta_busca_externa(user):
+    breaker = resilience.get_circuit_breaker('perplexity')
+    breaker._open()
+
+    decision = StageRouter().route(user, RESEARCH)
+
+    assert decision['skipped']['external_info'] == 'provedor indisponível'
+
+
+def test_insights_externos_dispensados_reduzem_a_pontuacao(user):
+    router = StageRouter()
+    before = router.route(user, QUESTION)
+    assert 'external_info' in before['stages']
+
+    note = Note(user_id=user.id, content=QUESTION)
+    db.session.add(note)
+    db.session.flush()
+    for _ in range(router.min_history):
+        insight = Insight(user_id=user.id, note_id=note.id, insight_type='external_info', content='...')
+        insight.is_dismissed = True
+        db.session.add(insight)
+    db.session.commit()
+
+    after = router.route(user, QUESTION)
+    assert after['features']['external_dismissal_rate'] == 1.0
+    assert after['external_score'] == pytest.approx(before['external_score'] - 0.6)
+    assert after['skipped']['external_info'] == 'pontuação abaixo do limiar'
@@ -0,0 +1,104 @@
+import json
+import numpy as np
+import pytest
+from src.models.user import db, User
+from src.models.note import Note
+from src.models.job import ProcessingJob
+from src.services.topic_clustering import build_tfidf_matrix, MiniBatchKMeans, top_terms
+from src.controllers.ai_processor import AIProcessor
+
+WORK = [{'reuniao': 2, 'cliente': 1, 'projeto': 1}, {'cliente': 2, 'contrato': 1, 'reuniao': 1},
+        {'projeto': 2, 'prazo': 1, 'cliente': 1}, {'contrato': 1, 'prazo': 2, 'reuniao': 1}]
+GROCERIES = [{'pao': 2, 'leite': 1, 'mercado': 1}, {'leite': 2, 'ovo': 1, 'mercado': 1},
+             {'mercado': 2, 'fruta': 1, 'pao': 1}, {'ovo': 1, 'fruta': 2, 'leite': 1}]
+
+
+def test_kmeans_separa_grupos_bem_definidos():
+    matrix, vocabulary = build_tfidf_matrix(WORK + GROCERIES, max_df_ratio=0.6)
+    model = MiniBatchKMeans(n_clusters=2, seed=1).fit(matrix)
+    labels, similarities = model.predict(matrix)
+
+    assert len(set(labels[:4])) == 1
+    assert len(set(labels[4:])) == 1
+    assert labels[0] != labels[4]
+    assert np.all(similarities > 0)
+
+    work_terms = set(top_terms(model.centers[labels[0]], vocabulary, limit=3))
+    assert work_terms <= {'reuniao', 'cliente', 'projeto', 'contrato', 'prazo'}
+
+
+def test_vocabulario_vazio_sem_termos_em_comum():
+    matrix, vocabulary = build_tfidf_matrix([{'alfa': 1}, {'beta': 1}, {'gama': 2}])
+    assert vocabulary == []
+    assert matrix.shape == (3, 0)
+
+    with pytest.raises(ValueError):
+        MiniBatchKMeans(n_clusters=2).fit(matrix)
+
+
+def test_cluster_topics_com_vocabulario_vazio_nao_agrupa(app):
+    user = User('clusters@exemplo.com', 'Senha123')
+    db.session.add(user)
+    db.session.commit()
+    notes = [Note(user_id=user.id, content=content) for content in ('alfabeto', 'bicicleta', 'guarda-chuva')]
+    db.session.add_all(notes)
+    db.session.commit()
+
+    result = AIProcessor().cluster_topics(user.id, use_llm=False)
+
+    assert result['success']
+    assert result['clusters'] == []
+    assert sorted(result['unassigned_note_ids']) == sorted(note.id for note in notes)
+
+
+@pytest.fixture
+def client(app):
+    from src.routes.ai import ai_bp
+    app.config['SECRET_KEY'] = 'segredo-de-teste'
+    app.register_blueprint(ai_bp, url_prefix='/api/ai')
+    return app.test_client()
+
+
+def auth_headers(user):
+    from src.routes.auth import generate_token
+    return {'Authorization': f'Bearer {generate_token(user.id)}'}
+
+
+@pytest.mark.parametrize('n_clusters', ['abc', [3], {'n': 3}, 1, 101])
+def test_rota_rejeita_n_clusters_invalido(client, n_clusters):
+    user = User('clusters@exemplo.com', 'Senha123')
+    db.session.add(user)
+    db.session.commit()
+
+    response = client.post('/api/ai/topic-clusters', json={'n_clusters': n_clusters}, headers=auth_headers(user))
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'n_clusters deve estar entre 2 e 100'
+
+
+def test_rota_agenda_com_n_clusters_convertido(client):
+    user = User('clusters@exemplo.com', 'Senha123')
+    db.session.add(user)
+    db.session.commit()
+
+    response = client.post('/api/ai/topic-clusters', json={'n_clusters': '5'}, headers=auth_headers(user))
+
+    assert response.status_code == 202
+    assert ProcessingJob.query.one().get_payload()['n_clusters'] == 5
+
+
+@pytest.mark.parametrize('selection', [['c1'], [{'cluster_id': 'c1'}, 7], {'cluster_id': 'c1'}, 'c1'])
+def test_apply_rejeita_selecao_que_nao_e_lista_de_objetos(client, selection):
+    user = User('clusters@exemplo.com', 'Senha123')
+    db.session.add(user)
+    db.session.commit()
+    job = ProcessingJob(user_id=user.id, job_type='cluster_topics')
+    job.status = 'succeeded'
+    job.result = json.dumps({'clusters': [{'cluster_id': 'c1', 'proposed_category': 'Trabalho', 'note_ids': []}]})
+    db.session.add(job)
+    db.session.commit()
+
+    response = client.post(f'/api/ai/topic-clusters/{job.id}/apply', json={'clusters': selection},
+                           headers=auth_headers(user))
+
+    assert response.status_code == 400
@@ -0,0 +1,55 @@
+import threading
+from datetime import date
+from src.models.user import db, User, UserDailyUsage
+
+
+def test_try_reserve_concurrente_para_exatamente_no_limite(app):
+    user = User('cota@exemplo.com', 'Senha123')
+    db.session.add(user)
+    db.session.commit()
+    user_id = user.id
+
+    limit = 5
+    day = date(2026, 1, 15)
+    barrier = threading.Barrier(20)
+    results = []
+    results_lock = threading.Lock()
+
+    def reserve():
+        with app.app_context():
+            barrier.wait()
+            reserved = UserDailyUsage.try_reserve(user_id, 'ai_processing', limit=limit, day=day)
+            with results_lock:
+                results.append(reserved)
+
+    threads = [threading.Thread(target=reserve) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(1 for reserved in results if reserved == day) == limit
+    assert results.count(None) == 20 - limit
+    assert UserDailyUsage.get_count(user_id, 'ai_processing', day) == limit
+
+
+def test_try_reserve_libera_vaga_apos_release(app):
+    user = User('release@exemplo.com', 'Senha123')
+    db.session.add(user)
+    db.session.commit()
+
+    day = date(2026, 1, 15)
+    assert UserDailyUsage.try_reserve(user.id, 'ai_processing', limit=1, day=day) == day
+    assert UserDailyUsage.try_reserve(user.id, 'ai_processing', limit=1, day=day) is None
+
+    UserDailyUsage.release(user.id, 'ai_processing', day)
+    assert UserDailyUsage.try_reserve(user.id, 'ai_processing', limit=1, day=day) == day
+
+
+def test_try_reserve_com_limite_zero_nao_cria_contador(app):
+    user = User('zero@exemplo.com', 'Senha123')
+    db.session.add(user)
+    db.session.commit()
+
+    assert UserDailyUsage.try_reserve(user.id, 'ai_processing', limit=0) is None
+    assert UserDailyUsage.get_count(user.id, 'ai_processing') == 0